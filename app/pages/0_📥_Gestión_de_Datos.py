@@ -19,6 +19,8 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from rdflib import Graph
+from knowledge_graph import graph_snapshot, graph_store
+from knowledge_graph.ntriples_io import streaming_format, write_graph
 
 st.set_page_config(
     page_title="Gestión de Datos - AI Model Discovery",
@@ -58,19 +60,97 @@ def save_graph(graph: Graph, filename: str = "ai_models_multi_repo.ttl"):
     output_dir.mkdir(parents=True, exist_ok=True)
     
     output_path = output_dir / filename
-    graph.serialize(destination=str(output_path), format="turtle")
+    if streaming_format(output_path):
+        # Escritura en streaming: memoria acotada y coste lineal en el número de triples
+        write_graph(graph, output_path)
+    else:
+        graph.serialize(destination=str(output_path), format=graph_snapshot.guess_format(output_path))
+    
+    # Compilar snapshot binario para que las demás páginas no re-parseen el TTL
+    graph_snapshot.compile_snapshot(output_path, graph=graph)
+    
+    # Publicar el grafo recién guardado en el registro compartido del proceso
+    # (versión nueva: los resultados SPARQL cacheados de la anterior ya no se sirven)
+    graph_store.get_graph_store().register(output_path, graph)
     
     return output_path
 
 
+def update_graph_incrementally(all_models: dict, graph_path: Path, errors: list):
+    """Actualizar el grafo con upserts por modelo en lugar de reconstruirlo"""
+    from knowledge_graph.multi_repository_builder import MultiRepositoryGraphBuilder
+    from knowledge_graph.incremental import IncrementalGraph
+    
+    builder = MultiRepositoryGraphBuilder()
+    # La primera vez (o tras una reconstrucción completa) el estado se siembra desde el grafo existente
+    state = IncrementalGraph.open(IncrementalGraph.default_directory(graph_path), graph_path=graph_path)
+    st.info(f"♻️ Estado incremental: {len(state.models)} modelos (secuencia {state.sequence})")
+    
+    downloaded = [(repo, models) for repo, models in all_models.values() if models]
+    # Cada repositorio devuelve solo sus N modelos más populares: que un modelo no
+    # aparezca no significa que se haya borrado, así que no se eliminan ausentes
+    changes = state.upsert_models(
+        [model for _, models in downloaded for model in models],
+        builder,
+        repositories=[repo for repo, _ in downloaded],
+        remove_missing_sources=False
+    )
+    
+    if changes or not graph_path.exists():
+        st.info("💾 Exportando grafo actualizado...")
+        saved_path = state.export(graph_path)
+        st.cache_resource.clear()
+        st.success("🔄 Caché limpiado - otras páginas usarán el nuevo grafo")
+    else:
+        saved_path = graph_path
+        st.success("✅ El grafo ya estaba al día, no se reescribe")
+    
+    final_graph = graph_store.get_shared_graph(saved_path)
+    
+    # Resultados finales
+    st.markdown("---")
+    st.markdown("### 🎉 Grafo Actualizado Exitosamente")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🆕 Nuevos", len(changes.added))
+    with col2:
+        st.metric("✏️ Actualizados", len(changes.updated))
+    with col3:
+        st.metric("🗑️ Eliminados", len(changes.removed))
+    with col4:
+        st.metric("⏸️ Sin cambios", changes.unchanged)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📊 Total Modelos", len(state.models))
+    with col2:
+        st.metric("🔢 Total Triples", f"{len(final_graph):,}")
+    with col3:
+        st.metric("📦 Repositorios", len(downloaded))
+    with col4:
+        st.metric("💾 Archivo", saved_path.name)
+    
+    st.success(f"✅ Grafo guardado en: `{saved_path}`")
+    
+    # Mostrar errores si los hay
+    if errors:
+        with st.expander("⚠️ Errores durante la descarga"):
+            for error in errors:
+                st.warning(error)
+    
+    # Botón para ir a búsqueda
+    if st.button("🔍 Ir a Búsqueda", type="primary"):
+        st.switch_page("pages/1_🔍_Búsqueda.py")
+
+
 def load_existing_graph():
     """Cargar grafo existente si existe"""
     graph_path = project_root / "data" / "ai_models_multi_repo.ttl"
     
     if graph_path.exists():
         try:
-            g = Graph()
-            g.parse(str(graph_path), format="turtle")
+            g = graph_store.get_shared_graph(graph_path)
             return g, graph_path
         except Exception as e:
             # Si el grafo está corrupto, mejor ignorarlo
@@ -104,7 +184,8 @@ def main():
             with col3:
                 st.metric("📁 Ubicación", graph_path.name)
             
-            st.warning(f"⚠️ Al descargar nuevos modelos, el grafo actual será **reemplazado completamente**")
+            # El aviso de reemplazo depende del modo elegido más abajo
+            replace_warning = st.empty()
             st.info(f"📂 Ubicación actual: `{graph_path}`")
         else:
             st.info("ℹ️ No hay grafo existente. Se creará uno nuevo con los modelos descargados.")
@@ -147,7 +228,18 @@ def main():
             total_expected = models_per_repo * len(selected_repos)
             st.metric("📊 Total esperado", f"{total_expected} modelos")
             
-            st.info("💡 Al descargar, el sistema siempre reemplaza el grafo existente con los nuevos datos")
+            incremental_mode = st.checkbox(
+                "♻️ Actualización incremental",
+                value=True,
+                help="Actualizar solo los modelos nuevos o modificados en lugar de reconstruir el grafo completo"
+            )
+            
+            if incremental_mode:
+                st.info("💡 Solo se reescriben los modelos nuevos o modificados; los que ya no aparecen en la descarga se conservan")
+            else:
+                st.info("💡 Al descargar, el sistema reemplaza el grafo existente con los nuevos datos")
+                if existing_graph:
+                    replace_warning.warning("⚠️ Al descargar nuevos modelos, el grafo actual será **reemplazado completamente**")
             
             graph_filename = st.text_input(
                 "Nombre del archivo",
@@ -180,7 +272,7 @@ def main():
         
         # Mostrar confirmación si existe grafo
         confirm_download = True
-        if download_button and existing_graph_check:
+        if download_button and existing_graph_check and not incremental_mode:
             st.warning("⚠️ **ADVERTENCIA**: Ya existe un grafo con datos. Al continuar, será **eliminado y reemplazado**.")
             confirm_download = st.checkbox(
                 "✅ Confirmo que quiero eliminar el grafo existente y crear uno nuevo",
@@ -252,63 +344,72 @@ def main():
             try:
                 from knowledge_graph.multi_repository_builder import MultiRepositoryGraphBuilder
                 
-                # Verificar si existe grafo previo
                 graph_path_check = project_root / "data" / graph_filename
-                if graph_path_check.exists():
-                    st.warning(f"⚠️ Grafo existente encontrado: `{graph_filename}`")
-                    st.info("🗑️ Eliminando grafo anterior...")
-                    graph_path_check.unlink()
-                    st.success("✅ Grafo anterior eliminado")
                 
-                # Crear nuevo grafo desde cero
-                builder = MultiRepositoryGraphBuilder()
-                st.info("📝 Creando nuevo grafo desde cero")
+                if incremental_mode:
+                    update_graph_incrementally(all_models, graph_path_check, errors)
+                else:
                 
-                # Agregar modelos al grafo
-                total_added = 0
-                for repo_name, (repo, models) in all_models.items():
-                    if models:
-                        builder.add_repository(repo)
-                        for model in models:
-                            builder.add_standardized_model(model, repository=repo)
-                        total_added += len(models)
+                    # Verificar si existe grafo previo
+                    if graph_path_check.exists():
+                        st.warning(f"⚠️ Grafo existente encontrado: `{graph_filename}`")
+                        st.info("🗑️ Eliminando grafo anterior...")
+                        graph_path_check.unlink()
+                        st.success("✅ Grafo anterior eliminado")
                 
-                # Obtener grafo final
-                final_graph = builder.graph
+                    # Crear nuevo grafo desde cero
+                    builder = MultiRepositoryGraphBuilder()
+                    st.info("📝 Creando nuevo grafo desde cero")
                 
-                # Guardar grafo
-                st.info("💾 Guardando nuevo grafo...")
-                saved_path = save_graph(final_graph, graph_filename)
+                    # Agregar modelos al grafo
+                    total_added = 0
+                    for repo_name, (repo, models) in all_models.items():
+                        if models:
+                            builder.add_repository(repo)
+                            for model in models:
+                                builder.add_standardized_model(model, repository=repo)
+                            total_added += len(models)
                 
-                # Limpiar caché para forzar recarga en otras páginas
-                st.cache_resource.clear()
-                st.success("🔄 Caché limpiado - otras páginas usarán el nuevo grafo")
+                    # Obtener grafo final
+                    final_graph = builder.graph
+                
+                    # Guardar grafo
+                    st.info("💾 Guardando nuevo grafo...")
+                    saved_path = save_graph(final_graph, graph_filename)
+                
+                    # El estado incremental debe partir del grafo nuevo, no del eliminado
+                    from knowledge_graph.incremental import IncrementalGraph
+                    IncrementalGraph.open(IncrementalGraph.default_directory(saved_path), graph_path=saved_path)
+                
+                    # Limpiar caché para forzar recarga en otras páginas
+                    st.cache_resource.clear()
+                    st.success("🔄 Caché limpiado - otras páginas usarán el nuevo grafo")
                 
-                # Resultados finales
-                st.markdown("---")
-                st.markdown("### 🎉 Grafo Construido Exitosamente")
+                    # Resultados finales
+                    st.markdown("---")
+                    st.markdown("### 🎉 Grafo Construido Exitosamente")
                 
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("📊 Total Modelos", total_added)
-                with col2:
-                    st.metric("🔢 Total Triples", f"{len(final_graph):,}")
-                with col3:
-                    st.metric("📦 Repositorios", len([m for m in all_models.values() if m[1]]))
-                with col4:
-                    st.metric("💾 Archivo", saved_path.name)
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("📊 Total Modelos", total_added)
+                    with col2:
+                        st.metric("🔢 Total Triples", f"{len(final_graph):,}")
+                    with col3:
+                        st.metric("📦 Repositorios", len([m for m in all_models.values() if m[1]]))
+                    with col4:
+                        st.metric("💾 Archivo", saved_path.name)
                 
-                st.success(f"✅ Grafo guardado en: `{saved_path}`")
+                    st.success(f"✅ Grafo guardado en: `{saved_path}`")
                 
-                # Mostrar errores si los hay
-                if errors:
-                    with st.expander("⚠️ Errores durante la descarga"):
-                        for error in errors:
-                            st.warning(error)
+                    # Mostrar errores si los hay
+                    if errors:
+                        with st.expander("⚠️ Errores durante la descarga"):
+                            for error in errors:
+                                st.warning(error)
                 
-                # Botón para ir a búsqueda
-                if st.button("🔍 Ir a Búsqueda", type="primary"):
-                    st.switch_page("pages/1_🔍_Búsqueda.py")
+                    # Botón para ir a búsqueda
+                    if st.button("🔍 Ir a Búsqueda", type="primary"):
+                        st.switch_page("pages/1_🔍_Búsqueda.py")
                 
             except Exception as e:
                 st.error(f"❌ Error construyendo grafo: {e}")
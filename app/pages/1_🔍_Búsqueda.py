@@ -21,11 +21,27 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 sys.path.insert(0, str(project_root / "experiments" / "benchmarks"))
 
-from rdflib import Graph, Namespace
+from rdflib import Graph
+from knowledge_graph import graph_store
+from knowledge_graph.facet_index import facet_mask, get_facet_index
+from knowledge_graph.model_catalog import get_graph_statistics, get_model_catalog
+from knowledge_graph.query_budget import BudgetedResult, QueryBudget, execute_with_budget
 
 
 st.set_page_config(page_title="Búsqueda - AI Model Discovery", page_icon="🔍", layout="wide")
 
+# Presupuesto de las consultas SPARQL generadas por el LLM
+SPARQL_BUDGET = QueryBudget(timeout=10.0)
+
+# Facetas de la barra lateral: campo del catálogo -> etiqueta
+FACET_LABELS = {
+    "task": "🎯 Tarea",
+    "library": "📚 Biblioteca",
+    "source": "📦 Repositorio",
+    "license": "📜 Licencia",
+    "accessLevel": "🔐 Nivel de acceso",
+}
+
 
 # ==================== SEARCH UTILITIES ====================
 
@@ -92,6 +108,16 @@ def is_complex_query(query: str) -> bool:
     return matches >= 2 or any(pattern in query_lower for pattern in ["count", "how many", "cuántos", "average", "sum"])
 
 
+def format_budget_warning(execution: BudgetedResult) -> Optional[str]:
+    """Aviso para resultados incompletos por el presupuesto de ejecución"""
+    if execution.status == "timeout":
+        return (f"⏱️ La consulta superó el tiempo máximo ({SPARQL_BUDGET.timeout:.0f}s); "
+                f"se muestran los resultados obtenidos hasta entonces.")
+    if execution.status == "truncated":
+        return f"✂️ La consulta devolvió más de {SPARQL_BUDGET.max_rows:,} filas; se muestran las primeras."
+    return None
+
+
 def format_query_results_suggestion(query: str, method: str) -> str:
     """Genera sugerencias si un método no aplica"""
     suggestions = {
@@ -111,8 +137,7 @@ def load_graph():
     
     if graph_path.exists():
         try:
-            g = Graph()
-            g.parse(str(graph_path), format="turtle")
+            g = graph_store.get_shared_graph(graph_path)
             return g, f"✅ Grafo real cargado: {len(g):,} triples"
         except Exception as e:
             st.sidebar.warning(f"⚠️ Error cargando grafo: {e}")
@@ -130,7 +155,7 @@ def load_bm25_engine():
     
     try:
         from keyword_bm25 import KeywordBM25Baseline
-        engine = KeywordBM25Baseline(graph_path=graph_path)
+        engine = KeywordBM25Baseline(graph=graph_store.get_shared_graph(graph_path))
         return engine, "✅ Motor BM25 cargado"
     except Exception as e:
         return None, f"❌ Error: {e}"
@@ -149,8 +174,9 @@ def load_hybrid_engine():
         from dense_retrieval import DenseRetrieval
         from hybrid_retrieval import HybridRetrieval
         
-        bm25_engine = OntologyEnhancedBM25(graph_path=graph_path)
-        dense_engine = DenseRetrieval(graph_path=graph_path)
+        graph = graph_store.get_shared_graph(graph_path)
+        bm25_engine = OntologyEnhancedBM25(graph=graph)
+        dense_engine = DenseRetrieval(graph=graph)
         hybrid_engine = HybridRetrieval(
             bm25_engine=bm25_engine,
             dense_engine=dense_engine,
@@ -189,7 +215,7 @@ def load_llm_engine():
 
 # ==================== SEARCH METHODS ====================
 
-def execute_fast_search(query: str, top_k: int = 10) -> Dict[str, Any]:
+def execute_fast_search(query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Búsqueda Rápida: BM25 Baseline
     - Más rápido (~1ms)
@@ -214,7 +240,7 @@ def execute_fast_search(query: str, top_k: int = 10) -> Dict[str, Any]:
         
         # Tokenize query (BM25 needs tokens)
         tokens = query.lower().split()
-        results = engine.search(tokens, top_k=top_k)
+        results = engine.search(tokens, top_k=top_k, filters=filters)
         
         execution_time = time.time() - start
         
@@ -222,12 +248,12 @@ def execute_fast_search(query: str, top_k: int = 10) -> Dict[str, Any]:
         formatted_results = []
         graph, _ = load_graph()
         
-        for result in results:
+        all_metadata = extract_models_metadata(graph, [result.model_uri for result in results])
+        
+        for result, metadata in zip(results, all_metadata):
             model_uri = result.model_uri
             score = result.score
             
-            # Extract metadata from graph
-            metadata = extract_model_metadata(graph, model_uri)
             formatted_results.append({
                 "model_uri": model_uri,
                 "score": score,
@@ -257,7 +283,7 @@ def execute_fast_search(query: str, top_k: int = 10) -> Dict[str, Any]:
         }
 
 
-def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
+def execute_smart_search(query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Búsqueda Inteligente: Router (Hybrid para básicas, LLM para complejas)
     - Balance entre velocidad y precisión
@@ -302,13 +328,27 @@ def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
                     "suggestion": format_query_results_suggestion(query, "smart")
                 }
             
-            # Execute SPARQL
-            results = graph.query(conversion_result.sparql_query)
+            # Execute SPARQL (con estimación de coste y tiempo máximo)
+            execution = execute_with_budget(graph, conversion_result.sparql_query, SPARQL_BUDGET)
+            
+            if execution.result is None:
+                error = execution.error if execution.status == "rejected" else "Este método no puede procesar esta consulta."
+                return {
+                    "success": False,
+                    "error": error,
+                    "results": [],
+                    "execution_time": time.time() - start,
+                    "method": "smart",
+                    "sub_method": "llm",
+                    "applicable": False,
+                    "suggestion": format_query_results_suggestion(query, "smart")
+                }
             
+            results = execution.result
             execution_time = time.time() - start
             
             # Format results
-            formatted_results = format_sparql_results(graph, results, query, top_k)
+            formatted_results = format_sparql_results(graph, results, query, top_k, filters)
             
             return {
                 "success": True,
@@ -319,7 +359,9 @@ def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
                 "sub_method": "llm",
                 "sparql": conversion_result.sparql_query,
                 "applicable": True,
-                "confidence": conversion_result.confidence
+                "confidence": conversion_result.confidence,
+                "timed_out": execution.timed_out,
+                "warning": format_budget_warning(execution)
             }
             
         except Exception as e:
@@ -353,7 +395,7 @@ def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
         try:
             start = time.time()
             
-            results = engine.search(query, top_k=top_k)
+            results = engine.search(query, top_k=top_k, filters=filters)
             
             execution_time = time.time() - start
             
@@ -361,12 +403,12 @@ def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
             formatted_results = []
             graph, _ = load_graph()
             
-            for result in results:
+            all_metadata = extract_models_metadata(graph, [result.model_uri for result in results])
+            
+            for result, metadata in zip(results, all_metadata):
                 model_uri = result.model_uri
                 score = result.combined_score
                 
-                # Extract metadata from graph
-                metadata = extract_model_metadata(graph, model_uri)
                 formatted_results.append({
                     "model_uri": model_uri,
                     "score": score,
@@ -400,7 +442,7 @@ def execute_smart_search(query: str, top_k: int = 10) -> Dict[str, Any]:
             }
 
 
-def execute_expert_search(query: str, top_k: int = 10) -> Dict[str, Any]:
+def execute_expert_search(query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Búsqueda Experta: LLM + Ontology Dictionary + RAG
     - Más lento (~3-6s)
@@ -438,13 +480,26 @@ def execute_expert_search(query: str, top_k: int = 10) -> Dict[str, Any]:
                 "suggestion": format_query_results_suggestion(query, "expert")
             }
         
-        # Execute SPARQL
-        results = graph.query(conversion_result.sparql_query)
+        # Execute SPARQL (con estimación de coste y tiempo máximo)
+        execution = execute_with_budget(graph, conversion_result.sparql_query, SPARQL_BUDGET)
+        
+        if execution.result is None:
+            error = execution.error if execution.status == "rejected" else "Este método no puede procesar esta consulta."
+            return {
+                "success": False,
+                "error": error,
+                "results": [],
+                "execution_time": time.time() - start,
+                "method": "expert",
+                "applicable": False,
+                "suggestion": format_query_results_suggestion(query, "expert")
+            }
         
+        results = execution.result
         execution_time = time.time() - start
         
         # Format results
-        formatted_results = format_sparql_results(graph, results, query, top_k)
+        formatted_results = format_sparql_results(graph, results, query, top_k, filters)
         
         return {
             "success": True,
@@ -455,6 +510,8 @@ def execute_expert_search(query: str, top_k: int = 10) -> Dict[str, Any]:
             "sparql": conversion_result.sparql_query,
             "applicable": True,
             "confidence": conversion_result.confidence,
+            "timed_out": execution.timed_out,
+            "warning": format_budget_warning(execution),
             "retrieved_examples": conversion_result.retrieved_examples
         }
         
@@ -473,61 +530,42 @@ def execute_expert_search(query: str, top_k: int = 10) -> Dict[str, Any]:
 # ==================== HELPER FUNCTIONS ====================
 
 def extract_model_metadata(graph: Graph, model_uri: str) -> Dict[str, Any]:
-    """Extrae metadata de un modelo desde el grafo"""
-    DAIMO = Namespace("http://purl.org/pionera/daimo#")
-    DCTERMS = Namespace("http://purl.org/dc/terms/")
-    
-    from rdflib import URIRef, Literal
-    
-    model_ref = URIRef(model_uri)
-    
-    metadata = {
-        "title": None,
-        "source": None,
-        "task": None,
-        "library": None,
-        "domain": None,
-        "rating": 0,
-        "downloads": 0
-    }
+    """Extrae metadata de un modelo desde el catálogo columnar del grafo"""
+    return extract_models_metadata(graph, [model_uri])[0]
+
+
+def extract_models_metadata(graph: Graph, model_uris: List[str]) -> List[Dict[str, Any]]:
+    """Extrae la metadata de una página de modelos con una sola hidratación del catálogo"""
+    catalog = get_model_catalog(graph)
+    records = catalog.hydrate(model_uris, ("title", "source", "task", "library", "domain", "rating", "downloads"))
+    
+    all_metadata = []
+    for model_uri, record in zip(model_uris, records):
+        metadata = {
+            **record,
+            "rating": float(record["rating"] or 0),
+            "downloads": int(record["downloads"] or 0)
+        }
+        
+        # Default title if not found
+        if not metadata["title"]:
+            metadata["title"] = model_uri.split("#")[-1].split("/")[-1]
+        
+        all_metadata.append(metadata)
     
-    # Extract properties
-    for pred, obj in graph.predicate_objects(model_ref):
-        pred_str = str(pred)
-        obj_str = str(obj)
-        
-        if "title" in pred_str.lower() or "name" in pred_str.lower():
-            metadata["title"] = obj_str
-        elif "source" in pred_str.lower():
-            metadata["source"] = obj_str
-        elif "task" in pred_str.lower():
-            metadata["task"] = obj_str
-        elif "library" in pred_str.lower():
-            metadata["library"] = obj_str
-        elif "domain" in pred_str.lower():
-            metadata["domain"] = obj_str
-        elif "rating" in pred_str.lower() or "score" in pred_str.lower():
-            try:
-                metadata["rating"] = float(obj_str)
-            except:
-                pass
-        elif "downloads" in pred_str.lower():
-            try:
-                metadata["downloads"] = int(float(obj_str))
-            except:
-                pass
-    
-    # Default title if not found
-    if not metadata["title"]:
-        metadata["title"] = model_uri.split("#")[-1].split("/")[-1]
-    
-    return metadata
-
-
-def format_sparql_results(graph: Graph, results: Any, query: str, top_k: int) -> List[Dict[str, Any]]:
+    return all_metadata
+
+
+def format_sparql_results(
+    graph: Graph,
+    results: Any,
+    query: str,
+    top_k: int,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
     """
     Formatea resultados de SPARQL según el tipo de query
-    - Listado: devuelve modelos con metadata
+    - Listado: devuelve modelos con metadata (solo los que cumplen los filtros de facetas)
     - Agregación: devuelve tabla agregada
     """
     formatted_results = []
@@ -544,28 +582,31 @@ def format_sparql_results(graph: Graph, results: Any, query: str, top_k: int) ->
                 result_dict[str(var)] = str(value) if value else "N/A"
             formatted_results.append(result_dict)
     else:
-        # Para listados, extraer URIs y metadata
-        count = 0
+        # Para listados, extraer URIs y luego la metadata de todos a la vez
+        model_uris = []
         for row in results:
-            if count >= top_k:
+            if len(model_uris) >= top_k and not filters:
                 break
             
             # Try to find model URI in row
-            model_uri = None
             for value in row:
                 value_str = str(value)
                 if "http" in value_str and "#" in value_str:
-                    model_uri = value_str
+                    model_uris.append(value_str)
                     break
-            
-            if model_uri:
-                metadata = extract_model_metadata(graph, model_uri)
-                formatted_results.append({
-                    "model_uri": model_uri,
-                    "score": count + 1,  # Rank as score
-                    **metadata
-                })
-                count += 1
+        
+        if filters:
+            # Filtros de facetas evaluados sobre los bitmaps del catálogo
+            allowed = facet_mask(graph, model_uris, filters)
+            model_uris = [uri for uri, keep in zip(model_uris, allowed) if keep][:top_k]
+        
+        all_metadata = extract_models_metadata(graph, model_uris)
+        for rank, (model_uri, metadata) in enumerate(zip(model_uris, all_metadata), start=1):
+            formatted_results.append({
+                "model_uri": model_uri,
+                "score": rank,  # Rank as score
+                **metadata
+            })
     
     return formatted_results
 
@@ -645,14 +686,34 @@ def main():
         # Graph stats
         graph, graph_status = load_graph()
         st.markdown("### 📊 Catálogo")
+        filters = {}
         if graph:
-            DAIMO = Namespace("http://purl.org/pionera/daimo#")
-            from rdflib import RDF
+            stats = get_graph_statistics(graph)
+            st.metric("Total modelos", f"{stats['total_models']:,}")
+            st.metric("Total triples", f"{stats['total_triples']:,}")
             
-            # Count models
-            model_count = sum(1 for _ in graph.subjects(RDF.type, DAIMO.Model))
-            st.metric("Total modelos", f"{model_count:,}")
-            st.metric("Total triples", f"{len(graph):,}")
+            # Filtros por facetas con conteos en vivo (bitmaps del catálogo)
+            st.markdown("### 🧩 Filtros")
+            facets = get_facet_index(get_model_catalog(graph))
+            selected = {name: st.session_state.get(f"facet_{name}", []) for name in FACET_LABELS}
+            filters = {name: values for name, values in selected.items() if values}
+            counts = facets.counts(filters, list(FACET_LABELS))
+            
+            for name, label in FACET_LABELS.items():
+                options = [
+                    value for value, count in sorted(counts[name].items(), key=lambda x: -x[1])
+                    if count or value in selected[name]
+                ]
+                if options:
+                    st.multiselect(
+                        label,
+                        options,
+                        key=f"facet_{name}",
+                        format_func=lambda value, name=name: f"{value} ({counts[name][value]:,})"
+                    )
+            
+            if filters:
+                st.caption(f"✅ {facets.count(filters):,} modelos cumplen los filtros")
         else:
             st.warning(graph_status)
     
@@ -735,9 +796,9 @@ def main():
             st.markdown("## 🔄 Modo Comparación: Ejecutando 3 métodos...")
             
             with st.spinner("Ejecutando búsquedas..."):
-                fast_result = execute_fast_search(query, max_results)
-                smart_result = execute_smart_search(query, max_results)
-                expert_result = execute_expert_search(query, max_results)
+                fast_result = execute_fast_search(query, max_results, filters)
+                smart_result = execute_smart_search(query, max_results, filters)
+                expert_result = execute_expert_search(query, max_results, filters)
             
             # Show comparison
             st.markdown("### 📊 Resultados Comparativos")
@@ -806,11 +867,11 @@ def main():
             
             with st.spinner(f"🔄 Ejecutando búsqueda {search_methods[selected_method]['icon']}..."):
                 if selected_method == "fast":
-                    result = execute_fast_search(query, max_results)
+                    result = execute_fast_search(query, max_results, filters)
                 elif selected_method == "smart":
-                    result = execute_smart_search(query, max_results)
+                    result = execute_smart_search(query, max_results, filters)
                 else:  # expert
-                    result = execute_expert_search(query, max_results)
+                    result = execute_expert_search(query, max_results, filters)
             
             # Store result
             st.session_state.current_results = {selected_method: result}
@@ -873,6 +934,9 @@ def display_results(result: Dict[str, Any], query: str, show_sparql: bool, show_
         }.get(result["method"], result["method"])
         st.metric("🔧 Método", method_name)
     
+    if result.get("warning"):
+        st.warning(result["warning"])
+    
     # SPARQL generado
     if show_sparql and result.get("sparql"):
         with st.expander("📝 SPARQL generado", expanded=False):
@@ -18,23 +18,22 @@ import plotly.graph_objects as go
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from rdflib import Graph
-from search.non_federated import create_api
+from knowledge_graph import graph_store
+from knowledge_graph.model_catalog import get_graph_statistics
 
 
 st.set_page_config(page_title="Dashboard - AI Model Discovery", page_icon="📊", layout="wide")
 
 
 @st.cache_resource
-def load_api():
-    """Cargar API (cacheado)"""
+def load_graph():
+    """Cargar grafo (cacheado)"""
     # Intentar cargar grafo real primero
     graph_path = project_root / "data" / "ai_models_multi_repo.ttl"
     
     if graph_path.exists():
         try:
-            g = Graph()
-            g.parse(str(graph_path), format="turtle")
+            g = graph_store.get_shared_graph(graph_path)
             st.sidebar.success(f"✅ Grafo real: {len(g):,} triples")
         except Exception as e:
             st.sidebar.warning(f"⚠️ Error: {e}")
@@ -47,7 +46,16 @@ def load_api():
         st.sidebar.info("📊 Grafo de prueba (70 modelos)")
         st.sidebar.warning("💡 Descarga modelos reales en 'Gestión de Datos'")
     
-    return create_api(graph=g)
+    return g
+
+
+def load_statistics():
+    """
+    Estadísticas del catálogo: se calculan una vez por versión del grafo al
+    construir el catálogo de modelos y se sirven desde memoria (no hace falta
+    crear el motor de búsqueda ni el LLM para mostrar el Dashboard).
+    """
+    return get_graph_statistics(load_graph())
 
 
 def main():
@@ -56,8 +64,7 @@ def main():
     
     # Cargar datos
     try:
-        api = load_api()
-        stats = api.get_statistics()
+        stats = load_statistics()
     except Exception as e:
         st.error(f"❌ Error cargando datos: {e}")
         return
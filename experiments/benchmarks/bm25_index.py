@@ -0,0 +1,524 @@
+"""
+Array-backed inverted index for the BM25 baselines.
+
+Postings are stored as a CSR matrix (terms x documents) over integer doc ids:
+
+- ``offsets[row]:offsets[row + 1]`` delimits the postings of a term,
+- ``doc_ids`` holds the (ascending) documents of each term as int32,
+- ``impacts`` holds the precomputed BM25 contribution of each posting
+  (idf x saturated tf, times the property weight when the engine uses one).
+
+Query-time scoring is a gather-and-sum over the rows of the query terms: no
+per-posting arithmetic, no per-document dicts and no token lists kept after
+the build. Doc ids follow the sorted URI order, so they double as the
+deterministic tie-break of the top-k selection, and term rows follow the
+sorted vocabulary, so a term is found by bisection without building a dict.
+
+``PostingIndex.top_k`` is a block-max MaxScore top-k over the same postings.
+Doc ids are split into blocks of ``2**BLOCK_SHIFT`` documents and each term
+row keeps, per block where it has postings, the largest impact and the
+position of its first posting (``block_*`` arrays). A query sums the block
+maxima of its terms into a bound per block, visits blocks from the highest
+bound down and stops as soon as no remaining block can beat the k-th best
+score found so far. Within the visited blocks, terms whose global bounds
+(``max_impacts``) cannot lift a document into the top k stop producing
+candidates (MaxScore) and are only looked up for the others. The result is
+the same as exhaustive scoring: same scores, same ties.
+
+Indexes are persisted as memory-mapped bundles (knowledge_graph.mmap_store)
+next to the graph snapshot, ``.compiled/<name>.<sha16>.<engine>.bm25/``. The
+header records the graph sha256 and the settings the index depends on
+(tokenizer, properties, weights, k1/b); a bundle whose header does not match
+is stale and the engine rebuilds it.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import math
+import shutil
+import sys
+
+import numpy as np
+from rdflib import Graph
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from knowledge_graph.graph_snapshot import compiled_artifact_path, stale_compiled_artifacts
+from knowledge_graph.graph_store import get_graph_store
+from knowledge_graph.mmap_store import StringColumn, load_bundle, pack_strings, read_bundle_header, save_bundle
+from knowledge_graph.ranking import top_k_indices
+
+
+# Tokenizer shared by the BM25 engines (part of the persisted settings)
+TOKEN_PATTERN = r"[a-zA-Z0-9]+"
+
+# Bundle suffix and format version (bump when the arrays change)
+BM25_SUFFIX = ".bm25"
+BM25_FORMAT_VERSION = 2
+
+# Block-max metadata: documents per block (as a shift) and blocks of the first
+# batch visited by ``top_k`` (doubled at each step)
+BLOCK_SHIFT = 7
+FIRST_BLOCK_BATCH = 32
+
+# Queries with fewer postings than this are scored in full: pruning would cost more
+EXHAUSTIVE_POSTINGS = 200_000
+
+# Relative slack on upper bounds: sums in another order may round differently
+BOUND_SLACK = 1e-9
+
+
+@dataclass
+class PostingIndex:
+    doc_uris: Sequence[str]    # doc id -> model URI (sorted)
+    doc_len: np.ndarray        # int32, tokens per document
+    terms: Sequence[str]       # CSR row -> term (sorted)
+    idf: np.ndarray            # float64 per row
+    offsets: np.ndarray        # int64, len(terms) + 1
+    doc_ids: np.ndarray        # int32, postings of each row in ascending doc order
+    impacts: np.ndarray        # float64, BM25 contribution of each posting
+    max_impacts: np.ndarray    # float64 per row, upper bound of the row impacts
+    block_offsets: np.ndarray  # int64, len(terms) + 1: block entries of each row
+    block_ids: np.ndarray      # int32, block (doc_id >> BLOCK_SHIFT) of each entry
+    block_max: np.ndarray      # float64, largest impact of the row in the block
+    block_starts: np.ndarray   # int64, position in doc_ids of the first posting in the block
+    avgdl: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.doc_uris)
+
+    def __contains__(self, term: str) -> bool:
+        return self.row(term) is not None
+
+    def row(self, term: str) -> Optional[int]:
+        """CSR row of a term (None if it is not in the vocabulary)."""
+        row = bisect_left(self.terms, term)
+        if row < len(self.terms) and self.terms[row] == term:
+            return row
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the posting and document arrays."""
+        return sum(a.nbytes for a in (self.doc_len, self.idf, self.offsets, self.doc_ids, self.impacts, self.max_impacts))
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc_ids, impacts) of a term; empty arrays for unknown terms."""
+        row = self.row(term)
+        if row is None:
+            return self.doc_ids[:0], self.impacts[:0]
+        return self._row_postings(row)
+
+    def top_k(
+        self,
+        terms: Iterable[str],
+        k: int,
+        bonus: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        bonus_bound: float = 0.0,
+        allowed: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Block-max MaxScore top-k: the k best matched documents without scoring every posting.
+
+        Args:
+            terms: Query terms (repeated terms count again, as in ``score``)
+            k: Number of results
+            bonus: Extra score of matched documents (non-negative), by doc ids
+            bonus_bound: Upper bound of ``bonus``
+            allowed: Mask of the doc ids that may be returned (facet filters)
+
+        Returns:
+            (doc ids, scores) ordered by score, ties by doc id (URI order)
+        """
+        rows = [row for row in map(self.row, terms) if row is not None]
+        best_ids, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if not rows or k <= 0:
+            return best_ids, best_scores
+        if sum(int(self.offsets[row + 1] - self.offsets[row]) for row in rows) <= EXHAUSTIVE_POSTINGS:
+            return self._top_k_exhaustive(rows, k, bonus, allowed)
+
+        # Bound of each block: block maxima of the query terms plus the bonus bound
+        n_blocks = (len(self.doc_uris) >> BLOCK_SHIFT) + 1
+        block_bounds = np.zeros(n_blocks, dtype=np.float64)
+        entry_of_block = np.full((len(rows), n_blocks), -1, dtype=np.int64)
+        for i, row in enumerate(rows):
+            lo, hi = self.block_offsets[row], self.block_offsets[row + 1]
+            blocks = self.block_ids[lo:hi]
+            block_bounds[blocks] += self.block_max[lo:hi]
+            entry_of_block[i, blocks] = np.arange(lo, hi)
+        block_bounds = (block_bounds + bonus_bound) * (1.0 + BOUND_SLACK)
+        order = np.flatnonzero((entry_of_block >= 0).any(axis=0))
+        order = order[np.argsort(-block_bounds[order])]
+
+        # Bound of a document matched only by the j lowest-bound terms (MaxScore)
+        bounds = self.max_impacts[rows]
+        by_bound = np.argsort(bounds, kind="stable")
+        prefix_bounds = (np.cumsum(bounds[by_bound]) + bonus_bound) * (1.0 + BOUND_SLACK)
+
+        threshold = -np.inf
+        done, batch = 0, FIRST_BLOCK_BATCH
+        while done < len(order):
+            blocks = order[done:done + batch]
+            done, batch = done + batch, batch * 2
+            # Blocks come in decreasing bound order: once one cannot reach the top k, none can
+            blocks = blocks[block_bounds[blocks] >= threshold]
+            skipped = int(np.searchsorted(prefix_bounds, threshold, side="left"))
+            if not len(blocks) or skipped == len(rows):
+                break
+            essential = by_bound[skipped:].tolist()
+
+            # Postings of the essential terms in the visited blocks (ascending doc ids)
+            blocks = np.sort(blocks)
+            spans: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+            for i in essential:
+                row = rows[i]
+                entry = entry_of_block[i, blocks]
+                entry = entry[entry >= 0]
+                ends = np.where(
+                    entry + 1 < self.block_offsets[row + 1],
+                    self.block_starts[np.minimum(entry + 1, len(self.block_starts) - 1)],
+                    self.offsets[row + 1],
+                )
+                positions = _ranges(self.block_starts[entry], ends)
+                spans[i] = (self.doc_ids[positions], self.impacts[positions])
+
+            candidates = np.unique(np.concatenate([spans[i][0] for i in essential]))
+            if allowed is not None and len(candidates):
+                candidates = candidates[allowed(candidates)]
+            if not len(candidates):
+                continue
+            contributions: Dict[int, np.ndarray] = {i: _lookup(*spans[i], candidates) for i in essential}
+            if skipped:
+                partial = np.sum([contributions[i] for i in essential], axis=0)
+                keep = (partial + prefix_bounds[skipped - 1]) * (1.0 + BOUND_SLACK) >= threshold
+                candidates = candidates[keep]
+                contributions = {i: c[keep] for i, c in contributions.items()}
+                if not len(candidates):
+                    continue
+
+            # Exact scores, accumulated in query order (same floats as ``score``);
+            # the other terms are looked up in their whole posting lists
+            scores = np.zeros(len(candidates), dtype=np.float64)
+            for i, row in enumerate(rows):
+                scores += contributions[i] if i in contributions else _lookup(*self._row_postings(row), candidates)
+            if bonus is not None:
+                scores += bonus(candidates)
+
+            merged_ids = np.concatenate([best_ids, candidates])
+            merged_scores = np.concatenate([best_scores, scores])
+            top = top_k_indices(merged_scores, k, tiebreak=merged_ids)
+            best_ids, best_scores = merged_ids[top], merged_scores[top]
+            if len(best_ids) == k:
+                threshold = best_scores[-1]
+
+        return best_ids, best_scores
+
+    def _top_k_exhaustive(
+        self,
+        rows: List[int],
+        k: int,
+        bonus: Optional[Callable[[np.ndarray], np.ndarray]],
+        allowed: Optional[Callable[[np.ndarray], np.ndarray]],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """``top_k`` scoring every posting of the query rows."""
+        postings = [self._row_postings(row) for row in rows]
+        if sum(len(ids) for ids, _ in postings) * 16 >= len(self.doc_uris):
+            # Dense accumulator over all documents
+            scores, candidates = self._accumulate(postings)
+            scores = scores[candidates]
+        else:
+            # Sparse: bincount adds in input order, i.e. in query order for each document
+            candidates, inverse = np.unique(np.concatenate([ids for ids, _ in postings]), return_inverse=True)
+            scores = np.bincount(
+                inverse.ravel(), weights=np.concatenate([impacts for _, impacts in postings]), minlength=len(candidates)
+            )
+        if allowed is not None:
+            keep = allowed(candidates)
+            candidates, scores = candidates[keep], scores[keep]
+        if bonus is not None and len(candidates):
+            scores = scores + bonus(candidates)
+        top = top_k_indices(scores, k, tiebreak=candidates)
+        return candidates[top].astype(np.int64), scores[top]
+
+    def _row_postings(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.offsets[row], self.offsets[row + 1]
+        return self.doc_ids[lo:hi], self.impacts[lo:hi]
+
+    def score(self, terms: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Accumulate the impacts of the query terms (repeated terms count again).
+
+        Returns:
+            (scores of every document, ascending ids of the matched documents)
+        """
+        return self._accumulate([self.postings(term) for term in terms])
+
+    def _accumulate(self, postings: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.zeros(len(self.doc_uris), dtype=np.float64)
+        matched = np.zeros(len(self.doc_uris), dtype=bool)
+        for ids, impacts in postings:
+            # Doc ids are unique within a row, so fancy-index += is a gather-and-sum
+            scores[ids] += impacts
+            matched[ids] = True
+        return scores, np.flatnonzero(matched)
+
+    def contains(self, term: str, doc_ids: np.ndarray) -> np.ndarray:
+        """Mask: does each document have a posting for the term?"""
+        ids, _ = self.postings(term)
+        doc_ids = np.asarray(doc_ids)
+        if not len(ids):
+            return np.zeros(len(doc_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(ids, doc_ids), len(ids) - 1)
+        return ids[pos] == doc_ids
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays of the index for a bundle (see ``from_arrays``)."""
+        return {
+            "doc_len": self.doc_len,
+            "idf": self.idf,
+            "offsets": self.offsets,
+            "doc_ids": self.doc_ids,
+            "impacts": self.impacts,
+            "max_impacts": self.max_impacts,
+            "block_offsets": self.block_offsets,
+            "block_ids": self.block_ids,
+            "block_max": self.block_max,
+            "block_starts": self.block_starts,
+            **pack_strings("doc_uris", self.doc_uris),
+            **pack_strings("terms", self.terms),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], avgdl: float) -> "PostingIndex":
+        """Rebuild an index from (possibly memory-mapped) bundle arrays."""
+        return cls(
+            doc_uris=StringColumn.from_arrays(arrays, "doc_uris"),
+            doc_len=arrays["doc_len"],
+            terms=StringColumn.from_arrays(arrays, "terms"),
+            idf=arrays["idf"],
+            offsets=arrays["offsets"],
+            doc_ids=arrays["doc_ids"],
+            impacts=arrays["impacts"],
+            max_impacts=arrays["max_impacts"],
+            block_offsets=arrays["block_offsets"],
+            block_ids=arrays["block_ids"],
+            block_max=arrays["block_max"],
+            block_starts=arrays["block_starts"],
+            avgdl=avgdl,
+        )
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of ``arange(start, end)`` for each pair."""
+    counts = ends - starts
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+def _lookup(ids: np.ndarray, impacts: np.ndarray, doc_ids: np.ndarray) -> np.ndarray:
+    """Impact of each doc id in a (sorted) posting list, 0 where it has no posting."""
+    if not len(ids):
+        return np.zeros(len(doc_ids), dtype=np.float64)
+    pos = np.minimum(np.searchsorted(ids, doc_ids), len(ids) - 1)
+    return np.where(ids[pos] == doc_ids, impacts[pos], 0.0)
+
+
+def block_max_arrays(
+    term_ids: np.ndarray, doc_ids: np.ndarray, impacts: np.ndarray, n_terms: int
+) -> Dict[str, np.ndarray]:
+    """Block-max entries (one per row and block with postings) of postings sorted by (term, doc)."""
+    blocks = doc_ids >> BLOCK_SHIFT
+    first = np.ones(len(doc_ids), dtype=bool)
+    first[1:] = (term_ids[1:] != term_ids[:-1]) | (blocks[1:] != blocks[:-1])
+    starts = np.flatnonzero(first)
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids[starts], minlength=n_terms), out=offsets[1:])
+    return {
+        "block_offsets": offsets,
+        "block_ids": blocks[starts].astype(np.int32),
+        "block_max": (np.maximum.reduceat(impacts, starts) if len(starts) else np.zeros(0)).astype(np.float64),
+        "block_starts": starts.astype(np.int64),
+    }
+
+
+class PostingIndexBuilder:
+    """Collects (term, tf, weight) postings per document, then packs them into a PostingIndex."""
+
+    def __init__(self):
+        self.doc_uris: List[str] = []
+        self.terms: Dict[str, int] = {}
+        self._doc_len = array("i")
+        self._term_ids = array("i")
+        self._doc_ids = array("i")
+        self._tf = array("i")
+        self._weights = array("d")
+
+    def add_document(self, uri: str, length: int, postings: Iterable[Tuple[str, int, float]]) -> None:
+        """Add a document with its length and postings.
+
+        A term may appear in several postings of the same document (e.g. once
+        per property); their impacts are summed into a single posting.
+        """
+        doc_id = len(self.doc_uris)
+        self.doc_uris.append(uri)
+        self._doc_len.append(length)
+        for term, tf, weight in postings:
+            row = self.terms.setdefault(term, len(self.terms))
+            self._term_ids.append(row)
+            self._doc_ids.append(doc_id)
+            self._tf.append(tf)
+            self._weights.append(weight)
+
+    def build(self, k1: float, b: float) -> PostingIndex:
+        n_docs = len(self.doc_uris)
+        doc_count = max(n_docs, 1)
+
+        # Renumber documents in URI order
+        by_uri = sorted(range(n_docs), key=self.doc_uris.__getitem__)
+        rank = np.empty(n_docs, dtype=np.int64)
+        rank[by_uri] = np.arange(n_docs)
+        doc_uris = [self.doc_uris[i] for i in by_uri]
+        doc_len = np.asarray(self._doc_len, dtype=np.int32)[by_uri]
+        avgdl = int(doc_len.sum(dtype=np.int64)) / doc_count
+
+        # Renumber terms in vocabulary order
+        terms = sorted(self.terms)
+        term_rank = np.empty(len(terms), dtype=np.int32)
+        term_rank[[self.terms[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+        term_ids = term_rank[np.asarray(self._term_ids, dtype=np.int32)]
+        doc_ids = rank[np.asarray(self._doc_ids, dtype=np.int32)]
+        tf = np.asarray(self._tf, dtype=np.int32)
+        weights = np.asarray(self._weights, dtype=np.float64)
+
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tf, weights = term_ids[order], doc_ids[order], tf[order], weights[order]
+
+        # One posting per (term, document)
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+        starts = np.flatnonzero(first)
+
+        n_terms = len(self.terms)
+        df = np.bincount(term_ids[starts], minlength=n_terms)
+        # BM25 IDF with smoothing (math.log: same values as the scalar formula)
+        ratios = (doc_count - df + 0.5) / (df + 0.5) + 1.0
+        idf = np.array([math.log(r) for r in ratios.tolist()], dtype=np.float64)
+
+        dl = doc_len[doc_ids].astype(np.float64)
+        denom = tf + k1 * (1.0 - b + b * (dl / avgdl))
+        raw = idf[term_ids] * (tf * (k1 + 1.0) / denom) * weights
+        impacts = np.add.reduceat(raw, starts) if len(starts) else np.zeros(0)
+
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        # Every row has at least one posting
+        max_impacts = np.maximum.reduceat(impacts, offsets[:-1]) if n_terms else np.zeros(0)
+
+        return PostingIndex(
+            doc_uris=doc_uris,
+            doc_len=np.ascontiguousarray(doc_len, dtype=np.int32),
+            terms=terms,
+            idf=idf,
+            offsets=offsets,
+            doc_ids=doc_ids[starts].astype(np.int32),
+            impacts=impacts.astype(np.float64),
+            max_impacts=max_impacts.astype(np.float64),
+            **block_max_arrays(term_ids[starts], doc_ids[starts], impacts, n_terms),
+            avgdl=avgdl,
+        )
+
+
+def default_index_path(graph: Graph, engine: str) -> Optional[Path]:
+    """Bundle path of an engine's index for a GraphStore graph (None for loose or modified graphs)."""
+    entry = get_graph_store().entry_of(graph)
+    if entry is None or entry.modified:
+        return None
+    return compiled_artifact_path(entry.path, entry.version, f".{engine}{BM25_SUFFIX}")
+
+
+def _graph_stamp(graph: Graph) -> Dict[str, Any]:
+    """Graph identity stored in the header: sha256 of the source, or triple count for loose graphs."""
+    version = get_graph_store().version_of(graph)
+    return {"graph_version": version} if version else {"graph_triples": len(graph)}
+
+
+def _as_json(value: Any) -> Any:
+    # Settings are compared after a JSON round trip (tuples -> lists, URIRefs -> str)
+    return json.loads(json.dumps(value, default=str))
+
+
+def save_posting_bundle(
+    path: Path,
+    index: PostingIndex,
+    graph: Graph,
+    engine: str,
+    settings: Dict[str, Any],
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+    header: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """Persist an index (plus engine-specific arrays) as a memory-mappable bundle.
+
+    Older bundles of the same engine for other versions of the graph are removed.
+    """
+    path = Path(path)
+    save_bundle(
+        path,
+        {**index.to_arrays(), **(arrays or {})},
+        header={
+            "kind": "bm25_index",
+            "engine": engine,
+            "bm25_format": BM25_FORMAT_VERSION,
+            "block_shift": BLOCK_SHIFT,
+            **_graph_stamp(graph),
+            "settings": _as_json(settings),
+            "avgdl": index.avgdl,
+            "doc_count": len(index),
+            "term_count": len(index.terms),
+            "posting_count": int(len(index.doc_ids)),
+            **(header or {}),
+        },
+    )
+    entry = get_graph_store().entry_of(graph)
+    if entry is not None and path == default_index_path(graph, engine):
+        # Only this graph's older versions: "<name>.<sha16>.<engine>.bm25", never other graphs
+        for stale in stale_compiled_artifacts(entry.path, f".{engine}{BM25_SUFFIX}", path):
+            shutil.rmtree(stale, ignore_errors=True)
+    return path
+
+
+def load_posting_bundle(
+    path: Optional[Path],
+    graph: Graph,
+    engine: str,
+    settings: Dict[str, Any],
+) -> Optional[Tuple[PostingIndex, Dict[str, np.ndarray]]]:
+    """Open a persisted index memory-mapped.
+
+    Returns:
+        (index, all bundle arrays), or None if the bundle is missing, unreadable
+        or stale (different graph, settings or format)
+    """
+    if path is None:
+        return None
+    header = read_bundle_header(path)
+    if (
+        header is None
+        or header.get("kind") != "bm25_index"
+        or header.get("engine") != engine
+        or header.get("bm25_format") != BM25_FORMAT_VERSION
+        or header.get("block_shift") != BLOCK_SHIFT
+        or header.get("settings") != _as_json(settings)
+        or any(header.get(key) != value for key, value in _graph_stamp(graph).items())
+    ):
+        return None
+    try:
+        arrays, header = load_bundle(path, mmap=True)
+        return PostingIndex.from_arrays(arrays, header["avgdl"]), arrays
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Unreadable BM25 index {path}: {e}")
+        return None
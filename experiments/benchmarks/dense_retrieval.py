@@ -11,14 +11,24 @@ Date: 2026-02-15
 from __future__ import annotations
 
 import pickle
+import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 from rdflib import Graph, Literal, Namespace, URIRef
 from rdflib.namespace import DCAT, DCTERMS, FOAF, RDF, RDFS
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from knowledge_graph.facet_index import get_facet_index
+from knowledge_graph.graph_store import get_graph_store, get_shared_graph
+from knowledge_graph.mmap_store import StringColumn, load_bundle, pack_strings, save_bundle
+from knowledge_graph.model_catalog import get_model_catalog
+
 try:
     from sentence_transformers import SentenceTransformer
     SBERT_AVAILABLE = True
@@ -27,11 +37,10 @@ except ImportError:
     print("⚠️ sentence-transformers not installed. Run: pip install sentence-transformers")
 
 try:
-    import faiss
+    import faiss  # Only needed to migrate legacy .faiss/.pkl indexes
     FAISS_AVAILABLE = True
 except ImportError:
     FAISS_AVAILABLE = False
-    print("⚠️ faiss not installed. Run: pip install faiss-cpu")
 
 
 @dataclass
@@ -47,8 +56,8 @@ class DenseRetrieval:
     Dense retrieval using Sentence-BERT embeddings.
     
     Features:
-    - Pre-computed embeddings with FAISS index
-    - Fast similarity search (~10-20ms)
+    - Pre-computed, L2-normalized embeddings (exact inner-product search)
+    - Memory-mapped index: worker processes on one host share a single copy
     - Semantic understanding beyond exact matches
     """
     
@@ -65,21 +74,17 @@ class DenseRetrieval:
             graph_path: Path to RDF graph (Turtle format)
             graph: Pre-loaded RDF graph (alternative to graph_path)
             model_name: Sentence transformer model
-            index_path: Path to save/load FAISS index
+            index_path: Base path of the index (stored as ``<stem>.embeddings/``)
             rebuild_index: Force rebuild of index
         """
         if not SBERT_AVAILABLE:
             raise ImportError("sentence-transformers required. Install: pip install sentence-transformers")
         
-        if not FAISS_AVAILABLE:
-            raise ImportError("faiss required. Install: pip install faiss-cpu")
-        
         # Load graph
         if graph is not None:
             self.graph = graph
         elif graph_path is not None:
-            self.graph = Graph()
-            self.graph.parse(str(graph_path), format="turtle")
+            self.graph = get_shared_graph(graph_path)
         else:
             raise ValueError("Provide either graph_path or graph")
         
@@ -90,16 +95,19 @@ class DenseRetrieval:
         self.encoder = SentenceTransformer(model_name)
         self.embedding_dim = self.encoder.get_sentence_embedding_dimension()
         
-        # Index structures
-        self.model_uris: List[str] = []
-        self.model_texts: List[str] = []
-        self.index: Optional[faiss.Index] = None
+        # Index structures (memory-mapped once loaded)
+        self.model_uris: Sequence[str] = []
+        self.model_texts: Sequence[str] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self._catalog_ids = None  # (catalog, catalog id per row) for facet filters
         
         # Build or load index
         self.index_path = index_path or Path("dense_index.faiss")
-        self.metadata_path = self.index_path.with_suffix(".pkl")
+        self.bundle_path = self.index_path.with_suffix(".embeddings")
+        self.metadata_path = self.index_path.with_suffix(".pkl")  # Legacy FAISS metadata
         
-        if rebuild_index or not self.index_path.exists():
+        has_legacy_index = self.index_path.exists() and self.metadata_path.exists()
+        if rebuild_index or not (self.bundle_path.exists() or has_legacy_index):
             self._build_index()
         else:
             self._load_index()
@@ -165,8 +173,32 @@ class DenseRetrieval:
         
         return full_text if full_text else f"Model {model}"
     
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        """L2-normalize rows so inner product equals cosine similarity."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    def _save_bundle(self, embeddings: np.ndarray, model_name: str) -> None:
+        """Persist embeddings, URIs and texts as a memory-mappable bundle."""
+        save_bundle(
+            self.bundle_path,
+            {
+                "embeddings": embeddings.astype(np.float32),
+                **pack_strings("model_uris", self.model_uris),
+                **pack_strings("model_texts", self.model_texts),
+            },
+            header={
+                "kind": "dense_index",
+                "model_name": model_name,
+                "embedding_dim": int(embeddings.shape[1]),
+                "graph_version": get_graph_store().version_of(self.graph),
+            },
+        )
+    
     def _build_index(self):
-        """Build FAISS index with model embeddings."""
+        """Build the embedding matrix and persist it as a memory-mapped bundle."""
         print("🔨 Building dense retrieval index...")
         
         # Extract all models
@@ -194,81 +226,104 @@ class DenseRetrieval:
             convert_to_numpy=True,
         )
         
-        # Normalize for cosine similarity
-        faiss.normalize_L2(embeddings)
-        
-        # Build FAISS index (Inner Product = Cosine after normalization)
-        print(f"   Building FAISS index (dimension={self.embedding_dim})")
-        self.index = faiss.IndexFlatIP(self.embedding_dim)
-        self.index.add(embeddings.astype(np.float32))
-        
-        # Save index and metadata
-        print(f"   Saving index to {self.index_path}")
-        faiss.write_index(self.index, str(self.index_path))
+        # Normalize for cosine similarity (Inner Product = Cosine after normalization)
+        embeddings = self._normalize(embeddings)
         
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump({
-                "model_uris": self.model_uris,
-                "model_texts": self.model_texts,
-                "model_name": self.encoder._first_module().auto_model.config._name_or_path,
-            }, f)
+        # Save embeddings and metadata, then re-open memory-mapped
+        print(f"   Saving index to {self.bundle_path}")
+        self._save_bundle(embeddings, self.encoder._first_module().auto_model.config._name_or_path)
+        self._load_index()
         
         print(f"✅ Dense index built: {len(self.model_uris)} models indexed")
     
-    def _load_index(self):
-        """Load pre-built FAISS index."""
-        print(f"📂 Loading dense index from {self.index_path}")
+    def _migrate_legacy_index(self):
+        """Convert a legacy FAISS index + pickle into the memory-mapped bundle."""
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss required to migrate legacy index. Install: pip install faiss-cpu")
         
-        self.index = faiss.read_index(str(self.index_path))
+        print(f"🔄 Migrating legacy index {self.index_path} -> {self.bundle_path}")
+        index = faiss.read_index(str(self.index_path))
+        embeddings = index.reconstruct_n(0, index.ntotal)
         
         with open(self.metadata_path, "rb") as f:
             metadata = pickle.load(f)
-            self.model_uris = metadata["model_uris"]
-            self.model_texts = metadata["model_texts"]
-            model_name = metadata.get("model_name", "unknown")
+        self.model_uris = metadata["model_uris"]
+        self.model_texts = metadata["model_texts"]
+        self._save_bundle(self._normalize(embeddings), metadata.get("model_name", "unknown"))
+    
+    def _load_index(self):
+        """Load the pre-built index memory-mapped (shared page cache across workers)."""
+        if not self.bundle_path.exists():
+            self._migrate_legacy_index()
+        
+        print(f"📂 Loading dense index from {self.bundle_path}")
+        
+        arrays, header = load_bundle(self.bundle_path, mmap=True)
+        self.embeddings = arrays["embeddings"]
+        self.model_uris = StringColumn.from_arrays(arrays, "model_uris")
+        self.model_texts = StringColumn.from_arrays(arrays, "model_texts")
+        model_name = header.get("model_name", "unknown")
         
         print(f"✅ Loaded {len(self.model_uris)} models (indexed with {model_name})")
     
-    def search(self, query: str, top_k: int = 5) -> List[DenseResult]:
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[DenseResult]:
         """
         Search for models using dense retrieval.
         
         Args:
             query: Natural language query
             top_k: Number of results to return
+            filters: Facet filters (see knowledge_graph.facet_index), applied before top-k
             
         Returns:
             List of DenseResult sorted by score (descending)
         """
-        if self.index is None:
+        if self.embeddings is None:
             raise RuntimeError("Index not built. Call _build_index() first.")
         
         # Encode query
         query_emb = self.encoder.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(query_emb)  # Normalize for cosine similarity
-        
-        # Search
-        scores, indices = self.index.search(query_emb.astype(np.float32), top_k)
+        query_emb = self._normalize(query_emb)[0]  # Normalize for cosine similarity
+        
+        # Exact inner-product search over the memory-mapped matrix
+        scores = self.embeddings @ query_emb
+        if filters:
+            allowed = self._facet_mask(filters)
+            scores = np.where(allowed, scores, -np.inf)
+            top_k = min(top_k, int(allowed.sum()))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        indices = indices[np.argsort(-scores[indices], kind="stable")]
         
         # Build results
         results = []
-        for rank, (idx, score) in enumerate(zip(indices[0], scores[0]), 1):
-            if idx < len(self.model_uris):  # Valid index
-                results.append(DenseResult(
-                    model_uri=self.model_uris[idx],
-                    score=float(score),  # Cosine similarity [0, 1]
-                    rank=rank
-                ))
+        for rank, idx in enumerate(indices, 1):
+            results.append(DenseResult(
+                model_uri=self.model_uris[int(idx)],
+                score=float(scores[idx]),  # Cosine similarity [0, 1]
+                rank=rank
+            ))
         
         return results
     
+    def _facet_mask(self, filters: Dict) -> np.ndarray:
+        """Rows of the embedding matrix whose model matches the facet filters."""
+        catalog = get_model_catalog(self.graph)
+        if self._catalog_ids is None or self._catalog_ids[0] is not catalog:
+            # Catalog id of every indexed model, resolved once per graph version
+            self._catalog_ids = (catalog, catalog.model_ids(self.model_uris))
+        facets = get_facet_index(catalog)
+        return facets.contains(self._catalog_ids[1], facets.select(filters))
+    
     def get_statistics(self) -> Dict:
         """Get index statistics."""
         return {
             "num_models": len(self.model_uris),
             "embedding_dim": self.embedding_dim,
             "model_name": self.encoder._first_module().auto_model.config._name_or_path,
-            "index_type": type(self.index).__name__ if self.index else None,
+            "index_type": "FlatIP (memory-mapped)" if self.embeddings is not None else None,
         }
 
 
@@ -11,8 +11,11 @@ Date: 2026-02-15
 from __future__ import annotations
 
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+from rdflib import Graph
+
 from ontology_enhanced_bm25 import OntologyEnhancedBM25, SearchResult
 from dense_retrieval import DenseRetrieval, DenseResult
 
@@ -40,12 +43,14 @@ class HybridRetrieval:
     
     def __init__(
         self,
-        bm25_engine: OntologyEnhancedBM25,
-        dense_engine: DenseRetrieval,
+        bm25_engine: Optional[OntologyEnhancedBM25] = None,
+        dense_engine: Optional[DenseRetrieval] = None,
         fusion_method: str = "rrf",
         bm25_weight: float = 0.6,
         dense_weight: float = 0.4,
         rrf_k: int = 60,
+        graph: Optional[Graph] = None,
+        graph_path: Optional[Path] = None,
     ):
         """
         Args:
@@ -55,7 +60,20 @@ class HybridRetrieval:
             bm25_weight: Weight for BM25 scores (if weighted fusion)
             dense_weight: Weight for dense scores (if weighted fusion)
             rrf_k: Constant for RRF (typically 60)
+            graph: Graph used to build any engine not given (shared by both)
+            graph_path: Path resolved through the shared GraphStore if graph is None
         """
+        if bm25_engine is None or dense_engine is None:
+            if graph is None:
+                if graph_path is None:
+                    raise ValueError("Provide both engines, or graph / graph_path to build them")
+                from knowledge_graph.graph_store import get_shared_graph
+                graph = get_shared_graph(graph_path)
+            if bm25_engine is None:
+                bm25_engine = OntologyEnhancedBM25(graph=graph)
+            if dense_engine is None:
+                dense_engine = DenseRetrieval(graph=graph)
+        
         self.bm25_engine = bm25_engine
         self.dense_engine = dense_engine
         self.fusion_method = fusion_method
@@ -77,6 +95,7 @@ class HybridRetrieval:
         top_k: int = 5,
         bm25_top_k: int = 50,
         dense_top_k: int = 50,
+        filters: Optional[Dict] = None,
     ) -> List[HybridResult]:
         """
         Hybrid search combining BM25 and Dense retrieval.
@@ -86,6 +105,7 @@ class HybridRetrieval:
             top_k: Final number of results
             bm25_top_k: Retrieve top-N from BM25
             dense_top_k: Retrieve top-N from Dense
+            filters: Facet filters (see knowledge_graph.facet_index) for both engines
             
         Returns:
             List of HybridResult sorted by combined score
@@ -95,7 +115,8 @@ class HybridRetrieval:
         # Get results from both engines
         bm25_results_raw = self.bm25_engine.search(
             query.lower().split(),
-            top_k=bm25_top_k
+            top_k=bm25_top_k,
+            filters=filters
         )
         
         # Add ranks to BM25 results (SearchResult doesn't have rank attribute)
@@ -109,7 +130,8 @@ class HybridRetrieval:
         
         dense_results = self.dense_engine.search(
             query,
-            top_k=dense_top_k
+            top_k=dense_top_k,
+            filters=filters
         )
         
         # Fusion
@@ -277,12 +299,11 @@ def main():
     
     # Build BM25 engine
     print("\n📊 Loading BM25 with ontology...")
-    from rdflib import Graph
-    graph = Graph()
-    graph.parse(str(graph_path), format="turtle")
+    from knowledge_graph.graph_store import get_shared_graph
+    graph = get_shared_graph(graph_path)
     
     bm25 = OntologyEnhancedBM25(
-        graph_path=graph_path,
+        graph=graph,
         enable_query_expansion=True,
         enable_property_weighting=True,
         structured_boost=1.5,
@@ -321,9 +342,13 @@ def main():
     print("🔍 SEARCH COMPARISON")
     print("="*80)
     
-    from rdflib import URIRef, Namespace
-    from rdflib.namespace import DCTERMS
-    DAIMO = Namespace("http://purl.org/pionera/daimo#")
+    from knowledge_graph.model_catalog import get_model_catalog
+    catalog = get_model_catalog(graph)
+    
+    def titles(results):
+        """Titles of a page of results, hydrated in one catalog lookup."""
+        records = catalog.hydrate([r.model_uri for r in results], ("title",))
+        return [record["title"] or "Unknown" for record in records]
     
     for query in test_queries:
         print(f"\n{'='*80}")
@@ -345,33 +370,17 @@ def main():
         
         # Display BM25
         print("\n📊 BM25 with Ontology:")
-        for r in bm25_results:
-            model_uri = URIRef(r.model_uri)
-            title = "Unknown"
-            for t in graph.objects(model_uri, DCTERMS.title):
-                title = str(t)
-                break
+        for r, title in zip(bm25_results, titles(bm25_results)):
             print(f"  {r.rank}. [{r.score:6.2f}] {title[:55]}")
         
         # Display Dense
         print("\n🧠 Dense (SBERT):")
-        for r in dense_results:
-            model_uri = URIRef(r.model_uri)
-            title = "Unknown"
-            for t in graph.objects(model_uri, DCTERMS.title):
-                title = str(t)
-                break
+        for r, title in zip(dense_results, titles(dense_results)):
             print(f"  {r.rank}. [{r.score:.3f}] {title[:55]}")
         
         # Display Hybrid
         print("\n🔀 Hybrid (RRF Fusion):")
-        for r in hybrid_results:
-            model_uri = URIRef(r.model_uri)
-            title = "Unknown"
-            for t in graph.objects(model_uri, DCTERMS.title):
-                title = str(t)
-                break
-            
+        for r, title in zip(hybrid_results, titles(hybrid_results)):
             bm25_indicator = f"BM25#{r.bm25_rank}" if r.bm25_rank else "----"
             dense_indicator = f"Dense#{r.dense_rank}" if r.dense_rank else "----"
             
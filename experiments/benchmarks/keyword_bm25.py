@@ -8,13 +8,33 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
-import math
+from typing import Dict, Iterable, List, Optional
+from collections import Counter
 import re
+import sys
 
+import numpy as np
 from rdflib import Graph, Literal, Namespace, RDF, URIRef
 from rdflib.namespace import DCTERMS, DCAT, FOAF, RDFS
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from knowledge_graph.graph_store import get_shared_graph
+from knowledge_graph.facet_index import get_facet_index
+from knowledge_graph.model_catalog import get_model_catalog
+from knowledge_graph.ranking import top_k_indices
+
+from bm25_index import (
+    TOKEN_PATTERN,
+    PostingIndex,
+    PostingIndexBuilder,
+    default_index_path,
+    load_posting_bundle,
+    save_posting_bundle,
+)
+
 try:
     from rdflib.namespace import ODRL
 except ImportError:
@@ -56,14 +76,21 @@ class SearchResult:
 class KeywordBM25Baseline:
     def __init__(
         self,
-        graph_path: Path,
+        graph_path: Optional[Path] = None,
         property_uris: Optional[List[URIRef]] = None,
         k1: float = 1.5,
         b: float = 0.75,
         min_token_len: int = 2,
+        graph: Optional[Graph] = None,
+        index_path: Optional[Path] = None,
+        rebuild_index: bool = False,
     ):
-        self.graph = Graph()
-        self.graph.parse(str(graph_path), format="turtle")
+        if graph is not None:
+            self.graph = graph
+        elif graph_path is not None:
+            self.graph = get_shared_graph(graph_path)
+        else:
+            raise ValueError("Provide either graph_path or graph")
         self.DAIMO = Namespace("http://purl.org/pionera/daimo#")
 
         self.property_uris = property_uris or DEFAULT_PROPERTY_URIS
@@ -71,49 +98,61 @@ class KeywordBM25Baseline:
         self.b = b
         self.min_token_len = min_token_len
 
-        self._doc_tokens: Dict[str, List[str]] = {}
-        self._doc_len: Dict[str, int] = {}
-        self._doc_tf: Dict[str, Dict[str, int]] = {}
-        self._df: Dict[str, int] = {}
-        self._idf: Dict[str, float] = {}
-        self._inverted: Dict[str, List[Tuple[str, int]]] = {}
-        self._avgdl: float = 0.0
-
-        self._build_index()
+        # CSR postings over integer doc ids (see bm25_index)
+        self._index: Optional[PostingIndex] = None
+        self._catalog_ids = None  # (catalog, catalog id per doc) for facet filters
+
+        # Persisted next to the graph snapshot (.compiled/) unless a path is given
+        self.index_path = Path(index_path) if index_path else default_index_path(self.graph, "keyword")
+        if rebuild_index or not self.load():
+            self._build_index()
+            if self.index_path is not None:
+                try:
+                    self.save()
+                    self.load()  # re-open memory-mapped, shared with other workers
+                except OSError as e:
+                    print(f"⚠️ Could not persist BM25 index: {e}")
+
+    def _index_settings(self) -> Dict:
+        """Everything the postings depend on besides the graph (stored in the bundle header)."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "min_token_len": self.min_token_len,
+            "token_pattern": TOKEN_PATTERN,
+            "properties": [str(prop) for prop in self.property_uris],
+            "label_predicates": [str(pred) for pred in LABEL_PREDICATES],
+        }
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        """Persist the index as a memory-mappable bundle (header: graph sha256 + settings)."""
+        path = path or self.index_path
+        if path is None:
+            raise ValueError("No index path: graph is not from the GraphStore, pass index_path")
+        return save_posting_bundle(path, self._index, self.graph, "keyword", self._index_settings())
+
+    def load(self, path: Optional[Path] = None) -> bool:
+        """Open a saved index memory-mapped. Returns False if it is missing or stale."""
+        loaded = load_posting_bundle(path or self.index_path, self.graph, "keyword", self._index_settings())
+        if loaded is None:
+            return False
+        self._index, _ = loaded
+        self._catalog_ids = None
+        return True
 
     def _build_index(self) -> None:
-        models = list(self.graph.subjects(RDF.type, self.DAIMO.Model))
-        total_len = 0
+        builder = PostingIndexBuilder()
 
-        for model in models:
-            model_uri = str(model)
+        for model in self.graph.subjects(RDF.type, self.DAIMO.Model):
             text = self._extract_model_text(model)
             tokens = self._tokenize(text)
             if not tokens:
                 continue
+            builder.add_document(
+                str(model), len(tokens), ((term, tf, 1.0) for term, tf in Counter(tokens).items())
+            )
 
-            self._doc_tokens[model_uri] = tokens
-            self._doc_len[model_uri] = len(tokens)
-            total_len += len(tokens)
-
-            tf: Dict[str, int] = {}
-            for t in tokens:
-                tf[t] = tf.get(t, 0) + 1
-            self._doc_tf[model_uri] = tf
-
-            for term in set(tokens):
-                self._df[term] = self._df.get(term, 0) + 1
-
-        doc_count = max(len(self._doc_len), 1)
-        self._avgdl = total_len / doc_count
-
-        for term, df in self._df.items():
-            # BM25 IDF with smoothing
-            self._idf[term] = math.log((doc_count - df + 0.5) / (df + 0.5) + 1.0)
-
-        for doc_uri, tf in self._doc_tf.items():
-            for term, freq in tf.items():
-                self._inverted.setdefault(term, []).append((doc_uri, freq))
+        self._index = builder.build(self.k1, self.b)
 
     def _extract_model_text(self, model: URIRef) -> str:
         values: List[str] = []
@@ -151,25 +190,52 @@ class KeywordBM25Baseline:
         return s.rsplit("/", 1)[-1]
 
     def _tokenize(self, text: str) -> List[str]:
-        tokens = re.findall(r"[a-zA-Z0-9]+", text.lower())
+        tokens = re.findall(TOKEN_PATTERN, text.lower())
         return [t for t in tokens if len(t) >= self.min_token_len]
 
-    def search(self, query_tokens: Iterable[str], top_k: int = 5) -> List[SearchResult]:
+    def _facet_mask(self, doc_ids: np.ndarray, filters: Dict) -> np.ndarray:
+        """Mask of the documents whose model matches the facet filters (see knowledge_graph.facet_index)."""
+        catalog = get_model_catalog(self.graph)
+        if self._catalog_ids is None or self._catalog_ids[0] is not catalog:
+            # Catalog id of every indexed document, resolved once per graph version
+            self._catalog_ids = (catalog, catalog.model_ids(self._index.doc_uris))
+        facets = get_facet_index(catalog)
+        return facets.contains(self._catalog_ids[1][doc_ids], facets.select(filters))
+
+    def _top_k(self, scores: np.ndarray, doc_ids: np.ndarray, top_k: int, filters: Optional[Dict] = None) -> np.ndarray:
+        """Doc ids of the top_k scores among doc_ids (ties by URI), without sorting every scored document."""
+        if filters:
+            doc_ids = doc_ids[self._facet_mask(doc_ids, filters)]
+        # doc_ids are ascending and follow the URI order: positional ties are URI ties
+        return doc_ids[top_k_indices(scores[doc_ids], top_k)]
+
+    def search(
+        self,
+        query_tokens: Iterable[str],
+        top_k: int = 5,
+        filters: Optional[Dict] = None,
+        mode: str = "maxscore",
+    ) -> List[SearchResult]:
+        """Top-k BM25 search.
+
+        mode "maxscore" skips documents that cannot enter the top k (per-term
+        upper bounds, see bm25_index); "exhaustive" scores every posting. Both
+        return the same results.
+        """
+        if mode not in ("maxscore", "exhaustive"):
+            raise ValueError(f"Unknown search mode: {mode}")
         tokens = [t.lower() for t in query_tokens if t]
         if not tokens:
             return []
 
-        scores: Dict[str, float] = {}
-        for term in tokens:
-            if term not in self._idf:
-                continue
-            idf = self._idf[term]
-            postings = self._inverted.get(term, [])
-            for doc_uri, tf in postings:
-                dl = self._doc_len[doc_uri]
-                denom = tf + self.k1 * (1.0 - self.b + self.b * (dl / self._avgdl))
-                score = idf * (tf * (self.k1 + 1.0) / denom)
-                scores[doc_uri] = scores.get(doc_uri, 0.0) + score
-
-        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
-        return [SearchResult(model_uri=uri, score=score) for uri, score in ranked[:top_k]]
+        if mode == "maxscore":
+            allowed = (lambda doc_ids: self._facet_mask(doc_ids, filters)) if filters else None
+            top, top_scores = self._index.top_k(tokens, top_k, allowed=allowed)
+        else:
+            scores, matched = self._index.score(tokens)
+            top = self._top_k(scores, matched, top_k, filters)
+            top_scores = scores[top]
+        return [
+            SearchResult(model_uri=self._index.doc_uris[doc_id], score=score)
+            for doc_id, score in zip(top.tolist(), top_scores.tolist())
+        ]
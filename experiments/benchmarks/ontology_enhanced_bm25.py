@@ -16,73 +16,41 @@ from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Set, Tuple
-import math
+from collections import Counter
 import re
+import sys
 
+import numpy as np
 from rdflib import Graph, Literal, Namespace, RDF, URIRef
 from rdflib.namespace import DCTERMS, DCAT, FOAF, RDFS
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from knowledge_graph.graph_store import get_shared_graph
+from knowledge_graph.facet_index import get_facet_index
+from knowledge_graph.mmap_store import StringColumn, pack_strings
+from knowledge_graph.model_catalog import get_model_catalog
+from knowledge_graph.ranking import top_k_indices
+
+from bm25_index import (
+    TOKEN_PATTERN,
+    PostingIndex,
+    PostingIndexBuilder,
+    default_index_path,
+    load_posting_bundle,
+    save_posting_bundle,
+)
+# The expansion tables moved to query_expansion; re-exported for existing importers
+from query_expansion import ABBREVIATION_EXPANSIONS, QUERY_EXPANSIONS, expand_query  # noqa: F401
+
 try:
     from rdflib.namespace import ODRL
 except ImportError:
     ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
 
 
-# Domain-specific synonym expansions for AI/ML queries
-QUERY_EXPANSIONS = {
-    # Programming libraries/frameworks
-    "pytorch": ["pytorch", "torch", "pt"],
-    "tensorflow": ["tensorflow", "tf", "keras"],
-    "transformers": ["transformers", "transformer", "huggingface", "hf"],
-    "scikit": ["scikit", "sklearn", "scikit-learn"],
-    "jax": ["jax", "flax"],
-    
-    # Tasks - Computer Vision
-    "image classification": ["image-classification", "image classification", "computer vision", "cv", "vision"],
-    "object detection": ["object-detection", "object detection", "detection", "yolo", "rcnn"],
-    "segmentation": ["segmentation", "semantic-segmentation", "instance-segmentation", "image-segmentation"],
-    "image generation": ["image-generation", "text-to-image", "image generation", "diffusion", "gan"],
-    
-    # Tasks - NLP
-    "nlp": ["nlp", "natural language", "text", "language"],
-    "text classification": ["text-classification", "text classification", "sentiment", "classification"],
-    "text generation": ["text-generation", "text generation", "language-modeling", "generation"],
-    "translation": ["translation", "text-translation", "machine-translation"],
-    "question answering": ["question-answering", "question answering", "qa", "squad"],
-    "summarization": ["summarization", "text-summarization", "abstractive", "extractive"],
-    
-    # Tasks - Audio
-    "audio": ["audio", "speech", "sound"],
-    "speech recognition": ["speech-recognition", "asr", "automatic-speech-recognition", "speech-to-text"],
-    
-    # Tasks - Multimodal
-    "multimodal": ["multimodal", "vision-language", "image-text"],
-    
-    # Model types
-    "cnn": ["cnn", "convolutional", "convnet"],
-    "rnn": ["rnn", "recurrent", "lstm", "gru"],
-    "transformer": ["transformer", "attention", "bert", "gpt"],
-    
-    # General ML terms
-    "deep learning": ["deep-learning", "deep learning", "dl", "neural network", "neural-network"],
-    "machine learning": ["machine-learning", "machine learning", "ml"],
-    "pretrained": ["pretrained", "pre-trained", "finetuned", "fine-tuned"],
-}
-
-# Normalize common abbreviations
-ABBREVIATION_EXPANSIONS = {
-    "dl": ["deep learning", "deep-learning"],
-    "ml": ["machine learning", "machine-learning"],
-    "cv": ["computer vision", "computer-vision"],
-    "nlp": ["natural language processing", "natural-language-processing"],
-    "asr": ["automatic speech recognition", "speech recognition"],
-    "qa": ["question answering", "question-answering"],
-    "gan": ["generative adversarial network"],
-    "vae": ["variational autoencoder"],
-    "bert": ["bert", "bidirectional encoder representations"],
-    "gpt": ["gpt", "generative pre-trained transformer"],
-}
-
 # Property weights (higher = more important)
 PROPERTY_WEIGHTS = {
     # Highly structured, precise fields
@@ -106,6 +74,13 @@ PROPERTY_WEIGHTS = {
     DCTERMS.creator: 0.8,
 }
 
+# Structured fields whose exact values boost matching queries
+STRUCTURED_BOOST_PROPERTIES = [
+    URIRef("http://purl.org/pionera/daimo#task"),
+    URIRef("http://purl.org/pionera/daimo#library"),
+    URIRef("http://purl.org/pionera/daimo#framework"),
+]
+
 
 @dataclass
 class SearchResult:
@@ -127,13 +102,16 @@ class OntologyEnhancedBM25:
     
     def __init__(
         self,
-        graph_path: Path,
+        graph_path: Optional[Path] = None,
         k1: float = 1.5,
         b: float = 0.75,
         min_token_len: int = 2,
         enable_query_expansion: bool = True,
         enable_property_weighting: bool = True,
         structured_boost: float = 1.5,
+        graph: Optional[Graph] = None,
+        index_path: Optional[Path] = None,
+        rebuild_index: bool = False,
     ):
         """
         Args:
@@ -144,9 +122,16 @@ class OntologyEnhancedBM25:
             enable_query_expansion: Enable semantic query expansion
             enable_property_weighting: Enable property-specific weights
             structured_boost: Boost factor for structured field exact matches
+            graph: Pre-loaded RDF graph (alternative to graph_path, shared as-is)
+            index_path: Bundle of the persisted index (default: next to the graph snapshot)
+            rebuild_index: Rebuild the index even if a fresh bundle exists
         """
-        self.graph = Graph()
-        self.graph.parse(str(graph_path), format="turtle")
+        if graph is not None:
+            self.graph = graph
+        elif graph_path is not None:
+            self.graph = get_shared_graph(graph_path)
+        else:
+            raise ValueError("Provide either graph_path or graph")
         self.DAIMO = Namespace("http://purl.org/pionera/daimo#")
 
         self.k1 = k1
@@ -156,27 +141,96 @@ class OntologyEnhancedBM25:
         self.enable_property_weighting = enable_property_weighting
         self.structured_boost = structured_boost
 
-        # Index structures
-        self._doc_tokens: Dict[str, List[str]] = {}
-        self._doc_len: Dict[str, int] = {}
-        self._doc_tf: Dict[str, Dict[str, int]] = {}
-        self._doc_property_terms: Dict[str, Dict[str, Set[str]]] = {}  # doc -> property -> terms
-        self._df: Dict[str, int] = {}
-        self._idf: Dict[str, float] = {}
-        self._inverted: Dict[str, List[Tuple[str, int, str]]] = {}  # term -> [(doc, tf, property)]
-        self._avgdl: float = 0.0
-        
-        # Structured field values for exact matching
-        self._structured_values: Dict[str, Dict[str, Set[str]]] = {}  # doc -> field -> values
-
-        self._build_index()
+        # CSR postings over integer doc ids, property weights folded into the impacts
+        self._index: Optional[PostingIndex] = None
+        self._catalog_ids = None  # (catalog, catalog id per doc) for facet filters
+
+        # Structured field values for exact matching: one entry per (doc, field, value),
+        # entries sorted by doc id
+        self._structured_values: List[str] = []              # value id -> lowercased value
+        self._structured_value_tokens: List[Set[str]] = []   # value id -> tokens
+        self._structured_docs = np.zeros(0, dtype=np.int32)       # entry -> doc id
+        self._structured_value_ids = np.zeros(0, dtype=np.int32)  # entry -> value id
+        self._max_structured_entries = 0                          # bound of entries per doc
+
+        # Persisted next to the graph snapshot (.compiled/) unless a path is given
+        self.index_path = Path(index_path) if index_path else default_index_path(self.graph, "ontology")
+        if rebuild_index or not self.load():
+            self._build_index()
+            if self.index_path is not None:
+                try:
+                    self.save()
+                    self.load()  # re-open memory-mapped, shared with other workers
+                except OSError as e:
+                    print(f"⚠️ Could not persist BM25 index: {e}")
+
+    def _index_settings(self) -> Dict:
+        """Everything the postings depend on besides the graph (stored in the bundle header)."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "min_token_len": self.min_token_len,
+            "token_pattern": TOKEN_PATTERN,
+            "property_weights": {
+                str(prop): self._calculate_property_weight(str(prop)) for prop in PROPERTY_WEIGHTS
+            },
+            "structured_properties": [str(prop) for prop in STRUCTURED_BOOST_PROPERTIES],
+        }
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        """Persist the index as a memory-mappable bundle (header: graph sha256 + settings)."""
+        path = path or self.index_path
+        if path is None:
+            raise ValueError("No index path: graph is not from the GraphStore, pass index_path")
+        return save_posting_bundle(
+            path,
+            self._index,
+            self.graph,
+            "ontology",
+            self._index_settings(),
+            arrays={
+                "structured_docs": self._structured_docs,
+                "structured_value_ids": self._structured_value_ids,
+                **pack_strings("structured_values", self._structured_values),
+            },
+            # Query-time only (not part of staleness), recorded for provenance
+            header={
+                "query_settings": {
+                    "enable_query_expansion": self.enable_query_expansion,
+                    "structured_boost": self.structured_boost,
+                },
+            },
+        )
+
+    def load(self, path: Optional[Path] = None) -> bool:
+        """Open a saved index memory-mapped. Returns False if it is missing or stale."""
+        loaded = load_posting_bundle(path or self.index_path, self.graph, "ontology", self._index_settings())
+        if loaded is None:
+            return False
+        self._index, arrays = loaded
+        self._set_structured(
+            list(StringColumn.from_arrays(arrays, "structured_values")),
+            arrays["structured_docs"],
+            arrays["structured_value_ids"],
+        )
+        self._catalog_ids = None
+        return True
+
+    def _set_structured(self, values: List[str], doc_ids: np.ndarray, value_ids: np.ndarray) -> None:
+        """Install the structured field entries (sorted by doc id)."""
+        self._structured_values = values
+        self._structured_value_tokens = [set(self._tokenize(value)) for value in values]
+        self._structured_docs = doc_ids
+        self._structured_value_ids = value_ids
+        self._max_structured_entries = int(np.bincount(doc_ids).max()) if len(doc_ids) else 0
 
     def _build_index(self) -> None:
         """Build inverted index with property information"""
-        models = list(self.graph.subjects(RDF.type, self.DAIMO.Model))
-        total_len = 0
+        builder = PostingIndexBuilder()
+        structured: List[Tuple[str, str]] = []  # (doc, value) per structured field value
+        boost_props = [str(prop) for prop in STRUCTURED_BOOST_PROPERTIES]
 
-        for model in models:
+        for model in self.graph.subjects(RDF.type, self.DAIMO.Model):
             model_uri = str(model)
             
             # Extract text with property tracking
@@ -185,36 +239,31 @@ class OntologyEnhancedBM25:
             if not all_tokens:
                 continue
 
-            self._doc_tokens[model_uri] = all_tokens
-            self._doc_len[model_uri] = len(all_tokens)
-            self._doc_property_terms[model_uri] = property_terms
-            self._structured_values[model_uri] = structured_values
-            total_len += len(all_tokens)
-
-            # Term frequency
-            tf: Dict[str, int] = {}
-            for t in all_tokens:
-                tf[t] = tf.get(t, 0) + 1
-            self._doc_tf[model_uri] = tf
-
-            # Document frequency
-            for term in set(all_tokens):
-                self._df[term] = self._df.get(term, 0) + 1
-
-        doc_count = max(len(self._doc_len), 1)
-        self._avgdl = total_len / doc_count
-
-        # IDF calculation with smoothing
-        for term, df in self._df.items():
-            self._idf[term] = math.log((doc_count - df + 0.5) / (df + 0.5) + 1.0)
-
-        # Build inverted index with property information
-        for doc_uri, terms_by_prop in self._doc_property_terms.items():
-            for prop, terms in terms_by_prop.items():
-                for term in terms:
-                    tf = self._doc_tf[doc_uri].get(term, 0)
-                    if tf > 0:
-                        self._inverted.setdefault(term, []).append((doc_uri, tf, prop))
+            # One posting per (term, property) in the document, with the document tf
+            tf = Counter(all_tokens)
+            builder.add_document(
+                model_uri,
+                len(all_tokens),
+                (
+                    (term, tf[term], self._calculate_property_weight(prop))
+                    for prop, terms in property_terms.items()
+                    for term in terms
+                ),
+            )
+            for prop in boost_props:
+                for value in structured_values.get(prop, ()):
+                    structured.append((model_uri, value))
+
+        self._index = builder.build(self.k1, self.b)
+
+        doc_ids = {uri: doc_id for doc_id, uri in enumerate(self._index.doc_uris)}
+        value_ids: Dict[str, int] = {}
+        for _, value in structured:
+            value_ids.setdefault(value, len(value_ids))
+        entry_docs = np.array([doc_ids[uri] for uri, _ in structured], dtype=np.int32)
+        entry_values = np.array([value_ids[value] for _, value in structured], dtype=np.int32)
+        by_doc = np.argsort(entry_docs, kind="stable")
+        self._set_structured(list(value_ids), entry_docs[by_doc], entry_values[by_doc])
 
     def _extract_model_text_enhanced(
         self, model: URIRef
@@ -285,7 +334,7 @@ class OntologyEnhancedBM25:
 
     def _tokenize(self, text: str) -> List[str]:
         """Tokenize text into searchable terms"""
-        tokens = re.findall(r"[a-zA-Z0-9]+", text.lower())
+        tokens = re.findall(TOKEN_PATTERN, text.lower())
         return [t for t in tokens if len(t) >= self.min_token_len]
 
     def _expand_query(self, query_tokens: List[str]) -> List[str]:
@@ -299,23 +348,9 @@ class OntologyEnhancedBM25:
         if not self.enable_query_expansion:
             return query_tokens
 
-        expanded = set(query_tokens)
-        query_text = " ".join(query_tokens).lower()
-
-        # Check for multi-word expansions first
-        for key, expansions in QUERY_EXPANSIONS.items():
-            if key in query_text:
-                # Add expanded terms
-                for exp in expansions:
-                    expanded.update(exp.split())
-
-        # Check for abbreviations
-        for token in query_tokens:
-            if token.lower() in ABBREVIATION_EXPANSIONS:
-                for exp in ABBREVIATION_EXPANSIONS[token.lower()]:
-                    expanded.update(exp.split())
-
-        return list(expanded)
+        # Phrase keys and abbreviations compiled into one automaton (query_expansion),
+        # memoized per normalized query
+        return expand_query(query_tokens)
 
     def _calculate_property_weight(self, property_uri: str) -> float:
         """Get weight for a property (higher = more important)"""
@@ -325,104 +360,118 @@ class OntologyEnhancedBM25:
         prop = URIRef(property_uri)
         return PROPERTY_WEIGHTS.get(prop, 1.0)
 
-    def _check_structured_match(
-        self, doc_uri: str, query_tokens: List[str]
-    ) -> float:
+    def _value_boosts(self, query_tokens: List[str]) -> np.ndarray:
         """
-        Check if query matches structured field values exactly.
+        Boost of each distinct structured field value for the query.
         
         Example: Query "pytorch image classification" should boost models with:
         - library = "pytorch" (exact match)
         - task = "image-classification" (exact match after normalization)
         """
-        if doc_uri not in self._structured_values:
-            return 0.0
-
-        structured_vals = self._structured_values[doc_uri]
-        query_text = " ".join(query_tokens).lower()
-        
-        boost = 0.0
-        
-        # Check high-value structured fields
-        for prop in [
-            str(self.DAIMO.task),
-            str(self.DAIMO.library),
-            str(self.DAIMO.framework),
-        ]:
-            if prop in structured_vals:
-                for value in structured_vals[prop]:
-                    # Exact match or high overlap
-                    value_tokens = set(self._tokenize(value))
-                    query_token_set = set(query_tokens)
-                    
-                    if value_tokens.issubset(query_token_set) or query_token_set.issubset(value_tokens):
-                        # Strong match
-                        boost += self.structured_boost
-                    elif len(value_tokens & query_token_set) >= len(value_tokens) * 0.5:
-                        # Partial match
-                        boost += self.structured_boost * 0.5
-
-        return boost
-
-    def search(self, query_tokens: Iterable[str], top_k: int = 5) -> List[SearchResult]:
+        query_token_set = set(query_tokens)
+
+        value_boosts = np.zeros(len(self._structured_values), dtype=np.float64)
+        for value_id, value_tokens in enumerate(self._structured_value_tokens):
+            if value_tokens.issubset(query_token_set) or query_token_set.issubset(value_tokens):
+                # Strong match
+                value_boosts[value_id] = self.structured_boost
+            elif len(value_tokens & query_token_set) >= len(value_tokens) * 0.5:
+                # Partial match
+                value_boosts[value_id] = self.structured_boost * 0.5
+        return value_boosts
+
+    def _doc_boosts(self, value_boosts: np.ndarray, doc_ids: np.ndarray) -> np.ndarray:
+        """Structured boost of each doc id: its value boosts summed, kept only if positive."""
+        lo = np.searchsorted(self._structured_docs, doc_ids, side="left")
+        counts = np.searchsorted(self._structured_docs, doc_ids, side="right") - lo
+        # Entry positions of every document, grouped by document
+        entries = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        boosts = np.bincount(
+            np.repeat(np.arange(len(doc_ids)), counts),
+            weights=value_boosts[self._structured_value_ids[entries]],
+            minlength=len(doc_ids),
+        )
+        return np.where(boosts > 0, boosts, 0.0)
+
+    def _facet_mask(self, doc_ids: np.ndarray, filters: Dict) -> np.ndarray:
+        """Mask of the documents whose model matches the facet filters (see knowledge_graph.facet_index)."""
+        catalog = get_model_catalog(self.graph)
+        if self._catalog_ids is None or self._catalog_ids[0] is not catalog:
+            # Catalog id of every indexed document, resolved once per graph version
+            self._catalog_ids = (catalog, catalog.model_ids(self._index.doc_uris))
+        facets = get_facet_index(catalog)
+        return facets.contains(self._catalog_ids[1][doc_ids], facets.select(filters))
+
+    def _top_k(self, scores: np.ndarray, doc_ids: np.ndarray, top_k: int, filters: Optional[Dict] = None) -> np.ndarray:
+        """Doc ids of the top_k scores among doc_ids (ties by URI), without sorting every scored document."""
+        if filters:
+            doc_ids = doc_ids[self._facet_mask(doc_ids, filters)]
+        # doc_ids are ascending and follow the URI order: positional ties are URI ties
+        return doc_ids[top_k_indices(scores[doc_ids], top_k)]
+
+    def search(
+        self,
+        query_tokens: Iterable[str],
+        top_k: int = 5,
+        filters: Optional[Dict] = None,
+        mode: str = "maxscore",
+    ) -> List[SearchResult]:
         """
         Search with ontology-enhanced BM25.
         
         Args:
             query_tokens: Query terms (can be single words or phrases)
             top_k: Number of results to return
+            filters: Facet filters, e.g. {"library": ["pytorch"], "not": {"license": "unknown"}}
+            mode: "maxscore" (skip documents that cannot enter the top k) or
+                "exhaustive" (score every posting); both return the same results
             
         Returns:
             Ranked list of SearchResult objects
         """
+        if mode not in ("maxscore", "exhaustive"):
+            raise ValueError(f"Unknown search mode: {mode}")
         tokens = [t.lower() for t in query_tokens if t]
         if not tokens:
             return []
 
         # 1. Query expansion
         expanded_tokens = self._expand_query(tokens)
-        
-        # 2. Standard BM25 scoring with property weights
-        scores: Dict[str, float] = {}
-        matched_terms: Dict[str, Set[str]] = {}
-        
-        for term in expanded_tokens:
-            if term not in self._idf:
-                continue
-            
-            idf = self._idf[term]
-            postings = self._inverted.get(term, [])
-            
-            for doc_uri, tf, prop in postings:
-                dl = self._doc_len[doc_uri]
-                
-                # Standard BM25 score
-                denom = tf + self.k1 * (1.0 - self.b + self.b * (dl / self._avgdl))
-                bm25_score = idf * (tf * (self.k1 + 1.0) / denom)
-                
-                # Apply property weight
-                prop_weight = self._calculate_property_weight(prop)
-                weighted_score = bm25_score * prop_weight
-                
-                scores[doc_uri] = scores.get(doc_uri, 0.0) + weighted_score
-                matched_terms.setdefault(doc_uri, set()).add(term)
+        value_boosts = self._value_boosts(tokens)
+
+        if mode == "maxscore":
+            # 2-4. Top-k with per-term upper bounds; the structured boost is bounded
+            # by the most entries of a document times the largest value boost
+            top, top_scores = self._index.top_k(
+                expanded_tokens,
+                top_k,
+                bonus=lambda doc_ids: self._doc_boosts(value_boosts, doc_ids),
+                bonus_bound=self._max_structured_entries * max(float(value_boosts.max(initial=0.0)), 0.0),
+                allowed=(lambda doc_ids: self._facet_mask(doc_ids, filters)) if filters else None,
+            )
+        else:
+            # 2. BM25 scoring: gather-and-sum of the property-weighted impacts
+            scores, matched = self._index.score(expanded_tokens)
 
-        # 3. Apply structured field boost
-        for doc_uri in list(scores.keys()):
-            struct_boost = self._check_structured_match(doc_uri, tokens)
-            if struct_boost > 0:
-                scores[doc_uri] += struct_boost
+            # 3. Apply structured field boost to the matched documents
+            scores[matched] += self._doc_boosts(value_boosts, matched)
 
-        # 4. Rank and return
-        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+            # 4. Rank (partial top-k selection)
+            top = self._top_k(scores, matched, top_k, filters)
+            top_scores = scores[top]
+
+        matched_terms = {doc_id: set() for doc_id in top.tolist()}
+        for term in expanded_tokens:
+            for doc_id in top[self._index.contains(term, top)].tolist():
+                matched_terms[doc_id].add(term)
         
         return [
             SearchResult(
-                model_uri=uri,
-                score=score,
-                matched_terms=matched_terms.get(uri)
+                model_uri=self._index.doc_uris[doc_id],
+                score=float(score),
+                matched_terms=matched_terms[doc_id] or None
             )
-            for uri, score in ranked[:top_k]
+            for doc_id, score in zip(top.tolist(), top_scores.tolist())
         ]
 
 
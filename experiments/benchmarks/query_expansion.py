@@ -0,0 +1,177 @@
+"""
+Compiled query expansion for the BM25 engines.
+
+``OntologyEnhancedBM25._expand_query`` used to test every key of
+``QUERY_EXPANSIONS`` as a substring of the joined query text and then look up
+every token in ``ABBREVIATION_EXPANSIONS``, on each search. Here both tables
+are compiled once, at import time, into a ``QueryExpander``:
+
+- The phrase keys go into a character-level Aho-Corasick automaton, so one
+  pass over the query text finds every key it contains (keys spanning several
+  tokens and keys inside longer tokens match exactly as with ``in``).
+- Each key and abbreviation maps to its expansion terms, already split.
+- ``expand`` is memoized per normalized (lowercased) token tuple.
+
+Expansion is O(query length + matches) and the result is the same term set as
+the substring loop; terms come out in a deterministic order (query tokens,
+then expansions in table order).
+
+Usage:
+    from query_expansion import expand_query
+    expand_query(["pytorch", "image", "classification"])
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+
+# Domain-specific synonym expansions for AI/ML queries
+QUERY_EXPANSIONS = {
+    # Programming libraries/frameworks
+    "pytorch": ["pytorch", "torch", "pt"],
+    "tensorflow": ["tensorflow", "tf", "keras"],
+    "transformers": ["transformers", "transformer", "huggingface", "hf"],
+    "scikit": ["scikit", "sklearn", "scikit-learn"],
+    "jax": ["jax", "flax"],
+    
+    # Tasks - Computer Vision
+    "image classification": ["image-classification", "image classification", "computer vision", "cv", "vision"],
+    "object detection": ["object-detection", "object detection", "detection", "yolo", "rcnn"],
+    "segmentation": ["segmentation", "semantic-segmentation", "instance-segmentation", "image-segmentation"],
+    "image generation": ["image-generation", "text-to-image", "image generation", "diffusion", "gan"],
+    
+    # Tasks - NLP
+    "nlp": ["nlp", "natural language", "text", "language"],
+    "text classification": ["text-classification", "text classification", "sentiment", "classification"],
+    "text generation": ["text-generation", "text generation", "language-modeling", "generation"],
+    "translation": ["translation", "text-translation", "machine-translation"],
+    "question answering": ["question-answering", "question answering", "qa", "squad"],
+    "summarization": ["summarization", "text-summarization", "abstractive", "extractive"],
+    
+    # Tasks - Audio
+    "audio": ["audio", "speech", "sound"],
+    "speech recognition": ["speech-recognition", "asr", "automatic-speech-recognition", "speech-to-text"],
+    
+    # Tasks - Multimodal
+    "multimodal": ["multimodal", "vision-language", "image-text"],
+    
+    # Model types
+    "cnn": ["cnn", "convolutional", "convnet"],
+    "rnn": ["rnn", "recurrent", "lstm", "gru"],
+    "transformer": ["transformer", "attention", "bert", "gpt"],
+    
+    # General ML terms
+    "deep learning": ["deep-learning", "deep learning", "dl", "neural network", "neural-network"],
+    "machine learning": ["machine-learning", "machine learning", "ml"],
+    "pretrained": ["pretrained", "pre-trained", "finetuned", "fine-tuned"],
+}
+
+# Normalize common abbreviations
+ABBREVIATION_EXPANSIONS = {
+    "dl": ["deep learning", "deep-learning"],
+    "ml": ["machine learning", "machine-learning"],
+    "cv": ["computer vision", "computer-vision"],
+    "nlp": ["natural language processing", "natural-language-processing"],
+    "asr": ["automatic speech recognition", "speech recognition"],
+    "qa": ["question answering", "question-answering"],
+    "gan": ["generative adversarial network"],
+    "vae": ["variational autoencoder"],
+    "bert": ["bert", "bidirectional encoder representations"],
+    "gpt": ["gpt", "generative pre-trained transformer"],
+}
+
+# Distinct normalized queries kept by the memo of each expander
+EXPANSION_CACHE_SIZE = 4096
+
+
+class QueryExpander:
+    """Phrase and abbreviation tables compiled into an Aho-Corasick automaton."""
+
+    def __init__(
+        self,
+        phrases: Mapping[str, Sequence[str]],
+        abbreviations: Mapping[str, Sequence[str]],
+        cache_size: int = EXPANSION_CACHE_SIZE,
+    ):
+        # Expansion terms of each phrase key, in table order
+        self._phrase_terms: List[Tuple[str, ...]] = [_split_terms(exps) for exps in phrases.values()]
+        self._abbreviation_terms: Dict[str, Tuple[str, ...]] = {
+            key.lower(): _split_terms(exps) for key, exps in abbreviations.items()
+        }
+        self._goto, self._outputs = _compile_automaton([key.lower() for key in phrases])
+        self.expand = lru_cache(maxsize=cache_size)(self._expand)
+
+    def matches(self, text: str) -> List[int]:
+        """Indices of the phrase keys found in ``text`` (sorted, no repeats)"""
+        goto, outputs = self._goto, self._outputs
+        state, found = 0, set()
+        for char in text:
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return sorted(found)
+
+    def _expand(self, tokens: Tuple[str, ...]) -> Tuple[str, ...]:
+        expanded = dict.fromkeys(tokens)
+        for key in self.matches(" ".join(tokens)):
+            expanded.update(dict.fromkeys(self._phrase_terms[key]))
+        for token in tokens:
+            expanded.update(dict.fromkeys(self._abbreviation_terms.get(token, ())))
+        return tuple(expanded)
+
+    def __call__(self, query_tokens: Iterable[str]) -> List[str]:
+        """Query tokens plus their expansion terms (each term once)"""
+        return list(self.expand(tuple(token.lower() for token in query_tokens)))
+
+
+def _split_terms(expansions: Sequence[str]) -> Tuple[str, ...]:
+    """Whitespace-split terms of a list of expansions, first occurrence kept"""
+    return tuple(dict.fromkeys(term for expansion in expansions for term in expansion.split()))
+
+
+def _compile_automaton(keys: Sequence[str]) -> Tuple[List[Dict[str, int]], List[Tuple[int, ...]]]:
+    """
+    Aho-Corasick automaton of ``keys`` as a full transition table.
+
+    Returns:
+        (goto, outputs): ``goto[state]`` maps a character to the next state
+        (missing = back to the root) and ``outputs[state]`` lists the keys
+        ending at that state, including those reached through failure links.
+    """
+    goto: List[Dict[str, int]] = [{}]
+    outputs: List[List[int]] = [[]]
+    for index, key in enumerate(keys):
+        state = 0
+        for char in key:
+            if char not in goto[state]:
+                goto.append({})
+                outputs.append([])
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        outputs[state].append(index)
+
+    # Breadth-first: failure links, then the missing transitions of each
+    # state are copied from its failure state (a DFA, no fallback loop)
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        outputs[state].extend(outputs[fail[state]])
+        for char, child in goto[state].items():
+            queue.append(child)
+            fail[child] = goto[fail[state]].get(char, 0) if state else 0
+        for char, target in goto[fail[state]].items():
+            goto[state].setdefault(char, target)
+    return goto, [tuple(out) for out in outputs]
+
+
+# Compiled once at import time, shared by every engine
+DEFAULT_EXPANDER = QueryExpander(QUERY_EXPANSIONS, ABBREVIATION_EXPANSIONS)
+
+
+def expand_query(query_tokens: Iterable[str]) -> List[str]:
+    """Expand a query with the default tables (memoized per normalized query)"""
+    return DEFAULT_EXPANDER(query_tokens)
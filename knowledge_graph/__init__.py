@@ -1,6 +1,71 @@
-"""Módulo de construcción del grafo de conocimiento."""
+"""
+Módulo de construcción del grafo de conocimiento.
 
-from .build_graph import DAIMOGraphBuilder
-from .multi_repository_builder import MultiRepositoryGraphBuilder, sanitize_string, sanitize_uri
+Los símbolos públicos se importan bajo demanda (``__getattr__``): importar el
+paquete no carga ningún submódulo, así que ``python -m knowledge_graph.<módulo>``
+ejecuta una sola copia del módulo y de su estado (GraphStore, stores abiertos,
+cachés).
+"""
 
-__all__ = ["DAIMOGraphBuilder", "MultiRepositoryGraphBuilder", "sanitize_string", "sanitize_uri"]
+import importlib
+
+# Símbolo público -> submódulo que lo define
+_EXPORTS = {
+    "DAIMOGraphBuilder": "build_graph",
+    "MultiRepositoryGraphBuilder": "multi_repository_builder",
+    "sanitize_string": "multi_repository_builder",
+    "sanitize_uri": "multi_repository_builder",
+    "compile_snapshot": "graph_snapshot",
+    "load_graph": "graph_snapshot",
+    "parse_graph": "graph_snapshot",
+    "read_graph": "ntriples_io",
+    "write_graph": "ntriples_io",
+    "GraphStore": "graph_store",
+    "get_graph_store": "graph_store",
+    "get_shared_graph": "graph_store",
+    "ModelCatalog": "model_catalog",
+    "get_model_catalog": "model_catalog",
+    "get_graph_statistics": "model_catalog",
+    "RankingWeights": "ranking",
+    "get_ranking_features": "ranking",
+    "top_k_indices": "ranking",
+    "FacetIndex": "facet_index",
+    "get_facet_index": "facet_index",
+    "facet_mask": "facet_index",
+    "open_graph": "graph_backends",
+    "ChangeSet": "incremental",
+    "IncrementalGraph": "incremental",
+    "ColumnarIndex": "columnar_sparql",
+    "query_columnar": "columnar_sparql",
+    "TextIndex": "text_index",
+    "get_text_index": "text_index",
+    "QueryOptimizer": "sparql_optimizer",
+    "optimize_query": "sparql_optimizer",
+    "PreparedQueryCache": "sparql_cache",
+    "get_query_cache": "sparql_cache",
+    "QueryResultCache": "sparql_cache",
+    "get_result_cache": "sparql_cache",
+    "run_query": "sparql_cache",
+    "ResultPage": "sparql_pages",
+    "query_page": "sparql_pages",
+    "encode_page_token": "sparql_pages",
+    "decode_page_token": "sparql_pages",
+    "QueryBudget": "query_budget",
+    "estimate_cost": "query_budget",
+    "execute_with_budget": "query_budget",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
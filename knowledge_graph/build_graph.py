@@ -29,6 +29,11 @@ from datetime import datetime
 from rdflib import Graph, Namespace, Literal, URIRef, RDF, RDFS, XSD
 from rdflib.namespace import FOAF, DCTERMS
 
+try:
+    from .ntriples_io import STREAMING_FORMATS, split_compression, write_graph
+except ImportError:  # Ejecutado como script: python knowledge_graph/build_graph.py
+    from ntriples_io import STREAMING_FORMATS, split_compression, write_graph
+
 
 class DAIMOGraphBuilder:
     """
@@ -317,20 +322,30 @@ class DAIMOGraphBuilder:
         
         return models_added
     
-    def save(self, output_path: str, format: str = "turtle"):
+    def save(self, output_path: str, format: str = "turtle", streaming: Optional[bool] = None):
         """
         Guarda el grafo en un archivo.
         
         Args:
-            output_path: Ruta del archivo de salida
-            format: Formato de serialización (turtle, xml, nt, json-ld)
+            output_path: Ruta del archivo de salida (.gz/.zst para comprimir)
+            format: Formato de serialización (turtle, xml, nt, nquads, json-ld)
+            streaming: Escribir turtle/nt/nquads línea a línea (memoria acotada)
+                en lugar del serializador de rdflib. Por defecto solo para
+                nt/nquads y salidas comprimidas; el Turtle sin comprimir
+                mantiene el formato agrupado de rdflib
         """
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
+        if streaming is None:
+            streaming = format in ("nt", "nquads") or split_compression(output_file)[1] is not None
+        
         print(f"💾 Guardando grafo en: {output_file} (formato: {format})")
         
-        self.graph.serialize(destination=str(output_file), format=format, encoding='utf-8')
+        if streaming and format in STREAMING_FORMATS:
+            write_graph(self.graph, output_file, format=format)
+        else:
+            self.graph.serialize(destination=str(output_file), format=format, encoding='utf-8')
         
         print(f"✅ Grafo guardado exitosamente")
         
@@ -439,9 +454,14 @@ def main():
         "--format",
         type=str,
         default="turtle",
-        choices=["turtle", "xml", "nt", "json-ld"],
+        choices=["turtle", "xml", "nt", "nquads", "json-ld"],
         help="Formato de serialización RDF"
     )
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Usar el serializador de rdflib (Turtle agrupado, más lento) también en salidas nt/nquads o comprimidas"
+    )
     parser.add_argument(
         "--ontology",
         type=str,
@@ -454,7 +474,7 @@ def main():
     # Construir grafo
     builder = DAIMOGraphBuilder(ontology_path=args.ontology)
     builder.build_from_json(args.input)
-    builder.save(args.output, format=args.format)
+    builder.save(args.output, format=args.format, streaming=False if args.pretty else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,1279 @@
+"""
+Motor SPARQL columnar sobre triples codificados como enteros.
+
+El evaluador de rdflib recorre las soluciones fila a fila en Python, y domina
+el tiempo de las consultas generadas por el LLM (patrones básicos sobre
+``daimo:Model`` con ``daimo:task``, ``daimo:library``, ``dcterms:source`` y
+``odrl:hasPolicy/dcterms:identifier``). Este módulo evalúa el álgebra de la
+consulta ya compilada por rdflib como operaciones NumPy sobre el snapshot
+compilado (diccionario de términos + triples ``int32``):
+
+- BGP: cada patrón se resuelve con ``searchsorted`` sobre permutaciones
+  ordenadas (p,s,o), (p,o,s), (s,p,o) y (o,s,p), y los patrones se unen
+  (sort-merge join vectorizado) empezando por el más selectivo.
+- FILTER: comparaciones numéricas, ``=``/``!=`` entre IRIs, ``BOUND``,
+  ``CONTAINS``/``STRSTARTS``/``STRENDS``/``REGEX`` sobre ``STR(?v)`` y
+  ``&&``/``||``/``!`` con la lógica de tres valores de SPARQL. El resto de
+  expresiones se evalúan con rdflib una vez por combinación distinta de valores.
+- OPTIONAL, UNION, VALUES, DISTINCT, ORDER BY (por variables), LIMIT/OFFSET
+  y caminos secuencia/inverso (``odrl:hasPolicy/dcterms:identifier``). Un
+  VALUES unido a un BGP (los candidatos del índice de texto) se usa como
+  semilla del BGP.
+- GROUP BY y agregados: los grupos se forman con ``np.unique`` sobre las
+  columnas clave; ``COUNT`` (también ``DISTINCT`` y ``*``), ``MIN``/``MAX``
+  numéricos y ``SUM``/``AVG`` sobre enteros se calculan por grupo con
+  operaciones vectorizadas, con los mismos tipos de resultado que rdflib.
+  HAVING es un FILTER sobre la tabla agregada.
+- BIND de constantes y variables; otras expresiones se evalúan con rdflib una
+  vez por combinación distinta de valores.
+
+Cualquier otra construcción (MINUS, GRAPH, subconsultas...) lanza
+``UnsupportedQuery`` y el llamador recurre a rdflib. Solo se usa con grafos
+del ``GraphStore`` (de solo lectura y con versión), uno por versión. Con un
+``deadline`` el plazo se comprueba antes de cada operación del álgebra y cada
+pocas soluciones evaluadas con rdflib, y al agotarse se lanza ``QueryTimeout``.
+
+Uso:
+    from knowledge_graph.columnar_sparql import query_columnar
+    result = query_columnar(graph, prepared)  # None si no aplica
+
+    python -m knowledge_graph.columnar_sparql check data/ai_models_multi_repo.ttl \\
+        experiments/benchmarks/queries_90.jsonl
+
+Autor: Edmundo Mori
+"""
+
+import logging
+import operator
+import re
+import threading
+import time
+import weakref
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef, Variable
+from rdflib.graph import ConjunctiveGraph
+from rdflib.namespace import XSD
+from rdflib.paths import InvPath, SequencePath
+from rdflib.plugins.sparql.datatypes import type_promotion
+from rdflib.plugins.sparql.evalutils import _ebv, _eval
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import FrozenBindings, Query, QueryContext, SPARQLError
+from rdflib.query import Result
+from rdflib.term import Node
+
+from .graph_snapshot import (
+    TERM_BNODE,
+    TERM_LITERAL,
+    TERM_URI,
+    CompiledSnapshot,
+    TermKey,
+    compiled_path_for,
+    term_key,
+)
+from .graph_store import get_graph_store
+
+
+logger = logging.getLogger(__name__)
+
+# Datatypes que se comparan como float64 sin perder exactitud (xsd:decimal no)
+NUMERIC_DATATYPES = {
+    str(dt) for dt in (
+        XSD.integer, XSD.int, XSD.long, XSD.short, XSD.byte,
+        XSD.nonNegativeInteger, XSD.positiveInteger, XSD.nonPositiveInteger,
+        XSD.negativeInteger, XSD.unsignedLong, XSD.unsignedInt,
+        XSD.unsignedShort, XSD.unsignedByte, XSD.float, XSD.double,
+    )
+}
+
+# Enteros mayores no se representan exactamente en float64
+MAX_EXACT_FLOAT = float(2 ** 53)
+
+# Funciones no deterministas: no se pueden evaluar una vez por valor distinto
+NON_DETERMINISTIC = {
+    "Builtin_RAND", "Builtin_NOW", "Builtin_UUID", "Builtin_STRUUID", "Builtin_BNODE",
+    "Builtin_EXISTS", "Builtin_NOTEXISTS",
+}
+
+# Joins más grandes no se materializan en memoria
+MAX_JOIN_ROWS = 50_000_000
+
+# Soluciones evaluadas con rdflib entre dos comprobaciones del plazo
+DEADLINE_CHECK_ROWS = 256
+
+# Datatypes enteros para SUM/AVG exactos
+INTEGER_DATATYPES = {
+    XSD.integer, XSD.int, XSD.long, XSD.short, XSD.byte,
+    XSD.nonNegativeInteger, XSD.positiveInteger, XSD.nonPositiveInteger, XSD.negativeInteger,
+    XSD.unsignedLong, XSD.unsignedInt, XSD.unsignedShort, XSD.unsignedByte,
+}
+
+# Flags de REGEX soportados por rdflib
+REGEX_FLAGS = {"i": re.IGNORECASE, "s": re.DOTALL, "m": re.MULTILINE}
+
+_COMPARISONS = {
+    ">": operator.gt, "<": operator.lt, ">=": operator.ge,
+    "<=": operator.le, "=": operator.eq, "!=": operator.ne,
+}
+
+_STRING_TESTS = {
+    "Builtin_CONTAINS": lambda text, arg: arg in text,
+    "Builtin_STRSTARTS": lambda text, arg: text.startswith(arg),
+    "Builtin_STRENDS": lambda text, arg: text.endswith(arg),
+}
+
+
+class UnsupportedQuery(Exception):
+    """La consulta usa álgebra que este motor no evalúa (se usa rdflib)"""
+
+
+class QueryTimeout(Exception):
+    """Se agotó el plazo de la consulta (``deadline`` de ``query_columnar``)"""
+
+
+class _NotVectorizable(Exception):
+    """Subexpresión de FILTER sin versión vectorizada (se evalúa con rdflib)"""
+
+
+class ColumnarIndex:
+    """
+    Triples enteros de una versión del grafo con sus permutaciones ordenadas.
+
+    Las permutaciones, el diccionario término -> id y los valores numéricos
+    se construyen la primera vez que se necesitan.
+    """
+
+    def __init__(self, snapshot: CompiledSnapshot, ids: Optional[Dict[TermKey, int]] = None):
+        self.snapshot = snapshot
+        self.triples = snapshot.triples
+        self.term_count = snapshot.term_count
+        self.kinds = snapshot.term_kinds
+        self._ids = ids
+        self._terms: Dict[int, Node] = {}
+        self._orders: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._numeric: Optional[np.ndarray] = None
+        self._predicate_stats: Optional[Dict[int, Tuple[int, int, int]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_graph(cls, graph: Graph, version: str = "") -> "ColumnarIndex":
+        """Codificar un grafo rdflib en memoria"""
+        snapshot = CompiledSnapshot.from_graph(graph, version)
+        return cls(snapshot)
+
+    def __len__(self) -> int:
+        return len(self.triples)
+
+    def term_id(self, term: Node) -> Optional[int]:
+        """Id de un término, o None si no aparece en el grafo"""
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = self._build_ids()
+        return self._ids.get(term_key(term))
+
+    def _build_ids(self) -> Dict[TermKey, int]:
+        """Diccionario clave de término -> id a partir de los arrays del snapshot"""
+        snapshot = self.snapshot
+        text = snapshot.term_blob.tobytes()
+        offsets = snapshot.term_offsets.tolist()
+        datatypes = snapshot.datatypes + [None]
+        langs = snapshot.langs + [None]
+        return {
+            (kind, text[offsets[i]:offsets[i + 1]].decode("utf-8"), datatypes[dt_id], langs[lang_id]): i
+            for i, (kind, dt_id, lang_id) in enumerate(zip(
+                snapshot.term_kinds.tolist(), snapshot.term_datatypes.tolist(), snapshot.term_langs.tolist()
+            ))
+        }
+
+    def term(self, term_id: int) -> Node:
+        """Término rdflib de un id (decodificado bajo demanda)"""
+        term = self._terms.get(term_id)
+        if term is None:
+            snapshot = self.snapshot
+            start, end = snapshot.term_offsets[term_id], snapshot.term_offsets[term_id + 1]
+            value = snapshot.term_blob[start:end].tobytes().decode("utf-8")
+            kind = snapshot.term_kinds[term_id]
+            if kind == TERM_URI:
+                term = URIRef(value)
+            elif kind == TERM_BNODE:
+                term = BNode(value)
+            else:
+                dt_id = snapshot.term_datatypes[term_id]
+                lang_id = snapshot.term_langs[term_id]
+                term = Literal(
+                    value,
+                    datatype=URIRef(snapshot.datatypes[dt_id]) if dt_id >= 0 else None,
+                    lang=snapshot.langs[lang_id] if lang_id >= 0 else None,
+                )
+            self._terms[term_id] = term
+        return term
+
+    def numeric(self) -> np.ndarray:
+        """Valor float64 de cada término numérico (NaN para el resto)"""
+        if self._numeric is None:
+            snapshot = self.snapshot
+            numeric = np.full(self.term_count, np.nan)
+            datatype_ids = [i for i, dt in enumerate(snapshot.datatypes) if dt in NUMERIC_DATATYPES]
+            candidates = np.flatnonzero(
+                (snapshot.term_kinds == TERM_LITERAL) & np.isin(snapshot.term_datatypes, datatype_ids)
+            )
+            text = snapshot.term_blob.tobytes()
+            offsets = snapshot.term_offsets
+            for term_id in candidates.tolist():
+                try:
+                    numeric[term_id] = float(text[offsets[term_id]:offsets[term_id + 1]])
+                except ValueError:
+                    pass
+            self._numeric = numeric
+        return self._numeric
+
+    def _order(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Permutación de los triples y claves int64 ordenadas para un orden dado"""
+        order = self._orders.get(name)
+        if order is None:
+            s, p, o = (self.triples[:, i].astype(np.int64) for i in range(3))
+            m = self.term_count
+            if name == "ps":
+                perm, keys = np.lexsort((o, s, p)), p * m + s
+            elif name == "po":
+                perm, keys = np.lexsort((s, o, p)), p * m + o
+            elif name == "s":
+                perm, keys = np.lexsort((o, p, s)), s
+            else:
+                perm, keys = np.lexsort((p, s, o)), o
+            order = self._orders[name] = (perm, keys[perm])
+        return order
+
+    def _range(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> Tuple[np.ndarray, int, int]:
+        """(permutación, inicio, fin) de los triples compatibles con las constantes"""
+        m = self.term_count
+        if p is not None:
+            if s is not None:
+                perm, keys = self._order("ps")
+                low, high = p * m + s, p * m + s + 1
+            elif o is not None:
+                perm, keys = self._order("po")
+                low, high = p * m + o, p * m + o + 1
+            else:
+                perm, keys = self._order("ps")
+                low, high = p * m, (p + 1) * m
+        elif s is not None:
+            perm, keys = self._order("s")
+            low, high = s, s + 1
+        elif o is not None:
+            perm, keys = self._order("o")
+            low, high = o, o + 1
+        else:
+            return np.arange(len(self.triples)), 0, len(self.triples)
+        return perm, int(np.searchsorted(keys, low, "left")), int(np.searchsorted(keys, high, "left"))
+
+    def predicate_stats(self) -> Dict[int, Tuple[int, int, int]]:
+        """Cardinalidades por predicado: id -> (triples, sujetos distintos, objetos distintos)"""
+        stats = self._predicate_stats
+        if stats is None:
+            m = self.term_count
+            predicates, counts = np.unique(self.triples[:, 1], return_counts=True)
+            subjects = np.bincount(np.unique(self._order("ps")[1]) // m)
+            objects = np.bincount(np.unique(self._order("po")[1]) // m)
+            stats = self._predicate_stats = {
+                int(p): (int(count), int(subjects[p]), int(objects[p]))
+                for p, count in zip(predicates.tolist(), counts.tolist())
+            }
+        return stats
+
+    def count(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> int:
+        """Número (aproximado por exceso) de triples que encajan con el patrón"""
+        if any(term_id is not None and term_id >= self.term_count for term_id in (s, p, o)):
+            return 0
+        _, start, end = self._range(s, p, o)
+        return end - start
+
+    def match(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> np.ndarray:
+        """Triples (filas de ``self.triples``) que encajan con las constantes"""
+        if any(term_id is not None and term_id >= self.term_count for term_id in (s, p, o)):
+            return np.empty((0, 3), dtype=self.triples.dtype)
+        perm, start, end = self._range(s, p, o)
+        rows = self.triples[perm[start:end]]
+        # Solo los órdenes (p,s) y (p,o) fijan dos posiciones; el resto se filtra
+        if p is not None and s is not None and o is not None:
+            rows = rows[rows[:, 2] == o]
+        elif p is None and s is not None and o is not None:
+            rows = rows[rows[:, 2] == o]
+        return rows
+
+
+class _Table:
+    """Soluciones como columnas de ids por variable (-1 = sin valor)"""
+
+    def __init__(self, columns: Dict[Any, np.ndarray], size: int):
+        self.columns = columns
+        self.size = size
+
+    def take(self, index: np.ndarray) -> "_Table":
+        return _Table({var: column[index] for var, column in self.columns.items()}, len(index))
+
+    def column(self, var: Any) -> np.ndarray:
+        column = self.columns.get(var)
+        if column is None:
+            return np.full(self.size, -1, dtype=np.int64)
+        return column
+
+
+def _join_keys(left: _Table, right: _Table, shared: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Clave entera única de las variables compartidas en ambas tablas"""
+    for table in (left, right):
+        for var in shared:
+            if table.size and table.columns[var].min() < 0:
+                # La compatibilidad con valores sin ligar no se vectoriza
+                raise UnsupportedQuery("join sobre variables opcionales")
+
+    if len(shared) == 1:
+        return left.columns[shared[0]], right.columns[shared[0]]
+
+    stacked = np.concatenate([
+        np.stack([left.columns[var] for var in shared], axis=1),
+        np.stack([right.columns[var] for var in shared], axis=1),
+    ])
+    _, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse[:left.size], inverse[left.size:]
+
+
+def _join(left: _Table, right: _Table, optional: bool = False) -> _Table:
+    """Join (o left join) vectorizado por ordenación de la tabla derecha"""
+    shared = [var for var in left.columns if var in right.columns]
+    if shared:
+        left_keys, right_keys = _join_keys(left, right, shared)
+        order = np.argsort(right_keys, kind="stable")
+        sorted_keys = right_keys[order]
+        starts = np.searchsorted(sorted_keys, left_keys, "left")
+        counts = np.searchsorted(sorted_keys, left_keys, "right") - starts
+    else:
+        order = np.arange(right.size)
+        starts = np.zeros(left.size, dtype=np.int64)
+        counts = np.full(left.size, right.size, dtype=np.int64)
+
+    if optional:
+        # Las filas sin pareja se conservan una vez, sin valores a la derecha
+        matched = counts > 0
+        counts = np.where(matched, counts, 1)
+
+    total = int(counts.sum())
+    if total > MAX_JOIN_ROWS:
+        # rdflib evalúa el join de forma perezosa (y el presupuesto lo puede cortar)
+        raise UnsupportedQuery(f"join de {total:,} filas")
+    before = np.cumsum(counts) - counts
+    left_index = np.repeat(np.arange(left.size), counts)
+    right_pos = np.repeat(starts - before, counts) + np.arange(total)
+
+    columns = {var: column[left_index] for var, column in left.columns.items()}
+    if optional:
+        keep = np.repeat(matched, counts)
+        right_index = order[np.where(keep, right_pos, 0)] if right.size else np.zeros(total, dtype=np.int64)
+        for var, column in right.columns.items():
+            if var not in columns:
+                values = column[right_index] if right.size else np.full(total, -1, dtype=np.int64)
+                columns[var] = np.where(keep, values, -1)
+    else:
+        right_index = order[right_pos]
+        for var, column in right.columns.items():
+            if var not in columns:
+                columns[var] = column[right_index]
+    return _Table(columns, total)
+
+
+def _expr_vars(expr: Any) -> List[Variable]:
+    """Variables usadas en una expresión (``_vars`` de rdflib no es fiable)"""
+    found: List[Variable] = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, Variable):
+            if node not in found:
+                found.append(node)
+        elif isinstance(node, CompValue):
+            if node.name in NON_DETERMINISTIC:
+                raise UnsupportedQuery(node.name)
+            for key, value in node.items():
+                if key != "_vars":
+                    walk(value)
+        elif isinstance(node, (list, tuple)):
+            for value in node:
+                walk(value)
+
+    walk(expr)
+    return found
+
+
+class ColumnarEvaluator:
+    """Evaluación del álgebra de una consulta rdflib sobre un ``ColumnarIndex``"""
+
+    def __init__(self, index: ColumnarIndex, graph: Graph, query: Query, deadline: Optional[float] = None):
+        self.index = index
+        self.graph = graph
+        self.query = query
+        # Instante (``time.monotonic``) a partir del cual se aborta la evaluación
+        self.deadline = deadline
+        # Términos que no están en el grafo (initBindings, agregados, BIND): ids >= term_count
+        self._extra: List[Node] = []
+        self._extra_ids: Dict[Node, int] = {}
+        self._init_bindings: Dict[Variable, Node] = {}
+
+    # ------------------------------------------------------------------
+    # Términos
+    # ------------------------------------------------------------------
+
+    def encode(self, term: Node) -> int:
+        term_id = self.index.term_id(term)
+        if term_id is None:
+            term_id = self._extra_ids.get(term)
+            if term_id is None:
+                term_id = self._extra_ids[term] = self.index.term_count + len(self._extra)
+                self._extra.append(term)
+        return term_id
+
+    def decode(self, term_id: int) -> Node:
+        if term_id >= self.index.term_count:
+            return self._extra[term_id - self.index.term_count]
+        return self.index.term(term_id)
+
+    def _kinds(self, ids: np.ndarray) -> np.ndarray:
+        """Tipo de término de cada id (-1 para ids sin valor)"""
+        kinds = np.full(len(ids), -1, dtype=np.int16)
+        known = (ids >= 0) & (ids < self.index.term_count)
+        kinds[known] = self.index.kinds[ids[known]]
+        extra = np.flatnonzero(ids >= self.index.term_count)
+        for i in extra.tolist():
+            term = self.decode(int(ids[i]))
+            kinds[i] = TERM_LITERAL if isinstance(term, Literal) else TERM_BNODE if isinstance(term, BNode) else TERM_URI
+        return kinds
+
+    def _numeric(self, ids: np.ndarray) -> np.ndarray:
+        numeric = np.full(len(ids), np.nan)
+        known = (ids >= 0) & (ids < self.index.term_count)
+        numeric[known] = self.index.numeric()[ids[known]]
+        for i in np.flatnonzero(ids >= self.index.term_count).tolist():
+            numeric[i] = _literal_number(self.decode(int(ids[i])))
+        return numeric
+
+    def check_deadline(self) -> None:
+        """Abortar si se agotó el plazo (se comprueba entre operaciones vectorizadas)"""
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise QueryTimeout("plazo agotado durante la evaluación columnar")
+
+    # ------------------------------------------------------------------
+    # Álgebra
+    # ------------------------------------------------------------------
+
+    def evaluate(self, initBindings: Optional[Mapping[str, Any]] = None) -> Result:
+        main = self.query.algebra
+        if main.name not in ("SelectQuery", "AskQuery") or main.datasetClause:
+            raise UnsupportedQuery(main.name)
+
+        self._init_bindings = {Variable(name): value for name, value in (initBindings or {}).items()}
+        seed = _Table({
+            var: np.array([self.encode(value)], dtype=np.int64)
+            for var, value in self._init_bindings.items()
+        }, 1)
+        table = self._eval(main.p, seed)
+        self.check_deadline()
+
+        if main.name == "AskQuery":
+            result = Result("ASK")
+            result.askAnswer = table.size > 0
+            return result
+
+        result = Result("SELECT")
+        result.vars = list(main.PV)
+        columns = [table.column(var) for var in result.vars]
+        decoded = {}
+        for column in columns:
+            for term_id in np.unique(column).tolist():
+                if term_id >= 0 and term_id not in decoded:
+                    decoded[term_id] = self.decode(term_id)
+        rows = zip(*(column.tolist() for column in columns)) if columns else [()] * table.size
+        result.bindings = [
+            {var: decoded[term_id] for var, term_id in zip(result.vars, row) if term_id >= 0}
+            for row in rows
+        ]
+        return result
+
+    def _eval(self, part: CompValue, seed: _Table) -> _Table:
+        self.check_deadline()
+        name = part.name
+        if name == "BGP":
+            return self._bgp(part.triples, seed)
+        if name == "Filter":
+            table = self._eval(part.p, seed)
+            return table.take(np.flatnonzero(self._filter(part.expr, table)))
+        if name == "Join":
+            if part.p1.name == "ToMultiSet" and part.p2.name == "BGP":
+                # VALUES delante de un BGP (candidatos del índice de texto): semilla del BGP
+                return self._bgp(part.p2.triples, self._eval(part.p1, seed))
+            return _join(self._eval(part.p1, seed), self._eval(part.p2, seed))
+        if name == "ToMultiSet":
+            return _join(seed, self._values(part.p))
+        if name == "LeftJoin":
+            if part.expr is not None and getattr(part.expr, "name", None) != "TrueFilter":
+                raise UnsupportedQuery("OPTIONAL con FILTER")
+            return _join(self._eval(part.p1, seed), self._eval(part.p2, seed), optional=True)
+        if name == "Union":
+            return self._union(self._eval(part.p1, seed), self._eval(part.p2, seed))
+        if name == "Extend":
+            table = self._eval(part.p, seed)
+            if part.var in table.columns:
+                raise UnsupportedQuery("BIND sobre una variable ya ligada")
+            columns = dict(table.columns)
+            if isinstance(part.expr, (URIRef, Literal)):
+                # BIND de una constante (p.ej. un FILTER de igualdad ya sustituido)
+                columns[part.var] = np.full(table.size, self.encode(part.expr), dtype=np.int64)
+            elif isinstance(part.expr, Variable):
+                # ``(COUNT(?m) AS ?n)`` se compila como BIND(?__agg_1__ AS ?n)
+                columns[part.var] = table.column(part.expr)
+            else:
+                columns[part.var] = self._extend_rdflib(part.expr, table)
+            return _Table(columns, table.size)
+        if name == "AggregateJoin":
+            return self._aggregate(part, seed)
+        if name == "Project":
+            table = self._eval(part.p, seed)
+            return _Table({var: table.column(var) for var in part.PV}, table.size)
+        if name in ("Distinct", "Reduced"):
+            return self._distinct(self._eval(part.p, seed))
+        if name == "OrderBy":
+            return self._order_by(self._eval(part.p, seed), part.expr)
+        if name == "Slice":
+            table = self._eval(part.p, seed)
+            end = table.size if part.length is None else part.start + part.length
+            return table.take(np.arange(table.size)[part.start:end])
+        raise UnsupportedQuery(name)
+
+    def _values(self, part: CompValue) -> _Table:
+        """Tabla de un bloque VALUES (``UNDEF`` = sin valor)"""
+        if part.name != "values":
+            raise UnsupportedQuery(part.name)
+        variables: List[Variable] = []
+        for row in part.res:
+            variables.extend(var for var in row if var not in variables)
+        return _Table({
+            var: np.array([
+                self.encode(row[var]) if row.get(var, "UNDEF") != "UNDEF" else -1 for row in part.res
+            ], dtype=np.int64)
+            for var in variables
+        }, len(part.res))
+
+    def _expand_path(self, s: Any, path: Any, o: Any, counter: List[int]) -> List[Tuple]:
+        """Traducir caminos secuencia / inverso a patrones con variables ocultas"""
+        if isinstance(path, (URIRef, Variable, BNode)):
+            return [(s, path, o)]
+        if isinstance(path, InvPath):
+            return self._expand_path(o, path.arg, s, counter)
+        if isinstance(path, SequencePath):
+            patterns = []
+            current = s
+            for i, step in enumerate(path.args):
+                if i == len(path.args) - 1:
+                    target = o
+                else:
+                    counter[0] += 1
+                    target = BNode(f"_path{counter[0]}")
+                patterns.extend(self._expand_path(current, step, target, counter))
+                current = target
+            return patterns
+        raise UnsupportedQuery(f"camino {type(path).__name__}")
+
+    def _bgp(self, triples: Iterable[Tuple], seed: _Table) -> _Table:
+        counter = [0]
+        patterns = []
+        for s, p, o in triples:
+            for pattern in self._expand_path(s, p, o, counter):
+                # Los blank nodes de la consulta se comportan como variables
+                patterns.append(tuple(
+                    term if isinstance(term, (Variable, BNode)) else self.encode(term)
+                    for term in pattern
+                ))
+
+        table = seed
+        while patterns:
+            best, best_score, best_bound = None, None, None
+            for i, pattern in enumerate(patterns):
+                bound = self._bind(pattern, table)
+                variables = [term for term in bound if not isinstance(term, int)]
+                shares = not table.columns or any(var in table.columns for var in variables)
+                score = (not shares, self.index.count(*(
+                    term if isinstance(term, int) else None for term in bound
+                )))
+                if best_score is None or score < best_score:
+                    best, best_score, best_bound = i, score, bound
+            patterns.pop(best)
+            self.check_deadline()
+            table = _join(table, self._match(best_bound))
+            if table.size == 0:
+                break
+        return table
+
+    @staticmethod
+    def _bind(pattern: Tuple, table: _Table) -> Tuple:
+        """Sustituir por constantes las variables ligadas en una tabla de una fila"""
+        if table.size != 1:
+            return pattern
+        bound = []
+        for term in pattern:
+            column = table.columns.get(term) if not isinstance(term, int) else None
+            if column is not None and column[0] >= 0:
+                term = int(column[0])
+            bound.append(term)
+        return tuple(bound)
+
+    def _match(self, pattern: Tuple) -> _Table:
+        rows = self.index.match(*(term if isinstance(term, int) else None for term in pattern))
+        columns: Dict[Any, np.ndarray] = {}
+        keep = None
+        for position, term in enumerate(pattern):
+            if isinstance(term, int):
+                continue
+            values = rows[:, position].astype(np.int64)
+            if term in columns:
+                # Variable repetida en el patrón (?x p ?x)
+                same = columns[term] == values
+                keep = same if keep is None else keep & same
+            else:
+                columns[term] = values
+        table = _Table(columns, len(rows))
+        return table.take(np.flatnonzero(keep)) if keep is not None else table
+
+    @staticmethod
+    def _union(left: _Table, right: _Table) -> _Table:
+        variables = list(left.columns) + [var for var in right.columns if var not in left.columns]
+        return _Table(
+            {var: np.concatenate([left.column(var), right.column(var)]) for var in variables},
+            left.size + right.size,
+        )
+
+    @staticmethod
+    def _distinct(table: _Table) -> _Table:
+        """Eliminar filas repetidas conservando la primera aparición"""
+        if table.size == 0 or not table.columns:
+            return table.take(np.arange(min(table.size, 1)))
+        rows = np.stack(list(table.columns.values()), axis=1)
+        _, first = np.unique(rows, axis=0, return_index=True)
+        return table.take(np.sort(first))
+
+    def _order_by(self, table: _Table, conditions: List[Any]) -> _Table:
+        """Ordenación estable por variables, igual que ``sorted`` en rdflib"""
+        index = np.arange(table.size)
+        for condition in reversed(conditions):
+            expr = getattr(condition, "expr", condition)
+            if not isinstance(expr, Variable):
+                raise UnsupportedQuery("ORDER BY sobre expresiones")
+            ranks = self._ranks(table.column(expr)[index])
+            if getattr(condition, "order", None) == "DESC":
+                ranks = -ranks
+            index = index[np.argsort(ranks, kind="stable")]
+        return table.take(index)
+
+    def _ranks(self, ids: np.ndarray) -> np.ndarray:
+        """Rango de cada id según el orden de términos de rdflib (``_val``)"""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        kinds = self._kinds(unique)
+        # rdflib: sin valor < blank node < IRI < literal
+        group = np.select([kinds == TERM_BNODE, kinds == TERM_URI, kinds == TERM_LITERAL], [1, 2, 3], 0)
+        within = np.zeros(len(unique), dtype=np.float64)
+
+        literals = np.flatnonzero(kinds == TERM_LITERAL)
+        numeric = self._numeric(unique[literals])
+        if len(literals) and np.isfinite(numeric).all() and np.abs(numeric).max() <= MAX_EXACT_FLOAT:
+            within[literals] = numeric
+        elif len(literals):
+            terms = [self.decode(int(term_id)) for term_id in unique[literals]]
+            numbers = [_exact_number(term) for term in terms]
+            if all(number is not None for number in numbers):
+                # Decimales (p.ej. AVG) o enteros grandes: orden exacto de Python
+                within[literals] = _lexical_ranks(numbers)
+            elif len({term.language for term in terms}) > 1 or any(not _is_simple_string(term) for term in terms
+                                                                   if not term.language):
+                raise UnsupportedQuery("ORDER BY sobre literales no textuales o de tipos distintos")
+            else:
+                within[literals] = _lexical_ranks([str(term) for term in terms])
+
+        for kind in (TERM_BNODE, TERM_URI):
+            members = np.flatnonzero(kinds == kind)
+            within[members] = _lexical_ranks([str(self.decode(int(term_id))) for term_id in unique[members]])
+
+        # Rango denso (empates con el mismo rango) por (grupo, valor)
+        order = np.lexsort((within, group))
+        changed = np.ones(len(order), dtype=bool)
+        changed[1:] = (np.diff(group[order]) != 0) | (np.diff(within[order]) != 0)
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.cumsum(changed)
+        return ranks[inverse.reshape(-1)]
+
+    # ------------------------------------------------------------------
+    # GROUP BY y agregados
+    # ------------------------------------------------------------------
+
+    def _aggregate(self, part: CompValue, seed: _Table) -> _Table:
+        """
+        ``AggregateJoin(Group)``: una fila por grupo con las variables de resultado
+        de cada agregado (``?__agg_n__``), igual que ``evalAggregateJoin``.
+        """
+        group = part.p
+        keys = group.expr
+        if keys is not None and not all(isinstance(key, Variable) for key in keys):
+            raise UnsupportedQuery("GROUP BY sobre expresiones")
+        table = self._eval(group.p, seed)
+
+        if keys is None:
+            inverse = np.zeros(table.size, dtype=np.int64)
+            first = np.zeros(1, dtype=np.int64)
+        elif table.size == 0:
+            # rdflib devuelve una solución vacía cuando no hay grupos
+            return _Table({}, 1)
+        else:
+            stacked = np.stack([table.column(key) for key in keys], axis=1)
+            _, first, inverse = np.unique(stacked, axis=0, return_index=True, return_inverse=True)
+            # Grupos en orden de primera aparición
+            order = np.argsort(first, kind="stable")
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            inverse, first = rank[inverse.reshape(-1)], first[order]
+
+        columns: Dict[Any, np.ndarray] = {}
+        for aggregate in part.A:
+            columns[aggregate.res] = self._aggregate_column(aggregate, table, inverse, first, keys or [])
+        return _Table(columns, len(first))
+
+    def _aggregate_column(
+        self, aggregate: CompValue, table: _Table, inverse: np.ndarray, first: np.ndarray, keys: List[Variable]
+    ) -> np.ndarray:
+        name = aggregate.name
+        groups = len(first)
+        distinct = bool(aggregate.get("distinct"))
+
+        if name == "Aggregate_Sample":
+            # Solo variables de agrupación: para el resto, rdflib toma la primera fila
+            if aggregate.vars not in keys:
+                raise UnsupportedQuery("SAMPLE de una variable no agrupada")
+            return table.column(aggregate.vars)[first] if table.size else np.full(groups, -1, dtype=np.int64)
+
+        if name == "Aggregate_Count" and aggregate.vars == "*":
+            if distinct:
+                rows = np.stack([inverse] + list(table.columns.values()), axis=1)
+                counts = np.bincount(np.unique(rows, axis=0)[:, 0], minlength=groups)
+            else:
+                counts = np.bincount(inverse, minlength=groups)
+            return np.array([self.encode(Literal(int(count))) for count in counts.tolist()], dtype=np.int64)
+
+        if not isinstance(aggregate.vars, Variable):
+            raise UnsupportedQuery(f"{name} sobre expresiones")
+        values = table.column(aggregate.vars)
+        bound = values >= 0
+        if distinct and name in ("Aggregate_Sum", "Aggregate_Avg") and not bound.all():
+            raise UnsupportedQuery(f"{name} DISTINCT con valores sin ligar")  # rdflib lanza NotBoundError
+        group_of, values = inverse[bound], values[bound]
+        if distinct and name != "Aggregate_Count":
+            pairs = np.unique(np.stack([group_of, values], axis=1), axis=0)
+            group_of, values = pairs[:, 0], pairs[:, 1]
+
+        if name == "Aggregate_Count":
+            if distinct:
+                group_of = np.unique(np.stack([group_of, values], axis=1), axis=0)[:, 0]
+            counts = np.bincount(group_of, minlength=groups)
+            return np.array([self.encode(Literal(int(count))) for count in counts.tolist()], dtype=np.int64)
+        if name in ("Aggregate_Min", "Aggregate_Max"):
+            return self._extremum(name == "Aggregate_Min", group_of, values, groups)
+        if name in ("Aggregate_Sum", "Aggregate_Avg"):
+            return self._sum_or_average(name == "Aggregate_Avg", group_of, values, groups)
+        raise UnsupportedQuery(name)
+
+    def _extremum(self, minimum: bool, group_of: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+        """MIN / MAX numéricos: el término original con el valor extremo de cada grupo"""
+        unique = np.unique(values)
+        numeric = self._numeric(unique)
+        # Con literales distintos del mismo valor ("01" y "1") rdflib se queda con el primero
+        if (not np.isfinite(numeric).all() or len(np.unique(numeric)) != len(unique)
+                or (len(numeric) and np.abs(numeric).max() > MAX_EXACT_FLOAT)):
+            raise UnsupportedQuery("MIN/MAX sobre valores no numéricos")
+        ranks = np.searchsorted(unique, values)
+        order = np.lexsort((numeric[ranks] if minimum else -numeric[ranks], group_of))
+        result = np.full(groups, -1, dtype=np.int64)
+        sorted_groups = group_of[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]) if len(order) else order
+        result[sorted_groups[starts]] = values[order][starts]
+        return result
+
+    def _sum_or_average(self, average: bool, group_of: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+        """SUM / AVG exactos sobre literales enteros de un mismo datatype (Decimal en AVG, como rdflib)"""
+        unique, inverse = np.unique(values, return_inverse=True)
+        terms = [self.decode(int(term_id)) for term_id in unique.tolist()]
+        datatypes = {term.datatype if isinstance(term, Literal) else None for term in terms}
+        if len(datatypes) > 1 or not datatypes <= INTEGER_DATATYPES:
+            raise UnsupportedQuery("SUM/AVG sobre valores no enteros")
+        numbers = np.array([int(term.toPython()) for term in terms], dtype=object)
+        if len(numbers) and max(abs(number) for number in numbers) * len(values) >= 2 ** 63:
+            raise UnsupportedQuery("SUM/AVG con desbordamiento")
+
+        per_row = numbers.astype(np.int64)[inverse.reshape(-1)]
+        sums = np.zeros(groups, dtype=np.int64)
+        np.add.at(sums, group_of, per_row)
+        counts = np.bincount(group_of, minlength=groups)
+        datatype = next(iter(datatypes), None)
+
+        result = []
+        for total, count in zip(sums.tolist(), counts.tolist()):
+            if count == 0:
+                value = Literal(0)
+            elif average:
+                value = Literal(Decimal(total) / Decimal(count))
+            else:
+                # rdflib promociona el datatype a partir del segundo valor
+                value = Literal(total, datatype=datatype if count == 1 else type_promotion(datatype, datatype))
+            result.append(self.encode(value))
+        return np.array(result, dtype=np.int64)
+
+    # ------------------------------------------------------------------
+    # FILTER
+    # ------------------------------------------------------------------
+
+    def _filter(self, expr: Any, table: _Table) -> np.ndarray:
+        """Máscara de filas que cumplen la expresión (los errores cuentan como falso)"""
+        if table.size == 0:
+            return np.zeros(0, dtype=bool)
+        try:
+            truth, error = self._vector(expr, table)
+            return truth & ~error
+        except _NotVectorizable:
+            return self._filter_rdflib(expr, table, np.arange(table.size))
+
+    def _combinations(self, expr: Any, table: _Table, rows: np.ndarray) -> Tuple[List[FrozenBindings], np.ndarray]:
+        """Soluciones distintas (solo con las variables de ``expr``) de las filas dadas y su índice por fila"""
+        variables = _expr_vars(expr)
+        if not variables:
+            combos, inverse = np.zeros((1, 0), dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+        elif len(variables) == 1:
+            unique, inverse = np.unique(table.column(variables[0])[rows], return_inverse=True)
+            combos = unique.reshape(-1, 1)
+        else:
+            values = np.stack([table.column(var)[rows] for var in variables], axis=1)
+            combos, inverse = np.unique(values, axis=0, return_inverse=True)
+
+        ctx = QueryContext(self.graph, initBindings=self._init_bindings)
+        ctx.prologue = self.query.prologue
+        bindings = [
+            FrozenBindings(ctx, {var: self.decode(term_id) for var, term_id in zip(variables, combo) if term_id >= 0})
+            for combo in combos.tolist()
+        ]
+        return bindings, inverse.reshape(-1)
+
+    def _timed(self, bindings: List[FrozenBindings]) -> Iterator[FrozenBindings]:
+        """Recorrer las soluciones comprobando el plazo cada ``DEADLINE_CHECK_ROWS``"""
+        for i, solution in enumerate(bindings):
+            if i % DEADLINE_CHECK_ROWS == 0:
+                self.check_deadline()
+            yield solution
+
+    def _filter_rdflib(self, expr: Any, table: _Table, rows: np.ndarray) -> np.ndarray:
+        """Evaluar con rdflib en las filas dadas, una vez por combinación distinta de valores"""
+        mask = np.zeros(table.size, dtype=bool)
+        if len(rows) == 0:
+            return mask
+        bindings, inverse = self._combinations(expr, table, rows)
+        outcome = np.fromiter((_ebv(expr, solution) for solution in self._timed(bindings)), dtype=bool, count=len(bindings))
+        mask[rows] = outcome[inverse]
+        return mask
+
+    def _extend_rdflib(self, expr: Any, table: _Table) -> np.ndarray:
+        """Valor de un BIND con rdflib, una vez por combinación distinta (-1 si da error)"""
+        if table.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        bindings, inverse = self._combinations(expr, table, np.arange(table.size))
+        values = []
+        for solution in self._timed(bindings):
+            try:
+                value = _eval(expr, solution)
+            except SPARQLError:
+                value = None
+            values.append(-1 if value is None or isinstance(value, SPARQLError) else self.encode(value))
+        return np.array(values, dtype=np.int64)[inverse]
+
+    def _vector(self, expr: Any, table: _Table, negated: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (verdad, error) por fila para las expresiones soportadas.
+
+        Dentro de ``&&`` / ``||`` las subexpresiones sin versión vectorizada se
+        evalúan con rdflib solo en las filas que aún pueden cambiar el
+        resultado. Su error se confunde con falso, lo que solo es correcto si
+        ningún ``!`` lo invierte (``negated``).
+        """
+        name = getattr(expr, "name", None)
+
+        if name in ("ConditionalAndExpression", "ConditionalOrExpression"):
+            conjunction = name == "ConditionalAndExpression"
+            truth = error = None
+            pending = []
+            for operand in [expr.expr] + list(expr.other or []):
+                try:
+                    operand_truth, operand_error = self._vector(operand, table, negated)
+                except _NotVectorizable:
+                    if negated:
+                        raise
+                    pending.append(operand)
+                    continue
+                if truth is None:
+                    truth, error = operand_truth, operand_error
+                elif conjunction:
+                    false = (~truth & ~error) | (~operand_truth & ~operand_error)
+                    error = ~false & (error | operand_error)
+                    truth = truth & operand_truth & ~error
+                else:
+                    truth = (truth & ~error) | (operand_truth & ~operand_error)
+                    error = ~truth & (error | operand_error)
+
+            if truth is None:
+                truth = np.full(table.size, conjunction)
+                error = np.zeros(table.size, dtype=bool)
+            for operand in pending:
+                if conjunction:
+                    truth = truth & self._filter_rdflib(operand, table, np.flatnonzero(truth & ~error))
+                else:
+                    truth = truth | self._filter_rdflib(operand, table, np.flatnonzero(~truth))
+                    error = error & ~truth
+            return truth, error
+
+        if name == "UnaryNot":
+            truth, error = self._vector(expr.expr, table, negated=not negated)
+            return ~truth & ~error, error
+
+        if name == "Builtin_BOUND":
+            if not isinstance(expr.arg, Variable):
+                raise _NotVectorizable(name)
+            return table.column(expr.arg) >= 0, np.zeros(table.size, dtype=bool)
+
+        if name == "RelationalExpression" and expr.other is not None and expr.op in _COMPARISONS:
+            return self._compare(expr, table)
+
+        if name in _STRING_TESTS or name == "Builtin_REGEX":
+            return self._string_test(expr, table)
+
+        raise _NotVectorizable(name)
+
+    def _operand(self, term: Any, table: _Table) -> np.ndarray:
+        """Ids por fila de un operando (variable o constante)"""
+        if isinstance(term, Variable):
+            return table.column(term)
+        if isinstance(term, (URIRef, Literal)):
+            return np.full(table.size, self.encode(term), dtype=np.int64)
+        raise _NotVectorizable(getattr(term, "name", type(term).__name__))
+
+    def _compare(self, expr: CompValue, table: _Table) -> Tuple[np.ndarray, np.ndarray]:
+        left = self._operand(expr.expr, table)
+        right = self._operand(expr.other, table)
+        unbound = (left < 0) | (right < 0)
+        compare = _COMPARISONS[expr.op]
+
+        bound_ids = np.concatenate([left[~unbound], right[~unbound]])
+        kinds = self._kinds(bound_ids)
+
+        if (kinds == TERM_LITERAL).all():
+            numeric = self._numeric(bound_ids)
+            if not np.isfinite(numeric).all() or (len(numeric) and np.abs(numeric).max() > MAX_EXACT_FLOAT):
+                raise _NotVectorizable("comparación de literales no numéricos")
+            left_values = self._numeric(left)
+            right_values = self._numeric(right)
+            with np.errstate(invalid="ignore"):
+                truth = compare(left_values, right_values)
+            return truth & ~unbound, unbound
+
+        if expr.op in ("=", "!=") and (kinds != TERM_LITERAL).all():
+            # Igualdad de IRIs / blank nodes: identidad de término
+            return compare(left, right) & ~unbound, unbound
+
+        raise _NotVectorizable("comparación de términos mixtos")
+
+    def _string_test(self, expr: CompValue, table: _Table) -> Tuple[np.ndarray, np.ndarray]:
+        if expr.name == "Builtin_REGEX":
+            text, argument, flags = expr.text, expr.pattern, expr.flags
+        else:
+            text, argument, flags = expr.arg1, expr.arg2, None
+
+        if getattr(text, "name", None) != "Builtin_STR" or not isinstance(text.arg, Variable):
+            raise _NotVectorizable(expr.name)
+        if not _is_simple_string(argument) or (flags is not None and not _is_simple_string(flags)):
+            raise _NotVectorizable(expr.name)
+
+        if expr.name == "Builtin_REGEX":
+            pattern = re.compile(str(argument), _regex_flags(flags))
+            test = lambda value, _arg: pattern.search(value) is not None
+        else:
+            test = _STRING_TESTS[expr.name]
+
+        column = table.column(text.arg)
+        unique, inverse = np.unique(column, return_inverse=True)
+        outcome = np.fromiter((
+            term_id >= 0 and test(str(self.decode(term_id)), str(argument))
+            for term_id in unique.tolist()
+        ), dtype=bool, count=len(unique))
+        unbound = column < 0
+        return outcome[inverse.reshape(-1)] & ~unbound, unbound
+
+
+def _literal_number(term: Node) -> float:
+    if isinstance(term, Literal) and term.datatype is not None and str(term.datatype) in NUMERIC_DATATYPES:
+        try:
+            return float(str(term))
+        except ValueError:
+            pass
+    return np.nan
+
+
+def _exact_number(term: Node) -> Any:
+    """Valor Python (int, Decimal o float finito) de un literal numérico, o None"""
+    if not isinstance(term, Literal) or term.datatype is None:
+        return None
+    if str(term.datatype) not in NUMERIC_DATATYPES and term.datatype != XSD.decimal:
+        return None
+    value = term.toPython()
+    if isinstance(value, bool) or not isinstance(value, (int, float, Decimal)) or value != value:
+        return None
+    return value
+
+
+def _is_simple_string(term: Any) -> bool:
+    return isinstance(term, Literal) and not term.language and term.datatype in (None, XSD.string)
+
+
+def _regex_flags(flags: Optional[Literal]) -> int:
+    value = 0
+    for flag in str(flags or ""):
+        value |= REGEX_FLAGS.get(flag, 0)
+    return value
+
+
+def _lexical_ranks(values: List[Any]) -> np.ndarray:
+    """Rango (con empates) de cadenas o números según el orden de Python"""
+    if not values:
+        return np.zeros(0, dtype=np.float64)
+    _, ranks = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+    return ranks.reshape(-1).astype(np.float64)
+
+
+# Índices por grafo: id(grafo) -> (weakref, versión, índice)
+_index_cache: Dict[int, Tuple[weakref.ref, str, ColumnarIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def _load_or_build_index(graph: Graph, path: Any, version: str) -> ColumnarIndex:
+    """Índice desde el snapshot compilado de la versión, o codificando el grafo"""
+    compiled_path = compiled_path_for(path, version)
+    if compiled_path.exists():
+        try:
+            snapshot = CompiledSnapshot.load(compiled_path)
+            if snapshot.sha256 == version and snapshot.triple_count == len(graph):
+                return ColumnarIndex(snapshot)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Snapshot compilado ilegible ({compiled_path.name}): {e}")
+    return ColumnarIndex.from_graph(graph, version)
+
+
+def get_columnar_index(graph: Graph) -> Optional[ColumnarIndex]:
+    """
+    Índice columnar de un grafo del ``GraphStore`` (uno por versión).
+
+    Devuelve None para grafos sin versión (pueden cambiar sin aviso) y para
+    datasets con grafos con nombre.
+    """
+    if isinstance(graph, ConjunctiveGraph):
+        return None
+    entry = get_graph_store().entry_of(graph)
+    if entry is None:
+        return None
+
+    key = id(graph)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None:
+            ref, version, index = cached
+            if ref() is graph and version == entry.version:
+                return index
+
+        index = _load_or_build_index(graph, entry.path, entry.version)
+        ref = weakref.ref(graph, lambda _ref, key=key: _index_cache.pop(key, None))
+        _index_cache[key] = (ref, entry.version, index)
+        logger.info(f"🧮 Índice columnar v{entry.version[:12]}: {len(index):,} triples")
+        return index
+
+
+def query_columnar(
+    graph: Graph,
+    query: Query,
+    initBindings: Optional[Mapping[str, Any]] = None,
+    deadline: Optional[float] = None,
+) -> Optional[Result]:
+    """
+    Ejecutar una consulta compilada con el motor columnar.
+
+    Args:
+        deadline: Instante (``time.monotonic()``) tras el que se aborta la
+            evaluación con ``QueryTimeout``
+
+    Returns:
+        ``Result`` de rdflib, o None si el grafo o la consulta no están
+        soportados (el llamador debe usar ``graph.query``)
+    """
+    index = get_columnar_index(graph)
+    if index is None:
+        return None
+    try:
+        return ColumnarEvaluator(index, graph, query, deadline).evaluate(initBindings)
+    except UnsupportedQuery as e:
+        logger.debug(f"Consulta no soportada por el motor columnar ({e}); se usa rdflib")
+        return None
+
+
+def _rows(result: Result, variables: List[Variable]) -> List[Tuple]:
+    return [tuple(binding.get(var) for var in variables) for binding in result.bindings]
+
+
+def _order_variables(part: Any) -> List[Variable]:
+    """Variables de ORDER BY de un álgebra (vacío si no hay ORDER BY)"""
+    if not isinstance(part, CompValue):
+        return []
+    if part.name == "OrderBy":
+        return [getattr(condition, "expr", condition) for condition in part.expr]
+    for key in ("p", "p1", "p2"):
+        found = _order_variables(part.get(key))
+        if found:
+            return found
+    return []
+
+
+def _has_aggregates(algebra: CompValue) -> bool:
+    """¿Contiene el álgebra un GROUP BY o funciones de agregado?"""
+    if isinstance(algebra, CompValue):
+        return algebra.name == "AggregateJoin" or any(_has_aggregates(v) for v in algebra.values())
+    if isinstance(algebra, (list, tuple)):
+        return any(_has_aggregates(v) for v in algebra)
+    return False
+
+
+def compare_with_rdflib(graph: Graph, sparql: str) -> Optional[bool]:
+    """
+    Comprobar que el motor columnar devuelve las mismas filas que rdflib.
+
+    Las filas se comparan como multiconjunto. Con ORDER BY, el orden entre
+    empates no está definido (y LIMIT puede quedarse con cualquiera de ellos),
+    así que además se compara la secuencia de claves de orden de la consulta
+    sin LIMIT/OFFSET y con ``SELECT *``.
+
+    Returns:
+        True/False, o None si el motor columnar no soporta la consulta
+    """
+    from .sparql_cache import prepare_query
+
+    prepared = prepare_query(sparql)
+    result = query_columnar(graph, prepared)
+    if result is None:
+        return None
+    expected = graph.query(prepared)
+    if result.type == "ASK":
+        return result.askAnswer == expected.askAnswer
+
+    variables = list(expected.vars)
+    ours, theirs = _rows(result, variables), _rows(expected, variables)
+    if len(ours) != len(theirs):
+        return False
+
+    order = _order_variables(prepared.algebra)
+    unsliced = re.sub(r"\b(LIMIT|OFFSET)\s+\d+", "", sparql, flags=re.IGNORECASE)
+    if not order:
+        if sorted(map(repr, ours)) == sorted(map(repr, theirs)):
+            return True
+        # Sin ORDER BY, LIMIT/OFFSET pueden quedarse con cualquier subconjunto
+        complete = {repr(row) for row in _rows(graph.query(prepare_query(unsliced)), variables)}
+        return unsliced != sparql and all(repr(row) in complete for row in ours)
+
+    if not _has_aggregates(prepared.algebra):
+        # Con agregados, SELECT * no es válido: se conserva la proyección
+        unsliced = re.sub(r"\bSELECT\s+(DISTINCT\s+|REDUCED\s+)?.*?\bWHERE\b", "SELECT * WHERE",
+                          unsliced, count=1, flags=re.IGNORECASE | re.DOTALL)
+    full = prepare_query(unsliced)
+    full_result = query_columnar(graph, full)
+    full_expected = graph.query(full)
+    full_vars = list(full_expected.vars)
+    ours, theirs = _rows(full_result, full_vars), _rows(full_expected, full_vars)
+    positions = [full_vars.index(var) for var in order]
+    return (
+        sorted(map(repr, ours)) == sorted(map(repr, theirs))
+        and [[row[i] for i in positions] for row in ours] == [[row[i] for i in positions] for row in theirs]
+    )
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+    import json
+    import sys
+    import time
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from knowledge_graph.graph_store import get_shared_graph
+    from knowledge_graph.sparql_cache import prepare_query
+
+    parser = argparse.ArgumentParser(description="Motor SPARQL columnar sobre el snapshot compilado")
+    subparsers = parser.add_subparsers(dest="command")
+
+    check_parser = subparsers.add_parser(
+        "check", help="Comparar filas y tiempos con rdflib sobre un fichero de consultas"
+    )
+    check_parser.add_argument("graph", help="Fichero RDF fuente")
+    check_parser.add_argument("queries", help="JSONL de consultas")
+    check_parser.add_argument("--field", default="gold_sparql", help="Campo con la consulta SPARQL")
+
+    args = parser.parse_args()
+    if args.command != "check":
+        parser.print_help()
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    graph = get_shared_graph(args.graph)
+    get_columnar_index(graph)
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    columnar_time = rdflib_time = 0.0
+    supported = mismatches = total = 0
+    for entry in entries:
+        sparql = entry.get(args.field)
+        if not sparql:
+            continue
+        total += 1
+        query_id = entry.get("id", total)
+
+        same = compare_with_rdflib(graph, sparql)
+        if same is None:
+            continue
+        supported += 1
+        if not same:
+            mismatches += 1
+            print(f"❌ {query_id}: resultados distintos de rdflib")
+
+        prepared = prepare_query(sparql)
+        start = time.perf_counter()
+        query_columnar(graph, prepared)
+        columnar_time += time.perf_counter() - start
+        start = time.perf_counter()
+        len(graph.query(prepared))
+        rdflib_time += time.perf_counter() - start
+
+    print(f"\n✅ {supported}/{total} consultas evaluadas por el motor columnar, {mismatches} diferencias")
+    if supported:
+        print(f"⏱️ columnar {columnar_time * 1000:.1f} ms · rdflib {rdflib_time * 1000:.1f} ms "
+              f"(x{rdflib_time / max(columnar_time, 1e-9):.1f})")
+
+
+if __name__ == "__main__":
+    main()
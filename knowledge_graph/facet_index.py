@@ -0,0 +1,227 @@
+"""
+Índice de facetas con bitmaps sobre los ids densos de modelo.
+
+Filtrar por tarea, librería, repositorio, licencia o nivel de acceso
+requería otra consulta SPARQL o recorrer los resultados en Python. Este
+índice guarda, para cada valor de cada faceta categórica del ``ModelCatalog``,
+un bitmap de los modelos que lo tienen (palabras ``uint64``, un bit por id de
+modelo):
+
+- Combinaciones AND/OR/NOT: operaciones bit a bit sobre arrays de palabras.
+- Conteos: popcount de ``bitmap_valor & selección`` para todos los valores de
+  una faceta a la vez (``np.bitwise_count``, o tabla por byte en NumPy 1.x).
+
+Los conteos por faceta son disyuntivos, como en los catálogos web: los de
+una faceta se calculan con los demás filtros, pero sin el de esa misma
+faceta, para poder ampliar la selección.
+
+Formato de los filtros (JSON-friendly)::
+
+    {"task": "text-generation",                # un valor
+     "library": ["pytorch", "transformers"],   # OR dentro de la faceta
+     "not": {"license": "unknown"},            # NOT
+     "or": [{"source": "kaggle"}, {"accessLevel": "open"}]}
+
+Las claves se combinan con AND.
+
+Uso:
+    from knowledge_graph.facet_index import facet_mask, get_facet_index
+    facets = get_facet_index(get_model_catalog(graph))
+    facets.counts({"task": "text-generation"})      # {faceta: {valor: n}}
+    facets.contains(model_ids, facets.select(filters))
+    facet_mask(graph, result_uris, filters)          # máscara por URI de resultado
+
+Autor: Edmundo Mori
+"""
+
+import threading
+import weakref
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from rdflib import Graph
+
+from .model_catalog import ModelCatalog, get_model_catalog
+
+
+# Palabras de 64 bits en little-endian: el bit i de la palabra w es el modelo 64·w + i
+WORD_DTYPE = np.dtype("<u8")
+
+# Claves de combinación en los filtros
+NOT_KEY = "not"
+OR_KEY = "or"
+
+# Popcount por byte para NumPy sin ``bitwise_count``
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Bits a 1 de cada fila de palabras (o del array entero si es 1-D)"""
+    words = np.ascontiguousarray(words, dtype=WORD_DTYPE)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(*words.shape[:-1], words.shape[-1] * 8)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    """Bitmap (palabras ``uint64``) de un array booleano"""
+    words = (len(mask) + 63) // 64
+    padded = np.zeros(words * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder="little").view(WORD_DTYPE)
+
+
+def unpack_mask(words: np.ndarray, size: int) -> np.ndarray:
+    """Array booleano de ``size`` posiciones a partir de un bitmap"""
+    bits = np.unpackbits(np.ascontiguousarray(words, dtype=WORD_DTYPE).view(np.uint8), bitorder="little")
+    return bits[:size].astype(bool)
+
+
+class FacetIndex:
+    """
+    Bitmaps por valor de cada faceta categórica del catálogo.
+
+    ``bitmaps[faceta]`` es una matriz (valores × palabras), con las filas en
+    el orden de ``labels[faceta]`` (el de ``ModelCatalog.categories``).
+    """
+
+    def __init__(self, size: int, labels: Dict[str, List[str]], bitmaps: Dict[str, np.ndarray]):
+        self.size = size
+        self.labels = labels
+        self.bitmaps = bitmaps
+        self.words = (size + 63) // 64
+        self.everything = pack_mask(np.ones(size, dtype=bool))
+        self._rows = {name: {label: row for row, label in enumerate(values)} for name, values in labels.items()}
+
+    @classmethod
+    def from_catalog(cls, catalog: ModelCatalog) -> "FacetIndex":
+        """Construir los bitmaps a partir de las columnas de códigos del catálogo"""
+        size = len(catalog)
+        words = (size + 63) // 64
+        bitmaps: Dict[str, np.ndarray] = {}
+        for name, labels in catalog.categories.items():
+            codes = np.asarray(catalog.codes[name])
+            model_ids = np.flatnonzero(codes >= 0)
+            matrix = np.zeros((len(labels), words), dtype=WORD_DTYPE)
+            bits = np.left_shift(np.uint64(1), (model_ids & 63).astype(np.uint64))
+            np.bitwise_or.at(matrix, (codes[model_ids], model_ids >> 6), bits)
+            bitmaps[name] = matrix
+        return cls(size, {name: list(labels) for name, labels in catalog.categories.items()}, bitmaps)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.bitmaps)
+
+    def empty(self) -> np.ndarray:
+        """Bitmap sin ningún modelo"""
+        return np.zeros(self.words, dtype=WORD_DTYPE)
+
+    def bitmap(self, name: str, values: Any) -> np.ndarray:
+        """
+        Modelos con alguno de los valores de una faceta (OR).
+
+        Raises:
+            ValueError: Faceta desconocida (un valor desconocido no selecciona nada)
+        """
+        if name not in self.bitmaps:
+            raise ValueError(f"Faceta desconocida: {name} (disponibles: {', '.join(self.bitmaps)})")
+        if isinstance(values, (str, bytes)) or not isinstance(values, Iterable):
+            values = [values]
+        rows = [self._rows[name][str(value)] for value in values if str(value) in self._rows[name]]
+        if not rows:
+            return self.empty()
+        return np.bitwise_or.reduce(self.bitmaps[name][rows], axis=0)
+
+    def select(self, filters: Optional[Mapping[str, Any]] = None) -> np.ndarray:
+        """
+        Bitmap de los modelos que cumplen los filtros (ver el formato en el módulo).
+
+        Sin filtros se seleccionan todos los modelos.
+        """
+        selection = self.everything.copy()
+        for key, value in (filters or {}).items():
+            if key == NOT_KEY:
+                selection &= self.everything & ~self.select(value)
+            elif key == OR_KEY:
+                union = self.empty()
+                for branch in value:
+                    union |= self.select(branch)
+                selection &= union
+            else:
+                selection &= self.bitmap(key, value)
+        return selection
+
+    def count(self, filters: Optional[Mapping[str, Any]] = None) -> int:
+        """Número de modelos que cumplen los filtros"""
+        return int(popcount(self.select(filters)))
+
+    def model_ids(self, filters: Optional[Mapping[str, Any]] = None) -> np.ndarray:
+        """Ids densos (ordenados) de los modelos que cumplen los filtros"""
+        return np.flatnonzero(unpack_mask(self.select(filters), self.size))
+
+    def contains(self, model_ids: np.ndarray, selection: np.ndarray) -> np.ndarray:
+        """Máscara: ¿está cada id en la selección? (False para ids -1)"""
+        model_ids = np.asarray(model_ids, dtype=np.int64)
+        inside = (model_ids >= 0) & (model_ids < self.size)
+        safe = np.where(inside, model_ids, 0)
+        if not self.size:
+            return inside
+        bits = (selection[safe >> 6] >> (safe & 63).astype(np.uint64)) & np.uint64(1)
+        return inside & (bits == 1)
+
+    def counts(
+        self,
+        filters: Optional[Mapping[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Conteos por valor de cada faceta bajo los filtros (disyuntivos).
+
+        Args:
+            filters: Filtros activos
+            fields: Facetas a contar (por defecto, todas)
+
+        Returns:
+            ``{faceta: {valor: modelos}}`` con todos los valores (también los 0)
+        """
+        filters = dict(filters or {})
+        counts: Dict[str, Dict[str, int]] = {}
+        for name in fields or self.fields:
+            others = {key: value for key, value in filters.items() if key != name}
+            selection = self.select(others)
+            totals = popcount(self.bitmaps[name] & selection)
+            counts[name] = dict(zip(self.labels[name], totals.tolist()))
+        return counts
+
+
+# Caché de índices por catálogo: id(catálogo) -> (weakref, índice)
+_facet_cache: Dict[int, Tuple[weakref.ref, FacetIndex]] = {}
+_facet_lock = threading.Lock()
+
+
+def get_facet_index(catalog: ModelCatalog) -> FacetIndex:
+    """Índice de facetas de un catálogo (se construye una vez por versión)"""
+    key = id(catalog)
+    with _facet_lock:
+        cached = _facet_cache.get(key)
+        if cached is not None and cached[0]() is catalog:
+            return cached[1]
+        index = FacetIndex.from_catalog(catalog)
+        ref = weakref.ref(catalog, lambda _ref, key=key: _facet_cache.pop(key, None))
+        _facet_cache[key] = (ref, index)
+        return index
+
+
+def facet_mask(graph: Graph, model_uris: Sequence[Any], filters: Optional[Mapping[str, Any]]) -> np.ndarray:
+    """
+    Máscara de las URIs de modelo que cumplen los filtros de facetas.
+
+    Las URIs que no están en el catálogo no cumplen ningún filtro; sin
+    filtros, la máscara es toda True.
+    """
+    if not filters:
+        return np.ones(len(model_uris), dtype=bool)
+    catalog = get_model_catalog(graph)
+    facets = get_facet_index(catalog)
+    return facets.contains(catalog.model_ids(model_uris), facets.select(filters))
@@ -0,0 +1,286 @@
+"""
+Backends de almacenamiento para el grafo de conocimiento.
+
+Por defecto el grafo vive en memoria (rdflib ``Memory``) y cada proceso paga
+la carga completa. Para catálogos que no caben en RAM, el grafo puede residir
+en un triple store en disco detrás de la misma interfaz ``rdflib.Graph``
+(``query()``, ``triples()``, ``value()``...):
+
+- ``memory``: grafo en memoria compartido vía ``GraphStore`` (por defecto).
+- ``oxigraph``: store RocksDB de pyoxigraph vía ``oxrdflib`` (SPARQL nativo).
+  Se abre en solo lectura, así que varios procesos pueden abrirlo a la vez.
+- ``berkeleydb``: store BerkeleyDB de rdflib (paquete ``berkeleydb``).
+
+El store se crea una vez a partir del snapshot Turtle con el comando
+``migrate``; junto a él se guarda un ``.meta.json`` con el sha256 del fichero
+fuente, que sirve de versión del grafo (catálogo columnar, cachés).
+
+Uso:
+    python -m knowledge_graph.graph_backends migrate data/ai_models_multi_repo.ttl --backend oxigraph
+
+    from knowledge_graph.graph_backends import open_graph
+    graph = open_graph("data/ai_models_multi_repo.ttl", backend="oxigraph")
+
+Autor: Edmundo Mori
+"""
+
+import json
+import logging
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from rdflib import Graph
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+from rdflib.plugin import PluginException
+
+from .graph_snapshot import guess_format, parse_graph, snapshot_sha256
+from .ntriples_io import split_compression
+from .graph_store import get_graph_store, get_shared_graph
+
+
+logger = logging.getLogger(__name__)
+
+# Backend -> (plugin de store rdflib, paquete que lo provee)
+GRAPH_BACKENDS = {
+    "memory": (None, None),
+    "oxigraph": ("Oxigraph", "oxrdflib"),
+    "berkeleydb": ("BerkeleyDB", "berkeleydb"),
+}
+
+DEFAULT_BACKEND = "memory"
+
+# Directorio (junto al grafo fuente) donde se crean los stores por defecto
+STORES_DIRNAME = ".stores"
+
+# Sufijo del fichero de metadatos del store
+STORE_METADATA_SUFFIX = ".meta.json"
+
+# Formatos que oxrdflib parsea con el parser nativo de Oxigraph
+OXIGRAPH_FORMATS = {"turtle", "nt", "nquads", "xml"}
+
+# Stores abiertos en este proceso: (backend, ruta) -> grafo
+_open_graphs: Dict[Tuple[str, Path], Graph] = {}
+_open_lock = threading.Lock()
+
+
+def default_store_path(source: Union[str, Path], backend: str) -> Path:
+    """Ruta por defecto del store de un backend para un fichero fuente"""
+    source = Path(source)
+    return source.parent / STORES_DIRNAME / f"{source.stem}.{backend}"
+
+
+def _metadata_path(store_path: Path) -> Path:
+    return store_path.with_name(store_path.name + STORE_METADATA_SUFFIX)
+
+
+def read_store_metadata(store_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Metadatos de migración de un store (None si no existen)"""
+    try:
+        with open(_metadata_path(Path(store_path)), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _check_backend(backend: str) -> None:
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(
+            f"Backend desconocido '{backend}'. Opciones: {', '.join(GRAPH_BACKENDS)}"
+        )
+
+
+def _new_store_graph(backend: str, store_path: Path, create: bool) -> Graph:
+    """Crear el ``Graph`` rdflib sobre el store en disco del backend"""
+    plugin_name, package = GRAPH_BACKENDS[backend]
+
+    try:
+        if backend == "oxigraph" and not create:
+            # Solo lectura: varios workers pueden abrir el mismo store
+            import pyoxigraph
+            from oxrdflib import OxigraphStore
+            store = OxigraphStore(store=pyoxigraph.Store.read_only(str(store_path)))
+            return Graph(store=store, identifier=DATASET_DEFAULT_GRAPH_ID)
+
+        # Identificador fijo: el grafo por defecto del store, estable entre aperturas
+        graph = Graph(store=plugin_name, identifier=DATASET_DEFAULT_GRAPH_ID)
+    except (ImportError, PluginException):
+        raise ImportError(f"El backend '{backend}' requiere: pip install {package}")
+
+    graph.open(str(store_path), create=create)
+    return graph
+
+
+def open_graph(
+    source: Optional[Union[str, Path]] = None,
+    backend: str = DEFAULT_BACKEND,
+    store_path: Optional[Union[str, Path]] = None,
+) -> Graph:
+    """
+    Abrir el grafo de conocimiento con el backend indicado.
+
+    Los stores en disco se abren una sola vez por proceso y se registran en el
+    ``GraphStore`` con la versión del fichero fuente migrado, de modo que el
+    catálogo columnar se persiste y comparte igual que con el grafo en memoria.
+
+    Args:
+        source: Fichero RDF fuente (obligatorio para ``memory``)
+        backend: ``memory``, ``oxigraph`` o ``berkeleydb``
+        store_path: Ruta del store (por defecto, ``.stores/<stem>.<backend>``)
+
+    Returns:
+        Grafo rdflib (solo lectura para los backends en disco)
+    """
+    _check_backend(backend)
+
+    if backend == "memory":
+        if source is None:
+            raise ValueError("El backend 'memory' requiere el fichero fuente")
+        return get_shared_graph(source)
+
+    if store_path is None:
+        if source is None:
+            raise ValueError(f"El backend '{backend}' requiere 'source' o 'store_path'")
+        store_path = default_store_path(source, backend)
+    store_path = Path(store_path).resolve()
+
+    with _open_lock:
+        key = (backend, store_path)
+        if key in _open_graphs:
+            return _open_graphs[key]
+
+        if not store_path.exists():
+            raise FileNotFoundError(
+                f"Store no encontrado: {store_path}. Ejecuta: "
+                f"python -m knowledge_graph.graph_backends migrate <grafo.ttl> --backend {backend}"
+            )
+
+        metadata = read_store_metadata(store_path) or {}
+        if source is not None and Path(source).exists() and metadata:
+            stat = Path(source).stat()
+            if (stat.st_size, stat.st_mtime_ns) != (metadata.get("source_size"), metadata.get("source_mtime_ns")):
+                logger.warning(f"⚠️ El store {store_path.name} es anterior a {Path(source).name}; vuelve a migrar")
+
+        graph = _new_store_graph(backend, store_path, create=False)
+        if metadata.get("source_sha256"):
+            get_graph_store().register(store_path, graph, version=metadata["source_sha256"])
+        _open_graphs[key] = graph
+
+        logger.info(f"🗄️ Store {backend} abierto: {store_path}")
+        return graph
+
+
+def migrate(
+    source: Union[str, Path],
+    backend: str,
+    store_path: Optional[Union[str, Path]] = None,
+    format: Optional[str] = None,
+    force: bool = False,
+) -> Path:
+    """
+    Crear un store en disco a partir de un fichero RDF (p.ej. el snapshot Turtle).
+
+    Los triples se parsean directamente en el store, sin pasar por un grafo
+    en memoria.
+
+    Args:
+        source: Fichero RDF fuente
+        backend: Backend en disco (``oxigraph`` o ``berkeleydb``)
+        store_path: Ruta del store (por defecto, ``.stores/<stem>.<backend>``)
+        format: Formato rdflib (por defecto, según la extensión)
+        force: Reemplazar el store si ya existe
+
+    Returns:
+        Ruta del store creado
+    """
+    _check_backend(backend)
+    if backend == "memory":
+        raise ValueError("El backend 'memory' no necesita migración")
+
+    source = Path(source)
+    store_path = Path(store_path) if store_path else default_store_path(source, backend)
+    format = format or guess_format(source)
+
+    if store_path.exists():
+        if not force:
+            raise FileExistsError(f"El store ya existe: {store_path} (usa --force para reemplazarlo)")
+        if store_path.is_dir():
+            shutil.rmtree(store_path)
+        else:
+            store_path.unlink()
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+
+    graph = _new_store_graph(backend, store_path, create=True)
+    try:
+        _, compression = split_compression(source)
+        if backend == "oxigraph" and format in OXIGRAPH_FORMATS and compression is None:
+            graph.parse(str(source), format=f"ox-{format}")
+        else:
+            parse_graph(source, format=format, graph=graph)
+        triple_count = len(graph)
+    finally:
+        graph.close()
+
+    stat = source.stat()
+    metadata = {
+        "backend": backend,
+        "source": str(source),
+        "source_sha256": snapshot_sha256(source),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "triple_count": triple_count,
+        "migrated_at": datetime.now().isoformat(),
+    }
+    with open(_metadata_path(store_path), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    logger.info(f"✅ Migrados {triple_count:,} triples a {backend}: {store_path}")
+    return store_path
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Migrar el grafo de conocimiento a un triple store en disco"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    backends = [name for name in GRAPH_BACKENDS if name != "memory"]
+
+    migrate_parser = subparsers.add_parser("migrate", help="Crear el store desde un fichero RDF")
+    migrate_parser.add_argument("graph", help="Fichero RDF fuente (p.ej. Turtle)")
+    migrate_parser.add_argument("--backend", choices=backends, default="oxigraph")
+    migrate_parser.add_argument("--store", default=None, help="Ruta del store")
+    migrate_parser.add_argument("--format", default=None, help="Formato rdflib del fichero")
+    migrate_parser.add_argument("--force", action="store_true", help="Reemplazar el store existente")
+
+    info_parser = subparsers.add_parser("info", help="Mostrar metadatos del store")
+    info_parser.add_argument("graph", help="Fichero RDF fuente")
+    info_parser.add_argument("--backend", choices=backends, default="oxigraph")
+    info_parser.add_argument("--store", default=None, help="Ruta del store")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "migrate":
+        store_path = migrate(
+            args.graph, args.backend, store_path=args.store, format=args.format, force=args.force
+        )
+        print(f"✅ Store creado: {store_path}")
+    elif args.command == "info":
+        store_path = Path(args.store) if args.store else default_store_path(args.graph, args.backend)
+        metadata = read_store_metadata(store_path)
+        if metadata is None:
+            print(f"⚠️ No hay store migrado en {store_path}")
+            return
+        print(json.dumps(metadata, indent=2, ensure_ascii=False))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+"""
+Snapshot compilado del grafo de conocimiento.
+
+Parsear ``data/ai_models_multi_repo.ttl`` con el parser Turtle de rdflib tarda
+segundos y crece linealmente con el catálogo. Este módulo produce, una sola vez
+por versión del grafo, un fichero binario (``.npz``) con:
+
+- Diccionario de términos: tipo (URI, BNode, Literal), valor léxico UTF-8
+  concatenado + offsets, datatype e idioma codificados como enteros.
+- Triples como un array ``int32`` de forma (N, 3) sobre ese diccionario.
+- Cabecera JSON con el sha256 del grafo fuente, prefijos y conteos.
+
+El snapshot compilado se identifica por el sha256 del fichero fuente (el mismo
+que registra ``experiments/benchmarks/snapshot/snapshot_metadata.json``), de modo
+que se invalida solo cuando el grafo cambia.
+
+Uso:
+    from knowledge_graph.graph_snapshot import load_graph
+    graph = load_graph("data/ai_models_multi_repo.ttl")  # usa el snapshot si está fresco
+
+    python -m knowledge_graph.graph_snapshot compile data/ai_models_multi_repo.ttl
+
+Autor: Edmundo Mori
+"""
+
+import hashlib
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.term import Node
+
+from .ntriples_io import open_text, read_graph, split_compression
+
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato binario (incrementar si cambia la estructura)
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Directorio (junto al grafo fuente) donde se guardan los snapshots compilados
+COMPILED_DIRNAME = ".compiled"
+
+# Metadatos de snapshot que ya registran el sha256 del grafo
+SNAPSHOT_METADATA_FILENAME = "snapshot_metadata.json"
+CANONICAL_SNAPSHOT_METADATA = (
+    Path(__file__).resolve().parent.parent / "experiments" / "benchmarks" / "snapshot" / SNAPSHOT_METADATA_FILENAME
+)
+
+# Tipos de término
+TERM_URI = 0
+TERM_BNODE = 1
+TERM_LITERAL = 2
+
+# Formatos rdflib según extensión
+FORMAT_BY_SUFFIX = {
+    ".ttl": "turtle",
+    ".nt": "nt",
+    ".nq": "nquads",
+    ".rdf": "xml",
+    ".xml": "xml",
+    ".jsonld": "json-ld",
+}
+
+
+def file_sha256(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Calcula el sha256 de un fichero leyendo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _recorded_sha256(metadata_path: Path, path: Path) -> Optional[str]:
+    """
+    sha256 que un ``snapshot_metadata.json`` registra para ``path``, si lo describe.
+
+    Lo describe si ``source_file`` es la misma ruta (o, escrito en otra máquina,
+    el mismo nombre), con el mismo tamaño, y el metadato es posterior al fichero.
+    """
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        stat = path.stat()
+        source_file = metadata.get("source_file")
+        if (
+            metadata.get("sha256")
+            and source_file
+            and (Path(source_file) == path.resolve() or Path(source_file).name == path.name)
+            and metadata.get("size_bytes") == stat.st_size
+            and metadata_path.stat().st_mtime >= stat.st_mtime
+        ):
+            return metadata["sha256"]
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def snapshot_sha256(path: Union[str, Path]) -> str:
+    """
+    Obtiene el sha256 que identifica la versión de un grafo.
+
+    Si un ``snapshot_metadata.json`` describe este mismo fichero (el de su
+    directorio o el canónico de ``experiments/benchmarks/snapshot``), se
+    reutiliza el sha256 ya registrado. En otro caso se calcula sobre el contenido.
+    """
+    path = Path(path)
+
+    for metadata_path in (path.parent / SNAPSHOT_METADATA_FILENAME, CANONICAL_SNAPSHOT_METADATA):
+        if metadata_path.exists():
+            recorded = _recorded_sha256(metadata_path, path)
+            if recorded is not None:
+                return recorded
+
+    return file_sha256(path)
+
+
+def compiled_artifact_path(path: Union[str, Path], sha256: str, suffix: str) -> Path:
+    """
+    Ruta de un artefacto compilado de un grafo fuente: ``.compiled/<nombre>.<sha16><sufijo>``.
+
+    Se usa el nombre completo del fuente (con extensión), para que ``x.ttl`` y
+    ``x.nt`` del mismo directorio no compartan artefactos.
+    """
+    path = Path(path)
+    return path.parent / COMPILED_DIRNAME / f"{path.name}.{sha256[:16]}{suffix}"
+
+
+def stale_compiled_artifacts(path: Union[str, Path], suffix: str, current: Path) -> List[Path]:
+    """
+    Artefactos ``<sufijo>`` de otras versiones del mismo grafo fuente (nunca los de otros grafos).
+
+    Incluye los nombrados con el formato anterior, sin la extensión del fuente
+    (``<stem>.<sha16><sufijo>``).
+    """
+    path = Path(path)
+    directory = path.parent / COMPILED_DIRNAME
+    if not directory.is_dir():
+        return []
+    names = {re.escape(path.name), re.escape(path.stem)}
+    pattern = re.compile("(?:" + "|".join(names) + r")\.[0-9a-f]{16}" + re.escape(suffix))
+    return [
+        entry for entry in directory.iterdir()
+        if entry != current and pattern.fullmatch(entry.name)
+    ]
+
+
+def compiled_path_for(path: Union[str, Path], sha256: str) -> Path:
+    """Ruta del snapshot compilado para un grafo fuente y versión dados."""
+    return compiled_artifact_path(path, sha256, ".npz")
+
+
+def guess_format(path: Union[str, Path]) -> str:
+    """Deduce el formato rdflib a partir de la extensión (ignorando .gz/.zst)."""
+    base, _ = split_compression(path)
+    return FORMAT_BY_SUFFIX.get(base.suffix.lower(), "turtle")
+
+
+def parse_graph(
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    graph: Optional[Graph] = None,
+) -> Graph:
+    """
+    Parsea un fichero RDF, comprimido o no.
+
+    N-Triples y N-Quads se leen en streaming (memoria acotada); el resto de
+    formatos pasan por el parser de rdflib.
+    """
+    path = Path(path)
+    format = format or guess_format(path)
+    if graph is None:
+        graph = Graph()
+
+    if format in ("nt", "nquads"):
+        return read_graph(path, graph)
+
+    _, compression = split_compression(path)
+    if compression is not None:
+        with open_text(path, "r", compression=compression) as f:
+            graph.parse(file=f, format=format)
+    else:
+        graph.parse(str(path), format=format)
+    return graph
+
+
+# Clave de un término: (tipo, valor léxico, datatype, idioma)
+TermKey = Tuple[int, str, Optional[str], Optional[str]]
+
+
+def term_key(term: Node) -> TermKey:
+    """Clave hashable y serializable de un término rdflib."""
+    if isinstance(term, Literal):
+        datatype = str(term.datatype) if term.datatype is not None else None
+        return TERM_LITERAL, str(term), datatype, term.language or None
+    return (TERM_BNODE if isinstance(term, BNode) else TERM_URI), str(term), None, None
+
+
+class TermDictionary:
+    """
+    Diccionario de términos en construcción (clave -> id denso).
+
+    Lo usan tanto la compilación desde un ``Graph`` como la fusión de las
+    partes parseadas en paralelo (``parallel_parse``).
+    """
+
+    def __init__(self):
+        self.ids: Dict[TermKey, int] = {}
+        self.kinds: List[int] = []
+        self.values: List[bytes] = []
+        self.term_datatypes: List[int] = []
+        self.term_langs: List[int] = []
+        self.datatype_ids: Dict[str, int] = {}
+        self.lang_ids: Dict[str, int] = {}
+        self._term_ids: Dict[Node, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def add(self, key: TermKey) -> int:
+        """Id del término con esa clave (lo crea si no existe)"""
+        term_id = self.ids.get(key)
+        if term_id is not None:
+            return term_id
+
+        kind, value, datatype, lang = key
+        term_id = len(self.kinds)
+        self.ids[key] = term_id
+        self.kinds.append(kind)
+        self.values.append(value.encode("utf-8"))
+        self.term_datatypes.append(
+            self.datatype_ids.setdefault(datatype, len(self.datatype_ids)) if datatype else -1
+        )
+        self.term_langs.append(
+            self.lang_ids.setdefault(lang, len(self.lang_ids)) if lang else -1
+        )
+        return term_id
+
+    def encode(self, term: Node) -> int:
+        """Id de un término rdflib"""
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = self.add(term_key(term))
+        return term_id
+
+
+@dataclass
+class CompiledSnapshot:
+    """
+    Grafo codificado con diccionario de términos y triples enteros.
+
+    Los términos se guardan como un único blob UTF-8 (``term_blob``) indexado
+    por ``term_offsets``; ``term_datatypes`` y ``term_langs`` apuntan a las
+    tablas ``datatypes`` y ``langs`` (-1 = sin datatype / idioma).
+    """
+    sha256: str
+    term_kinds: np.ndarray
+    term_offsets: np.ndarray
+    term_blob: np.ndarray
+    term_datatypes: np.ndarray
+    term_langs: np.ndarray
+    datatypes: List[str]
+    langs: List[str]
+    triples: np.ndarray
+    namespaces: Dict[str, str] = field(default_factory=dict)
+    header: Dict = field(default_factory=dict)
+
+    @property
+    def term_count(self) -> int:
+        return len(self.term_kinds)
+
+    @property
+    def triple_count(self) -> int:
+        return len(self.triples)
+
+    @classmethod
+    def from_graph(cls, graph: Graph, sha256: str, source: Optional[str] = None) -> "CompiledSnapshot":
+        """Codifica un grafo rdflib en memoria."""
+        terms = TermDictionary()
+        triples = np.empty((len(graph), 3), dtype=np.int32)
+        for i, (s, p, o) in enumerate(graph):
+            triples[i, 0] = terms.encode(s)
+            triples[i, 1] = terms.encode(p)
+            triples[i, 2] = terms.encode(o)
+
+        namespaces = {prefix: str(uri) for prefix, uri in graph.namespaces()}
+        return cls.from_terms(terms, triples, sha256, source=source, namespaces=namespaces)
+
+    @classmethod
+    def from_terms(
+        cls,
+        terms: "TermDictionary",
+        triples: np.ndarray,
+        sha256: str,
+        source: Optional[str] = None,
+        namespaces: Optional[Dict[str, str]] = None,
+        unique: bool = False,
+    ) -> "CompiledSnapshot":
+        """
+        Construye el snapshot a partir de un diccionario de términos y sus triples.
+
+        Args:
+            unique: Eliminar triples repetidos (entradas que no vienen de un Graph)
+        """
+        # Orden (s, p, o) para mejorar la localidad al recorrer por sujeto
+        if unique and len(triples):
+            triples = np.unique(triples, axis=0)
+        elif len(triples):
+            order = np.lexsort((triples[:, 2], triples[:, 1], triples[:, 0]))
+            triples = triples[order]
+
+        lengths = np.fromiter((len(v) for v in terms.values), dtype=np.int64, count=len(terms.values))
+        offsets = np.zeros(len(terms.values) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        blob = np.frombuffer(b"".join(terms.values), dtype=np.uint8)
+
+        header = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "sha256": sha256,
+            "source_file": source,
+            "created_at": datetime.now().isoformat(),
+            "term_count": len(terms),
+            "triple_count": int(len(triples)),
+        }
+
+        return cls(
+            sha256=sha256,
+            term_kinds=np.asarray(terms.kinds, dtype=np.uint8),
+            term_offsets=offsets,
+            term_blob=blob,
+            term_datatypes=np.asarray(terms.term_datatypes, dtype=np.int32),
+            term_langs=np.asarray(terms.term_langs, dtype=np.int32),
+            datatypes=sorted(terms.datatype_ids, key=terms.datatype_ids.get),
+            langs=sorted(terms.lang_ids, key=terms.lang_ids.get),
+            triples=triples,
+            namespaces=namespaces or {},
+            header=header,
+        )
+
+    def save(self, output_path: Union[str, Path]) -> Path:
+        """Guarda el snapshot (npz sin comprimir para cargas rápidas)."""
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        header = {
+            **self.header,
+            "datatypes": self.datatypes,
+            "langs": self.langs,
+            "namespaces": self.namespaces,
+        }
+
+        # Escritura atómica: otros procesos pueden estar leyendo el anterior
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                header=np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+                term_kinds=self.term_kinds,
+                term_offsets=self.term_offsets,
+                term_blob=self.term_blob,
+                term_datatypes=self.term_datatypes,
+                term_langs=self.term_langs,
+                triples=self.triples,
+            )
+        tmp_path.replace(output_path)
+        return output_path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "CompiledSnapshot":
+        """Carga un snapshot compilado desde disco."""
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(
+                    f"Formato de snapshot no soportado: {header.get('format_version')}"
+                )
+            return cls(
+                sha256=header["sha256"],
+                term_kinds=data["term_kinds"],
+                term_offsets=data["term_offsets"],
+                term_blob=data["term_blob"],
+                term_datatypes=data["term_datatypes"],
+                term_langs=data["term_langs"],
+                datatypes=header.pop("datatypes"),
+                langs=header.pop("langs"),
+                triples=data["triples"],
+                namespaces=header.pop("namespaces"),
+                header=header,
+            )
+
+    def decode_terms(self) -> List[Node]:
+        """Reconstruye la lista de términos rdflib (indexada por id)."""
+        text = self.term_blob.tobytes()
+        offsets = self.term_offsets.tolist()
+        kinds = self.term_kinds.tolist()
+        term_datatypes = self.term_datatypes.tolist()
+        term_langs = self.term_langs.tolist()
+        datatypes = [URIRef(dt) for dt in self.datatypes]
+
+        terms: List[Node] = []
+        for i, kind in enumerate(kinds):
+            value = text[offsets[i]:offsets[i + 1]].decode("utf-8")
+            if kind == TERM_URI:
+                terms.append(URIRef(value))
+            elif kind == TERM_BNODE:
+                terms.append(BNode(value))
+            else:
+                dt_id = term_datatypes[i]
+                lang_id = term_langs[i]
+                terms.append(Literal(
+                    value,
+                    datatype=datatypes[dt_id] if dt_id >= 0 else None,
+                    lang=self.langs[lang_id] if lang_id >= 0 else None,
+                ))
+        return terms
+
+    def to_graph(self, graph: Optional[Graph] = None) -> Graph:
+        """Materializa el snapshot como grafo rdflib en memoria."""
+        graph = graph if graph is not None else Graph()
+        for prefix, uri in self.namespaces.items():
+            graph.bind(prefix, uri, override=True)
+
+        terms = self.decode_terms()
+        graph.addN(
+            (terms[s], terms[p], terms[o], graph)
+            for s, p, o in self.triples.tolist()
+        )
+        return graph
+
+
+def compile_snapshot(
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    graph: Optional[Graph] = None,
+    sha256: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Path:
+    """
+    Compila un grafo fuente a su snapshot binario.
+
+    Args:
+        path: Fichero RDF fuente
+        format: Formato rdflib (por defecto, según extensión)
+        graph: Grafo ya parseado del mismo fichero (evita parsear de nuevo)
+        sha256: Versión del grafo (por defecto, se calcula)
+        workers: Procesos para parsear volcados línea a línea (por defecto, todos los núcleos)
+
+    Returns:
+        Ruta del snapshot compilado
+    """
+    path = Path(path)
+    sha256 = sha256 or snapshot_sha256(path)
+
+    snapshot = None
+    if graph is None:
+        from .parallel_parse import parse_snapshot_parallel
+        snapshot = parse_snapshot_parallel(path, sha256, format=format, workers=workers)
+        if snapshot is None:
+            graph = parse_graph(path, format=format)
+
+    if snapshot is None:
+        snapshot = CompiledSnapshot.from_graph(graph, sha256, source=str(path))
+    return _save_compiled(path, snapshot)
+
+
+def _save_compiled(path: Path, snapshot: CompiledSnapshot) -> Path:
+    """Guarda el snapshot de un grafo fuente y elimina los de versiones anteriores."""
+    output_path = snapshot.save(compiled_path_for(path, snapshot.sha256))
+
+    # Eliminar snapshots de versiones anteriores del mismo grafo
+    for stale in stale_compiled_artifacts(path, ".npz", output_path):
+        stale.unlink(missing_ok=True)
+
+    logger.info(f"📦 Snapshot compilado: {output_path} ({snapshot.triple_count:,} triples)")
+    return output_path
+
+
+def load_graph(
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    use_compiled: bool = True,
+    write_compiled: bool = True,
+    workers: Optional[int] = None,
+) -> Graph:
+    """
+    Carga un grafo RDF usando el snapshot compilado cuando está fresco.
+
+    Si no existe snapshot para la versión actual del fichero, parsea el
+    fichero fuente y (por defecto) deja el snapshot compilado para los
+    siguientes arranques.
+
+    Args:
+        path: Fichero RDF fuente
+        format: Formato rdflib (por defecto, según extensión)
+        use_compiled: Usar el snapshot compilado si existe
+        write_compiled: Compilar el snapshot tras parsear el fuente
+        workers: Procesos para parsear volcados línea a línea (por defecto, todos los núcleos)
+
+    Returns:
+        Grafo rdflib en memoria
+    """
+    path = Path(path)
+
+    if not use_compiled:
+        graph = parse_graph(path, format=format)
+        return graph
+
+    sha256 = snapshot_sha256(path)
+    compiled_path = compiled_path_for(path, sha256)
+
+    if compiled_path.exists():
+        try:
+            snapshot = CompiledSnapshot.load(compiled_path)
+            if snapshot.sha256 == sha256:
+                return snapshot.to_graph()
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot compilado inválido ({compiled_path}): {e}")
+
+    # Volcados grandes línea a línea: parseo multiproceso directo a snapshot
+    from .parallel_parse import parse_snapshot_parallel
+    snapshot = parse_snapshot_parallel(path, sha256, format=format, workers=workers)
+    if snapshot is not None:
+        if write_compiled:
+            try:
+                _save_compiled(path, snapshot)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo guardar el snapshot compilado: {e}")
+        return snapshot.to_graph()
+
+    graph = parse_graph(path, format=format)
+
+    if write_compiled:
+        try:
+            compile_snapshot(path, graph=graph, sha256=sha256)
+        except OSError as e:
+            # Directorio de solo lectura: seguimos con el grafo parseado
+            logger.warning(f"⚠️ No se pudo guardar el snapshot compilado: {e}")
+
+    return graph
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compilar grafos RDF a snapshots binarios de carga rápida"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    compile_parser = subparsers.add_parser("compile", help="Compilar snapshot")
+    compile_parser.add_argument("graph", help="Fichero RDF fuente")
+    compile_parser.add_argument("--format", default=None, help="Formato rdflib del fichero")
+    compile_parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Procesos para parsear volcados línea a línea (por defecto, todos los núcleos)"
+    )
+    compile_parser.add_argument(
+        "--no-catalog", action="store_true",
+        help="No materializar el catálogo de modelos ni sus estadísticas"
+    )
+
+    info_parser = subparsers.add_parser("info", help="Mostrar cabecera del snapshot")
+    info_parser.add_argument("graph", help="Fichero RDF fuente")
+
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        output_path = compile_snapshot(args.graph, format=args.format, workers=args.workers)
+        print(f"✅ Snapshot compilado: {output_path}")
+        if not args.no_catalog:
+            # Catálogo de modelos y estadísticas de facetas de la misma versión
+            from .graph_store import get_shared_graph
+            from .model_catalog import get_graph_statistics
+
+            stats = get_graph_statistics(get_shared_graph(args.graph))
+            print(f"🗂️ Catálogo: {stats['total_models']:,} modelos, {stats['total_triples']:,} triples")
+    elif args.command == "info":
+        sha256 = snapshot_sha256(args.graph)
+        compiled_path = compiled_path_for(args.graph, sha256)
+        if not compiled_path.exists():
+            print(f"⚠️ No hay snapshot compilado para sha256 {sha256[:16]}")
+            return
+        snapshot = CompiledSnapshot.load(compiled_path)
+        print(json.dumps(snapshot.header, indent=2, ensure_ascii=False))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Registro de grafos compartidos por proceso (GraphStore).
+
+Cada motor (SearchEngine, BM25, Dense, Hybrid, páginas Streamlit) cargaba su
+propia copia del mismo grafo. El ``GraphStore`` mantiene una única instancia
+en memoria por fichero y versión (sha256 del snapshot) y se la entrega a todos
+los consumidores del proceso.
+
+El grafo compartido debe tratarse como de solo lectura: quien necesite
+modificarlo debe trabajar sobre una copia o llamar a ``touch(graph)`` después,
+que le da una versión nueva para que las cachés por versión (resultados SPARQL,
+índices, catálogo) no sirvan la anterior.
+
+Uso:
+    from knowledge_graph.graph_store import get_shared_graph
+    graph = get_shared_graph("data/ai_models_multi_repo.ttl")
+
+Autor: Edmundo Mori
+"""
+
+import hashlib
+import itertools
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from rdflib import Graph
+
+from .graph_snapshot import load_graph, snapshot_sha256
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GraphEntry:
+    """Grafo cargado junto con la versión de la que procede"""
+    path: Path
+    version: str
+    graph: Graph
+    stat_key: Tuple[int, int]
+    # Modificado en memoria tras cargarlo: ya no coincide con el fichero ni
+    # con sus artefactos compilados
+    modified: bool = False
+
+
+class GraphStore:
+    """
+    Registro de grafos RDF compartidos, indexado por ruta y versión.
+
+    La versión es el sha256 del fichero fuente. Solo se recalcula cuando
+    cambian el tamaño o la fecha de modificación del fichero, de modo que
+    las llamadas repetidas cuestan un ``stat``.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Path, GraphEntry] = {}
+        self._entries_by_graph: Dict[int, GraphEntry] = {}
+        self._lock = threading.RLock()
+        self._touches = itertools.count(1)
+
+    @staticmethod
+    def _stat_key(path: Path) -> Tuple[int, int]:
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def get_graph(self, path: Union[str, Path]) -> Graph:
+        """
+        Obtener el grafo compartido para un fichero.
+
+        Args:
+            path: Fichero RDF fuente
+
+        Returns:
+            Grafo rdflib compartido (no modificar)
+        """
+        return self.get_entry(path).graph
+
+    def get_entry(self, path: Union[str, Path]) -> GraphEntry:
+        """Obtener la entrada (grafo + versión), cargándola si está obsoleta"""
+        path = Path(path).resolve()
+
+        with self._lock:
+            stat_key = self._stat_key(path)
+            entry = self._entries.get(path)
+
+            if entry is not None and entry.stat_key == stat_key:
+                return entry
+
+            version = snapshot_sha256(path)
+            if entry is not None and entry.version == version:
+                entry.stat_key = stat_key
+                return entry
+
+            graph = load_graph(path)
+            entry = GraphEntry(path=path, version=version, graph=graph, stat_key=stat_key)
+            self._register_entry(entry)
+            logger.info(f"📚 GraphStore: {path.name} v{version[:12]} ({len(graph):,} triples)")
+            return entry
+
+    def _register_entry(self, entry: GraphEntry) -> None:
+        previous = self._entries.get(entry.path)
+        if previous is not None:
+            self._entries_by_graph.pop(id(previous.graph), None)
+        self._entries[entry.path] = entry
+        self._entries_by_graph[id(entry.graph)] = entry
+
+    def register(self, path: Union[str, Path], graph: Graph, version: Optional[str] = None) -> GraphEntry:
+        """
+        Registrar un grafo ya construido (p.ej. recién guardado a disco).
+
+        Args:
+            path: Fichero del que procede (o al que se ha guardado) el grafo
+            graph: Grafo en memoria
+            version: sha256 del fichero (por defecto, se calcula)
+        """
+        path = Path(path).resolve()
+        with self._lock:
+            entry = GraphEntry(
+                path=path,
+                version=version or snapshot_sha256(path),
+                graph=graph,
+                stat_key=self._stat_key(path),
+            )
+            self._register_entry(entry)
+            return entry
+
+    def version(self, path: Union[str, Path]) -> str:
+        """Versión (sha256) del grafo compartido para un fichero"""
+        return self.get_entry(path).version
+
+    def entry_of(self, graph: Graph) -> Optional[GraphEntry]:
+        """Entrada de un grafo registrado, o None si no procede del store"""
+        entry = self._entries_by_graph.get(id(graph))
+        if entry is not None and entry.graph is graph:
+            return entry
+        return None
+
+    def version_of(self, graph: Graph) -> Optional[str]:
+        """Versión de un grafo registrado, o None si no procede del store"""
+        entry = self.entry_of(graph)
+        return entry.version if entry is not None else None
+
+    def touch(self, graph: Graph) -> Optional[str]:
+        """
+        Dar una versión nueva a un grafo registrado que se ha modificado en memoria.
+
+        La versión nueva no es el sha256 de ningún fichero: los consumidores no
+        deben abrir ni persistir artefactos compilados de una entrada ``modified``.
+
+        Returns:
+            Versión nueva, o None si el grafo no procede del store
+        """
+        with self._lock:
+            entry = self.entry_of(graph)
+            if entry is None:
+                return None
+            entry.version = hashlib.sha256(f"{entry.version}:{next(self._touches)}".encode()).hexdigest()
+            entry.modified = True
+            return entry.version
+
+    def invalidate(self, path: Optional[Union[str, Path]] = None) -> None:
+        """Descartar una entrada (o todas) para forzar la recarga"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._entries_by_graph.clear()
+                return
+
+            entry = self._entries.pop(Path(path).resolve(), None)
+            if entry is not None:
+                self._entries_by_graph.pop(id(entry.graph), None)
+
+
+# Registro por defecto del proceso
+_default_store = GraphStore()
+
+
+def get_graph_store() -> GraphStore:
+    """Registro de grafos compartido por todo el proceso"""
+    return _default_store
+
+
+def get_shared_graph(path: Union[str, Path]) -> Graph:
+    """Atajo: grafo compartido del registro por defecto"""
+    return _default_store.get_graph(path)
@@ -0,0 +1,606 @@
+"""
+Ingestión incremental del grafo de conocimiento.
+
+``MultiRepositoryGraphBuilder.build_from_repositories`` reconstruye el grafo
+completo en cada refresco. Este módulo mantiene el grafo como un ``Dataset``
+rdflib con un grafo nombrado por modelo, de modo que actualizar un modelo
+consiste en reemplazar solo sus triples:
+
+- Cada modelo se identifica por su URI y una *huella* (``sha`` de HuggingFace,
+  ``last_modified`` o, en su defecto, hash del contenido). Si la huella no
+  cambia, el modelo no se toca.
+- Los cambios se añaden a un log de deltas (``deltas.jsonl``) en lugar de
+  reescribir el grafo; al abrir el estado se reaplican sobre la base.
+- La compactación periódica vuelca el estado a ``base.nq`` y vacía el log.
+- La primera vez (o si el grafo exportado cambió por otra vía, p.ej. una
+  reconstrucción completa) el estado se siembra desde el grafo existente,
+  repartiendo sus triples en un grafo nombrado por modelo. ``export`` se niega
+  a sobrescribir un grafo existente con un estado vacío o que no procede de él.
+- Cada operación devuelve un ``ChangeSet`` (modelos añadidos, actualizados y
+  eliminados) para que los índices derivados se actualicen sin reconstruirse.
+
+Los triples compartidos entre modelos (autor, tarea, licencia...) aparecen en
+el grafo nombrado de cada modelo que los aporta; la unión del ``Dataset`` los
+conserva mientras algún modelo los siga aportando.
+
+Uso:
+    from knowledge_graph.incremental import IncrementalGraph
+    graph_path = "data/ai_models_multi_repo.ttl"
+    state = IncrementalGraph.open(IncrementalGraph.default_directory(graph_path), graph_path=graph_path)
+    changes = state.upsert_models(models, builder, repositories)
+    if changes:
+        state.export("data/ai_models_multi_repo.ttl")
+
+    python -m knowledge_graph.incremental info data/.incremental/ai_models_multi_repo
+
+Autor: Edmundo Mori
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from rdflib import RDF, BNode, Dataset, Graph, Namespace, URIRef
+from rdflib.namespace import DCTERMS
+
+from .graph_snapshot import compile_snapshot, snapshot_sha256
+from .graph_store import get_graph_store
+from .ntriples_io import STREAMING_FORMATS, read_graph, write_graph
+
+
+logger = logging.getLogger(__name__)
+
+DAIMO = Namespace("http://purl.org/pionera/daimo#")
+
+# Directorio (junto al grafo exportado) donde vive el estado incremental
+INCREMENTAL_DIRNAME = ".incremental"
+
+BASE_FILENAME = "base.nq"
+MANIFEST_FILENAME = "manifest.json"
+DELTA_LOG_FILENAME = "deltas.jsonl"
+# Versión (sha256) del grafo exportado con el que coincide el estado
+EXPORT_STAMP_FILENAME = "export.json"
+
+# Grafo nombrado con la ontología DAIMO y los triples sembrados que no
+# pertenecen a ningún modelo
+ONTOLOGY_GRAPH = URIRef("urn:daimo:graph:ontology")
+
+# Prefijo de los grafos nombrados por modelo
+MODEL_GRAPH_PREFIX = "urn:daimo:graph:model:"
+
+# Compactar cuando el log supera esta fracción del número de modelos
+DEFAULT_COMPACT_RATIO = 0.25
+
+
+def model_graph_id(model_uri: Union[str, URIRef]) -> URIRef:
+    """Identificador del grafo nombrado de un modelo"""
+    return URIRef(f"{MODEL_GRAPH_PREFIX}{model_uri}")
+
+
+def model_fingerprint(model: Any) -> str:
+    """
+    Huella de versión de un ``StandardizedModel``.
+
+    Usa el ``sha`` del repositorio (HuggingFace) o ``last_modified``; si el
+    repositorio no expone ninguno, un hash del contenido normalizado.
+    """
+    sha = (getattr(model, "extra_metadata", None) or {}).get("sha")
+    if sha:
+        return f"sha:{sha}"
+    if getattr(model, "last_modified", None):
+        return f"modified:{model.last_modified}"
+    payload = json.dumps(asdict(model), sort_keys=True, default=str)
+    return "content:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class ChangeSet:
+    """Modelos afectados por una ingestión (URIs), consumible por índices derivados"""
+    from_sequence: int
+    to_sequence: int
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    @property
+    def changed(self) -> List[str]:
+        """Modelos cuyo contenido hay que (re)indexar"""
+        return self.added + self.updated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class IncrementalGraph:
+    """
+    Estado incremental del grafo: base compactada + log de deltas por modelo.
+
+    Attributes:
+        dataset: ``Dataset`` con un grafo nombrado por modelo; con
+            ``default_union`` se consulta como un grafo normal
+        models: URI del modelo -> {"id", "fingerprint"}
+        sequence: Último número de secuencia aplicado
+    """
+
+    def __init__(self, directory: Union[str, Path], compact_ratio: float = DEFAULT_COMPACT_RATIO):
+        self.directory = Path(directory)
+        self.compact_ratio = compact_ratio
+        self.dataset = Dataset(default_union=True)
+        self.models: Dict[str, Dict[str, str]] = {}
+        self.sequence = 0
+        self.base_sequence = 0
+        self.pending_deltas = 0
+
+    @property
+    def base_path(self) -> Path:
+        return self.directory / BASE_FILENAME
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.directory / MANIFEST_FILENAME
+
+    @property
+    def delta_log_path(self) -> Path:
+        return self.directory / DELTA_LOG_FILENAME
+
+    @property
+    def export_stamp_path(self) -> Path:
+        return self.directory / EXPORT_STAMP_FILENAME
+
+    @classmethod
+    def default_directory(cls, graph_path: Union[str, Path]) -> Path:
+        """Directorio de estado por defecto para un grafo exportado"""
+        graph_path = Path(graph_path)
+        return graph_path.parent / INCREMENTAL_DIRNAME / graph_path.stem
+
+    @classmethod
+    def open(
+        cls,
+        directory: Union[str, Path],
+        graph_path: Optional[Union[str, Path]] = None,
+        **kwargs,
+    ) -> "IncrementalGraph":
+        """
+        Abrir (o crear vacío) el estado: base + reaplicación del log de deltas.
+
+        Args:
+            directory: Directorio de estado
+            graph_path: Grafo exportado al que corresponde el estado. Si existe
+                y el estado no coincide con su versión (estado nuevo, o grafo
+                reescrito por otra vía), el estado se vuelve a sembrar desde él.
+        """
+        state = cls(directory, **kwargs)
+        state._load()
+        if graph_path is not None and Path(graph_path).exists():
+            version = snapshot_sha256(graph_path)
+            if state.exported_version() != version:
+                state.seed(graph_path)
+        return state
+
+    def exported_version(self) -> Optional[str]:
+        """sha256 del último grafo exportado (o sembrado) desde este estado"""
+        try:
+            with open(self.export_stamp_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("sha256")
+        except (OSError, ValueError):
+            return None
+
+    def _write_export_stamp(self, graph_path: Path, version: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_stamp = self.export_stamp_path.with_suffix(".json.tmp")
+        with open(tmp_stamp, "w", encoding="utf-8") as f:
+            json.dump({"graph": graph_path.name, "sha256": version, "sequence": self.sequence}, f)
+        os.replace(tmp_stamp, self.export_stamp_path)
+
+    def seed(self, graph_path: Union[str, Path]) -> None:
+        """
+        Reemplazar el estado por el contenido de un grafo exportado.
+
+        Cada modelo (``daimo:Model`` con ``daimo:source``) recibe su grafo
+        nombrado con sus triples y los de los recursos que enlaza (autor,
+        arquitectura, licencia...) sin entrar en otros modelos; el resto va al
+        grafo de la ontología. Las huellas sembradas no coinciden con ninguna
+        real, así que cada modelo se regenera la primera vez que se refresca.
+        La secuencia sigue creciendo: los consumidores de ``changes_since``
+        anteriores a la siembra reconstruyen su índice.
+        """
+        entry = get_graph_store().get_entry(graph_path)
+        graph = entry.graph
+
+        self.dataset = Dataset(default_union=True)
+        for prefix, namespace in graph.namespaces():
+            self.dataset.bind(prefix, namespace)
+        self.models = {}
+        self.sequence += 1
+
+        model_uris = {
+            subject for subject in graph.subjects(RDF.type, DAIMO.Model)
+            if isinstance(subject, URIRef) and graph.value(subject, DAIMO.source) is not None
+        }
+        attributed = set()
+        for model_uri in model_uris:
+            triples = self._model_closure(graph, model_uri, model_uris)
+            attributed.update(triples)
+            context = self.dataset.graph(model_graph_id(model_uri))
+            context.addN((s, p, o, context) for s, p, o in triples)
+            identifier = graph.value(model_uri, DCTERMS.identifier)
+            self.models[str(model_uri)] = {
+                "id": str(identifier) if identifier is not None else str(model_uri).rsplit("/", 1)[-1],
+                "fingerprint": f"seed:{entry.version[:16]}",
+            }
+
+        ontology = self.dataset.graph(ONTOLOGY_GRAPH)
+        ontology.addN((s, p, o, ontology) for s, p, o in graph if (s, p, o) not in attributed)
+
+        self.compact()
+        self._write_export_stamp(Path(graph_path), entry.version)
+        logger.info(f"🌱 Estado sembrado desde {Path(graph_path).name}: {len(self.models)} modelos")
+
+    @staticmethod
+    def _model_closure(graph: Graph, model_uri: URIRef, model_uris: set) -> set:
+        """Triples de un modelo y de los recursos que enlaza, sin entrar en otros modelos"""
+        triples, visited, pending = set(), {model_uri}, [model_uri]
+        while pending:
+            subject = pending.pop()
+            for s, p, o in graph.triples((subject, None, None)):
+                triples.add((s, p, o))
+                if isinstance(o, (URIRef, BNode)) and o not in visited and o not in model_uris and p != RDF.type:
+                    visited.add(o)
+                    pending.append(o)
+        return triples
+
+    def _load(self) -> None:
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.models = manifest.get("models", {})
+            self.base_sequence = self.sequence = manifest.get("sequence", 0)
+            for prefix, namespace in manifest.get("namespaces", {}).items():
+                self.dataset.bind(prefix, namespace)
+            if self.base_path.exists():
+                read_graph(self.base_path, self.dataset)
+
+        for entry in self._read_delta_log():
+            if entry["seq"] <= self.base_sequence:
+                continue  # Ya incluido en la base (compactación interrumpida)
+            self._apply_entry(entry)
+            self.sequence = entry["seq"]
+            self.pending_deltas += 1
+
+        logger.info(
+            f"📦 Estado incremental: {len(self.models)} modelos, "
+            f"secuencia {self.sequence} ({self.pending_deltas} deltas pendientes)"
+        )
+
+    def _read_delta_log(self) -> Iterable[Dict[str, Any]]:
+        if not self.delta_log_path.exists():
+            return
+        with open(self.delta_log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Última línea truncada por una escritura interrumpida
+                    logger.warning("⚠️ Entrada de delta ilegible ignorada")
+
+    def _apply_entry(self, entry: Dict[str, Any]) -> None:
+        """Aplicar una entrada del log al dataset y al manifiesto"""
+        if entry["op"] == "ontology":
+            self.dataset.remove_graph(self.dataset.graph(ONTOLOGY_GRAPH))
+            self.dataset.graph(ONTOLOGY_GRAPH).parse(data=entry["ntriples"], format="nt")
+            for prefix, namespace in entry.get("namespaces", {}).items():
+                self.dataset.bind(prefix, namespace)
+            return
+
+        model_uri = entry["model_uri"]
+        self.dataset.remove_graph(self.dataset.graph(model_graph_id(model_uri)))
+
+        if entry["op"] == "upsert":
+            context = self.dataset.graph(model_graph_id(model_uri))
+            context.parse(data=entry["ntriples"], format="nt")
+            self.models[model_uri] = {"id": entry["model_id"], "fingerprint": entry["fingerprint"]}
+        else:
+            self.models.pop(model_uri, None)
+
+    def _append_deltas(self, entries: List[Dict[str, Any]]) -> None:
+        """Añadir entradas al log de forma duradera (una escritura por lote)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.delta_log_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _ontology_entry(self, builder: Any) -> Optional[Dict[str, Any]]:
+        """Entrada que siembra la ontología y los prefijos la primera vez"""
+        if len(self.dataset.graph(ONTOLOGY_GRAPH)) > 0:
+            return None
+
+        ontology = Graph()
+        ontology_path = getattr(builder, "ontology_path", None)
+        if ontology_path is not None and Path(ontology_path).exists():
+            ontology.parse(str(ontology_path), format="turtle")
+
+        self.sequence += 1
+        return {
+            "seq": self.sequence,
+            "ts": datetime.now().isoformat(),
+            "op": "ontology",
+            "ntriples": ontology.serialize(format="nt"),
+            "namespaces": {prefix: str(ns) for prefix, ns in builder.graph.namespaces()},
+        }
+
+    def upsert_models(
+        self,
+        models: Iterable[Any],
+        builder: Any,
+        repositories: Optional[Iterable[Any]] = None,
+        remove_missing_sources: bool = False,
+        force: bool = False,
+    ) -> ChangeSet:
+        """
+        Insertar o actualizar modelos, reemplazando solo los que han cambiado.
+
+        Args:
+            models: ``StandardizedModel`` recién descargados
+            builder: ``MultiRepositoryGraphBuilder`` que genera los triples
+            repositories: Repositorios para el mapeo específico (por nombre de fuente)
+            remove_missing_sources: Eliminar los modelos de las fuentes
+                refrescadas que ya no aparecen en ``models``
+            force: Regenerar aunque la huella no haya cambiado
+
+        Returns:
+            ChangeSet con los modelos añadidos, actualizados y eliminados
+        """
+        repos_by_source = {repo.name.lower(): repo for repo in (repositories or [])}
+
+        changes = ChangeSet(from_sequence=self.sequence, to_sequence=self.sequence)
+        entries: List[Dict[str, Any]] = []
+
+        ontology_entry = self._ontology_entry(builder)
+        if ontology_entry is not None:
+            self._apply_entry(ontology_entry)
+            entries.append(ontology_entry)
+        seen: set = set()
+        refreshed_sources: set = set()
+
+        for model in models:
+            model_uri = str(builder.model_uri(model))
+            fingerprint = model_fingerprint(model)
+            seen.add(model_uri)
+            refreshed_sources.add(model.source.lower())
+
+            previous = self.models.get(model_uri)
+            if previous is not None and previous["fingerprint"] == fingerprint and not force:
+                changes.unchanged += 1
+                continue
+
+            repo = repos_by_source.get(model.source.lower())
+            try:
+                fragment = builder.build_model_fragment(model, repository=repo)
+            except Exception as e:
+                logger.warning(f"⚠️ Error generando triples de {model.id}: {e}")
+                continue
+
+            self.sequence += 1
+            entry = {
+                "seq": self.sequence,
+                "ts": datetime.now().isoformat(),
+                "op": "upsert",
+                "model_id": model.id,
+                "model_uri": model_uri,
+                "fingerprint": fingerprint,
+                "ntriples": fragment.serialize(format="nt"),
+            }
+            self._apply_entry(entry)
+            entries.append(entry)
+            (changes.added if previous is None else changes.updated).append(model_uri)
+
+        if remove_missing_sources:
+            missing = [
+                uri for uri, info in self.models.items()
+                if uri not in seen and self._model_source(uri) in refreshed_sources
+            ]
+            entries.extend(self._remove_entries(missing, changes))
+
+        if entries:
+            self._append_deltas(entries)
+            self.pending_deltas += len(entries)
+            get_graph_store().touch(self.dataset)
+        changes.to_sequence = self.sequence
+
+        logger.info(
+            f"🔁 Upsert: +{len(changes.added)} ~{len(changes.updated)} "
+            f"-{len(changes.removed)} ={changes.unchanged}"
+        )
+
+        if self.pending_deltas > max(1, len(self.models)) * self.compact_ratio:
+            self.compact()
+
+        return changes
+
+    def remove_models(self, model_uris: Iterable[str]) -> ChangeSet:
+        """Eliminar modelos del grafo"""
+        changes = ChangeSet(from_sequence=self.sequence, to_sequence=self.sequence)
+        entries = self._remove_entries([str(uri) for uri in model_uris if str(uri) in self.models], changes)
+        if entries:
+            self._append_deltas(entries)
+            self.pending_deltas += len(entries)
+            get_graph_store().touch(self.dataset)
+        changes.to_sequence = self.sequence
+        return changes
+
+    def _remove_entries(self, model_uris: List[str], changes: ChangeSet) -> List[Dict[str, Any]]:
+        entries = []
+        for model_uri in model_uris:
+            self.sequence += 1
+            entry = {
+                "seq": self.sequence,
+                "ts": datetime.now().isoformat(),
+                "op": "remove",
+                "model_id": self.models[model_uri]["id"],
+                "model_uri": model_uri,
+            }
+            self._apply_entry(entry)
+            entries.append(entry)
+            changes.removed.append(model_uri)
+        return entries
+
+    def _model_source(self, model_uri: str) -> Optional[str]:
+        """Fuente (repositorio) de un modelo según sus propios triples"""
+        source = self.dataset.graph(model_graph_id(model_uri)).value(URIRef(model_uri), DAIMO.source)
+        return str(source).lower() if source is not None else None
+
+    def changes_since(self, sequence: int) -> Optional[ChangeSet]:
+        """
+        Cambios posteriores a una secuencia, leídos del log de deltas.
+
+        Returns:
+            ChangeSet, o None si esa secuencia ya se compactó (el consumidor
+            debe reconstruir su índice completo)
+        """
+        if sequence < self.base_sequence:
+            return None
+
+        changes = ChangeSet(from_sequence=sequence, to_sequence=self.sequence)
+        latest: Dict[str, str] = {}
+        for entry in self._read_delta_log():
+            if entry["seq"] > sequence and entry.get("model_uri"):
+                latest[entry["model_uri"]] = entry["op"]
+        for model_uri, op in latest.items():
+            if op == "remove":
+                changes.removed.append(model_uri)
+            else:
+                changes.updated.append(model_uri)
+        return changes
+
+    def compact(self) -> Path:
+        """
+        Volcar el estado a la base y vaciar el log de deltas.
+
+        La base y el manifiesto se escriben de forma atómica antes de truncar el
+        log; si se interrumpe a medias, las entradas ya incluidas se ignoran al abrir.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        write_graph(self.dataset, self.base_path, format="nquads")
+
+        manifest = {
+            "sequence": self.sequence,
+            "compacted_at": datetime.now().isoformat(),
+            "namespaces": {prefix: str(ns) for prefix, ns in self.dataset.namespaces()},
+            "models": self.models,
+        }
+        tmp_manifest = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        open(self.delta_log_path, "w").close()
+        self.base_sequence = self.sequence
+        self.pending_deltas = 0
+
+        logger.info(f"🗜️ Compactado: {len(self.models)} modelos en secuencia {self.sequence}")
+        return self.base_path
+
+    def to_graph(self) -> Graph:
+        """Grafo plano (unión de todos los grafos nombrados)"""
+        graph = Graph()
+        for prefix, namespace in self.dataset.namespaces():
+            graph.bind(prefix, namespace)
+        graph.addN((s, p, o, graph) for s, p, o in self.dataset.triples((None, None, None)))
+        return graph
+
+    def export(self, output_path: Union[str, Path], format: str = "turtle", force: bool = False) -> Path:
+        """
+        Exportar el grafo plano para los consumidores existentes.
+
+        Además compila el snapshot binario y publica el grafo en el GraphStore.
+
+        Args:
+            output_path: Fichero de salida
+            format: Formato rdflib
+            force: Sobrescribir aunque el estado no proceda del fichero existente
+
+        Raises:
+            ValueError: El fichero existe y el estado está vacío o no se sembró
+                desde él (se perderían los modelos que no están en el estado)
+        """
+        output_path = Path(output_path)
+        if output_path.exists() and not force:
+            if not self.models:
+                raise ValueError(f"El estado incremental está vacío: no se sobrescribe {output_path}")
+            if self.exported_version() != snapshot_sha256(output_path):
+                raise ValueError(
+                    f"El estado incremental no procede de {output_path}: "
+                    f"ábrelo con graph_path para sembrarlo desde el grafo existente"
+                )
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        graph = self.to_graph()
+        if format in STREAMING_FORMATS:
+            write_graph(graph, output_path, format=format)
+        else:
+            graph.serialize(destination=str(output_path), format=format)
+        version = snapshot_sha256(output_path)
+        compile_snapshot(output_path, graph=graph, sha256=version)
+        get_graph_store().register(output_path, graph, version=version)
+        self._write_export_stamp(output_path, version)
+        return output_path
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gestionar el estado incremental del grafo")
+    subparsers = parser.add_subparsers(dest="command")
+
+    info_parser = subparsers.add_parser("info", help="Mostrar el estado incremental")
+    info_parser.add_argument("directory", help="Directorio de estado")
+
+    compact_parser = subparsers.add_parser("compact", help="Compactar el log de deltas")
+    compact_parser.add_argument("directory", help="Directorio de estado")
+
+    export_parser = subparsers.add_parser("export", help="Exportar el grafo plano")
+    export_parser.add_argument("directory", help="Directorio de estado")
+    export_parser.add_argument("output", help="Fichero de salida (Turtle)")
+    export_parser.add_argument("--force", action="store_true",
+                               help="Sobrescribir aunque el estado no proceda del fichero existente")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command is None:
+        parser.print_help()
+        return
+
+    state = IncrementalGraph.open(args.directory)
+    if args.command == "info":
+        print(json.dumps({
+            "models": len(state.models),
+            "sequence": state.sequence,
+            "base_sequence": state.base_sequence,
+            "pending_deltas": state.pending_deltas,
+            "triples": len(state.dataset),
+        }, indent=2))
+    elif args.command == "compact":
+        print(f"✅ Base compactada: {state.compact()}")
+    elif args.command == "export":
+        print(f"✅ Grafo exportado: {state.export(args.output, force=args.force)}")
+
+
+if __name__ == "__main__":
+    main()
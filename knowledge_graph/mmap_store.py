@@ -0,0 +1,182 @@
+"""
+Ficheros de arrays mapeados en memoria, compartibles entre procesos.
+
+Varios workers (Streamlit/ASGI) en la misma máquina cargaban cada uno su copia
+privada del catálogo, los índices y las embeddings. Un *bundle* es un
+directorio con un ``.npy`` por array más una cabecera JSON; al abrirlo con
+``mmap_mode="r"`` todos los procesos comparten las mismas páginas de la caché
+del sistema operativo, así que la memoria por máquina no crece con los workers.
+
+Las columnas de texto se guardan como blob UTF-8 + offsets (igual que el
+diccionario de términos del snapshot compilado) y se decodifican bajo demanda
+con ``StringColumn``.
+
+Uso:
+    from knowledge_graph.mmap_store import save_bundle, load_bundle
+    save_bundle(path, {"embeddings": matrix}, header={"model_name": name})
+    arrays, header = load_bundle(path)  # arrays mapeados en memoria
+
+Autor: Edmundo Mori
+"""
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato de bundle (incrementar si cambia la estructura)
+BUNDLE_FORMAT_VERSION = 1
+
+# Cabecera del bundle
+BUNDLE_HEADER_FILENAME = "header.json"
+
+
+def save_bundle(
+    directory: Union[str, Path],
+    arrays: Dict[str, np.ndarray],
+    header: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Guardar un conjunto de arrays como bundle mapeable.
+
+    Se escribe en un directorio temporal y se renombra al final, de modo que
+    un worker nunca abre un bundle a medio escribir. Si otro proceso publica
+    el mismo bundle antes, se conserva el suyo.
+
+    Args:
+        directory: Directorio destino del bundle
+        arrays: Arrays por nombre (un ``.npy`` cada uno)
+        header: Metadatos JSON adicionales
+
+    Returns:
+        Ruta del bundle
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    for name, array in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+
+    full_header = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "arrays": {
+            name: {"dtype": str(array.dtype), "shape": list(array.shape)}
+            for name, array in arrays.items()
+        },
+        **(header or {}),
+    }
+    with open(tmp_dir / BUNDLE_HEADER_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(full_header, f, indent=2, ensure_ascii=False)
+
+    if directory.exists():
+        # Los procesos que ya lo tienen mapeado conservan sus páginas
+        shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, directory)
+    except OSError:
+        # Otro worker lo publicó entre medias: nos quedamos con el suyo
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return directory
+
+
+def read_bundle_header(directory: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Leer la cabecera de un bundle (None si no existe o no es legible)"""
+    header_path = Path(directory) / BUNDLE_HEADER_FILENAME
+    try:
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get("format_version") != BUNDLE_FORMAT_VERSION:
+        return None
+    return header
+
+
+def load_bundle(
+    directory: Union[str, Path],
+    mmap: bool = True,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Abrir un bundle.
+
+    Args:
+        directory: Directorio del bundle
+        mmap: Mapear en memoria (solo lectura) en lugar de copiar al heap
+
+    Returns:
+        (arrays por nombre, cabecera)
+    """
+    directory = Path(directory)
+    header = read_bundle_header(directory)
+    if header is None:
+        raise FileNotFoundError(f"Bundle no válido: {directory}")
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        # Los arrays vacíos no se pueden mapear; se cargan directamente
+        mmap_mode = "r" if mmap and all(spec["shape"]) else None
+        arrays[name] = np.load(directory / f"{name}.npy", mmap_mode=mmap_mode, allow_pickle=False)
+    return arrays, header
+
+
+def pack_strings(name: str, values: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+    """
+    Codificar una columna de texto como blob UTF-8 + offsets + máscara de nulos.
+
+    Returns:
+        Arrays ``<name>.offsets``, ``<name>.blob`` y ``<name>.null`` para el bundle
+    """
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return {
+        f"{name}.offsets": offsets,
+        f"{name}.blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        f"{name}.null": np.array([value is None for value in values], dtype=bool),
+    }
+
+
+class StringColumn(Sequence):
+    """Columna de texto sobre arrays (posiblemente mapeados), decodificada bajo demanda"""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, nulls: np.ndarray):
+        self._offsets = offsets
+        self._blob = blob
+        self._nulls = nulls
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str) -> "StringColumn":
+        """Reconstruir la columna guardada con ``pack_strings``"""
+        return cls(arrays[f"{name}.offsets"], arrays[f"{name}.blob"], arrays[f"{name}.null"])
+
+    def __len__(self) -> int:
+        return len(self._nulls)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if self._nulls[i]:
+            return None
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for i in range(len(self)):
+            yield self[i]
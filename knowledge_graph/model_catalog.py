@@ -0,0 +1,445 @@
+"""
+Catálogo columnar de modelos (ModelCatalog).
+
+Materializa, una sola vez por versión del grafo, los atributos de los
+``daimo:Model`` que leen las rutas calientes (metadatos de resultados,
+ranking, facetas y estadísticas) en columnas indexadas por un id entero denso:
+
+- Numéricas (``numpy``): downloads, likes, parameterCount, rating.
+- Categóricas: task, library, source, license, accessLevel como códigos
+  ``int32`` (-1 = sin valor) sobre una lista ordenada de categorías.
+- Texto: title, description, domain, sourceURL.
+
+Así, una petición lee arrays en lugar de lanzar miles de ``graph.value``.
+
+Al construirlo se calculan también las estadísticas del grafo (modelos,
+triples y conteos de cada faceta categórica), que se guardan en la cabecera
+del bundle: el Dashboard y ``get_statistics`` las sirven desde memoria.
+
+Para grafos del GraphStore el catálogo se persiste como bundle mapeado en
+memoria (``.compiled/<nombre>.<sha>.catalog/``), de modo que todos los workers de
+una máquina comparten una sola copia en la caché de páginas.
+
+Uso:
+    from knowledge_graph.model_catalog import get_model_catalog
+    catalog = get_model_catalog(graph)
+    catalog.count_by("task")
+    catalog.metadata(catalog.model_id(uri))
+    catalog.hydrate(page_uris, ("title", "task", "downloads"))
+    get_graph_statistics(graph)["tasks"]
+
+Autor: Edmundo Mori
+"""
+
+import logging
+import shutil
+import threading
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import DCTERMS, RDF
+
+from .graph_snapshot import compiled_artifact_path, stale_compiled_artifacts
+from .graph_store import GraphEntry, get_graph_store
+from .mmap_store import StringColumn, load_bundle, pack_strings, read_bundle_header, save_bundle
+
+
+logger = logging.getLogger(__name__)
+
+DAIMO = Namespace("http://purl.org/pionera/daimo#")
+ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
+
+# Columnas numéricas: nombre -> (propiedad, dtype)
+NUMERIC_FIELDS = {
+    "downloads": (DAIMO.downloads, np.int64),
+    "likes": (DAIMO.likes, np.int64),
+    "parameterCount": (DAIMO.parameterCount, np.int64),
+    "rating": (DAIMO.rating, np.float64),
+}
+
+# Columnas categóricas: nombre -> propiedades candidatas (por orden de preferencia)
+CATEGORICAL_FIELDS = {
+    "task": (DAIMO.task,),
+    "library": (DAIMO.library,),
+    "source": (DAIMO.source, DCTERMS.source),
+    "license": (DAIMO.licenseName,),  # además de odrl:hasPolicy / dcterms:identifier
+    "accessLevel": (DAIMO.accessLevel,),
+}
+
+# Columnas de texto libre
+TEXT_FIELDS = {
+    "title": (DCTERMS.title,),
+    "description": (DCTERMS.description,),
+    "domain": (DAIMO.domain,),
+    "sourceURL": (DAIMO.sourceURL,),
+}
+
+# Estadísticas servidas por get_graph_statistics: clave -> faceta categórica
+STATISTICS_FACETS = {
+    "repositories": "source",
+    "tasks": "task",
+    "libraries": "library",
+    "access_levels": "accessLevel",
+    "licenses": "license",
+}
+
+# Sufijo del bundle persistido junto al snapshot compilado
+CATALOG_SUFFIX = ".catalog"
+
+# Orden de claves de ``metadata()`` (compatible con SearchEngine._get_model_metadata)
+METADATA_FIELDS = (
+    "title", "source", "description", "task", "library",
+    "downloads", "likes", "accessLevel", "domain", "sourceURL",
+)
+
+
+def catalog_path_for(path: Union[str, Path], sha256: str) -> Path:
+    """Ruta del catálogo persistido para una versión del grafo fuente"""
+    return compiled_artifact_path(path, sha256, CATALOG_SUFFIX)
+
+
+def _first_values(graph: Graph, predicates: Iterable[URIRef], index: Dict[str, int]) -> Dict[int, Any]:
+    """Primer valor de cada modelo para una lista de propiedades candidatas"""
+    values: Dict[int, Any] = {}
+    for predicate in predicates:
+        for subject, obj in graph.subject_objects(predicate):
+            model_id = index.get(str(subject))
+            if model_id is not None and model_id not in values:
+                values[model_id] = obj
+    return values
+
+
+def _to_number(value: Any, dtype) -> Optional[float]:
+    """Convierte un literal a número; None si no es numérico"""
+    raw = value.toPython() if isinstance(value, Literal) else value
+    try:
+        number = float(raw)
+    except (TypeError, ValueError):
+        return None
+    if np.issubdtype(dtype, np.integer):
+        return int(number)
+    return number
+
+
+@dataclass
+class ModelCatalog:
+    """
+    Columnas de atributos de modelos indexadas por id entero denso.
+
+    El id de un modelo es su posición en ``uris`` (ordenadas), estable para
+    una misma versión del grafo.
+    """
+    uris: Sequence[str]
+    numeric: Dict[str, np.ndarray]
+    present: Dict[str, np.ndarray]
+    codes: Dict[str, np.ndarray]
+    categories: Dict[str, List[str]]
+    text: Dict[str, Sequence[Optional[str]]]
+    version: Optional[str] = None
+    statistics: Dict[str, Any] = field(default_factory=dict)
+    _index: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self._index = {uri: i for i, uri in enumerate(self.uris)}
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    @classmethod
+    def from_graph(cls, graph: Graph, version: Optional[str] = None) -> "ModelCatalog":
+        """
+        Construir el catálogo recorriendo una vez cada propiedad relevante.
+
+        Args:
+            graph: Grafo RDF con instancias ``daimo:Model``
+            version: Versión del grafo (sha256), si se conoce
+        """
+        uris = sorted({str(s) for s in graph.subjects(RDF.type, DAIMO.Model)})
+        index = {uri: i for i, uri in enumerate(uris)}
+        n = len(uris)
+
+        numeric: Dict[str, np.ndarray] = {}
+        present: Dict[str, np.ndarray] = {}
+        for name, (predicate, dtype) in NUMERIC_FIELDS.items():
+            column = np.zeros(n, dtype=dtype)
+            mask = np.zeros(n, dtype=bool)
+            for model_id, value in _first_values(graph, (predicate,), index).items():
+                number = _to_number(value, dtype)
+                if number is not None:
+                    column[model_id] = number
+                    mask[model_id] = True
+            numeric[name] = column
+            present[name] = mask
+
+        codes: Dict[str, np.ndarray] = {}
+        categories: Dict[str, List[str]] = {}
+        for name, predicates in CATEGORICAL_FIELDS.items():
+            values = {i: str(v) for i, v in _first_values(graph, predicates, index).items()}
+            if name == "license":
+                # Licencia como política ODRL: modelo -> odrl:hasPolicy -> dcterms:identifier
+                for model_id, policy in _first_values(graph, (ODRL.hasPolicy,), index).items():
+                    identifier = graph.value(policy, DCTERMS.identifier)
+                    if identifier is not None:
+                        values[model_id] = str(identifier)
+            labels = sorted(set(values.values()))
+            label_codes = {label: code for code, label in enumerate(labels)}
+            column = np.full(n, -1, dtype=np.int32)
+            for model_id, label in values.items():
+                column[model_id] = label_codes[label]
+            codes[name] = column
+            categories[name] = labels
+
+        text: Dict[str, List[Optional[str]]] = {}
+        for name, predicates in TEXT_FIELDS.items():
+            column: List[Optional[str]] = [None] * n
+            for model_id, value in _first_values(graph, predicates, index).items():
+                column[model_id] = str(value)
+            text[name] = column
+
+        catalog = cls(
+            uris=uris,
+            numeric=numeric,
+            present=present,
+            codes=codes,
+            categories=categories,
+            text=text,
+            version=version,
+        )
+        catalog.statistics = {
+            "total_models": n,
+            "total_triples": len(graph),
+            "facets": {name: catalog.count_by(name) for name in CATEGORICAL_FIELDS},
+        }
+        logger.info(f"🗂️ ModelCatalog: {n} modelos materializados")
+        return catalog
+
+    def save(self, directory: Union[str, Path]) -> Path:
+        """Persistir el catálogo como bundle mapeable en memoria"""
+        arrays: Dict[str, np.ndarray] = {}
+        for name in self.numeric:
+            arrays[f"numeric.{name}"] = self.numeric[name]
+            arrays[f"present.{name}"] = self.present[name]
+        for name in self.codes:
+            arrays[f"codes.{name}"] = self.codes[name]
+        arrays.update(pack_strings("uris", self.uris))
+        for name, column in self.text.items():
+            arrays.update(pack_strings(f"text.{name}", column))
+
+        header = {
+            "kind": "model_catalog",
+            "version": self.version,
+            "model_count": len(self),
+            "numeric": list(self.numeric),
+            "categories": self.categories,
+            "text": list(self.text),
+            "statistics": self.statistics,
+        }
+        return save_bundle(directory, arrays, header=header)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap: bool = True) -> "ModelCatalog":
+        """
+        Abrir un catálogo persistido.
+
+        Args:
+            directory: Bundle escrito con ``save``
+            mmap: Mapear las columnas en memoria (compartidas entre procesos)
+        """
+        arrays, header = load_bundle(directory, mmap=mmap)
+        return cls(
+            uris=StringColumn.from_arrays(arrays, "uris"),
+            numeric={name: arrays[f"numeric.{name}"] for name in header["numeric"]},
+            present={name: arrays[f"present.{name}"] for name in header["numeric"]},
+            codes={name: arrays[f"codes.{name}"] for name in header["categories"]},
+            categories=header["categories"],
+            text={name: StringColumn.from_arrays(arrays, f"text.{name}") for name in header["text"]},
+            version=header.get("version"),
+            statistics=header.get("statistics") or {},
+        )
+
+    def model_id(self, uri: Any) -> Optional[int]:
+        """Id denso de un modelo (None si no está en el catálogo)"""
+        return self._index.get(str(uri))
+
+    def model_ids(self, uris: Iterable[Any]) -> np.ndarray:
+        """Ids densos de varios modelos (-1 para los desconocidos)"""
+        return np.array([self._index.get(str(uri), -1) for uri in uris], dtype=np.int64)
+
+    def column(self, name: str) -> np.ndarray:
+        """Columna numérica o de códigos categóricos"""
+        if name in self.numeric:
+            return self.numeric[name]
+        return self.codes[name]
+
+    def value(self, model_id: int, name: str) -> Any:
+        """Valor de un campo para un modelo (None si no tiene)"""
+        if name in self.numeric:
+            if not self.present[name][model_id]:
+                return None
+            return self.numeric[name][model_id].item()
+        if name in self.codes:
+            code = self.codes[name][model_id]
+            return self.categories[name][code] if code >= 0 else None
+        return self.text[name][model_id]
+
+    def metadata(self, model_id: Optional[int]) -> Dict[str, str]:
+        """
+        Metadatos de un modelo como cadenas, con las mismas claves que
+        ``SearchEngine._get_model_metadata`` (solo los campos presentes).
+        """
+        metadata: Dict[str, str] = {}
+        if model_id is None or model_id < 0:
+            return metadata
+        for name in METADATA_FIELDS:
+            value = self.value(model_id, name)
+            if value:
+                metadata[name] = str(value)
+        return metadata
+
+    def hydrate(self, model_uris: Iterable[Any], fields: Sequence[str] = METADATA_FIELDS) -> List[Dict[str, Any]]:
+        """
+        Registros de varios modelos (una página de resultados) en una pasada.
+
+        Cada campo se lee de su columna con un único indexado vectorizado para
+        todos los modelos, en lugar de una consulta por modelo y campo.
+
+        Args:
+            model_uris: URIs de los modelos (en el orden de los resultados)
+            fields: Campos numéricos, categóricos o de texto a leer
+
+        Returns:
+            Un dict por URI con todas las claves de ``fields``; el valor es
+            None si el modelo no tiene ese campo o no está en el catálogo
+        """
+        ids = self.model_ids(model_uris)
+        if not len(self):
+            return [dict.fromkeys(fields) for _ in ids]
+        known = ids >= 0
+        safe = np.where(known, ids, 0)
+
+        columns: Dict[str, List[Any]] = {}
+        for name in fields:
+            if name in self.numeric:
+                mask = (self.present[name][safe] & known).tolist()
+                values = self.numeric[name][safe].tolist()
+                columns[name] = [value if present else None for value, present in zip(values, mask)]
+            elif name in self.codes:
+                labels = self.categories[name]
+                codes = np.where(known, self.codes[name][safe], -1).tolist()
+                columns[name] = [labels[code] if code >= 0 else None for code in codes]
+            elif name in self.text:
+                column = self.text[name]
+                columns[name] = [column[i] if i >= 0 else None for i in ids.tolist()]
+            else:
+                raise KeyError(f"Campo desconocido en el catálogo: {name}")
+
+        if not columns:
+            return [{} for _ in ids]
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def metadata_for(self, model_uris: Iterable[Any]) -> List[Dict[str, str]]:
+        """Como ``metadata`` para varios modelos, hidratados con ``hydrate``"""
+        return [
+            {name: str(value) for name, value in record.items() if value}
+            for record in self.hydrate(model_uris, METADATA_FIELDS)
+        ]
+
+    def count_by(self, name: str, model_ids: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """
+        Contar modelos por valor de un campo categórico.
+
+        Args:
+            name: Campo categórico (task, library, source, license, accessLevel)
+            model_ids: Restringir a estos modelos (por defecto, todos)
+        """
+        codes = self.codes[name]
+        if model_ids is not None:
+            codes = codes[model_ids]
+        codes = codes[codes >= 0]
+        counts = np.bincount(codes, minlength=len(self.categories[name]))
+        labels = self.categories[name]
+        return {labels[code]: int(count) for code, count in enumerate(counts) if count}
+
+
+# Caché de catálogos por grafo: id(grafo) -> (weakref, sello, catálogo)
+_catalog_cache: Dict[int, Tuple[weakref.ref, Any, ModelCatalog]] = {}
+_catalog_lock = threading.Lock()
+
+
+def _load_or_build_catalog(entry: GraphEntry) -> ModelCatalog:
+    """Abrir el catálogo persistido de una versión del grafo, o construirlo y persistirlo"""
+    catalog_path = catalog_path_for(entry.path, entry.version)
+
+    header = read_bundle_header(catalog_path)
+    # Los bundles anteriores a las estadísticas en cabecera se reconstruyen
+    if header is not None and header.get("version") == entry.version and header.get("statistics"):
+        try:
+            return ModelCatalog.load(catalog_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Catálogo persistido ilegible ({catalog_path.name}): {e}")
+
+    catalog = ModelCatalog.from_graph(entry.graph, version=entry.version)
+    try:
+        catalog.save(catalog_path)
+        for stale in stale_compiled_artifacts(entry.path, CATALOG_SUFFIX, catalog_path):
+            shutil.rmtree(stale, ignore_errors=True)
+        # Reabrir mapeado para compartir páginas con los demás workers
+        return ModelCatalog.load(catalog_path)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo persistir el catálogo: {e}")
+        return catalog
+
+
+def get_model_catalog(graph: Graph) -> ModelCatalog:
+    """
+    Catálogo del grafo, construido una vez por versión.
+
+    Para grafos del GraphStore el sello es su sha256 y el catálogo se abre
+    mapeado desde disco (en memoria si se modificó tras cargarlo); para
+    grafos sueltos, el sello es el número de triples (se reconstruye en
+    memoria si el grafo cambia de tamaño).
+    """
+    entry = get_graph_store().entry_of(graph)
+    version = entry.version if entry is not None else None
+    stamp = version or len(graph)
+    key = id(graph)
+
+    with _catalog_lock:
+        cached = _catalog_cache.get(key)
+        if cached is not None:
+            ref, cached_stamp, catalog = cached
+            if ref() is graph and cached_stamp == stamp:
+                return catalog
+
+        if entry is not None and not entry.modified:
+            catalog = _load_or_build_catalog(entry)
+        else:
+            catalog = ModelCatalog.from_graph(graph)
+        ref = weakref.ref(graph, lambda _ref, key=key: _catalog_cache.pop(key, None))
+        _catalog_cache[key] = (ref, stamp, catalog)
+        return catalog
+
+
+def get_graph_statistics(graph: Graph) -> Dict[str, Any]:
+    """
+    Estadísticas del grafo para el Dashboard y ``get_statistics``.
+
+    Se calculan una vez por versión al construir el catálogo (y se leen de la
+    cabecera del bundle); aquí solo se copian.
+
+    Returns:
+        ``total_models``, ``total_triples`` y un dict de conteos por valor
+        para cada clave de ``STATISTICS_FACETS``
+    """
+    statistics = get_model_catalog(graph).statistics
+    stats: Dict[str, Any] = {
+        "total_models": statistics["total_models"],
+        "total_triples": statistics["total_triples"],
+    }
+    for key, name in STATISTICS_FACETS.items():
+        stats[key] = dict(statistics["facets"][name])
+    return stats
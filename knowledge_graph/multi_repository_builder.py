@@ -16,10 +16,12 @@ from pathlib import Path
 import re
 from urllib.parse import quote
 
-from rdflib import Literal, URIRef, RDF, RDFS, XSD
+from rdflib import Graph, Literal, URIRef, RDF, RDFS, XSD
 from rdflib.namespace import FOAF, DCTERMS
 
 from .build_graph import DAIMOGraphBuilder
+from .graph_store import get_graph_store
+from .incremental import ChangeSet, IncrementalGraph
 from utils.model_repository import StandardizedModel, ModelRepository
 
 
@@ -319,8 +321,85 @@ class MultiRepositoryGraphBuilder(DAIMOGraphBuilder):
             }
             repository.map_to_rdf(model, self.graph, namespaces)
         
+        # Si el grafo ya está publicado en el GraphStore, sus cachés por versión caducan
+        get_graph_store().touch(self.graph)
+        
         return model_uri
     
+    def model_uri(self, model: StandardizedModel) -> URIRef:
+        """URI que tendrá un modelo estandarizado en el grafo."""
+        return self._create_model_uri(model.id)
+    
+    def build_model_fragment(
+        self,
+        model: StandardizedModel,
+        repository: ModelRepository = None
+    ) -> Graph:
+        """
+        Genera en un grafo aparte los triples que aporta un único modelo.
+        
+        Usa el mismo mapeo que add_standardized_model(), sin tocar self.graph;
+        es la unidad de reemplazo de la ingestión incremental.
+        
+        Args:
+            model: Modelo estandarizado
+            repository: Repositorio de origen (para mapeo específico)
+        
+        Returns:
+            Grafo con los triples del modelo
+        """
+        fragment = Graph()
+        for prefix, namespace in self.graph.namespaces():
+            fragment.bind(prefix, namespace)
+        
+        graph, self.graph = self.graph, fragment
+        try:
+            self.add_standardized_model(model, repository=repository)
+        finally:
+            self.graph = graph
+        
+        return fragment
+    
+    def update_from_repositories(
+        self,
+        repositories: List[ModelRepository],
+        state: IncrementalGraph,
+        limit_per_repo: int = 50,
+        remove_missing: bool = False
+    ) -> ChangeSet:
+        """
+        Actualiza incrementalmente el grafo desde múltiples repositorios.
+        
+        A diferencia de build_from_repositories(), solo regenera los modelos
+        nuevos o cuya huella (sha / last_modified) ha cambiado.
+        
+        Args:
+            repositories: Lista de repositorios
+            state: Estado incremental (IncrementalGraph.open(...))
+            limit_per_repo: Límite de modelos por repositorio
+            remove_missing: Eliminar los modelos que ya no devuelve su repositorio
+        
+        Returns:
+            ChangeSet con los modelos añadidos, actualizados y eliminados
+        """
+        for repo in repositories:
+            self.add_repository(repo)
+        
+        all_models = self.fetch_all_models(limit_per_repo=limit_per_repo)
+        
+        print("\n🔁 Updating RDF graph incrementally...")
+        changes = state.upsert_models(
+            all_models,
+            builder=self,
+            repositories=self.repositories,
+            remove_missing_sources=remove_missing
+        )
+        
+        print(f"✅ Added: {len(changes.added)} | Updated: {len(changes.updated)} | "
+              f"Removed: {len(changes.removed)} | Unchanged: {changes.unchanged}")
+        
+        return changes
+    
     def build_from_repositories(self, repositories: List[ModelRepository], limit_per_repo: int = 50) -> int:
         """
         Construye el grafo desde múltiples repositorios.
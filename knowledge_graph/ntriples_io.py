@@ -0,0 +1,367 @@
+"""
+Escritura y lectura en streaming de N-Triples / N-Quads (con gzip o zstd).
+
+``graph.serialize(format="turtle")`` ordena sujetos y construye en memoria la
+salida comprimida por prefijos, así que guardar un grafo grande es lento y
+dispara la RAM. Aquí cada triple se escribe como una línea independiente, por
+bloques, de modo que el coste es lineal y la memoria está acotada:
+
+- ``nt`` / ``nquads``: N-Triples y N-Quads estándar.
+- ``turtle``: "Turtle plano", cabecera ``@prefix`` seguida de líneas N-Triples
+  (todo N-Triples es Turtle válido), para los ficheros ``.ttl`` existentes.
+
+Las extensiones ``.gz`` y ``.zst`` activan la compresión (zstd requiere el
+paquete ``zstandard``). El lector devuelve los triples en lotes sin cargar el
+fichero completo.
+
+Uso:
+    from knowledge_graph.ntriples_io import write_graph, read_graph
+    write_graph(graph, "data/ai_models_multi_repo.nt.gz")
+    graph = read_graph("data/ai_models_multi_repo.nt.gz")
+
+    python -m knowledge_graph.ntriples_io convert data/ai_models_multi_repo.ttl data/ai_models.nt.zst
+
+Autor: Edmundo Mori
+"""
+
+import gzip
+import io
+import logging
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+from rdflib import Dataset, Graph, Literal
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+from rdflib.plugins.parsers.ntriples import ParseError, r_tail, r_wspace
+from rdflib.plugins.parsers.nquads import NQuadsParser
+from rdflib.term import Node
+
+
+logger = logging.getLogger(__name__)
+
+# Compresión según la última extensión del fichero
+COMPRESSION_BY_SUFFIX = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+
+# Formatos que se escriben y leen línea a línea
+STREAMING_FORMATS = {"nt", "nquads", "turtle"}
+
+# Formato según la extensión (sin la de compresión)
+STREAMING_FORMAT_BY_SUFFIX = {
+    ".nt": "nt",
+    ".nq": "nquads",
+    ".ttl": "turtle",
+}
+
+# Triples por bloque de escritura / lote de lectura
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Niveles de compresión (equilibrio velocidad / tamaño)
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Cabecera "@prefix" del Turtle plano
+_PREFIX_LINE = re.compile(r"@prefix\s+([^:\s]*):\s*<([^>]*)>\s*\.\s*$")
+
+# Escapes de literales N-Triples (STRING_LITERAL_QUOTE)
+_LITERAL_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+Quad = Tuple[Node, Node, Node, Optional[Node]]
+
+
+def split_compression(path: Union[str, Path]) -> Tuple[Path, Optional[str]]:
+    """Separar la extensión de compresión: ``x.nt.gz`` -> (``x.nt``, ``gzip``)"""
+    path = Path(path)
+    compression = COMPRESSION_BY_SUFFIX.get(path.suffix.lower())
+    if compression is not None:
+        return path.with_suffix(""), compression
+    return path, None
+
+
+def streaming_format(path: Union[str, Path]) -> Optional[str]:
+    """Formato de streaming de un fichero según su extensión (None si no aplica)"""
+    base, _ = split_compression(path)
+    return STREAMING_FORMAT_BY_SUFFIX.get(base.suffix.lower())
+
+
+def open_text(path: Union[str, Path], mode: str = "r", compression: Optional[str] = None) -> IO[str]:
+    """
+    Abrir un fichero de texto UTF-8, comprimido o no.
+
+    Args:
+        path: Ruta del fichero
+        mode: ``r`` o ``w``
+        compression: ``gzip``, ``zstd`` o None (por defecto, según la extensión)
+    """
+    path = Path(path)
+    if compression is None:
+        _, compression = split_compression(path)
+
+    if compression is None:
+        return open(path, mode, encoding="utf-8", newline="\n" if mode == "w" else None)
+
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("La compresión zstd requiere: pip install zstandard")
+        if mode == "w":
+            raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+        else:
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(raw, encoding="utf-8")
+
+    raise ValueError(f"Compresión desconocida: {compression}")
+
+
+@lru_cache(maxsize=1 << 16)
+def term_n3(term: Node) -> str:
+    """Forma N-Triples de un término (los URIs repetidos salen de la caché)"""
+    if isinstance(term, Literal):
+        lexical = '"' + str(term).translate(_LITERAL_ESCAPES) + '"'
+        if term.language:
+            return f"{lexical}@{term.language}"
+        if term.datatype is not None:
+            return f"{lexical}^^{term.datatype.n3()}"
+        return lexical
+    return term.n3()
+
+
+def _iter_statements(graph: Graph, quads: bool) -> Iterator[Quad]:
+    """Triples del grafo, con su grafo nombrado si se piden quads"""
+    if quads and graph.context_aware:
+        for s, p, o, context in graph.quads((None, None, None, None)):
+            identifier = getattr(context, "identifier", context)
+            yield s, p, o, None if identifier == DATASET_DEFAULT_GRAPH_ID else identifier
+    else:
+        for s, p, o in graph.triples((None, None, None)):
+            yield s, p, o, None
+
+
+def write_graph(
+    graph: Graph,
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    compression: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Escribir un grafo línea a línea, por bloques.
+
+    Se escribe a un fichero temporal que se renombra al final, para que los
+    lectores nunca vean un grafo a medias.
+
+    Args:
+        graph: Grafo (o Dataset, para ``nquads``) a escribir
+        path: Fichero destino (``.gz`` / ``.zst`` activan la compresión)
+        format: ``nt``, ``nquads`` o ``turtle`` (por defecto, según la extensión)
+        compression: ``gzip``, ``zstd`` o None (por defecto, según la extensión)
+        chunk_size: Triples por bloque de escritura
+
+    Returns:
+        Número de triples (o quads) escritos
+    """
+    path = Path(path)
+    format = format or streaming_format(path)
+    if format not in STREAMING_FORMATS:
+        raise ValueError(f"Formato no soportado en streaming: {format}")
+    if compression is None:
+        _, compression = split_compression(path)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    quads = format == "nquads"
+    count = 0
+
+    try:
+        with open_text(tmp_path, "w", compression=compression) as f:
+            if format == "turtle":
+                for prefix, namespace in graph.namespaces():
+                    f.write(f"@prefix {prefix}: <{namespace}> .\n")
+                f.write("\n")
+
+            lines: List[str] = []
+            for s, p, o, g in _iter_statements(graph, quads):
+                if g is None:
+                    lines.append(f"{term_n3(s)} {term_n3(p)} {term_n3(o)} .\n")
+                else:
+                    lines.append(f"{term_n3(s)} {term_n3(p)} {term_n3(o)} {term_n3(g)} .\n")
+                if len(lines) >= chunk_size:
+                    f.write("".join(lines))
+                    count += len(lines)
+                    lines = []
+            f.write("".join(lines))
+            count += len(lines)
+
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    logger.info(f"💾 {count:,} triples escritos en {path} ({format}{', ' + compression if compression else ''})")
+    return count
+
+
+class _BNodeLabels(dict):
+    """Contexto de blank nodes que conserva la etiqueta del fichero"""
+
+    def get(self, label, default=None):
+        return label
+
+
+class LineParser(NQuadsParser):
+    """
+    Parser N-Triples/N-Quads de una línea, reutilizando los términos de rdflib.
+
+    Con ``keep_bnode_labels`` los blank nodes conservan su etiqueta (``_:b1`` ->
+    ``BNode("b1")``), de modo que trozos del mismo fichero parseados por
+    separado coinciden al fusionarse.
+    """
+
+    def __init__(self, keep_bnode_labels: bool = False):
+        super().__init__(bnode_context=_BNodeLabels() if keep_bnode_labels else None)
+
+    def parse_statement(self, line: str) -> Optional[Quad]:
+        self.line = line.rstrip("\r\n")
+        self.eat(r_wspace)
+        if not self.line or self.line.startswith("#"):
+            return None
+
+        subject = self.subject()
+        self.eat(r_wspace)
+        predicate = self.predicate()
+        self.eat(r_wspace)
+        obj = self.object()
+        self.eat(r_wspace)
+        context = self.uriref() or self.nodeid() or None
+        self.eat(r_tail)
+
+        if self.line:
+            raise ParseError(f"Contenido inesperado al final de la línea: {line!r}")
+        return subject, predicate, obj, context
+
+
+def parse_prefix(line: str) -> Optional[Tuple[str, str]]:
+    """(prefijo, namespace) de una línea ``@prefix`` del Turtle plano (None si no lo es)"""
+    if not line.startswith("@prefix"):
+        return None
+    match = _PREFIX_LINE.match(line)
+    if match is None:
+        raise ParseError(f"Prefijo no válido: {line!r}")
+    return match.group(1), match.group(2)
+
+
+def iter_quads(
+    path: Union[str, Path],
+    compression: Optional[str] = None,
+    namespaces: Optional[dict] = None,
+) -> Iterator[Quad]:
+    """
+    Leer un fichero N-Triples / N-Quads / Turtle plano en streaming.
+
+    Args:
+        path: Fichero fuente (``.gz`` / ``.zst`` se descomprimen al vuelo)
+        compression: ``gzip``, ``zstd`` o None (por defecto, según la extensión)
+        namespaces: Diccionario donde se recogen los ``@prefix`` encontrados
+
+    Yields:
+        (sujeto, predicado, objeto, grafo) con grafo None en el grafo por defecto
+    """
+    parser = LineParser()
+    with open_text(path, "r", compression=compression) as f:
+        for number, line in enumerate(f, start=1):
+            try:
+                prefix = parse_prefix(line)
+                if prefix is not None:
+                    if namespaces is not None:
+                        namespaces[prefix[0]] = prefix[1]
+                    continue
+                statement = parser.parse_statement(line)
+            except ParseError as e:
+                raise ParseError(f"{path}:{number}: {e}")
+            if statement is not None:
+                yield statement
+
+
+def read_graph(
+    path: Union[str, Path],
+    graph: Optional[Graph] = None,
+    compression: Optional[str] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+) -> Graph:
+    """
+    Cargar un fichero en streaming, insertando los triples por lotes.
+
+    Args:
+        path: Fichero fuente
+        graph: Grafo destino (por defecto, uno nuevo). Si es un Dataset, los
+            quads se insertan en sus grafos nombrados; si no, se ignora el grafo
+        compression: ``gzip``, ``zstd`` o None (por defecto, según la extensión)
+        batch_size: Triples por lote de inserción
+
+    Returns:
+        El grafo destino
+    """
+    if graph is None:
+        graph = Graph()
+
+    contexts = {}
+
+    def context_for(identifier: Optional[Node]) -> Graph:
+        if identifier is None or not isinstance(graph, Dataset):
+            return graph if not isinstance(graph, Dataset) else graph.default_context
+        if identifier not in contexts:
+            contexts[identifier] = graph.graph(identifier)
+        return contexts[identifier]
+
+    namespaces = {}
+    batch = []
+    for s, p, o, g in iter_quads(path, compression=compression, namespaces=namespaces):
+        batch.append((s, p, o, context_for(g)))
+        if len(batch) >= batch_size:
+            graph.addN(batch)
+            batch = []
+    graph.addN(batch)
+
+    for prefix, namespace in namespaces.items():
+        graph.bind(prefix, namespace, override=True)
+
+    return graph
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convertir grafos RDF a N-Triples / N-Quads en streaming"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    convert_parser = subparsers.add_parser("convert", help="Convertir un fichero RDF")
+    convert_parser.add_argument("source", help="Fichero RDF fuente")
+    convert_parser.add_argument("output", help="Fichero destino (.nt, .nq, .ttl, opcionalmente .gz/.zst)")
+    convert_parser.add_argument("--format", default=None, choices=sorted(STREAMING_FORMATS))
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "convert":
+        from .graph_snapshot import parse_graph
+
+        graph = parse_graph(args.source, graph=Dataset() if args.format == "nquads" else None)
+        count = write_graph(graph, args.output, format=args.format)
+        print(f"✅ {count:,} triples escritos en {args.output}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Parseo multiproceso de volcados N-Triples / N-Quads / Turtle plano.
+
+Aunque el formato sea línea a línea, parsear el volcado inicial con rdflib usa
+un solo núcleo. Aquí el fichero se divide en trozos alineados a fin de línea,
+cada trozo se parsea en un proceso del pool produciendo su propio diccionario
+de términos y su array de triples, y el proceso principal fusiona las partes
+(reasignando ids) en un ``CompiledSnapshot``:
+
+- Ficheros sin comprimir: trozos por rango de bytes, que cada worker lee
+  directamente del disco.
+- Ficheros ``.gz`` / ``.zst``: el proceso principal descomprime y reparte
+  lotes de líneas (con un número acotado de lotes en vuelo).
+
+Los blank nodes conservan su etiqueta para que coincidan entre trozos. Si el
+fichero no es línea a línea (p.ej. Turtle agrupado) se devuelve None y el
+llamador recurre al parser de rdflib.
+
+Uso:
+    from knowledge_graph.parallel_parse import parse_snapshot_parallel
+    snapshot = parse_snapshot_parallel("data/ai_models.nt", sha256, workers=32)
+
+Autor: Edmundo Mori
+"""
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from rdflib.plugins.parsers.ntriples import ParseError
+
+from .graph_snapshot import CompiledSnapshot, TermDictionary, TermKey, guess_format, term_key
+from .ntriples_io import LineParser, open_text, parse_prefix, split_compression
+
+
+logger = logging.getLogger(__name__)
+
+# Formatos rdflib que se pueden partir por líneas
+LINE_BASED_FORMATS = {"nt", "nquads", "turtle"}
+
+# Tamaño mínimo (sin comprimir) para que compense arrancar el pool
+PARALLEL_MIN_BYTES = 32 << 20
+
+# Ratio aproximado de compresión de N-Triples (para estimar el tamaño real)
+COMPRESSED_SIZE_RATIO = 7
+
+# Tamaño de cada trozo por rango de bytes
+CHUNK_BYTES = 8 << 20
+
+# Líneas por lote cuando el fichero está comprimido
+CHUNK_LINES = 100_000
+
+# Parte parseada por un worker: (claves de términos, triples locales, prefijos)
+ParsedPart = Tuple[List[TermKey], np.ndarray, Dict[str, str]]
+
+
+def default_workers() -> int:
+    """Procesos por defecto: todos los núcleos disponibles"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _parse_text(text: str) -> ParsedPart:
+    """Parsear un trozo de texto con su propio diccionario de términos"""
+    parser = LineParser(keep_bnode_labels=True)
+    local_ids: Dict[TermKey, int] = {}
+    keys: List[TermKey] = []
+    ids: List[int] = []
+    namespaces: Dict[str, str] = {}
+
+    for line in text.split("\n"):
+        prefix = parse_prefix(line)
+        if prefix is not None:
+            namespaces[prefix[0]] = prefix[1]
+            continue
+
+        statement = parser.parse_statement(line)
+        if statement is None:
+            continue
+
+        for term in statement[:3]:
+            key = term_key(term)
+            term_id = local_ids.get(key)
+            if term_id is None:
+                term_id = local_ids[key] = len(keys)
+                keys.append(key)
+            ids.append(term_id)
+
+    return keys, np.asarray(ids, dtype=np.int32).reshape(-1, 3), namespaces
+
+
+def _parse_range(task: Tuple[str, int, int]) -> ParsedPart:
+    """Worker: parsear el rango de bytes [start, end) de un fichero"""
+    path, start, end = task
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _parse_text(data.decode("utf-8"))
+
+
+def _byte_ranges(path: Path, chunk_bytes: int) -> List[Tuple[str, int, int]]:
+    """Dividir un fichero en rangos de bytes que terminan en fin de línea"""
+    size = path.stat().st_size
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((str(path), start, end))
+            start = end
+    return ranges
+
+
+def _line_batches(path: Path, compression: str, batch_lines: int) -> Iterator[str]:
+    """Lotes de líneas de un fichero comprimido, descomprimido al vuelo"""
+    with open_text(path, "r", compression=compression) as f:
+        batch: List[str] = []
+        for line in f:
+            batch.append(line)
+            if len(batch) >= batch_lines:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+
+def is_line_based(path: Union[str, Path], format: Optional[str] = None) -> bool:
+    """
+    Comprobar si un fichero se puede partir por líneas.
+
+    N-Triples y N-Quads siempre; Turtle solo si es "plano" (cabecera de
+    prefijos y una sentencia N-Triples por línea, como escribe ``write_graph``).
+    """
+    format = format or guess_format(path)
+    if format not in LINE_BASED_FORMATS:
+        return False
+    if format != "turtle":
+        return True
+
+    parser = LineParser()
+    try:
+        with open_text(path, "r") as f:
+            for line in f:
+                if parse_prefix(line) is not None:
+                    continue
+                if parser.parse_statement(line) is not None:
+                    return True
+    except (ParseError, UnicodeDecodeError):
+        return False
+    return False
+
+
+def _estimated_size(path: Path) -> int:
+    _, compression = split_compression(path)
+    size = path.stat().st_size
+    return size * COMPRESSED_SIZE_RATIO if compression else size
+
+
+def parse_snapshot_parallel(
+    path: Union[str, Path],
+    sha256: str,
+    format: Optional[str] = None,
+    workers: Optional[int] = None,
+    min_bytes: int = PARALLEL_MIN_BYTES,
+) -> Optional[CompiledSnapshot]:
+    """
+    Parsear un volcado línea a línea en paralelo y compilarlo.
+
+    Args:
+        path: Fichero fuente (``.nt``, ``.nq``, ``.ttl`` plano; opcionalmente ``.gz``/``.zst``)
+        sha256: Versión del grafo fuente
+        format: Formato rdflib (por defecto, según la extensión)
+        workers: Procesos del pool (por defecto, todos los núcleos)
+        min_bytes: Por debajo de este tamaño no compensa paralelizar
+
+    Returns:
+        Snapshot compilado, o None si el fichero no se puede (o no compensa)
+        parsear en paralelo y debe usarse el parser de rdflib
+    """
+    path = Path(path)
+    workers = workers or default_workers()
+
+    if workers < 2 or _estimated_size(path) < min_bytes or not is_line_based(path, format):
+        return None
+
+    _, compression = split_compression(path)
+    if compression is None:
+        tasks = _byte_ranges(path, max(1 << 20, min(CHUNK_BYTES, path.stat().st_size // workers + 1)))
+        worker = _parse_range
+    else:
+        tasks = _line_batches(path, compression, CHUNK_LINES)
+        worker = _parse_text
+
+    terms = TermDictionary()
+    parts: List[np.ndarray] = []
+    namespaces: Dict[str, str] = {}
+
+    def merge(part: ParsedPart) -> None:
+        keys, triples, part_namespaces = part
+        remap = np.fromiter((terms.add(key) for key in keys), dtype=np.int32, count=len(keys))
+        if len(triples):
+            parts.append(remap[triples])
+        namespaces.update(part_namespaces)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Se fusiona en orden mientras los demás trozos siguen parseándose
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(worker, task))
+                if len(pending) >= 2 * workers:
+                    merge(pending.popleft().result())
+            while pending:
+                merge(pending.popleft().result())
+    except ParseError as e:
+        logger.warning(f"⚠️ {path.name} no es línea a línea ({e}); se usa el parser de rdflib")
+        return None
+    except (OSError, BrokenProcessPool) as e:
+        logger.warning(f"⚠️ No se pudo parsear en paralelo ({e}); se usa el parser de rdflib")
+        return None
+
+    triples = np.concatenate(parts) if parts else np.empty((0, 3), dtype=np.int32)
+    snapshot = CompiledSnapshot.from_terms(
+        terms, triples, sha256, source=str(path), namespaces=namespaces, unique=True
+    )
+    logger.info(
+        f"⚡ Parseo paralelo ({workers} procesos): {snapshot.triple_count:,} triples, "
+        f"{snapshot.term_count:,} términos"
+    )
+    return snapshot
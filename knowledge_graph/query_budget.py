@@ -0,0 +1,931 @@
+"""
+Presupuestos de ejecución para consultas SPARQL generadas por el LLM.
+
+Una consulta mal generada (un producto cartesiano entre patrones sin
+variables comunes, un camino ``*`` sobre todo el grafo, un FILTER que el motor
+columnar no vectoriza) puede bloquear la petición durante minutos. Antes de
+ejecutarla se estima su coste con las cardinalidades por predicado del índice
+columnar (triples, sujetos y objetos distintos), siguiendo el mismo orden
+voraz de joins que el motor, y se rechaza si supera el presupuesto.
+
+Las consultas que pasan la estimación se ejecutan con un tiempo máximo real:
+
+- Las pequeñas que el motor columnar soporta se evalúan en el propio proceso;
+  el evaluador comprueba el plazo entre operaciones y la aborta al agotarse.
+- El resto se ejecuta en un pool de procesos (intérpretes nuevos, no
+  ``fork`` de un proceso con hilos) que abren el snapshot compilado del grafo
+  una vez y envían las filas por lotes; al agotarse el tiempo el proceso se
+  mata (y se sustituye) y se devuelven las filas recibidas hasta entonces. El
+  tiempo de arranque y de carga del grafo cuenta para el plazo.
+- Sin pool (grafos que no proceden del ``GraphStore``, sistemas sin
+  ``pass_fds``) nada puede cortar la consulta: solo se ejecutan en el propio
+  proceso las de coste estimado pequeño y el resto se rechaza.
+
+Las respuestas completas se guardan en la caché de resultados.
+
+Uso:
+    from knowledge_graph.query_budget import QueryBudget, execute_with_budget
+    response = execute_with_budget(graph, sparql, QueryBudget(timeout=5.0))
+    if response.status == "timeout":
+        ...  # response.result contiene las filas parciales
+
+Autor: Edmundo Mori
+"""
+
+import atexit
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import numpy as np
+
+from rdflib import BNode, Graph, URIRef, Variable
+from rdflib.graph import ConjunctiveGraph
+from rdflib.paths import InvPath, SequencePath
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import Query
+from rdflib.query import Result
+
+from .columnar_sparql import (
+    ColumnarEvaluator,
+    ColumnarIndex,
+    QueryTimeout,
+    UnsupportedQuery,
+    get_columnar_index,
+    query_columnar,
+)
+from .graph_backends import GRAPH_BACKENDS, open_graph
+from .graph_snapshot import CompiledSnapshot, compiled_path_for
+from .graph_store import get_graph_store
+from .sparql_cache import get_query_cache, get_result_cache, has_native_sparql
+from .sparql_pages import run_query_page, slice_query, slice_result
+
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto por defecto de una consulta
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_ESTIMATED_ROWS = 5_000_000
+DEFAULT_MAX_ROWS = 50_000
+
+# Por debajo de esta estimación la consulta se evalúa en el propio proceso
+INLINE_MAX_ESTIMATED_ROWS = 200_000
+
+# Patrones con más triples se estiman con las cardinalidades medias del predicado
+HISTOGRAM_MAX_TRIPLES = 2_000_000
+
+# Filas por mensaje del proceso de la consulta
+ROW_BATCH_SIZE = 1000
+
+# Cada cuánto se comprueba si se ha agotado el tiempo (segundos)
+POLL_INTERVAL = 0.05
+
+# Procesos del pool de consultas (se arrancan bajo demanda)
+POOL_SIZE = 2
+
+# Los procesos del pool heredan el socket del padre (``pass_fds``)
+POOL_SUPPORTED = os.name == "posix"
+
+# Directorio desde el que los procesos del pool importan ``knowledge_graph``
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+
+# Nodos del álgebra que no cambian el trabajo de su hijo
+_PASS_THROUGH = {
+    "SelectQuery", "AskQuery", "ConstructQuery", "DescribeQuery",
+    "Project", "Distinct", "Reduced", "OrderBy", "Slice", "Filter",
+    "Extend", "Group", "AggregateJoin", "ToMultiSet", "Graph",
+}
+
+
+@dataclass
+class QueryBudget:
+    """Límites de ejecución de una consulta"""
+    timeout: float = DEFAULT_TIMEOUT
+    max_estimated_rows: float = DEFAULT_MAX_ESTIMATED_ROWS
+    max_rows: int = DEFAULT_MAX_ROWS
+
+
+@dataclass
+class CostEstimate:
+    """Coste estimado de una consulta antes de ejecutarla"""
+    rows: float                 # mayor resultado intermedio estimado
+    cartesian: bool = False     # algún join sin variables comunes
+    unbounded_path: bool = False
+    notes: List[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        """Resumen legible de la estimación"""
+        parts = [f"~{self.rows:,.0f} filas intermedias"]
+        if self.cartesian:
+            parts.append("producto cartesiano")
+        if self.unbounded_path:
+            parts.append("camino de longitud arbitraria")
+        return ", ".join(parts + self.notes)
+
+
+@dataclass
+class BudgetedResult:
+    """
+    Respuesta de ``execute_with_budget``.
+
+    ``status`` es ``ok`` (resultado completo), ``truncated`` (se alcanzó
+    ``max_rows``), ``timeout`` (filas recibidas antes de agotar el tiempo),
+    ``rejected`` (coste estimado excesivo, no se ejecutó) o ``error``.
+    """
+    status: str
+    result: Optional[Result] = None
+    estimate: Optional[CostEstimate] = None
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.status == "ok"
+
+    @property
+    def timed_out(self) -> bool:
+        return self.status == "timeout"
+
+
+class CostEstimator:
+    """Estimación de filas intermedias a partir de las cardinalidades del índice columnar"""
+
+    def __init__(self, index: ColumnarIndex):
+        self.index = index
+        self.stats = index.predicate_stats()
+
+    def estimate(self, query: Query) -> CostEstimate:
+        estimate = CostEstimate(rows=0.0)
+        self._peak = 0.0
+        self._estimate = estimate
+        self._part(query.algebra)
+        estimate.rows = self._peak
+        return estimate
+
+    def _seen(self, rows: float) -> float:
+        self._peak = max(self._peak, rows)
+        return rows
+
+    def _part(self, part: Any) -> Tuple[float, Set[Any]]:
+        """(filas estimadas, variables ligadas) de un nodo del álgebra"""
+        if not isinstance(part, CompValue):
+            return 1.0, set()
+        name = part.name
+
+        if name == "BGP":
+            return self._bgp(part.triples)
+        if name in _PASS_THROUGH:
+            if part.get("p") is None:
+                return 1.0, set()
+            return self._part(part.p)
+        if name == "values":
+            rows = float(len(part.res or []))
+            return self._seen(rows), {var for row in part.res or [] for var in row}
+        if name == "Union":
+            left, left_vars = self._part(part.p1)
+            right, right_vars = self._part(part.p2)
+            return self._seen(left + right), left_vars | right_vars
+        if name in ("Join", "LeftJoin", "Minus"):
+            left, left_vars = self._part(part.p1)
+            right, right_vars = self._part(part.p2)
+            if left_vars & right_vars:
+                rows = max(left, right)
+            else:
+                if left > 1 and right > 1:
+                    self._estimate.cartesian = True
+                rows = left * right if name == "Join" else left * max(right, 1.0)
+            if name == "Minus":
+                return self._seen(rows), left_vars
+            return self._seen(rows), left_vars | right_vars
+
+        self._estimate.notes.append(f"{name} sin estimar")
+        return 1.0, set()
+
+    def _expand(self, s: Any, path: Any, o: Any, counter: List[int]) -> List[Tuple]:
+        """Como el motor: secuencias e inversos a patrones simples; otros caminos se marcan"""
+        if isinstance(path, (URIRef, Variable, BNode)):
+            return [(s, path, o)]
+        if isinstance(path, InvPath):
+            return self._expand(o, path.arg, s, counter)
+        if isinstance(path, SequencePath):
+            patterns = []
+            current = s
+            for i, step in enumerate(path.args):
+                if i == len(path.args) - 1:
+                    target = o
+                else:
+                    counter[0] += 1
+                    target = BNode(f"_path{counter[0]}")
+                patterns.extend(self._expand(current, step, target, counter))
+                current = target
+            return patterns
+        # Alternativas, negaciones y caminos * / +: cota superior = todo el grafo
+        self._estimate.unbounded_path = True
+        return [(s, None, o)]
+
+    def _pattern_ids(self, pattern: Tuple) -> Optional[List[Optional[int]]]:
+        """Ids de las constantes del patrón (None si alguna no está en el grafo)"""
+        ids = []
+        for term in pattern:
+            if term is None or isinstance(term, (Variable, BNode)):
+                ids.append(None)
+            else:
+                term_id = self.index.term_id(term)
+                if term_id is None:
+                    return None
+                ids.append(term_id)
+        return ids
+
+    def _count(self, pattern: Tuple) -> float:
+        ids = self._pattern_ids(pattern)
+        return 0.0 if ids is None else float(self.index.count(*ids))
+
+    def _histogram(self, pattern: Tuple, position: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(valores, repeticiones) de una posición del patrón; None si es demasiado grande"""
+        ids = self._pattern_ids(pattern)
+        if ids is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.index.count(*ids) > HISTOGRAM_MAX_TRIPLES:
+            return None
+        return np.unique(self.index.match(*ids)[:, position], return_counts=True)
+
+    def _average_fanout(self, pattern: Tuple, position: int, count: float) -> float:
+        """Filas por valor según las cardinalidades del predicado (distribución uniforme)"""
+        ids = self._pattern_ids(pattern)
+        stats = self.stats.get(ids[1]) if ids and ids[1] is not None else None
+        if position == 1 or stats is None:
+            distinct = max(self.index.term_count, 1)
+        else:
+            distinct = stats[1] if position == 0 else stats[2]
+        return count / max(min(distinct, count), 1)
+
+    def _bgp(self, triples: Any) -> Tuple[float, Set[Any]]:
+        counter = [0]
+        patterns = []
+        for s, p, o in triples:
+            patterns.extend(self._expand(s, p, o, counter))
+
+        # Variable -> distribución de sus valores (ids, pesos que suman 1)
+        distributions: Dict[Any, Tuple[np.ndarray, np.ndarray]] = {}
+        rows, bound = 1.0, set()
+        while patterns:
+            best, best_score = None, None
+            for i, pattern in enumerate(patterns):
+                variables = {t for t in pattern if isinstance(t, (Variable, BNode))}
+                shares = not bound or bool(variables & bound)
+                score = (not shares, self._count(pattern))
+                if best_score is None or score < best_score:
+                    best, best_score = i, score
+            pattern = patterns.pop(best)
+            count = best_score[1]
+            variables = {t for t in pattern if isinstance(t, (Variable, BNode))}
+
+            if not bound:
+                rows = count
+            elif variables & bound:
+                # Filas nuevas por fila actual, ponderadas por la distribución
+                # real de la variable compartida (los valores frecuentes pesan más)
+                fanouts = []
+                for position, term in enumerate(pattern):
+                    if term not in bound:
+                        continue
+                    histogram = self._histogram(pattern, position)
+                    if histogram is None or term not in distributions:
+                        fanouts.append(self._average_fanout(pattern, position, count))
+                        continue
+                    values, weights = distributions[term]
+                    new_values, counts = histogram
+                    common, left, right = np.intersect1d(values, new_values, return_indices=True)
+                    fanouts.append(float(np.dot(weights[left], counts[right])))
+                rows *= min(fanouts) if fanouts else 1.0
+            else:
+                if rows > 1 and count > 1:
+                    self._estimate.cartesian = True
+                rows *= count
+
+            for position, term in enumerate(pattern):
+                if isinstance(term, (Variable, BNode)) and term not in distributions:
+                    histogram = self._histogram(pattern, position)
+                    if histogram is not None and len(histogram[0]):
+                        values, counts = histogram
+                        distributions[term] = (values, counts / counts.sum())
+            bound |= variables
+            self._seen(rows)
+            if rows == 0:
+                break
+        return rows, bound
+
+
+# Índices para estimar el coste en grafos fuera del GraphStore: id -> (weakref, triples, índice)
+_loose_indexes: Dict[int, Tuple[weakref.ref, int, ColumnarIndex]] = {}
+_loose_lock = threading.Lock()
+
+
+def _cost_index(graph: Graph) -> Optional[ColumnarIndex]:
+    """
+    Índice columnar con el que estimar el coste de una consulta.
+
+    Los grafos del ``GraphStore`` usan su índice por versión. Para los demás
+    se codifica un índice temporal, que se reconstruye cuando cambia el número
+    de triples: solo sirve para estimar, no para evaluar.
+    """
+    if has_native_sparql(graph):
+        return None
+    if get_graph_store().entry_of(graph) is not None:
+        return get_columnar_index(graph)
+    if isinstance(graph, ConjunctiveGraph):
+        return None
+
+    key = id(graph)
+    with _loose_lock:
+        cached = _loose_indexes.get(key)
+        if cached is not None:
+            ref, triples, index = cached
+            if ref() is graph and triples == len(graph):
+                return index
+        index = ColumnarIndex.from_graph(graph)
+        ref = weakref.ref(graph, lambda _ref, key=key: _loose_indexes.pop(key, None))
+        _loose_indexes[key] = (ref, len(graph), index)
+        return index
+
+
+def estimate_cost(graph: Graph, query: Query) -> Optional[CostEstimate]:
+    """
+    Estimar el coste de una consulta compilada.
+
+    Returns:
+        Estimación, o None si el grafo no admite índice columnar (stores con
+        SPARQL nativo o datasets con grafos con nombre)
+    """
+    index = _cost_index(graph)
+    if index is None:
+        return None
+    return CostEstimator(index).estimate(query)
+
+
+def _send_result(send: Callable[[Tuple], Any], result: Result, max_rows: int) -> None:
+    """Enviar un resultado como mensajes: cabecera, filas por lotes y cierre"""
+    if result.type == "ASK":
+        send(("ask", result.askAnswer))
+        return
+    if result.type in ("CONSTRUCT", "DESCRIBE"):
+        rows = iter(result.graph)
+        send(("header", result.type, None))
+    else:
+        variables = list(result.vars or [])
+        # Iterar el resultado (en vez de ``bindings``) deja que rdflib produzca
+        # las filas a medida que las evalúa: llegan al padre antes del plazo
+        rows = iter(result)
+        send(("header", "SELECT", variables))
+
+    batch: List[Tuple] = []
+    sent = 0
+    for row in rows:
+        if sent + len(batch) >= max_rows:
+            send(("rows", batch))
+            send(("truncated",))
+            return
+        batch.append(tuple(row))
+        if len(batch) >= ROW_BATCH_SIZE:
+            send(("rows", batch))
+            sent += len(batch)
+            batch = []
+    send(("rows", batch))
+    send(("done",))
+
+
+def _build_result(kind: str, variables: Optional[List[Variable]], rows: List[Tuple]) -> Result:
+    result = Result(kind)
+    if kind == "SELECT":
+        result.vars = variables or []
+        result.bindings = [
+            {var: value for var, value in zip(result.vars, row) if value is not None}
+            for row in rows
+        ]
+    else:
+        graph = Graph()
+        for triple in rows:
+            graph.add(triple)
+        result.graph = graph
+    return result
+
+
+def _collect(
+    receive: Callable[[float], Optional[Tuple]],
+    deadline: float,
+) -> Tuple[str, Optional[Result], Optional[str]]:
+    """
+    Reunir los mensajes de ``_send_result`` hasta el plazo.
+
+    Args:
+        receive: Devuelve el siguiente mensaje, o None si no llega ninguno en
+            el tiempo indicado
+        deadline: Instante (``time.monotonic()``) en que se corta la consulta
+
+    Returns:
+        (estado, resultado, error); con ``timeout`` el resultado contiene las
+        filas recibidas hasta entonces y con ``unsupported`` (el motor columnar
+        del proceso no evalúa la consulta) no hay resultado
+    """
+    kind, variables, rows = "SELECT", None, []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "timeout", _build_result(kind, variables, rows), None
+        message = receive(min(POLL_INTERVAL, remaining))
+        if message is None:
+            continue
+
+        tag = message[0]
+        if tag == "header":
+            kind, variables = message[1], message[2]
+        elif tag == "rows":
+            rows.extend(message[1])
+        elif tag == "ask":
+            result = Result("ASK")
+            result.askAnswer = message[1]
+            return "ok", result, None
+        elif tag in ("done", "truncated"):
+            return "ok" if tag == "done" else "truncated", _build_result(kind, variables, rows), None
+        elif tag == "unsupported":
+            return "unsupported", None, None
+        elif tag == "error":
+            return "error", None, message[1]
+
+
+def _run_inline(
+    graph: Graph,
+    query: str,
+    initBindings: Optional[Mapping[str, Any]],
+    page: Tuple[int, Optional[int]],
+    budget: QueryBudget,
+) -> Tuple[str, Optional[Result], Optional[str]]:
+    """Ejecutar con rdflib en este proceso, sin plazo (solo consultas de coste estimado pequeño)"""
+    messages: List[Tuple] = []
+    _send_result(messages.append, run_query_page(graph, query, *page, initBindings=initBindings), budget.max_rows)
+    pending = iter(messages)
+    return _collect(lambda timeout: next(pending, None), float("inf"))
+
+
+# ----------------------------------------------------------------------
+# Pool de procesos de consulta
+# ----------------------------------------------------------------------
+
+# (backend, ruta, versión) con que un proceso del pool abre el mismo grafo
+GraphSource = Tuple[str, str, str]
+
+
+def _graph_source(graph: Graph) -> Optional[GraphSource]:
+    """Cómo abrir el grafo desde otro proceso (None si no procede del ``GraphStore`` o se modificó en memoria)"""
+    entry = get_graph_store().entry_of(graph)
+    if entry is None or entry.modified:
+        return None
+    store = type(graph.store).__name__
+    backend = next((name for name, (plugin, _) in GRAPH_BACKENDS.items() if plugin == store), "memory")
+    return backend, str(entry.path), entry.version
+
+
+def _open_source(source: GraphSource, level: str) -> Any:
+    """
+    Proceso del pool: abrir un grafo.
+
+    ``index`` es el ``ColumnarIndex`` sobre el snapshot compilado de la versión
+    (sin reconstruir el grafo rdflib); ``graph`` es el grafo completo del
+    ``GraphStore`` o el store en disco abierto en solo lectura.
+    """
+    backend, path, version = source
+    if level == "index":
+        snapshot = CompiledSnapshot.load(compiled_path_for(path, version))
+        if snapshot.sha256 != version:
+            raise ValueError("el snapshot compilado es de otra versión")
+        return ColumnarIndex(snapshot)
+
+    if backend == "memory":
+        entry = get_graph_store().get_entry(path)
+    else:
+        entry = get_graph_store().entry_of(open_graph(backend=backend, store_path=path))
+    if entry is None or entry.version != version:
+        raise ValueError("el grafo en disco es de otra versión")
+    return entry.graph
+
+
+def _serve(conn: Connection) -> None:
+    """
+    Proceso del pool: atender peticiones hasta que se cierre la conexión.
+
+    ``("load", origen, nivel)`` abre el grafo (responde ``loaded`` o
+    ``load-failed``); ``("query", origen, nivel, consulta, initBindings,
+    página, max_rows)`` responde con los mensajes de ``_send_result``, o
+    ``unsupported`` si el nivel es ``index`` y el motor columnar no la evalúa.
+    """
+    # Aquí el motor columnar se usa sobre el snapshot; el nivel ``graph`` es rdflib
+    get_query_cache().columnar = False
+    opened: Dict[Tuple[GraphSource, str], Any] = {}
+
+    def open_level(source: GraphSource, level: str) -> Any:
+        key = (source, level)
+        if key not in opened:
+            # Solo se conserva la última versión de cada grafo
+            for other in [other for other in opened if other[0][:2] == source[:2] and other[1] == level]:
+                del opened[other]
+            opened[key] = _open_source(source, level)
+        return opened[key]
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            return
+        tag, source, level = request[:3]
+        if tag == "load":
+            try:
+                open_level(source, level)
+                conn.send(("loaded", source, level))
+            except Exception as e:
+                conn.send(("load-failed", source, level, f"{type(e).__name__}: {e}"))
+            continue
+
+        query, initBindings, page, max_rows = request[3:]
+        try:
+            if level == "index":
+                prepared = slice_query(get_query_cache().prepare(query), *page)
+                try:
+                    result = ColumnarEvaluator(open_level(source, level), Graph(), prepared).evaluate(initBindings)
+                except UnsupportedQuery:
+                    conn.send(("unsupported",))
+                    continue
+            else:
+                result = run_query_page(open_level(source, level), query, *page, initBindings=initBindings)
+            _send_result(conn.send, result, max_rows)
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+@dataclass(eq=False)
+class _PoolWorker:
+    process: subprocess.Popen
+    conn: Connection
+    loaded: Set[Tuple[GraphSource, str]] = field(default_factory=set)
+    pending: Set[Tuple[GraphSource, str]] = field(default_factory=set)
+    failed: Dict[Tuple[GraphSource, str], str] = field(default_factory=dict)
+
+
+class QueryWorkerPool:
+    """
+    Procesos que ejecutan consultas con tiempo máximo y se matan al agotarlo.
+
+    Cada proceso es un intérprete nuevo (``python -m
+    knowledge_graph.query_budget worker``) conectado por un socket: no hereda
+    hilos ni locks del proceso que lo lanza (un ``fork`` de Streamlit puede
+    quedarse bloqueado) ni vuelve a importar su ``__main__`` (``spawn`` falla
+    en scripts sin ``if __name__ == "__main__"``).
+
+    Los procesos se arrancan bajo demanda, hasta ``size``. Cada uno abre el
+    snapshot compilado del grafo (no el grafo rdflib) y evalúa con el motor
+    columnar; solo las consultas que este no soporta cargan el grafo completo
+    (o abren el store en disco). Las cargas cuentan para el plazo de la
+    consulta, pero no se interrumpen: si el plazo se agota, la siguiente
+    consulta encuentra el grafo cargado. El proceso que agota el plazo
+    ejecutando se mata y se sustituye por otro que vuelve a cargar lo mismo.
+    """
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._idle: List[_PoolWorker] = []
+        self._workers: Set[_PoolWorker] = set()
+        self._available = threading.Condition()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _spawn() -> _PoolWorker:
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PACKAGE_ROOT), env.get("PYTHONPATH")]))
+        try:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "knowledge_graph.query_budget", "worker", str(child_sock.fileno())],
+                pass_fds=(child_sock.fileno(),),
+                stdin=subprocess.DEVNULL,
+                env=env,
+            )
+        except Exception:
+            parent_sock.close()
+            raise
+        finally:
+            child_sock.close()
+        return _PoolWorker(process, Connection(parent_sock.detach()))
+
+    def _start_worker(self, preload: Iterable[Tuple[GraphSource, str]] = ()) -> _PoolWorker:
+        worker = self._spawn()
+        with self._available:
+            self._workers.add(worker)
+        for source, level in preload:
+            worker.conn.send(("load", source, level))
+            worker.pending.add((source, level))
+        return worker
+
+    def _discard(self, worker: _PoolWorker) -> None:
+        worker.conn.close()
+        if worker.process.poll() is None:
+            worker.process.kill()
+        try:
+            worker.process.wait(1.0)
+        except subprocess.TimeoutExpired:
+            pass
+        with self._available:
+            self._workers.discard(worker)
+
+    def _checkout(self, deadline: float) -> Optional[_PoolWorker]:
+        with self._available:
+            while not self._idle and len(self._workers) >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._available.wait(remaining)
+            worker = self._idle.pop() if self._idle else None
+        if worker is not None and worker.process.poll() is not None:
+            self._discard(worker)
+            worker = None
+        return worker if worker is not None else self._start_worker()
+
+    def _checkin(self, worker: _PoolWorker, reusable: bool) -> None:
+        if not reusable:
+            preload = worker.loaded | worker.pending
+            self._discard(worker)
+            try:
+                worker = self._start_worker(preload)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo sustituir un proceso de consultas: {e}")
+                with self._available:
+                    self._available.notify()
+                return
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _receive(self, worker: _PoolWorker, timeout: float) -> Optional[Tuple]:
+        """Siguiente mensaje de la consulta (las respuestas de carga se anotan aparte)"""
+        if not worker.conn.poll(timeout):
+            if worker.process.poll() is not None:
+                raise EOFError(f"código {worker.process.returncode}")
+            return None
+        message = worker.conn.recv()
+        if message[0] not in ("loaded", "load-failed"):
+            return message
+        source, level = message[1], message[2]
+        worker.pending.discard((source, level))
+        if message[0] == "loaded":
+            worker.loaded = {
+                key for key in worker.loaded if key[0][:2] != source[:2] or key[1] != level
+            } | {(source, level)}
+        else:
+            worker.failed[(source, level)] = message[3]
+        return None
+
+    def _load(self, worker: _PoolWorker, source: GraphSource, level: str, deadline: float) -> Optional[str]:
+        """Esperar a que el proceso tenga el grafo abierto; None si lo tiene, si no ``timeout`` o el error"""
+        key = (source, level)
+        if key not in worker.loaded and key not in worker.pending and key not in worker.failed:
+            worker.conn.send(("load", source, level))
+            worker.pending.add(key)
+        while key in worker.pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "timeout"
+            self._receive(worker, min(POLL_INTERVAL, remaining))
+        return None if key in worker.loaded else worker.failed[key]
+
+    def run(
+        self,
+        source: GraphSource,
+        query: str,
+        initBindings: Optional[Mapping[str, Any]],
+        page: Tuple[int, Optional[int]],
+        budget: QueryBudget,
+        deadline: float,
+    ) -> Optional[Tuple[str, Optional[Result], Optional[str]]]:
+        """
+        Ejecutar en un proceso del pool hasta el plazo.
+
+        Returns:
+            (estado, resultado, error), o None si el proceso no puede abrir el
+            grafo (p.ej. el fichero ya es de otra versión)
+        """
+        worker = self._checkout(deadline)
+        if worker is None:
+            return "timeout", _build_result("SELECT", [], []), "No hubo hueco para ejecutar la consulta a tiempo"
+
+        reusable = True
+        try:
+            levels = ("index", "graph") if source[0] == "memory" else ("graph",)
+            for level in levels:
+                failure = self._load(worker, source, level, deadline)
+                if failure == "timeout":
+                    return "timeout", _build_result("SELECT", [], []), "El proceso de consultas aún está cargando el grafo"
+                if failure is not None:
+                    if level == "graph":
+                        logger.warning(f"⚠️ El proceso de consultas no pudo abrir el grafo: {failure}")
+                        return None
+                    continue  # sin snapshot compilado: grafo completo
+
+                worker.conn.send(("query", source, level, query, initBindings, page, budget.max_rows))
+                status, result, error = _collect(lambda timeout: self._receive(worker, timeout), deadline)
+                if status != "unsupported":
+                    reusable = status != "timeout"
+                    return status, result, error
+            return None
+        except (EOFError, OSError) as e:
+            reusable = False
+            return "error", None, f"El proceso de la consulta terminó ({e})"
+        finally:
+            self._checkin(worker, reusable)
+
+    def close(self) -> None:
+        """Terminar todos los procesos"""
+        with self._available:
+            workers = list(self._workers)
+            self._idle.clear()
+        for worker in workers:
+            self._discard(worker)
+
+
+_pool: Optional[QueryWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_query_pool() -> QueryWorkerPool:
+    """Pool de procesos de consulta compartido por todo el proceso"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = QueryWorkerPool()
+        return _pool
+
+
+def execute_with_budget(
+    graph: Graph,
+    query: str,
+    budget: Optional[QueryBudget] = None,
+    initBindings: Optional[Mapping[str, Any]] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> BudgetedResult:
+    """
+    Ejecutar una consulta SPARQL con estimación de coste y tiempo máximo.
+
+    Args:
+        graph: Grafo rdflib
+        query: Texto SPARQL (p.ej. generado por el LLM)
+        budget: Límites (por defecto ``QueryBudget()``)
+        initBindings: Valores iniciales de variables
+        offset: Primera fila a devolver (paginación)
+        limit: Máximo de filas a devolver; el motor deja de producir filas
+            al completar la página
+
+    Returns:
+        ``BudgetedResult``; nunca bloquea más de ``budget.timeout`` segundos
+        (salvo las consultas de coste estimado pequeño que no se pueden
+        enviar al pool, que se ejecutan en este proceso)
+    """
+    budget = budget or QueryBudget()
+    start = time.monotonic()
+    deadline = start + budget.timeout
+
+    def finish(status: str, result: Optional[Result] = None, estimate: Optional[CostEstimate] = None,
+               error: Optional[str] = None) -> BudgetedResult:
+        return BudgetedResult(status, result, estimate, time.monotonic() - start, error)
+
+    page = (offset, limit)
+    paged = offset > 0 or limit is not None
+    result_cache = get_result_cache()
+    cached = result_cache.lookup(graph, query, initBindings=initBindings)
+    if cached is not None:
+        return finish("ok", slice_result(cached, offset, limit) if paged else cached)
+
+    try:
+        prepared = get_query_cache().prepare_for(graph, query, initBindings=initBindings)
+    except Exception as e:
+        return finish("error", error=f"Consulta SPARQL inválida: {e}")
+
+    def remember(result: Result) -> None:
+        # Solo las respuestas completas sirven para otras páginas
+        if not paged:
+            result_cache.remember(graph, query, result, initBindings=initBindings)
+
+    estimate = estimate_cost(graph, prepared)
+    if estimate is not None and estimate.rows > budget.max_estimated_rows:
+        logger.warning(f"🛑 Consulta rechazada por coste: {estimate.describe()}")
+        return finish(
+            "rejected", estimate=estimate,
+            error=f"Coste estimado excesivo ({estimate.describe()}); "
+                  f"el límite es {budget.max_estimated_rows:,.0f} filas",
+        )
+    small = estimate is not None and estimate.rows <= INLINE_MAX_ESTIMATED_ROWS
+
+    if small:
+        try:
+            result = query_columnar(graph, slice_query(prepared, offset, limit),
+                                    initBindings=initBindings, deadline=deadline)
+        except QueryTimeout:
+            logger.warning(f"⏱️ Consulta columnar cortada a los {budget.timeout:.1f}s")
+            return finish("timeout", _build_result("SELECT", [], []), estimate,
+                          error=f"Tiempo agotado ({budget.timeout:.1f}s)")
+        if result is not None:
+            if result.type == "SELECT" and len(result.bindings) > budget.max_rows:
+                result.bindings = result.bindings[:budget.max_rows]
+                return finish("truncated", result, estimate)
+            remember(result)
+            return finish("ok", result, estimate)
+
+    outcome = None
+    source = _graph_source(graph)
+    if source is not None and POOL_SUPPORTED:
+        outcome = get_query_pool().run(source, query, initBindings, page, budget, deadline)
+    if outcome is None:
+        # Sin un proceso que se pueda matar, solo se ejecutan consultas pequeñas
+        if not small:
+            logger.warning("🛑 Consulta rechazada: no se puede ejecutar con tiempo máximo en este grafo")
+            return finish(
+                "rejected", estimate=estimate,
+                error="Este grafo no admite ejecución con tiempo máximo (fuera del GraphStore "
+                      f"o sin pool de procesos) y el coste estimado supera {INLINE_MAX_ESTIMATED_ROWS:,} filas",
+            )
+        try:
+            outcome = _run_inline(graph, query, initBindings, page, budget)
+        except Exception as e:
+            return finish("error", estimate=estimate, error=str(e))
+    status, result, error = outcome
+
+    if status == "ok":
+        remember(result)
+    elif status == "timeout":
+        received = len(result.bindings) if result.type == "SELECT" else len(result.graph)
+        logger.warning(f"⏱️ Consulta cortada a los {budget.timeout:.1f}s ({received} filas parciales)")
+        error = error or f"Tiempo agotado ({budget.timeout:.1f}s)"
+    return finish(status, result, estimate, error)
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    from .graph_store import get_shared_graph
+
+    parser = argparse.ArgumentParser(description="Estimar y ejecutar consultas SPARQL con presupuesto")
+    subparsers = parser.add_subparsers(dest="command")
+
+    worker = subparsers.add_parser("worker", help="Proceso del pool de consultas (uso interno)")
+    worker.add_argument("fd", type=int, help="Descriptor del socket conectado al proceso padre")
+
+    for command, help_text in (("estimate", "Estimar el coste sin ejecutar"), ("run", "Ejecutar con presupuesto")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument("graph", help="Fichero RDF del grafo")
+        sub.add_argument("query", help="Consulta SPARQL o fichero .rq")
+        sub.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+        sub.add_argument("--max-estimated-rows", type=float, default=DEFAULT_MAX_ESTIMATED_ROWS)
+        sub.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS)
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        logging.basicConfig(level=logging.WARNING)
+        _serve(Connection(args.fd))
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command is None:
+        parser.print_help()
+        return
+
+    query = args.query
+    if query.endswith(".rq"):
+        with open(query, "r", encoding="utf-8") as f:
+            query = f.read()
+    graph = get_shared_graph(args.graph)
+
+    if args.command == "estimate":
+        estimate = estimate_cost(graph, get_query_cache().prepare(query))
+        print(f"📊 {estimate.describe()}" if estimate else "⚠️ El grafo no tiene índice columnar")
+        return
+
+    budget = QueryBudget(args.timeout, args.max_estimated_rows, args.max_rows)
+    response = execute_with_budget(graph, query, budget)
+    print(f"{'✅' if response.complete else '⚠️'} {response.status} en {response.elapsed:.2f}s")
+    if response.estimate:
+        print(f"📊 {response.estimate.describe()}")
+    if response.error:
+        print(f"   {response.error}")
+    if response.result is not None and response.result.type == "SELECT":
+        print(f"   {len(response.result.bindings)} filas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Ranking vectorizado de modelos y selección parcial de los k mejores.
+
+``SearchEngine._rank_results`` puntuaba cada resultado en un bucle Python
+(convirtiendo ``downloads`` y ``rating`` desde cadenas en cada petición) y
+ordenaba la lista completa; los motores BM25 ordenaban todo su diccionario de
+scores para quedarse con ``top_k``. Aquí:
+
+- Las señales a priori de cada modelo (descargas y rating) se precalculan una
+  vez por catálogo como arrays ``float64`` indexados por id de modelo.
+- El score de una página es una sola pasada NumPy con pesos configurables
+  (``RankingWeights``).
+- ``top_k_indices`` selecciona los k mejores con ``np.partition`` y solo
+  ordena esos k (más los empates en la frontera), así que el coste de ordenar
+  crece con k y no con el número de candidatos. El orden es el mismo que el de
+  una ordenación completa estable.
+
+Uso:
+    from knowledge_graph.ranking import RankingWeights, get_ranking_features, top_k_indices
+    features = get_ranking_features(catalog)
+    scores = features.score(model_ids, title_matches, RankingWeights())
+    best = top_k_indices(scores, 10)
+
+Autor: Edmundo Mori
+"""
+
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .model_catalog import ModelCatalog
+
+
+@dataclass(frozen=True)
+class RankingWeights:
+    """
+    Pesos del score de un resultado.
+
+    score = base + title_match·[query ⊂ título]
+            + downloads·min(descargas / downloads_scale, downloads_cap)
+            + rating·(rating / 5)
+    """
+    base: float = 1.0
+    title_match: float = 2.0
+    downloads: float = 1.0
+    downloads_scale: float = 10_000_000
+    downloads_cap: float = 2.0
+    rating: float = 1.0
+
+
+@dataclass
+class RankingFeatures:
+    """Señales a priori de cada modelo del catálogo (0 si el modelo no las tiene)"""
+    downloads: np.ndarray
+    rating: np.ndarray
+
+    @classmethod
+    def from_catalog(cls, catalog: ModelCatalog) -> "RankingFeatures":
+        """Precalcular las señales desde las columnas del catálogo"""
+        downloads = np.where(catalog.present["downloads"], catalog.numeric["downloads"], 0).astype(np.float64)
+        # El rating de los resultados es likes / 100 (escala 0-5), normalizado a 0-1
+        likes = np.where(catalog.present["likes"], catalog.numeric["likes"], 0).astype(np.float64)
+        rating = np.where(likes > 0, likes / 100.0 / 5.0, 0.0)
+        return cls(downloads=downloads, rating=rating)
+
+    def score(
+        self,
+        model_ids: np.ndarray,
+        title_matches: np.ndarray,
+        weights: Optional[RankingWeights] = None,
+    ) -> np.ndarray:
+        """
+        Scores de una página de resultados en una pasada.
+
+        Args:
+            model_ids: Ids de catálogo de los resultados (-1 si no está)
+            title_matches: Booleano por resultado: la consulta aparece en el título
+            weights: Pesos (por defecto, ``RankingWeights()``)
+        """
+        weights = weights or RankingWeights()
+        model_ids = np.asarray(model_ids, dtype=np.int64)
+        known = model_ids >= 0
+
+        prior = np.zeros(len(model_ids))
+        prior[known] = np.minimum(self.downloads[model_ids[known]] / weights.downloads_scale, weights.downloads_cap)
+        normalized_rating = np.zeros(len(model_ids))
+        normalized_rating[known] = self.rating[model_ids[known]]
+
+        return (
+            weights.base
+            + weights.title_match * np.asarray(title_matches, dtype=np.float64)
+            + weights.downloads * prior
+            + weights.rating * normalized_rating
+        )
+
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None, tiebreak: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Posiciones de los k scores más altos, ordenadas de mayor a menor.
+
+    Equivale a ordenar por ``(-score, tiebreak)`` y quedarse con los k
+    primeros (por defecto, el desempate es la posición: orden estable), pero
+    solo se ordenan los candidatos con score >= k-ésimo score.
+
+    Args:
+        scores: Scores de los candidatos
+        k: Número de resultados (None = todos)
+        tiebreak: Clave ascendente para desempatar (p. ej., rango de la URI)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(scores)
+    if tiebreak is None:
+        tiebreak = np.arange(n)
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    else:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(scores >= kth)
+
+    order = np.lexsort((tiebreak[candidates], -scores[candidates]))
+    return candidates[order[:k]]
+
+
+# Caché de señales por catálogo: id(catálogo) -> (weakref, señales)
+_features_cache: Dict[int, Tuple[weakref.ref, RankingFeatures]] = {}
+_features_lock = threading.Lock()
+
+
+def get_ranking_features(catalog: ModelCatalog) -> RankingFeatures:
+    """Señales de ranking de un catálogo (se calculan una vez por versión)"""
+    key = id(catalog)
+    with _features_lock:
+        cached = _features_cache.get(key)
+        if cached is not None and cached[0]() is catalog:
+            return cached[1]
+        features = RankingFeatures.from_catalog(catalog)
+        ref = weakref.ref(catalog, lambda _ref, key=key: _features_cache.pop(key, None))
+        _features_cache[key] = (ref, features)
+        return features
@@ -0,0 +1,508 @@
+"""
+Cachés LRU de consultas SPARQL: consultas preparadas y resultados.
+
+Cada consulta se parseaba y traducía a álgebra hasta tres veces: el validador
+(``prepareQuery``), su prueba de ejecución (``graph.query``) y el motor de
+búsqueda al ejecutarla. Este módulo guarda el objeto ``Query`` compilado por
+texto normalizado, compartido por todo el proceso, de modo que el validador y
+los ejecutores solo pagan el parseo una vez. Las plantillas parametrizadas se
+ejecutan con ``initBindings`` sobre la misma consulta compilada.
+
+Los stores con SPARQL nativo (Oxigraph) reciben el texto de la consulta, ya
+que no aceptan consultas preparadas por rdflib.
+
+Además, ``QueryResultCache`` guarda las filas de las consultas SELECT/ASK
+repetidas, indexadas por la versión del grafo (sha256 del ``GraphStore``) y
+una huella canónica de la consulta: sin ``PREFIX`` (nombres expandidos a
+IRIs), espacios normalizados y variables renombradas por orden de aparición.
+Al recargar o reconstruir el grafo cambia la versión y las entradas antiguas
+dejan de usarse. Los grafos que no proceden del ``GraphStore`` no se cachean.
+
+Sobre los grafos del ``GraphStore`` las consultas compiladas se evalúan
+primero con el motor columnar (``columnar_sparql``); si usan álgebra que ese
+motor no soporta, se ejecutan con rdflib.
+
+Antes de ejecutarse, la consulta compilada pasa por el optimizador de álgebra
+(``sparql_optimizer``) con las estadísticas del grafo; la versión optimizada
+se guarda por versión del grafo junto a la compilada.
+
+Uso:
+    from knowledge_graph.sparql_cache import run_query
+    results = run_query(graph, sparql, initBindings={"task": Literal("text-generation")})
+
+Autor: Edmundo Mori
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from rdflib import Graph, Variable
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.sparql import Query
+from rdflib.query import Result
+
+from .columnar_sparql import query_columnar
+from .graph_store import get_graph_store
+from .sparql_optimizer import optimize_query
+
+
+logger = logging.getLogger(__name__)
+
+# Consultas compiladas que se conservan por proceso
+DEFAULT_CACHE_SIZE = 512
+
+# Stores que evalúan SPARQL por sí mismos (reciben el texto, no la Query de rdflib)
+NATIVE_SPARQL_STORES = {"OxigraphStore"}
+
+# Límites de la caché de resultados
+DEFAULT_RESULT_ENTRIES = 1024
+DEFAULT_RESULT_ROWS = 500_000
+MAX_ROWS_PER_RESULT = 50_000
+
+# Tokens SPARQL para la huella canónica (cadenas e IRIs se conservan tal cual)
+_SPARQL_TOKEN = re.compile(
+    r"""
+      (?P<comment>\#[^\n]*)
+    | (?P<string>"{3}(?:[^"\\]|\\.|"(?!""))*"{3}|'{3}(?:[^'\\]|\\.|'(?!''))*'{3}
+                |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    | (?P<iri><[^<>"{}|^`\\\s]*>)
+    | (?P<var>[?$][A-Za-z0-9_\u00B7-\uFFFF]+)
+    | (?P<pname>[A-Za-z_][\w.-]*:[\w.%:-]*|:[\w.%:-]*)
+    | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_]\w*)
+    | (?P<space>\s+)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Texto canónico de una consulta para la clave de la caché.
+
+    Se eliminan la indentación, los espacios finales y las líneas vacías, que
+    es lo que cambia entre las plantillas del RAG, el LLM y el post-procesado.
+    """
+    return "\n".join(line.strip() for line in query.strip().splitlines() if line.strip())
+
+
+def has_native_sparql(graph: Graph) -> bool:
+    """True si el store del grafo evalúa SPARQL por sí mismo (p.ej. Oxigraph)"""
+    return type(graph.store).__name__ in NATIVE_SPARQL_STORES
+
+
+class PreparedQueryCache:
+    """
+    Caché LRU (thread-safe) de consultas ``Query`` compiladas por rdflib.
+
+    Los errores de sintaxis no se guardan: se propagan al llamador en cada intento.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, columnar: bool = True, optimize: bool = True):
+        self.maxsize = maxsize
+        self.columnar = columnar
+        self.optimize = optimize
+        self._queries: "OrderedDict[Tuple, Query]" = OrderedDict()
+        self._optimized: "OrderedDict[Tuple, Query]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def prepare(
+        self,
+        query: str,
+        initNs: Optional[Mapping[str, Any]] = None,
+        base: Optional[str] = None,
+    ) -> Query:
+        """
+        Obtener la consulta compilada (parseada y traducida a álgebra).
+
+        Args:
+            query: Texto SPARQL
+            initNs: Prefijos adicionales
+            base: IRI base
+
+        Returns:
+            ``Query`` de rdflib reutilizable con distintos ``initBindings``
+
+        Raises:
+            Exception: Error de sintaxis del parser de rdflib
+        """
+        key = self._key(query, initNs, base)
+
+        with self._lock:
+            prepared = self._queries.get(key)
+            if prepared is not None:
+                self._queries.move_to_end(key)
+                self.hits += 1
+                return prepared
+
+        # Compilar fuera del lock: otras consultas no esperan al parser
+        prepared = prepareQuery(key[0], initNs=dict(initNs) if initNs else None, base=base)
+
+        with self._lock:
+            self.misses += 1
+            self._queries[key] = prepared
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+        return prepared
+
+    @staticmethod
+    def _key(query: str, initNs: Optional[Mapping[str, Any]], base: Optional[str]) -> Tuple:
+        return (
+            normalize_query(query),
+            tuple(sorted((prefix, str(ns)) for prefix, ns in initNs.items())) if initNs else None,
+            base,
+        )
+
+    def prepare_for(
+        self,
+        graph: Graph,
+        query: str,
+        initNs: Optional[Mapping[str, Any]] = None,
+        initBindings: Optional[Mapping[str, Any]] = None,
+    ) -> Query:
+        """
+        Consulta compilada y optimizada para un grafo (una por versión del grafo).
+
+        Con ``initBindings`` se devuelve la consulta sin optimizar: las
+        reescrituras suponen que ninguna variable llega ligada de fuera.
+        """
+        prepared = self.prepare(query, initNs=initNs)
+        if not self.optimize or initBindings or has_native_sparql(graph):
+            return prepared
+
+        key = (self._key(query, initNs, None), get_graph_store().version_of(graph))
+        with self._lock:
+            optimized = self._optimized.get(key)
+            if optimized is not None:
+                self._optimized.move_to_end(key)
+                return optimized
+
+        optimized = optimize_query(graph, prepared)
+        with self._lock:
+            self._optimized[key] = optimized
+            while len(self._optimized) > self.maxsize:
+                self._optimized.popitem(last=False)
+        return optimized
+
+    def query(
+        self,
+        graph: Graph,
+        query: str,
+        initBindings: Optional[Mapping[str, Any]] = None,
+        initNs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ) -> Result:
+        """
+        Ejecutar una consulta sobre un grafo usando la versión compilada.
+
+        Args:
+            graph: Grafo rdflib
+            query: Texto SPARQL
+            initBindings: Valores iniciales de variables (plantillas parametrizadas)
+            initNs: Prefijos adicionales
+
+        Returns:
+            ``Result`` de rdflib
+        """
+        if has_native_sparql(graph):
+            return graph.query(query, initNs=initNs or {}, initBindings=initBindings or {}, **kwargs)
+
+        prepared = self.prepare_for(graph, query, initNs=initNs, initBindings=initBindings)
+        if self.columnar and not kwargs:
+            result = query_columnar(graph, prepared, initBindings=initBindings)
+            if result is not None:
+                return result
+        return graph.query(prepared, initBindings=initBindings or {}, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """Tamaño y aciertos de la caché"""
+        return {"size": len(self._queries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        """Vaciar la caché"""
+        with self._lock:
+            self._queries.clear()
+            self._optimized.clear()
+
+
+# Caché por defecto del proceso
+_default_cache = PreparedQueryCache()
+
+
+def get_query_cache() -> PreparedQueryCache:
+    """Caché de consultas preparadas compartida por todo el proceso"""
+    return _default_cache
+
+
+def prepare_query(query: str, initNs: Optional[Mapping[str, Any]] = None) -> Query:
+    """Atajo: consulta compilada desde la caché por defecto"""
+    return _default_cache.prepare(query, initNs=initNs)
+
+
+@lru_cache(maxsize=4096)
+def query_fingerprint(query: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """
+    Huella canónica de una consulta y el renombrado de sus variables.
+
+    Dos consultas que solo difieren en prefijos, espacios, comentarios,
+    mayúsculas de las palabras clave o nombres de variables comparten huella.
+
+    Returns:
+        (huella, ((variable original, variable canónica), ...))
+    """
+    prefixes: Dict[str, str] = {}
+    variables: Dict[str, str] = {}
+    tokens: List[str] = []
+    declaring: Optional[List[str]] = None
+
+    for match in _SPARQL_TOKEN.finditer(query):
+        kind, text = match.lastgroup, match.group()
+        if kind in ("space", "comment"):
+            continue
+
+        # Declaraciones "PREFIX p: <iri>": se recogen y no forman parte de la huella
+        if kind == "word" and text.upper() == "PREFIX":
+            declaring = []
+            continue
+        if declaring is not None:
+            declaring.append(text)
+            if len(declaring) == 2:
+                prefixes[declaring[0].rstrip(":")] = declaring[1][1:-1]
+                declaring = None
+            continue
+
+        if kind == "var":
+            name = text[1:]
+            if name not in variables:
+                variables[name] = f"v{len(variables)}"
+            tokens.append("?" + variables[name])
+        elif kind == "pname":
+            prefix, local = text.split(":", 1)
+            tokens.append(f"<{prefixes[prefix]}{local}>" if prefix in prefixes else text)
+        elif kind == "word":
+            tokens.append(text.upper())
+        else:
+            tokens.append(text)
+
+    return " ".join(tokens), tuple(variables.items())
+
+
+@dataclass
+class CachedResult:
+    """Filas de un resultado SELECT (o respuesta ASK) con variables canónicas"""
+    type: str
+    canonical_vars: List[str]
+    rows: List[Tuple]
+    ask_answer: Optional[bool] = None
+
+
+class QueryResultCache:
+    """
+    Caché LRU (thread-safe) de resultados SELECT/ASK por versión del grafo.
+
+    Se limita por número de entradas y por filas totales; los resultados con
+    más de ``max_rows_per_result`` filas no se guardan.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_RESULT_ENTRIES,
+        max_rows: int = DEFAULT_RESULT_ROWS,
+        max_rows_per_result: int = MAX_ROWS_PER_RESULT,
+    ):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.max_rows_per_result = max_rows_per_result
+        self._results: "OrderedDict[Tuple, CachedResult]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    @staticmethod
+    def _bindings_key(initBindings: Optional[Mapping[str, Any]], renaming: Dict[str, str]) -> Tuple:
+        if not initBindings:
+            return ()
+        return tuple(sorted(
+            (renaming.get(str(name), str(name)), value.n3() if hasattr(value, "n3") else repr(value))
+            for name, value in initBindings.items()
+        ))
+
+    def query(
+        self,
+        graph: Graph,
+        query: str,
+        initBindings: Optional[Mapping[str, Any]] = None,
+        initNs: Optional[Mapping[str, Any]] = None,
+        prepared_cache: Optional[PreparedQueryCache] = None,
+        **kwargs,
+    ) -> Result:
+        """
+        Ejecutar una consulta, respondiendo desde la caché si ya se ejecutó
+        sobre la misma versión del grafo.
+
+        Args:
+            graph: Grafo rdflib (solo se cachea si está registrado en el GraphStore)
+            query: Texto SPARQL
+            initBindings: Valores iniciales de variables
+            initNs: Prefijos adicionales (desactiva la caché de resultados)
+            prepared_cache: Caché de consultas preparadas (por defecto, la del proceso)
+
+        Returns:
+            ``Result`` de rdflib con los nombres de variable de esta consulta
+        """
+        prepared_cache = prepared_cache or _default_cache
+        if initNs or kwargs:
+            return prepared_cache.query(graph, query, initBindings=initBindings, initNs=initNs, **kwargs)
+
+        cached = self.lookup(graph, query, initBindings=initBindings)
+        if cached is not None:
+            return cached
+
+        result = prepared_cache.query(graph, query, initBindings=initBindings)
+        self.remember(graph, query, result, initBindings=initBindings)
+        return result
+
+    def _key(
+        self,
+        graph: Graph,
+        query: str,
+        initBindings: Optional[Mapping[str, Any]],
+    ) -> Optional[Tuple[Tuple, Tuple[Tuple[str, str], ...]]]:
+        """(clave de la caché, renombrado de variables), o None si el grafo no tiene versión"""
+        version = get_graph_store().version_of(graph)
+        if version is None:
+            return None
+        fingerprint, variables = query_fingerprint(query)
+        return (version, fingerprint, self._bindings_key(initBindings, dict(variables))), variables
+
+    def lookup(
+        self,
+        graph: Graph,
+        query: str,
+        initBindings: Optional[Mapping[str, Any]] = None,
+    ) -> Optional[Result]:
+        """Resultado cacheado de una consulta sobre la versión actual del grafo (o None)"""
+        keyed = self._key(graph, query, initBindings)
+        if keyed is None:
+            return None
+        key, variables = keyed
+
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is None:
+            return None
+        return self._to_result(cached, {canonical: name for name, canonical in variables})
+
+    def remember(
+        self,
+        graph: Graph,
+        query: str,
+        result: Result,
+        initBindings: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        """Guardar el resultado completo de una consulta ejecutada fuera de la caché"""
+        keyed = self._key(graph, query, initBindings)
+        if keyed is None:
+            return
+        key, variables = keyed
+        renaming = dict(variables)
+
+        if result.type == "ASK":
+            self._store(key, CachedResult(type="ASK", canonical_vars=[], rows=[], ask_answer=result.askAnswer))
+        elif result.type == "SELECT" and len(result.bindings) <= self.max_rows_per_result:
+            result_vars = list(result.vars or [])
+            self._store(key, CachedResult(
+                type="SELECT",
+                canonical_vars=[renaming.get(str(var), str(var)) for var in result_vars],
+                rows=[tuple(binding.get(var) for var in result_vars) for binding in result.bindings],
+            ))
+
+    def _store(self, key: Tuple, cached: CachedResult) -> None:
+        with self._lock:
+            previous = self._results.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous.rows)
+            self._results[key] = cached
+            self._rows += len(cached.rows)
+            while self._results and (len(self._results) > self.max_entries or self._rows > self.max_rows):
+                _, evicted = self._results.popitem(last=False)
+                self._rows -= len(evicted.rows)
+
+    @staticmethod
+    def _to_result(cached: CachedResult, names: Dict[str, str]) -> Result:
+        """Reconstruir un ``Result`` con los nombres de variable del llamador"""
+        result = Result(cached.type)
+        if cached.type == "ASK":
+            result.askAnswer = cached.ask_answer
+            return result
+
+        result.vars = [Variable(names.get(canonical, canonical)) for canonical in cached.canonical_vars]
+        result.bindings = [
+            {var: value for var, value in zip(result.vars, row) if value is not None}
+            for row in cached.rows
+        ]
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Tamaño y aciertos de la caché"""
+        return {"size": len(self._results), "rows": self._rows, "hits": self.hits, "misses": self.misses}
+
+    def invalidate(self, version: Optional[str] = None) -> None:
+        """Descartar los resultados de una versión del grafo (o todos)"""
+        with self._lock:
+            if version is None:
+                self._results.clear()
+                self._rows = 0
+                return
+            for key in [key for key in self._results if key[0] == version]:
+                self._rows -= len(self._results.pop(key).rows)
+
+
+# Caché de resultados por defecto del proceso
+_default_result_cache = QueryResultCache()
+
+
+def get_result_cache() -> QueryResultCache:
+    """Caché de resultados compartida por todo el proceso"""
+    return _default_result_cache
+
+
+def run_query(
+    graph: Graph,
+    query: str,
+    initBindings: Optional[Mapping[str, Any]] = None,
+    initNs: Optional[Mapping[str, Any]] = None,
+    use_result_cache: bool = True,
+    **kwargs,
+) -> Result:
+    """
+    Atajo: ejecutar una consulta con las cachés por defecto.
+
+    Args:
+        use_result_cache: Responder desde la caché de resultados si la misma
+            consulta ya se ejecutó sobre la misma versión del grafo
+    """
+    if use_result_cache:
+        return _default_result_cache.query(graph, query, initBindings=initBindings, initNs=initNs, **kwargs)
+    return _default_cache.query(graph, query, initBindings=initBindings, initNs=initNs, **kwargs)
@@ -0,0 +1,475 @@
+"""
+Optimizador del álgebra de las consultas SPARQL generadas por el LLM.
+
+El LLM suele escribir primero los patrones menos selectivos, comprobar
+constantes en un FILTER al final y añadir bloques OPTIONAL cuyas variables no
+se usan (el post-procesado del conversor convierte incluso ``daimo:task`` en
+OPTIONAL). Entre la compilación y la ejecución, la consulta compilada pasa por
+cuatro reescrituras que no cambian el resultado (como multiconjunto):
+
+1. ``FILTER(?v = <iri>)`` / ``FILTER(sameTerm(?v, cte))`` sobre una variable
+   que siempre liga un patrón del grupo: la constante se sustituye en los
+   patrones y ``?v`` se liga con ``BIND`` (``Extend``) para seguir visible.
+2. OPTIONAL cuyas variables propias no se usan fuera del bloque: se elimina
+   si la consulta es ``DISTINCT`` o si el bloque es un único patrón funcional
+   (cada sujeto u objeto tiene como mucho un valor, según las estadísticas).
+3. ``FILTER(CONTAINS(LCASE(?title), "..."))`` / ``REGEX`` sobre el objeto de
+   ``dcterms:title``, ``dcterms:description`` o ``dcat:keyword``: el BGP que
+   liga la variable se une a un ``VALUES`` con los literales candidatos del
+   ``TextIndex``, y el filtro (que se mantiene) solo ve esas filas.
+4. Reordenación de los patrones de cada BGP por filas esperadas: conteos por
+   predicado y por valor constante del índice columnar, y para variables ya
+   ligadas, triples por sujeto u objeto distinto del predicado.
+
+Las estadísticas salen del ``ColumnarIndex`` de la versión del grafo; sin
+índice (grafos fuera del ``GraphStore``) solo se aplican las reescrituras que
+no dependen de los datos. ``PreparedQueryCache.prepare_for`` guarda la consulta
+optimizada por versión del grafo.
+
+Uso:
+    python -m knowledge_graph.sparql_optimizer explain data/ai_models.ttl consulta.rq
+
+    from knowledge_graph.sparql_optimizer import optimize_query
+    optimized = optimize_query(graph, prepareQuery(sparql))
+
+Autor: Edmundo Mori
+"""
+
+import logging
+from collections import Counter
+from typing import Any, List, Optional, Set, Tuple
+
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef, Variable
+from rdflib.paths import Path as PropertyPath
+from rdflib.plugins.sparql.algebra import _addVars, _traverseAgg
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import Query
+
+from .columnar_sparql import ColumnarIndex, get_columnar_index
+from .text_index import TEXT_PREDICATES, get_text_index, text_filter_variables
+
+
+logger = logging.getLogger(__name__)
+
+# Nodos entre la raíz y un OPTIONAL que no dependen de la multiplicidad de filas
+# una vez hay un DISTINCT por encima
+_DEDUP_TRANSPARENT = {
+    "SelectQuery", "AskQuery", "Project", "Distinct", "Reduced", "OrderBy",
+    "Slice", "Filter", "Extend", "Join", "LeftJoin", "Union", "Minus",
+}
+
+# Nodos por los que se puede sustituir una variable en los patrones
+_SUBSTITUTABLE = {"BGP", "Join", "LeftJoin", "Filter"}
+
+# Los candidatos del índice de texto solo se usan si descartan al menos la
+# mitad de los valores del predicado (si no, el VALUES cuesta más que el filtro)
+TEXT_CANDIDATE_FRACTION = 0.5
+
+
+def _is_term_var(term: Any) -> bool:
+    return isinstance(term, (Variable, BNode))
+
+
+def _count_variables(node: Any, counts: Counter) -> Counter:
+    """Apariciones de cada variable en un subárbol del álgebra"""
+    if isinstance(node, Variable):
+        counts[node] += 1
+    elif isinstance(node, CompValue):
+        for key, value in node.items():
+            if key != "_vars":
+                _count_variables(value, counts)
+    elif isinstance(node, dict):
+        for value in node.values():
+            _count_variables(value, counts)
+    elif isinstance(node, (list, tuple, set)):
+        for value in node:
+            _count_variables(value, counts)
+    return counts
+
+
+def _copy(part: CompValue, **changes: Any) -> CompValue:
+    """Copia superficial de un nodo con algunos hijos cambiados"""
+    values = {key: value for key, value in part.items() if key != "_vars"}
+    values.update(changes)
+    return CompValue(part.name, **values)
+
+
+def _certain_vars(part: Any) -> Set[Any]:
+    """Variables ligadas en todas las soluciones de un nodo"""
+    if not isinstance(part, CompValue):
+        return set()
+    name = part.name
+    if name == "BGP":
+        return {term for triple in part.triples for term in triple if _is_term_var(term)}
+    if name == "Join":
+        return _certain_vars(part.p1) | _certain_vars(part.p2)
+    if name in ("LeftJoin", "Minus"):
+        return _certain_vars(part.p1)
+    if name == "Union":
+        return _certain_vars(part.p1) & _certain_vars(part.p2)
+    if name in ("Filter", "Distinct", "Reduced", "OrderBy", "Slice"):
+        return _certain_vars(part.p)
+    if name == "Extend":
+        return _certain_vars(part.p)
+    if name == "ToMultiSet" and getattr(part.p, "name", None) == "values" and part.p.res:
+        return set.intersection(*({var for var, value in row.items() if value != "UNDEF"} for row in part.p.res))
+    return set()
+
+
+def _conjuncts(expr: Any) -> List[Any]:
+    if isinstance(expr, CompValue) and expr.name == "ConditionalAndExpression":
+        result = _conjuncts(expr.expr)
+        for other in expr.other or []:
+            result.extend(_conjuncts(other))
+        return result
+    return [expr]
+
+
+def _conjunction(exprs: List[Any]) -> Any:
+    if len(exprs) == 1:
+        return exprs[0]
+    return CompValue("ConditionalAndExpression", expr=exprs[0], other=exprs[1:])
+
+
+def _constant_binding(expr: Any) -> Optional[Tuple[Variable, Any]]:
+    """(variable, constante) si la expresión fija una variable a un término concreto"""
+    if not isinstance(expr, CompValue):
+        return None
+    if expr.name == "RelationalExpression" and expr.op == "=":
+        left, right = expr.expr, expr.other
+        # Solo IRIs: la igualdad de literales es por valor ("1"^^xsd:int = "01"^^xsd:int)
+        if isinstance(left, Variable) and isinstance(right, URIRef):
+            return left, right
+        if isinstance(right, Variable) and isinstance(left, URIRef):
+            return right, left
+    elif expr.name == "Builtin_sameTerm":
+        left, right = expr.arg1, expr.arg2
+        if isinstance(left, Variable) and isinstance(right, (URIRef, Literal)):
+            return left, right
+        if isinstance(right, Variable) and isinstance(left, (URIRef, Literal)):
+            return right, left
+    return None
+
+
+def _substitute(part: CompValue, var: Variable, value: Any) -> Optional[CompValue]:
+    """
+    Sustituir una variable por una constante en los patrones de un subárbol.
+
+    Devuelve None si la variable aparece en algo que no sea un patrón (otro
+    FILTER, un BIND, una subconsulta...), donde la sustitución no es segura.
+    """
+    if part.name not in _SUBSTITUTABLE:
+        return part if not _count_variables(part, Counter())[var] else None
+    if part.name == "BGP":
+        triples = [tuple(value if term == var else term for term in triple) for triple in part.triples]
+        return _copy(part, triples=triples)
+    if part.name == "Filter":
+        if _count_variables(part.expr, Counter())[var]:
+            return None
+        p = _substitute(part.p, var, value)
+        return None if p is None else _copy(part, p=p)
+    if part.name == "LeftJoin" and _count_variables(part.expr, Counter())[var]:
+        return None
+    p1 = _substitute(part.p1, var, value)
+    p2 = _substitute(part.p2, var, value)
+    if p1 is None or p2 is None:
+        return None
+    return _copy(part, p1=p1, p2=p2)
+
+
+class QueryOptimizer:
+    """Reescrituras del álgebra de una consulta con estadísticas de un grafo"""
+
+    def __init__(self, index: Optional[ColumnarIndex] = None):
+        self.index = index
+        self.stats = index.predicate_stats() if index is not None else {}
+        self.rewrites: List[str] = []
+
+    def optimize(self, query: Query) -> Query:
+        """Consulta equivalente optimizada (la misma si no hay nada que reescribir)"""
+        self.rewrites = []
+        algebra = self._constants(query.algebra)
+        self._usage = _count_variables(algebra, Counter())
+        algebra = self._optionals(algebra, dedup=False)
+        algebra = self._text_filters(algebra)
+        algebra = self._reorder(algebra, bound=set())
+        if not self.rewrites:
+            return query
+
+        _traverseAgg(algebra, _addVars)
+        return Query(query.prologue, algebra)
+
+    # ------------------------------------------------------------------
+    # Recorrido genérico
+    # ------------------------------------------------------------------
+
+    def _children(self, part: CompValue, rewrite) -> CompValue:
+        """Aplicar ``rewrite`` a los hijos de álgebra (p, p1, p2) de un nodo"""
+        changes = {}
+        for key in ("p", "p1", "p2"):
+            child = part.get(key)
+            if isinstance(child, CompValue):
+                new_child = rewrite(child)
+                if new_child is not child:
+                    changes[key] = new_child
+        return _copy(part, **changes) if changes else part
+
+    # ------------------------------------------------------------------
+    # 1. FILTER de igualdad -> constantes
+    # ------------------------------------------------------------------
+
+    def _constants(self, part: CompValue) -> CompValue:
+        part = self._children(part, self._constants)
+        if part.name != "Filter":
+            return part
+
+        inner = part.p
+        remaining = []
+        bindings = []
+        for expr in _conjuncts(part.expr):
+            binding = _constant_binding(expr)
+            if binding is not None and binding[0] not in {var for var, _ in bindings}:
+                var, value = binding
+                if var in _certain_vars(inner):
+                    substituted = _substitute(inner, var, value)
+                    if substituted is not None:
+                        inner = substituted
+                        bindings.append(binding)
+                        continue
+            remaining.append(expr)
+
+        if not bindings:
+            return part
+        for var, value in bindings:
+            inner = CompValue("Extend", p=inner, expr=value, var=var)
+            self.rewrites.append(f"FILTER {var.n3()} = {value.n3()} → constante")
+        return CompValue("Filter", expr=_conjunction(remaining), p=inner) if remaining else inner
+
+    # ------------------------------------------------------------------
+    # 2. OPTIONAL sin uso
+    # ------------------------------------------------------------------
+
+    def _optionals(self, part: CompValue, dedup: bool) -> CompValue:
+        name = part.name
+        if name in ("Distinct", "Reduced"):
+            dedup = True
+        elif name not in _DEDUP_TRANSPARENT:
+            dedup = False
+
+        part = self._children(part, lambda child: self._optionals(child, dedup))
+        if name != "LeftJoin":
+            return part
+
+        # Variables que solo liga el OPTIONAL
+        inside = _count_variables(part.p2, Counter())
+        own = set(inside) - set(_count_variables(part.p1, Counter()))
+        if any(self._usage[var] > inside[var] for var in own):
+            return part
+        if dedup or self._functional(part.p2, _certain_vars(part.p1), own):
+            self.rewrites.append(f"OPTIONAL sin uso eliminado ({', '.join(sorted(v.n3() for v in own))})")
+            return part.p1
+        return part
+
+    def _functional(self, part: CompValue, bound: Set[Any], own: Set[Any]) -> bool:
+        """¿El bloque es un patrón con a lo sumo un valor por cada fila de la izquierda?"""
+        if part.name != "BGP" or len(part.triples) != 1 or not self.stats:
+            return False
+        s, p, o = part.triples[0]
+        if not isinstance(p, URIRef):
+            return False
+        predicate = self.index.term_id(p)
+        if predicate is None:
+            return True  # el predicado no existe: el OPTIONAL nunca liga nada
+        count, subjects, objects = self.stats.get(predicate, (0, 0, 0))
+        if s in bound and o in own:
+            return count == subjects
+        if o in bound and s in own:
+            return count == objects
+        return False
+
+    # ------------------------------------------------------------------
+    # 3. FILTER de texto -> candidatos
+    # ------------------------------------------------------------------
+
+    def _text_filters(self, part: CompValue) -> CompValue:
+        part = self._children(part, self._text_filters)
+        if part.name != "Filter" or self.index is None:
+            return part
+
+        candidates = None
+        inner = part.p
+        for var in sorted(text_filter_variables(part.expr) & _certain_vars(inner), key=str):
+            if self._text_pattern(inner, var) is None:
+                continue
+            if candidates is None:
+                candidates = get_text_index(self.index).filter_candidates(part.expr)
+            if var in candidates:
+                restricted = self._restrict(inner, var, candidates[var])
+                if restricted is not None:
+                    inner = restricted
+        return part if inner is part.p else _copy(part, p=inner)
+
+    def _text_pattern(self, part: CompValue, var: Variable) -> Optional[Tuple[CompValue, URIRef]]:
+        """(BGP, predicado) que liga ``var`` como objeto de texto en todas las soluciones"""
+        name = part.name
+        if name == "BGP":
+            for _, p, o in part.triples:
+                if o == var and p in TEXT_PREDICATES:
+                    return part, p
+            return None
+        if name == "Join":
+            return self._text_pattern(part.p1, var) or self._text_pattern(part.p2, var)
+        if name in ("LeftJoin", "Minus"):
+            return self._text_pattern(part.p1, var)
+        if name in ("Filter", "Extend"):
+            return self._text_pattern(part.p, var)
+        return None
+
+    def _restrict(self, part: CompValue, var: Variable, candidates: Any) -> Optional[CompValue]:
+        """Unir el BGP de ``_text_pattern`` a un VALUES con los candidatos que son objetos del predicado"""
+        bgp, predicate = self._text_pattern(part, var)
+        predicate_id = self.index.term_id(predicate)
+        objects = self.index.match(None, predicate_id, None)[:, 2]
+        values = candidates[np.isin(candidates, objects)]
+        _, _, distinct_objects = self.stats.get(predicate_id, (0, 0, 0))
+        if len(values) > TEXT_CANDIDATE_FRACTION * distinct_objects:
+            return None
+
+        rows = [{var: self.index.term(term_id)} for term_id in values.tolist()]
+        restricted = CompValue(
+            "Join", p1=CompValue("ToMultiSet", p=CompValue("values", res=rows)), p2=bgp, lazy=True,
+        )
+        self.rewrites.append(
+            f"FILTER de texto sobre {var.n3()} → {len(values):,} de {distinct_objects:,} candidatos"
+        )
+        return self._replace(part, bgp, restricted)
+
+    def _replace(self, part: CompValue, old: CompValue, new: CompValue) -> CompValue:
+        if part is old:
+            return new
+        return self._children(part, lambda child: self._replace(child, old, new))
+
+    # ------------------------------------------------------------------
+    # 4. Orden de los patrones
+    # ------------------------------------------------------------------
+
+    def _reorder(self, part: CompValue, bound: Set[Any]) -> CompValue:
+        name = part.name
+        if name == "BGP":
+            return self._reorder_bgp(part, bound)
+        if name in ("Join", "LeftJoin"):
+            p1 = self._reorder(part.p1, bound)
+            p2 = self._reorder(part.p2, bound | _certain_vars(part.p1))
+            if p1 is part.p1 and p2 is part.p2:
+                return part
+            return _copy(part, p1=p1, p2=p2)
+        return self._children(part, lambda child: self._reorder(child, bound))
+
+    def _pattern_cost(self, pattern: Tuple, bound: Set[Any]) -> Tuple[int, float]:
+        """(sin variables ligadas, filas esperadas por solución) de un patrón"""
+        ids: List[Optional[int]] = []
+        for term in pattern:
+            if _is_term_var(term) or isinstance(term, PropertyPath):
+                ids.append(None)
+            else:
+                term_id = self.index.term_id(term)
+                if term_id is None:
+                    return 0, 0.0  # constante ausente: el patrón no encaja nunca
+                ids.append(term_id)
+
+        count = float(self.index.count(*ids))
+        shared = [term for term in pattern if _is_term_var(term) and term in bound]
+        if bound and not shared:
+            return 1, count
+
+        s, p, o = pattern
+        stats = self.stats.get(ids[1]) if ids[1] is not None else None
+        expected = count
+        if stats is not None:
+            _, subjects, objects = stats
+            if s in bound:
+                expected = min(expected, count / max(subjects, 1))
+            if o in bound:
+                expected = min(expected, count / max(objects, 1))
+        elif shared:
+            expected = count / max(self.index.term_count, 1)
+        return 0, expected
+
+    def _reorder_bgp(self, part: CompValue, bound: Set[Any]) -> CompValue:
+        if self.index is None or len(part.triples) < 2:
+            return part
+
+        pending = list(part.triples)
+        ordered = []
+        known = set(bound)
+        while pending:
+            best = min(range(len(pending)), key=lambda i: self._pattern_cost(pending[i], known))
+            pattern = pending.pop(best)
+            ordered.append(pattern)
+            known.update(term for term in pattern if _is_term_var(term))
+
+        if ordered == list(part.triples):
+            return part
+        self.rewrites.append(f"BGP reordenado ({len(ordered)} patrones)")
+        return _copy(part, triples=ordered)
+
+
+def optimize_query(graph: Graph, query: Query) -> Query:
+    """
+    Optimizar una consulta compilada para un grafo.
+
+    Args:
+        graph: Grafo rdflib (las estadísticas salen de su índice columnar)
+        query: Consulta compilada por rdflib
+
+    Returns:
+        Consulta equivalente, o la misma si no hay reescrituras
+    """
+    try:
+        return QueryOptimizer(get_columnar_index(graph)).optimize(query)
+    except Exception as e:
+        # Una consulta que no se puede optimizar se ejecuta tal cual
+        logger.debug(f"Optimización omitida: {type(e).__name__}: {e}")
+        return query
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    from rdflib.plugins.sparql import prepareQuery
+    from rdflib.plugins.sparql.algebra import pprintAlgebra
+
+    from .graph_store import get_shared_graph
+
+    parser = argparse.ArgumentParser(description="Optimizador del álgebra SPARQL")
+    subparsers = parser.add_subparsers(dest="command")
+
+    explain_parser = subparsers.add_parser("explain", help="Mostrar las reescrituras de una consulta")
+    explain_parser.add_argument("graph", help="Fichero RDF del grafo")
+    explain_parser.add_argument("query", help="Consulta SPARQL o fichero .rq")
+    explain_parser.add_argument("--algebra", action="store_true", help="Imprimir el álgebra optimizada")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "explain":
+        query = args.query
+        if query.endswith(".rq"):
+            with open(query, "r", encoding="utf-8") as f:
+                query = f.read()
+        optimizer = QueryOptimizer(get_columnar_index(get_shared_graph(args.graph)))
+        optimized = optimizer.optimize(prepareQuery(query))
+        if not optimizer.rewrites:
+            print("✅ Sin reescrituras")
+        for rewrite in optimizer.rewrites:
+            print(f"🔧 {rewrite}")
+        if args.algebra:
+            pprintAlgebra(optimized)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Paginación de resultados SPARQL con terminación temprana.
+
+Las búsquedas materializaban todas las filas (``list(result)``), las
+hidrataban y solo después se quedaban con las primeras ``max_results``. Aquí
+cada página se pide al motor como un ``OFFSET``/``LIMIT`` sobre el álgebra ya
+compilada (la consulta del caché no se vuelve a parsear):
+
+- El motor columnar recorta la tabla antes de decodificar términos.
+- rdflib evalúa el ``Slice`` de forma perezosa y deja de producir filas en
+  cuanto la página está completa (salvo que haya ``ORDER BY``).
+- Los stores con SPARQL nativo reciben el texto y su resultado se recorre
+  solo hasta llenar la página.
+
+Se pide una fila más que el tamaño de página para saber si hay más. El cursor
+(``page_token``) es opaco: guarda la consulta SPARQL, el desplazamiento y la
+versión del grafo, de modo que la página siguiente no vuelve a llamar al LLM y
+un cursor de una versión anterior del grafo se rechaza.
+
+Uso:
+    from knowledge_graph.sparql_pages import query_page, encode_page_token
+    page = query_page(graph, sparql, offset=0, size=10)
+    token = encode_page_token(sparql, page.next_offset, version) if page.has_more else None
+
+Autor: Edmundo Mori
+"""
+
+import base64
+import json
+import zlib
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterator, List, Mapping, Optional
+
+from rdflib import Graph, Variable
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import Query
+from rdflib.query import Result, ResultRow
+
+from .columnar_sparql import query_columnar
+from .sparql_cache import get_query_cache, get_result_cache, has_native_sparql
+
+
+# Versión del formato de los cursores
+PAGE_TOKEN_VERSION = 1
+
+
+@dataclass
+class ResultPage:
+    """Una página de filas de una consulta SELECT"""
+    vars: List[Variable]
+    rows: List[ResultRow]
+    offset: int
+    has_more: bool
+
+    @property
+    def next_offset(self) -> int:
+        return self.offset + len(self.rows)
+
+
+@dataclass
+class PageToken:
+    """Contenido de un cursor de paginación"""
+    query: str
+    offset: int
+    version: Optional[str] = None
+    extra: Mapping[str, Any] = field(default_factory=dict)
+
+
+def encode_page_token(query: str, offset: int, version: Optional[str] = None, **extra: Any) -> str:
+    """Cursor opaco (base64 url-safe) para pedir la página que empieza en ``offset``"""
+    payload = {"v": PAGE_TOKEN_VERSION, "q": query, "o": offset, "g": version, "x": extra}
+    data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str) -> PageToken:
+    """
+    Leer un cursor de ``encode_page_token``.
+
+    Raises:
+        ValueError: Cursor corrupto o de otra versión del formato
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(zlib.decompress(data).decode("utf-8"))
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"page_token inválido: {e}")
+    if not isinstance(payload, dict) or payload.get("v") != PAGE_TOKEN_VERSION:
+        raise ValueError("page_token de una versión no soportada")
+    offset = payload.get("o")
+    if not isinstance(offset, int) or offset < 0 or not isinstance(payload.get("q"), str):
+        raise ValueError("page_token inválido")
+    return PageToken(payload["q"], offset, payload.get("g"), payload.get("x") or {})
+
+
+def slice_query(query: Query, offset: int = 0, limit: Optional[int] = None) -> Query:
+    """
+    Consulta compilada restringida a las filas ``[offset, offset + limit)``.
+
+    Se combina con el ``LIMIT``/``OFFSET`` propio de la consulta. Las consultas
+    que no son SELECT se devuelven sin cambios.
+    """
+    algebra = query.algebra
+    if algebra.name != "SelectQuery" or (offset == 0 and limit is None):
+        return query
+
+    part = algebra.p
+    if part.name == "Slice":
+        start = part.start + offset
+        if part.length is None:
+            length = limit
+        else:
+            remaining = max(part.length - offset, 0)
+            length = remaining if limit is None else min(remaining, limit)
+        part = part.p
+    else:
+        start, length = offset, limit
+
+    sliced = CompValue("Slice", p=part, start=start, length=length)
+    return Query(query.prologue, CompValue("SelectQuery", **{**algebra, "p": sliced}))
+
+
+def slice_result(result: Result, offset: int, limit: Optional[int]) -> Result:
+    """Recorte perezoso de un ``Result`` SELECT (sin materializar el resto)"""
+    if result.type != "SELECT":
+        return result
+    sliced = Result("SELECT")
+    sliced.vars = list(result.vars or [])
+    stop = None if limit is None else offset + limit
+    sliced.bindings = islice(
+        ({var: value for var, value in zip(sliced.vars, row) if value is not None} for row in result),
+        offset, stop,
+    )
+    return sliced
+
+
+def run_query_page(
+    graph: Graph,
+    query: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    initBindings: Optional[Mapping[str, Any]] = None,
+) -> Result:
+    """
+    Ejecutar una consulta solo para las filas ``[offset, offset + limit)``.
+
+    No usa la caché de resultados (ver ``query_page``). El ``Result`` es
+    perezoso siempre que el motor lo permita.
+    """
+    query_cache = get_query_cache()
+    if offset == 0 and limit is None:
+        return query_cache.query(graph, query, initBindings=initBindings)
+    if has_native_sparql(graph):
+        return slice_result(query_cache.query(graph, query, initBindings=initBindings), offset, limit)
+
+    sliced = slice_query(query_cache.prepare_for(graph, query, initBindings=initBindings), offset, limit)
+    if query_cache.columnar:
+        result = query_columnar(graph, sliced, initBindings=initBindings)
+        if result is not None:
+            return result
+    return graph.query(sliced, initBindings=initBindings or {})
+
+
+def page_from_result(result: Result, offset: int = 0, size: int = 10) -> ResultPage:
+    """Página de un ``Result`` ya ejecutado, consumiendo solo ``offset + size + 1`` filas"""
+    rows = list(islice(iter(result), offset, offset + size + 1))
+    return ResultPage(list(result.vars or []), rows[:size], offset, len(rows) > size)
+
+
+def query_page(
+    graph: Graph,
+    query: str,
+    offset: int = 0,
+    size: int = 10,
+    initBindings: Optional[Mapping[str, Any]] = None,
+) -> ResultPage:
+    """
+    Obtener una página de resultados de una consulta SELECT.
+
+    Si la consulta completa ya está en la caché de resultados, la página se
+    recorta de ahí; si no, se ejecuta solo la página (más una fila de control).
+
+    Args:
+        graph: Grafo rdflib
+        query: Texto SPARQL
+        offset: Primera fila de la página
+        size: Filas por página
+        initBindings: Valores iniciales de variables
+
+    Returns:
+        ``ResultPage`` con ``has_more`` para construir el cursor siguiente
+    """
+    cached = get_result_cache().lookup(graph, query, initBindings=initBindings)
+    if cached is not None:
+        return page_from_result(cached, offset, size)
+
+    result = run_query_page(graph, query, offset, size + 1, initBindings=initBindings)
+    page = page_from_result(result, 0, size)
+    page.offset = offset
+    return page
+
+
+def _has_node(part: Any, name: str) -> bool:
+    if isinstance(part, CompValue):
+        return part.name == name or any(_has_node(value, name) for value in part.values())
+    if isinstance(part, (list, tuple)):
+        return any(_has_node(value, name) for value in part)
+    return False
+
+
+def has_order_by(query: str) -> bool:
+    """¿Fija la consulta el orden de sus filas con ``ORDER BY``?"""
+    return _has_node(get_query_cache().prepare(query).algebra, "OrderBy")
+
+
+def iter_query(
+    graph: Graph,
+    query: str,
+    offset: int = 0,
+    initBindings: Optional[Mapping[str, Any]] = None,
+) -> Iterator[ResultRow]:
+    """Iterador perezoso de filas desde ``offset``: el llamador decide cuándo parar"""
+    return iter(run_query_page(graph, query, offset, None, initBindings=initBindings))
@@ -0,0 +1,389 @@
+"""
+Índice de texto para los FILTER ``CONTAINS``/``REGEX`` sobre títulos y descripciones.
+
+Muchas consultas del LLM (y de los ejemplos de ``llm/rag_sparql_examples.py``)
+filtran por subcadenas: ``FILTER(CONTAINS(LCASE(?title), "efficient"))`` o un
+``REGEX`` sobre ``dcterms:description``. Tanto rdflib como el motor columnar
+evalúan esos filtros literal a literal, y las descripciones de miles de
+caracteres son una de las formas de consulta más lentas.
+
+Este índice se construye una vez por versión del grafo sobre los objetos de
+``dcterms:title``, ``dcterms:description`` y ``dcat:keyword``:
+
+- Tokens: cada literal (normalizado con ``casefold``) se parte en palabras
+  ``\\w+``, con listas de documentos por token (CSR).
+- Trigramas del vocabulario: para localizar los tokens que contienen una
+  subcadena sin recorrer todo el vocabulario.
+
+Una subcadena se descompone en sus palabras: las interiores tienen que ser un
+token completo, la primera un sufijo de token y la última un prefijo. De un
+``REGEX`` se extraen los literales obligatorios (``a|b`` se une, una secuencia
+se intersecta). El resultado es un conjunto de candidatos que contiene todos
+los literales que pueden cumplir el filtro; el filtro se sigue evaluando sobre
+ellos, así que el resultado no cambia. ``QueryOptimizer`` usa los candidatos
+para restringir el BGP antes del join.
+
+Uso:
+    from knowledge_graph.text_index import get_text_index
+    text_index = get_text_index(get_columnar_index(graph))
+    candidates = text_index.filter_candidates(filter_expr)  # {?var: ids de término}
+
+    python -m knowledge_graph.text_index search data/ai_models_multi_repo.ttl "efficient"
+
+Autor: Edmundo Mori
+"""
+
+import itertools
+import logging
+import re
+import threading
+import time
+import weakref
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+from rdflib import Literal, URIRef, Variable
+from rdflib.namespace import DCAT, DCTERMS
+
+from .columnar_sparql import REGEX_FLAGS, ColumnarIndex
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+logger = logging.getLogger(__name__)
+
+# Predicados cuyos objetos se indexan
+TEXT_PREDICATES = (DCTERMS.title, DCTERMS.description, DCAT.keyword)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Funciones de subcadena y envoltorios que no cambian qué literal las cumple
+_SUBSTRING_TESTS = {"Builtin_CONTAINS", "Builtin_STRSTARTS", "Builtin_STRENDS"}
+_TEXT_WRAPPERS = {"Builtin_STR", "Builtin_LCASE", "Builtin_UCASE"}
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+# Requisito de un REGEX: subcadena, o ("and" | "or", [requisitos])
+Requirement = Union[str, Tuple[str, List[Any]]]
+
+
+def _text_variable(expr: Any) -> Optional[Variable]:
+    """Variable de ``?v``, ``STR(?v)``, ``LCASE(?v)``, ``UCASE(STR(?v))``..."""
+    while getattr(expr, "name", None) in _TEXT_WRAPPERS:
+        expr = expr.arg
+    return expr if isinstance(expr, Variable) else None
+
+
+def text_filter_variables(expr: Any) -> Set[Variable]:
+    """Variables sobre las que una expresión de FILTER aplica ``CONTAINS``/``REGEX``..."""
+    found: Set[Variable] = set()
+    name = getattr(expr, "name", None)
+    if name in _SUBSTRING_TESTS or name == "Builtin_REGEX":
+        var = _text_variable(expr.text if name == "Builtin_REGEX" else expr.arg1)
+        if var is not None:
+            found.add(var)
+    elif name in ("ConditionalAndExpression", "ConditionalOrExpression"):
+        for operand in [expr.expr] + list(expr.other or []):
+            found |= text_filter_variables(operand)
+    return found
+
+
+def _regex_requirement(pattern: str, flags: int = 0) -> Optional[Requirement]:
+    """Subcadenas que toda coincidencia del patrón tiene que contener"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, RecursionError):
+        return None
+    return _sequence_requirement(list(parsed))
+
+
+def _sequence_requirement(items: Sequence[Tuple[Any, Any]]) -> Optional[Requirement]:
+    required: List[Any] = []
+    run: List[str] = []
+    for op, av in list(items) + [(None, None)]:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            required.append("".join(run))
+            run = []
+        if op is sre_constants.SUBPATTERN:
+            required.append(_sequence_requirement(list(av[-1])))
+        elif op is sre_constants.BRANCH:
+            alternatives = [_sequence_requirement(list(branch)) for branch in av[1]]
+            if all(alternative is not None for alternative in alternatives):
+                required.append(("or", alternatives))
+        elif op in _REPEATS and av[0] >= 1:
+            required.append(_sequence_requirement(list(av[2])))
+        # Clases, anclas, '.', lookarounds...: no obligan a ninguna subcadena
+
+    required = [item for item in required if item is not None]
+    if not required:
+        return None
+    return required[0] if len(required) == 1 else ("and", required)
+
+
+def _intersect(left: Optional[np.ndarray], right: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """Intersección de candidatos (None = sin restricción)"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return np.intersect1d(left, right, assume_unique=True)
+
+
+class TextIndex:
+    """Tokens y trigramas de los literales de texto de una versión del grafo"""
+
+    def __init__(self, doc_terms: np.ndarray, vocabulary: List[str], offsets: np.ndarray, postings: np.ndarray):
+        self.doc_terms = doc_terms  # documento -> id de término
+        self.vocabulary = vocabulary
+        self.offsets = offsets  # token -> [offsets[t], offsets[t + 1]) en postings
+        self.postings = postings  # documentos (ordenados) de cada token
+        self._token_ids = {token: i for i, token in enumerate(vocabulary)}
+        self._trigrams: Optional[Dict[str, List[int]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, index: ColumnarIndex, predicates: Sequence[URIRef] = TEXT_PREDICATES) -> "TextIndex":
+        """Indexar los objetos de ``predicates`` de un ``ColumnarIndex``"""
+        objects = [
+            index.match(None, predicate_id, None)[:, 2]
+            for predicate_id in (index.term_id(predicate) for predicate in predicates)
+            if predicate_id is not None
+        ]
+        doc_terms = np.unique(np.concatenate(objects)).astype(np.int64) if objects else np.zeros(0, dtype=np.int64)
+
+        snapshot = index.snapshot
+        text = snapshot.term_blob.tobytes()
+        term_offsets = snapshot.term_offsets
+        # Token -> id nuevo la primera vez que aparece (sin bucle Python por token)
+        token_ids: Dict[str, int] = defaultdict(itertools.count().__next__)
+        pair_tokens = array("i")
+        doc_sizes = np.zeros(len(doc_terms), dtype=np.int64)
+        for doc, term_id in enumerate(doc_terms.tolist()):
+            value = text[term_offsets[term_id]:term_offsets[term_id + 1]].decode("utf-8").casefold()
+            before = len(pair_tokens)
+            pair_tokens.extend(map(token_ids.__getitem__, set(TOKEN_PATTERN.findall(value))))
+            doc_sizes[doc] = len(pair_tokens) - before
+
+        tokens = np.frombuffer(pair_tokens, dtype=np.int32) if pair_tokens else np.zeros(0, dtype=np.int32)
+        order = np.argsort(tokens, kind="stable")  # los documentos ya van en orden
+        offsets = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tokens, minlength=len(token_ids)), out=offsets[1:])
+        postings = np.repeat(np.arange(len(doc_terms), dtype=np.int32), doc_sizes)[order]
+        return cls(doc_terms, list(token_ids), offsets, postings)
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    # ------------------------------------------------------------------
+    # Subcadenas
+    # ------------------------------------------------------------------
+
+    def _trigram_index(self) -> Dict[str, List[int]]:
+        """Trigrama -> tokens del vocabulario que lo contienen"""
+        if self._trigrams is None:
+            with self._lock:
+                if self._trigrams is None:
+                    trigrams: Dict[str, List[int]] = {}
+                    for token_id, token in enumerate(self.vocabulary):
+                        for gram in {token[i:i + 3] for i in range(len(token) - 2)}:
+                            trigrams.setdefault(gram, []).append(token_id)
+                    self._trigrams = trigrams
+        return self._trigrams
+
+    def _matching_tokens(self, part: str, mode: str) -> List[int]:
+        """Tokens iguales a ``part`` o que lo contienen / empiezan / terminan por él"""
+        if mode == "exact":
+            token_id = self._token_ids.get(part)
+            return [] if token_id is None else [token_id]
+
+        if len(part) >= 3:
+            lists = []
+            for gram in {part[i:i + 3] for i in range(len(part) - 2)}:
+                tokens = self._trigram_index().get(gram)
+                if tokens is None:
+                    return []
+                lists.append(tokens)
+            lists.sort(key=len)
+            candidates = set(lists[0]).intersection(*lists[1:])
+        else:
+            candidates = range(len(self.vocabulary))
+
+        vocabulary = self.vocabulary
+        if mode == "prefix":
+            return [t for t in candidates if vocabulary[t].startswith(part)]
+        if mode == "suffix":
+            return [t for t in candidates if vocabulary[t].endswith(part)]
+        return [t for t in candidates if part in vocabulary[t]]
+
+    def _token_docs(self, token_ids: List[int]) -> np.ndarray:
+        if not token_ids:
+            return np.zeros(0, dtype=np.int32)
+        if len(token_ids) == 1:
+            t = token_ids[0]
+            return self.postings[self.offsets[t]:self.offsets[t + 1]]
+        return np.unique(np.concatenate([self.postings[self.offsets[t]:self.offsets[t + 1]] for t in token_ids]))
+
+    def substring_docs(self, needle: str) -> Optional[np.ndarray]:
+        """
+        Documentos que pueden contener ``needle`` (sin distinguir mayúsculas).
+
+        Returns:
+            Posiciones de documento ordenadas, o None si la subcadena no tiene
+            palabras y el índice no puede descartar nada
+        """
+        folded = needle.casefold()
+        docs = None
+        for match in TOKEN_PATTERN.finditer(folded):
+            open_left, open_right = match.start() == 0, match.end() == len(folded)
+            if open_left and open_right:
+                mode = "contains"
+            elif open_left:
+                mode = "suffix"  # lo que sigue en needle no es parte de una palabra
+            elif open_right:
+                mode = "prefix"
+            else:
+                mode = "exact"
+            docs = _intersect(docs, self._token_docs(self._matching_tokens(match.group(), mode)))
+            if not len(docs):
+                break
+        return docs
+
+    def regex_docs(self, pattern: str, flags: int = 0) -> Optional[np.ndarray]:
+        """Documentos que pueden encajar con un ``REGEX`` (None = cualquiera)"""
+        return self._requirement_docs(_regex_requirement(pattern, flags))
+
+    def _requirement_docs(self, requirement: Optional[Requirement]) -> Optional[np.ndarray]:
+        if requirement is None:
+            return None
+        if isinstance(requirement, str):
+            return self.substring_docs(requirement)
+        kind, items = requirement
+        results = [self._requirement_docs(item) for item in items]
+        if kind == "or":
+            if any(docs is None for docs in results):
+                return None
+            return np.unique(np.concatenate(results))
+        docs = None
+        for result in results:
+            docs = _intersect(docs, result)
+        return docs
+
+    # ------------------------------------------------------------------
+    # FILTER
+    # ------------------------------------------------------------------
+
+    def filter_candidates(self, expr: Any) -> Dict[Variable, np.ndarray]:
+        """
+        Candidatos por variable para una expresión de FILTER.
+
+        Para cada variable devuelta, toda solución que cumple la expresión
+        liga la variable a un término del array (ids de término ordenados) o a
+        un término que no es objeto de los predicados indexados.
+        """
+        return {var: self.doc_terms[docs] for var, docs in self._expr_docs(expr).items()}
+
+    def _expr_docs(self, expr: Any) -> Dict[Variable, np.ndarray]:
+        name = getattr(expr, "name", None)
+        if name in ("ConditionalAndExpression", "ConditionalOrExpression"):
+            operands = [self._expr_docs(operand) for operand in [expr.expr] + list(expr.other or [])]
+            if name == "ConditionalAndExpression":
+                merged: Dict[Variable, np.ndarray] = {}
+                for operand in operands:
+                    for var, docs in operand.items():
+                        merged[var] = _intersect(merged.get(var), docs)
+                return merged
+            # Disyunción: solo variables restringidas por todas las ramas
+            common = set(operands[0]).intersection(*operands[1:])
+            return {var: np.unique(np.concatenate([operand[var] for operand in operands])) for var in common}
+
+        if name in _SUBSTRING_TESTS or name == "Builtin_REGEX":
+            if name == "Builtin_REGEX":
+                text, argument, flags = expr.text, expr.pattern, expr.flags
+            else:
+                text, argument, flags = expr.arg1, expr.arg2, None
+            var = _text_variable(text)
+            if var is None or not isinstance(argument, Literal):
+                return {}
+            if name == "Builtin_REGEX":
+                if flags is not None and not isinstance(flags, Literal):
+                    return {}
+                value = 0
+                for flag in str(flags or ""):
+                    value |= REGEX_FLAGS.get(flag, 0)
+                docs = self.regex_docs(str(argument), value)
+            else:
+                docs = self.substring_docs(str(argument))
+            return {} if docs is None else {var: docs}
+        return {}
+
+
+# Un índice de texto por índice columnar (es decir, por versión del grafo)
+_text_indexes: "weakref.WeakKeyDictionary[ColumnarIndex, TextIndex]" = weakref.WeakKeyDictionary()
+_text_lock = threading.Lock()
+
+
+def get_text_index(index: ColumnarIndex) -> TextIndex:
+    """Índice de texto de una versión del grafo (se construye la primera vez)"""
+    with _text_lock:
+        text_index = _text_indexes.get(index)
+        if text_index is None:
+            start = time.perf_counter()
+            text_index = _text_indexes[index] = TextIndex.build(index)
+            logger.info(
+                f"🔤 Índice de texto: {len(text_index):,} literales, {len(text_index.vocabulary):,} tokens "
+                f"({time.perf_counter() - start:.2f}s)"
+            )
+        return text_index
+
+
+def main():
+    """Función principal para uso desde línea de comandos."""
+    import argparse
+
+    from .columnar_sparql import get_columnar_index
+    from .graph_store import get_shared_graph
+
+    parser = argparse.ArgumentParser(description="Índice de texto de títulos, descripciones y keywords")
+    subparsers = parser.add_subparsers(dest="command")
+
+    search_parser = subparsers.add_parser("search", help="Literales candidatos para una subcadena o REGEX")
+    search_parser.add_argument("graph", help="Fichero RDF del grafo")
+    search_parser.add_argument("text", help="Subcadena a buscar")
+    search_parser.add_argument("--regex", action="store_true", help="Interpretar el texto como REGEX")
+    search_parser.add_argument("--show", type=int, default=10, help="Candidatos a mostrar")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "search":
+        index = get_columnar_index(get_shared_graph(args.graph))
+        if index is None:
+            print("❌ El grafo no tiene índice columnar")
+            return
+        text_index = get_text_index(index)
+        start = time.perf_counter()
+        docs = text_index.regex_docs(args.text, re.IGNORECASE) if args.regex else text_index.substring_docs(args.text)
+        elapsed = (time.perf_counter() - start) * 1000
+        if docs is None:
+            print("⚠️ El índice no puede descartar ningún literal")
+            return
+        print(f"🔎 {len(docs):,} de {len(text_index):,} literales candidatos ({elapsed:.1f} ms)")
+        for term_id in text_index.doc_terms[docs[:args.show]].tolist():
+            print(f"   - {str(index.term(term_id))[:100]}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,13 @@ Valida sintaxis y estructura de queries SPARQL generadas
 import re
 from typing import Dict, List, Optional
 from rdflib import Graph, Namespace
-from rdflib.plugins.sparql import prepareQuery
+
+from knowledge_graph.sparql_cache import get_query_cache
+from knowledge_graph.sparql_pages import query_page
+
+
+# Filas que se ejecutan al comprobar que la query funciona (la primera página)
+DEFAULT_PROBE_ROWS = 10
 
 
 class SPARQLValidator:
@@ -25,16 +31,19 @@ class SPARQLValidator:
         'limit': r'LIMIT\s+\d+'
     }
     
-    def __init__(self, test_graph: Optional[Graph] = None):
+    def __init__(self, test_graph: Optional[Graph] = None, probe_rows: int = DEFAULT_PROBE_ROWS):
         """
         Inicializa el validador
         
         Args:
             test_graph: Grafo RDF opcional para validar ejecución de queries
+            probe_rows: Filas de la página que se ejecuta para validar (y se reutiliza)
         """
         self.errors = []
         self.warnings = []
         self.test_graph = test_graph
+        self.probe_rows = probe_rows
+        self.result = None
     
     def validate(self, sparql_query: str) -> Dict[str, any]:
         """
@@ -44,23 +53,28 @@ class SPARQLValidator:
             sparql_query: Query SPARQL a validar
             
         Returns:
-            Dict con 'valid' (bool), 'errors' (list), 'warnings' (list)
+            Dict con 'valid' (bool), 'errors' (list), 'warnings' (list) y
+            'result' (ResultPage con las primeras ``probe_rows`` filas ejecutadas
+            contra el grafo de prueba, o None)
         """
         self.errors = []
         self.warnings = []
+        self.result = None
         
         if not sparql_query or not sparql_query.strip():
             self.errors.append("Empty query")
             return self._build_result()
         
-        # Validaciones obligatorias
+        # Validaciones obligatorias baratas (regex) antes del parser
         self._check_required_patterns(sparql_query)
         self._check_balanced_braces(sparql_query)
         self._check_dangerous_patterns(sparql_query)
-        self._check_syntax_with_parser(sparql_query)
         
-        # Validar ejecución si hay grafo de prueba
-        if self.test_graph and len(self.errors) == 0:
+        if len(self.errors) == 0:
+            self._check_syntax_with_parser(sparql_query)
+        
+        # Validar ejecución si hay grafo de prueba (el resultado se reutiliza)
+        if self.test_graph is not None and len(self.errors) == 0:
             self._check_executability(sparql_query)
         
         # Validaciones recomendadas
@@ -104,9 +118,9 @@ class SPARQLValidator:
                 self.warnings.append(f"Missing recommended pattern: {name}")
     
     def _check_syntax_with_parser(self, query: str):
-        """Valida sintaxis usando el parser de RDFlib"""
+        """Valida sintaxis usando el parser de RDFlib (compilación cacheada)"""
         try:
-            prepareQuery(query)
+            get_query_cache().prepare(query)
         except Exception as e:
             error_msg = str(e)
             # Extraer solo el mensaje relevante
@@ -115,13 +129,13 @@ class SPARQLValidator:
             self.errors.append(f"SPARQL syntax error: {error_msg}")
     
     def _check_executability(self, query: str):
-        """Intenta ejecutar la query contra el grafo de prueba"""
+        """Ejecuta la primera página de la query contra el grafo de prueba y la conserva"""
         try:
-            # Intentar ejecutar la query
-            results = list(self.test_graph.query(query))
-            # Si se ejecuta correctamente, agregar información
-            if len(results) == 0:
+            # Solo probe_rows + 1 filas (LIMIT sobre el álgebra): no se materializa todo el resultado
+            page = query_page(self.test_graph, query, 0, self.probe_rows)
+            if not page.rows and not page.has_more:
                 self.warnings.append("Query executes but returns no results")
+            self.result = page
         except Exception as e:
             error_msg = str(e)
             # Limpiar mensaje de error
@@ -136,7 +150,8 @@ class SPARQLValidator:
             'errors': self.errors,
             'warnings': self.warnings,
             'error_count': len(self.errors),
-            'warning_count': len(self.warnings)
+            'warning_count': len(self.warnings),
+            'result': self.result
         }
     
     def format_report(self, validation_result: Dict) -> str:
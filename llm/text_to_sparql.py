@@ -69,6 +69,7 @@ class ConversionResult:
     validation_warnings: List[str]
     retrieved_examples: List[str]  # IDs de ejemplos usados en RAG
     confidence: str  # high, medium, low
+    query_result: Optional[Any] = None  # Primera página (ResultPage) ejecutada al validar contra validation_graph
 
 
 class TextToSPARQLConverter:
@@ -617,7 +618,13 @@ class TextToSPARQLConverter:
         
         return "\n".join(query_lines).strip()
     
-    def convert(self, user_query: str, validate: bool = True, use_fallback: bool = True) -> ConversionResult:
+    def convert(
+        self,
+        user_query: str,
+        validate: bool = True,
+        use_fallback: bool = True,
+        probe_rows: Optional[int] = None
+    ) -> ConversionResult:
         """
         Convierte lenguaje natural a SPARQL
         
@@ -625,6 +632,8 @@ class TextToSPARQLConverter:
             user_query: Query del usuario en lenguaje natural
             validate: Si True, valida la query generada
             use_fallback: Si True, usa el mejor ejemplo RAG como fallback cuando LLM falla
+            probe_rows: Filas de la primera página que se ejecutan al validar
+                (por defecto, las del validador)
             
         Returns:
             ConversionResult con query, validación y metadata
@@ -699,15 +708,20 @@ class TextToSPARQLConverter:
         is_valid = True
         errors = []
         warnings = []
+        query_result = None
         
         if validate:
             # Crear validador con grafo si está disponible
-            from llm.query_validator import SPARQLValidator
-            validator = SPARQLValidator(test_graph=self.validation_graph)
+            from llm.query_validator import DEFAULT_PROBE_ROWS, SPARQLValidator
+            validator = SPARQLValidator(
+                test_graph=self.validation_graph,
+                probe_rows=DEFAULT_PROBE_ROWS if probe_rows is None else probe_rows
+            )
             validation_result = validator.validate(sparql_query)
             is_valid = validation_result.get('valid', False)
             errors = validation_result.get('errors', [])
             warnings = validation_result.get('warnings', [])
+            query_result = validation_result.get('result')
             
             if is_valid:
                 print(f"   ✅ Query válida")
@@ -724,7 +738,8 @@ class TextToSPARQLConverter:
             validation_errors=errors,
             validation_warnings=warnings,
             retrieved_examples=example_ids,
-            confidence=confidence
+            confidence=confidence,
+            query_result=query_result
         )
     
     def _estimate_confidence(self, sparql: str, errors: List[str], warnings: List[str]) -> str:
@@ -51,7 +51,9 @@ class SearchAPI:
             "top_k_examples": 3,
             "temperature": 0.1,
             "max_results": 10,
-            "min_score": 0.0
+            "min_score": 0.0,
+            "graph_backend": "memory",
+            "store_path": None
         }
         
         self.config = {**default_config, **(config or {})}
@@ -64,7 +66,9 @@ class SearchAPI:
             model=self.config["model"],
             use_rag=self.config["use_rag"],
             top_k_examples=self.config["top_k_examples"],
-            temperature=self.config["temperature"]
+            temperature=self.config["temperature"],
+            graph_backend=self.config["graph_backend"],
+            store_path=self.config["store_path"]
         )
         
         logger.info("✅ SearchAPI inicializada")
@@ -74,7 +78,9 @@ class SearchAPI:
         query: str,
         max_results: Optional[int] = None,
         min_score: Optional[float] = None,
-        format: str = "dict"
+        format: str = "dict",
+        page_token: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> Any:
         """
         Ejecutar búsqueda semántica
@@ -84,6 +90,9 @@ class SearchAPI:
             max_results: Número máximo de resultados (None = usar config)
             min_score: Score mínimo (None = usar config)
             format: Formato de salida ('dict', 'json', 'response')
+            page_token: Cursor ``next_page_token`` de la página anterior
+            filters: Filtros de facetas, p. ej. {"task": "text-generation",
+                "library": ["pytorch", "transformers"], "not": {"license": "unknown"}}
             
         Returns:
             Resultados en el formato especificado
@@ -94,7 +103,9 @@ class SearchAPI:
         response = self.engine.search(
             query=query,
             max_results=max_results,
-            min_score=min_score
+            min_score=min_score,
+            page_token=page_token,
+            filters=filters
         )
         
         if format == "response":
@@ -121,6 +132,28 @@ class SearchAPI:
         else:
             return stats
     
+    def get_facet_counts(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        format: str = "dict"
+    ) -> Any:
+        """
+        Obtener conteos por faceta (para mostrarlos junto a cada filtro)
+        
+        Args:
+            filters: Filtros activos (mismo formato que en ``search``)
+            format: Formato de salida ('dict', 'json')
+            
+        Returns:
+            {faceta: {valor: número de modelos}}
+        """
+        counts = self.engine.get_facet_counts(filters)
+        
+        if format == "json":
+            return json.dumps(counts, indent=2, ensure_ascii=False)
+        else:
+            return counts
+    
     def get_sparql(self, query: str) -> str:
         """
         Obtener query SPARQL sin ejecutarla
@@ -22,17 +22,23 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from search.non_federated.api import create_api
+from knowledge_graph.graph_backends import DEFAULT_BACKEND, GRAPH_BACKENDS, open_graph
 from rdflib import Graph
 
 
-def load_default_graph() -> Optional[Graph]:
-    """Cargar grafo por defecto desde data/"""
+def load_default_graph(backend: str = DEFAULT_BACKEND, store_path: Optional[str] = None) -> Optional[Graph]:
+    """Cargar grafo por defecto desde data/ (o desde su store en disco)"""
     graph_path = project_root / "data" / "processed" / "knowledge_graph.ttl"
     
+    if backend != DEFAULT_BACKEND:
+        try:
+            return open_graph(graph_path, backend=backend, store_path=store_path)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"⚠️  {e}")
+            return None
+    
     if graph_path.exists():
-        g = Graph()
-        g.parse(str(graph_path), format="turtle")
-        return g
+        return open_graph(graph_path)
     else:
         print(f"⚠️  Grafo no encontrado en {graph_path}")
         print("   Crea el grafo primero ejecutando: python -m knowledge_graph.build_graph")
@@ -41,7 +47,7 @@ def load_default_graph() -> Optional[Graph]:
 
 def search_command(args):
     """Ejecutar búsqueda"""
-    graph = load_default_graph()
+    graph = load_default_graph(args.backend, args.store)
     if graph is None:
         return 1
     
@@ -53,7 +59,8 @@ def search_command(args):
     results = api.search(
         query=args.query,
         max_results=args.max_results,
-        format="response"
+        format="response",
+        page_token=args.page_token
     )
     
     if not results.is_valid:
@@ -62,7 +69,8 @@ def search_command(args):
             print(f"   - {error}")
         return 1
     
-    print(f"✅ {results.total_results} resultados encontrados")
+    total = f"{results.total_results}+" if results.total_is_estimate else results.total_results
+    print(f"✅ {total} resultados encontrados")
     print(f"⏱️  Tiempo: {results.execution_time:.2f}s")
     
     if args.show_sparql:
@@ -84,6 +92,9 @@ def search_command(args):
         
         print()
     
+    if results.next_page_token:
+        print(f"➡️  Más resultados: --page-token {results.next_page_token}\n")
+    
     if args.json:
         print("\n📄 JSON output:")
         print(json.dumps(results.to_dict(), indent=2, ensure_ascii=False))
@@ -93,7 +104,7 @@ def search_command(args):
 
 def stats_command(args):
     """Mostrar estadísticas"""
-    graph = load_default_graph()
+    graph = load_default_graph(args.backend, args.store)
     if graph is None:
         return 1
     
@@ -133,7 +144,7 @@ def stats_command(args):
 
 def sparql_command(args):
     """Generar SPARQL sin ejecutar"""
-    graph = load_default_graph()
+    graph = load_default_graph(args.backend, args.store)
     if graph is None:
         return 1
     
@@ -164,6 +175,10 @@ Ejemplos:
         """
     )
     
+    parser.add_argument("--backend", choices=list(GRAPH_BACKENDS), default=DEFAULT_BACKEND,
+                        help="Almacenamiento del grafo (memory o store en disco)")
+    parser.add_argument("--store", default=None, help="Ruta del store en disco")
+    
     subparsers = parser.add_subparsers(dest="command", help="Comando a ejecutar")
     
     # Comando: search
@@ -173,6 +188,7 @@ Ejemplos:
     search_parser.add_argument("--show-sparql", action="store_true", help="Mostrar SPARQL generado")
     search_parser.add_argument("--verbose", "-v", action="store_true", help="Salida detallada")
     search_parser.add_argument("--json", action="store_true", help="Output en JSON")
+    search_parser.add_argument("--page-token", default=None, help="Cursor de la página siguiente")
     search_parser.set_defaults(func=search_command)
     
     # Comando: stats
@@ -14,7 +14,6 @@ import sys
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import logging
-import tempfile
 
 # Add paths for Phase 2, Phase 3, and Phase 4 modules
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -62,6 +61,9 @@ OntologyEnhancedBM25 = None
 
 # Import original components
 from llm.text_to_sparql import TextToSPARQLConverter, ConversionResult
+from knowledge_graph.graph_backends import open_graph
+from knowledge_graph.model_catalog import get_graph_statistics, get_model_catalog
+from knowledge_graph.query_budget import QueryBudget, execute_with_budget
 from rdflib import Graph
 
 logger = logging.getLogger(__name__)
@@ -82,7 +84,7 @@ class EnhancedSearchEngine:
     
     def __init__(
         self,
-        graph: Graph,
+        graph: Optional[Graph] = None,
         llm_provider: str = "ollama",
         model: str = "deepseek-r1:7b",
         use_rag: bool = True,
@@ -92,13 +94,17 @@ class EnhancedSearchEngine:
         enable_phase3: bool = True,
         enable_phase4: bool = True,
         phase4_fusion_method: str = "rrf",
-        verbose: bool = False
+        verbose: bool = False,
+        graph_path: Optional[Path] = None,
+        graph_backend: str = "memory",
+        store_path: Optional[Path] = None,
+        query_budget: Optional[QueryBudget] = None
     ):
         """
         Initialize enhanced search engine
         
         Args:
-            graph: RDF graph
+            graph: RDF graph (alternative to graph_path / store_path)
             llm_provider: LLM provider
             model: LLM model name
             use_rag: Enable RAG
@@ -109,8 +115,17 @@ class EnhancedSearchEngine:
             enable_phase4: Enable Phase 4 optimizations (hybrid BM25 ↔ Method1)
             phase4_fusion_method: Fusion method for Phase 4 ("rrf", "weighted", "cascade")
             verbose: Show debug info
+            graph_path: RDF source file, opened with graph_backend if graph is None
+            graph_backend: Graph storage ("memory", "oxigraph", "berkeleydb")
+            store_path: On-disk store path (defaults to one next to graph_path)
+            query_budget: Cost and wall-clock limits for generated SPARQL
         """
+        if graph is None:
+            if graph_path is None and store_path is None:
+                raise ValueError("Provide graph, graph_path or store_path")
+            graph = open_graph(graph_path, backend=graph_backend, store_path=store_path)
         self.graph = graph
+        self.query_budget = query_budget or QueryBudget()
         self.enable_phase2 = enable_phase2
         self.enable_phase3 = enable_phase3
         self.enable_phase4 = enable_phase4
@@ -158,19 +173,13 @@ class EnhancedSearchEngine:
         if enable_phase4 and QueryRouter is not None:
             try:
                 # Initialize BM25 engine with ontology enhancements
-                # Save graph temporarily to file for BM25 indexing
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.ttl', delete=False) as tmp:
-                    tmp_path = Path(tmp.name)
-                    graph.serialize(destination=str(tmp_path), format='turtle')
-                
-                # Use Ontology-Enhanced BM25 for better semantic matching
+                # (indexes the same in-memory graph, no re-serialization)
                 self.bm25_engine = OntologyEnhancedBM25(
-                    graph_path=tmp_path,
+                    graph=graph,
                     enable_query_expansion=True,  # Semantic term expansion
                     enable_property_weighting=True,  # Weight by field importance
                     structured_boost=1.5  # Boost exact matches in task/library
                 )
-                tmp_path.unlink()  # Clean up temp file after indexing
                 
                 # Initialize router, calibrator, and fusion
                 self.router = QueryRouter(enable_fusion=True)
@@ -272,6 +281,8 @@ class EnhancedSearchEngine:
                         "method": "bm25"
                     })
                 
+                self._hydrate_results(results)
+                
                 if self.verbose:
                     logger.info(f"✅ BM25 returned {len(results)} results")
                 
@@ -349,6 +360,8 @@ class EnhancedSearchEngine:
                     results = method1_results
                     metadata["method_used"] = "method1_fallback"
                 
+                self._hydrate_results(results)
+                
                 return {
                     "success": True,
                     "query": query,
@@ -361,7 +374,7 @@ class EnhancedSearchEngine:
                 }
         
         # PHASE 2 & 3: METHOD1 PIPELINE (used for METHOD1_ONLY or when Phase 4 disabled)
-        results = self._run_method1_pipeline(query, max_results, metadata)
+        results = self._hydrate_results(self._run_method1_pipeline(query, max_results, metadata))
         
         # Extract SPARQL from metadata if available
         sparql_query = metadata.get("sparql_query", None)
@@ -500,7 +513,22 @@ class EnhancedSearchEngine:
             start = time.time()
             
             try:
-                query_results = self.graph.query(sparql_query)
+                # Budgeted execution: costly queries are rejected up front and
+                # slow ones return the rows obtained before the timeout. Only
+                # the first max_results rows are produced (LIMIT pushed down)
+                execution = execute_with_budget(
+                    self.graph, sparql_query, self.query_budget, limit=max_results
+                )
+                metadata["execution_status"] = execution.status
+                if execution.estimate is not None:
+                    metadata["estimated_rows"] = execution.estimate.rows
+                if execution.result is None:
+                    raise RuntimeError(execution.error)
+                if not execution.complete:
+                    metadata["partial_results"] = True
+                    metadata["timed_out"] = execution.timed_out
+                    logger.warning(f"⚠️ Partial SPARQL results ({execution.status}): {execution.error or ''}")
+                query_results = execution.result
                 
                 for row in query_results:
                     result_dict = {"method": "method1"}
@@ -516,8 +544,6 @@ class EnhancedSearchEngine:
                     
                     results.append(result_dict)
                 
-                # Limit results
-                results = results[:max_results]
                 metadata["execution_time"] = time.time() - start
                 
             except Exception as e:
@@ -526,6 +552,24 @@ class EnhancedSearchEngine:
         
         return results
     
+    def _hydrate_results(self, results: List[Dict]) -> List[Dict]:
+        """
+        Add catalog metadata (title, source, task, library, ...) to a page of results
+        
+        The whole page is hydrated with one columnar lookup; values already
+        returned by the SPARQL query are kept.
+        """
+        if not results:
+            return results
+        
+        catalog = get_model_catalog(self.graph)
+        all_metadata = catalog.metadata_for([result.get("model_uri") for result in results])
+        for result, model_metadata in zip(results, all_metadata):
+            for key, value in model_metadata.items():
+                result.setdefault(key, value)
+        
+        return results
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Get engine statistics"""
         stats = self.stats.copy()
@@ -544,31 +588,14 @@ class EnhancedSearchEngine:
         return stats
     
     def get_graph_statistics(self) -> Dict[str, Any]:
-        """Get graph statistics"""
-        from rdflib import RDF
-        from collections import Counter
-        
-        # Count models
-        daimo = "http://purl.org/pionera/daimo#"
-        model_type = f"{daimo}Model"
-        
-        models = list(self.graph.subjects(RDF.type, None))
-        total_models = len(models)
-        
-        # Count by source
-        sources = []
-        for model in models:
-            source = self.graph.value(model, None)
-            if source:
-                sources.append(str(source))
-        
-        source_counts = Counter(sources)
+        """Get graph statistics (computed once per graph version with the model catalog)"""
+        stats = get_graph_statistics(self.graph)
         
         return {
-            "total_models": total_models,
-            "total_triples": len(self.graph),
-            "sources": dict(source_counts),
-            "unique_sources": len(source_counts)
+            "total_models": stats["total_models"],
+            "total_triples": stats["total_triples"],
+            "sources": stats["repositories"],
+            "unique_sources": len(stats["repositories"])
         }
 
 
@@ -620,8 +647,8 @@ if __name__ == "__main__":
     graph_path = PROJECT_ROOT / "data" / "ai_models_multi_repo.ttl"
     
     if graph_path.exists():
-        g = Graph()
-        g.parse(str(graph_path), format="turtle")
+        from knowledge_graph.graph_store import get_shared_graph
+        g = get_shared_graph(graph_path)
         print(f"✅ Graph loaded: {len(g):,} triples")
     else:
         print("❌ Graph not found")
@@ -11,20 +11,32 @@ Fecha: 2026-02-04
 """
 
 from typing import List, Dict, Any, Optional, Tuple
+from itertools import islice
 from dataclasses import dataclass, field
 from pathlib import Path
 import logging
 from datetime import datetime
 
+import numpy as np
 from rdflib import Graph, Namespace, Literal, URIRef
-from rdflib.namespace import RDF, RDFS, XSD, DCTERMS
+from rdflib.namespace import RDFS, XSD
 
 # Imports del proyecto
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from llm import TextToSPARQLConverter, ConversionResult
+from knowledge_graph.graph_backends import DEFAULT_BACKEND, open_graph
+from knowledge_graph.facet_index import facet_mask, get_facet_index
+from knowledge_graph.model_catalog import get_graph_statistics, get_model_catalog
+from knowledge_graph.ranking import RankingWeights, get_ranking_features, top_k_indices
+from knowledge_graph.graph_store import get_graph_store
+from knowledge_graph.sparql_cache import run_query
+from knowledge_graph.sparql_pages import decode_page_token, encode_page_token, has_order_by, iter_query
 
 
+# Filas del primer bloque que se lee al llenar una página (se duplica en cada bloque)
+FILTER_BLOCK_ROWS = 64
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -57,11 +69,17 @@ class SearchResponse:
     """Respuesta completa de búsqueda"""
     query: str
     results: List[SearchResult]
-    total_results: int
+    total_results: int  # resultados que cumplen filtros y min_score
     sparql_query: str
     execution_time: float
     is_valid: bool = True
     errors: List[str] = field(default_factory=list)
+    next_page_token: Optional[str] = None  # cursor de la página siguiente (None = última)
+    total_is_estimate: bool = False  # total_results solo cuenta hasta esta página (hay más)
+    
+    @property
+    def has_more(self) -> bool:
+        return self.next_page_token is not None
     
     def to_dict(self) -> Dict[str, Any]:
         """Convertir a diccionario"""
@@ -69,10 +87,13 @@ class SearchResponse:
             "query": self.query,
             "results": [r.to_dict() for r in self.results],
             "total_results": self.total_results,
+            "total_is_estimate": self.total_is_estimate,
             "sparql_query": self.sparql_query,
             "execution_time": self.execution_time,
             "is_valid": self.is_valid,
-            "errors": self.errors
+            "errors": self.errors,
+            "next_page_token": self.next_page_token,
+            "has_more": self.has_more
         }
 
 
@@ -95,7 +116,10 @@ class SearchEngine:
         model: str = "deepseek-r1:7b",
         use_rag: bool = True,
         top_k_examples: int = 3,
-        temperature: float = 0.1
+        temperature: float = 0.1,
+        graph_backend: str = DEFAULT_BACKEND,
+        store_path: Optional[Path] = None,
+        ranking_weights: Optional[RankingWeights] = None
     ):
         """
         Inicializar motor de búsqueda
@@ -108,22 +132,31 @@ class SearchEngine:
             use_rag: Activar RAG con ejemplos SPARQL
             top_k_examples: Número de ejemplos RAG
             temperature: Temperatura del LLM
+            graph_backend: Almacenamiento del grafo (memory, oxigraph, berkeleydb)
+            store_path: Ruta del store en disco (por defecto, junto a graph_path)
+            ranking_weights: Pesos del ranking de resultados (por defecto, RankingWeights())
         """
         self.DAIMO = Namespace("http://purl.org/pionera/daimo#")
+        self.graph_backend = graph_backend
         
         # Cargar o usar grafo existente
         if graph is not None:
             self.graph = graph
             logger.info("✅ Usando grafo RDF proporcionado")
-        elif graph_path is not None:
-            self.graph = self._load_graph(graph_path)
-            logger.info(f"✅ Grafo cargado desde {graph_path}")
+        elif graph_path is not None or store_path is not None:
+            self.graph = self._load_graph(graph_path, store_path)
+            logger.info(f"✅ Grafo cargado desde {graph_path or store_path} ({graph_backend})")
         else:
-            raise ValueError("Se debe proporcionar 'graph' o 'graph_path'")
+            raise ValueError("Se debe proporcionar 'graph', 'graph_path' o 'store_path'")
+        
+        # Catálogo columnar de modelos (metadatos, ranking y estadísticas)
+        self.catalog = get_model_catalog(self.graph)
+        self.ranking_features = get_ranking_features(self.catalog)
+        self.ranking_weights = ranking_weights or RankingWeights()
         
-        # Estadísticas del grafo
-        self.total_models = len(list(self.graph.subjects(RDF.type, self.DAIMO.Model)))
-        self.total_triples = len(self.graph)
+        # Estadísticas del grafo (precalculadas con el catálogo)
+        self.total_models = self.catalog.statistics["total_models"]
+        self.total_triples = self.catalog.statistics["total_triples"]
         
         logger.info(f"📊 Grafo: {self.total_models} modelos, {self.total_triples:,} triples")
         
@@ -139,114 +172,248 @@ class SearchEngine:
         
         logger.info(f"✅ SearchEngine inicializado ({llm_provider}/{model})")
     
-    def _load_graph(self, path: Path) -> Graph:
-        """Cargar grafo RDF desde archivo"""
-        g = Graph()
-        g.parse(str(path), format="turtle")
-        return g
+    def _load_graph(self, path: Optional[Path], store_path: Optional[Path] = None) -> Graph:
+        """Cargar grafo RDF con el backend configurado (compartido por proceso)"""
+        return open_graph(path, backend=self.graph_backend, store_path=store_path)
     
     def search(
         self,
         query: str,
         max_results: int = 10,
-        min_score: float = 0.0
+        min_score: float = 0.0,
+        page_token: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> SearchResponse:
         """
         Ejecutar búsqueda semántica
         
+        Si la consulta tiene ORDER BY, su orden es el global: solo se leen del
+        grafo las filas necesarias para llenar la página (más una de control) y
+        el ranking reordena dentro de la página; ``total_results`` cuenta
+        entonces hasta esta página (``total_is_estimate`` si hay más). Sin
+        ORDER BY se rankea el resultado completo (acotado por su LIMIT, si lo
+        tiene) antes de paginar, y el total es exacto.
+        
         Args:
             query: Query en lenguaje natural
-            max_results: Número máximo de resultados
-            min_score: Score mínimo para incluir resultado
-            
+            max_results: Número máximo de resultados (tamaño de página)
+            min_score: Score mínimo para incluir resultado (se aplica al
+                llenar la página: todas las páginas salvo la última van llenas)
+            page_token: Cursor devuelto en ``next_page_token`` de la respuesta
+                anterior (reutiliza su SPARQL sin volver a llamar al LLM)
+            filters: Filtros de facetas (task, library, source, license,
+                accessLevel; ver ``knowledge_graph.facet_index``), evaluados
+                sobre los bitmaps del catálogo; el cursor conserva los filtros
+        
         Returns:
             SearchResponse con resultados rankeados
         """
         start_time = datetime.now()
+        version = get_graph_store().version_of(self.graph)
         
         logger.info(f"🔍 Búsqueda: '{query}'")
         
-        # 1. Convertir a SPARQL
-        conversion = self.converter.convert(query, validate=True)
-        
-        if not conversion.is_valid:
-            logger.warning(f"❌ Query inválida: {conversion.validation_errors}")
-            return SearchResponse(
-                query=query,
-                results=[],
-                total_results=0,
-                sparql_query=conversion.sparql_query,
-                execution_time=0.0,
-                is_valid=False,
-                errors=conversion.validation_errors
-            )
+        # 1. Convertir a SPARQL (o continuar la consulta del cursor)
+        offset = 0
+        matched_before = 0  # resultados de las páginas anteriores (consultas con ORDER BY)
+        first_page = None
+        if page_token:
+            try:
+                token = decode_page_token(page_token)
+            except ValueError as e:
+                return self._error_response(query, "", [str(e)])
+            if token.version != version:
+                return self._error_response(
+                    query, token.query, ["page_token caducado: el grafo ha cambiado, repite la búsqueda"]
+                )
+            sparql_query, offset = token.query, token.offset
+            if filters is None:
+                filters = token.extra.get("filters")
+            matched_before = token.extra.get("matched", 0)
+        else:
+            # La validación ejecuta solo la primera página (max_results + 1 filas)
+            conversion = self.converter.convert(query, validate=True, probe_rows=max_results)
+            
+            if not conversion.is_valid:
+                logger.warning(f"❌ Query inválida: {conversion.validation_errors}")
+                return self._error_response(query, conversion.sparql_query, conversion.validation_errors)
+            
+            sparql_query = conversion.sparql_query
+            if conversion.query_result is not None and self.converter.validation_graph is self.graph:
+                first_page = conversion.query_result
         
         # 2. Ejecutar SPARQL contra grafo
         try:
-            sparql_results = self.graph.query(conversion.sparql_query)
-            raw_results = list(sparql_results)
-            
-            logger.info(f"✅ {len(raw_results)} resultados encontrados")
+            ordered = has_order_by(sparql_query)
+            if ordered:
+                raw_results, next_offset, has_more = self._fill_page(
+                    sparql_query, query, offset, max_results, filters, min_score, first_page
+                )
+                total_results = matched_before + len(raw_results)
+            else:
+                raw_results, total_results = self._ranked_page(
+                    sparql_query, query, offset, max_results, filters, min_score
+                )
+                next_offset = offset + len(raw_results)
+                has_more = next_offset < total_results
             
+            logger.info(f"✅ {len(raw_results)} resultados en la página (offset {offset})")
+        
         except Exception as e:
             logger.error(f"❌ Error ejecutando SPARQL: {e}")
-            return SearchResponse(
-                query=query,
-                results=[],
-                total_results=0,
-                sparql_query=conversion.sparql_query,
-                execution_time=0.0,
-                is_valid=False,
-                errors=[str(e)]
-            )
+            return self._error_response(query, sparql_query, [str(e)])
         
-        # 3. Parsear y rankear resultados
+        # 3. Parsear y rankear resultados (ya filtrados por facetas y min_score)
         search_results = self._parse_results(raw_results, query)
         ranked_results = self._rank_results(search_results, query)
         
-        # 4. Filtrar y limitar
-        filtered = [r for r in ranked_results if r.score >= min_score]
-        limited = filtered[:max_results]
-        
         execution_time = (datetime.now() - start_time).total_seconds()
         
-        logger.info(f"✅ {len(limited)} resultados retornados ({execution_time:.2f}s)")
+        logger.info(f"✅ {len(ranked_results)} resultados retornados ({execution_time:.2f}s)")
         
+        extra: Dict[str, Any] = {"filters": filters} if filters else {}
+        if ordered:
+            extra["matched"] = total_results
         return SearchResponse(
             query=query,
-            results=limited,
-            total_results=len(raw_results),
-            sparql_query=conversion.sparql_query,
+            results=ranked_results,
+            total_results=total_results,
+            sparql_query=sparql_query,
             execution_time=execution_time,
-            is_valid=True
+            is_valid=True,
+            next_page_token=encode_page_token(sparql_query, next_offset, version, **extra) if has_more else None,
+            total_is_estimate=ordered and has_more
+        )
+    
+    def _row_mask(
+        self,
+        rows: List,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        min_score: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filas que entran en los resultados y su score
+        
+        Una fila entra si tiene URI de modelo, cumple los filtros de facetas y
+        su score (el de ``_rank_results``, sin hidratar metadatos) llega a
+        ``min_score``.
+        
+        Returns:
+            (máscara, scores) por fila
+        """
+        uris = [self._row_model_uri(row) for row in rows]
+        keep = np.fromiter((uri is not None for uri in uris), dtype=bool, count=len(uris))
+        if filters:
+            keep &= facet_mask(self.graph, [uri or "" for uri in uris], filters)
+        model_ids = self.catalog.model_ids(uri or "" for uri in uris)
+        titles = [self._row_title(row, model_id) for row, model_id in zip(rows, model_ids.tolist())]
+        scores = self._scores(model_ids, titles, query)
+        return keep & (scores >= min_score), scores
+    
+    def _ranked_page(
+        self,
+        sparql_query: str,
+        query: str,
+        offset: int,
+        size: int,
+        filters: Optional[Dict[str, Any]],
+        min_score: float
+    ) -> Tuple[List, int]:
+        """
+        Página ``[offset, offset + size)`` del resultado completo ordenado por score
+        
+        El resultado completo sale de la caché de resultados a partir de la
+        segunda página; solo se ordenan los ``offset + size`` mejores.
+        
+        Returns:
+            (filas, total de filas que entran en los resultados)
+        """
+        rows = list(run_query(self.graph, sparql_query))
+        keep, scores = self._row_mask(rows, query, filters, min_score)
+        candidates = np.flatnonzero(keep)
+        order = candidates[top_k_indices(scores[candidates], offset + size)]
+        return [rows[i] for i in order[offset:].tolist()], len(candidates)
+    
+    def _fill_page(
+        self,
+        sparql_query: str,
+        query: str,
+        offset: int,
+        size: int,
+        filters: Optional[Dict[str, Any]],
+        min_score: float,
+        first_page: Optional[Any] = None
+    ) -> Tuple[List, int, bool]:
+        """
+        Página de hasta ``size`` filas que entran en los resultados (ver ``_row_mask``)
+        
+        Lee el resultado de forma perezosa desde ``offset`` en bloques que se
+        duplican, evalúa la máscara por bloque y para en la fila ``size + 1``
+        que entra (la de control de ``has_more``). ``first_page`` (la página
+        ya ejecutada por la validación) se usa tal cual si todas sus filas
+        entran.
+        
+        Returns:
+            (filas, posición de la siguiente fila que entra, has_more); la
+            posición es sobre el resultado sin filtrar, la del cursor
+        """
+        if first_page is not None and offset == 0 and self._row_mask(first_page.rows, query, filters, min_score)[0].all():
+            return first_page.rows, first_page.next_offset, first_page.has_more
+        
+        rows = []
+        position = offset
+        block_size = max(size + 1, FILTER_BLOCK_ROWS)
+        iterator = iter_query(self.graph, sparql_query, offset)
+        while True:
+            block = list(islice(iterator, block_size))
+            if not block:
+                break
+            allowed, _ = self._row_mask(block, query, filters, min_score)
+            for index in np.flatnonzero(allowed).tolist():
+                if len(rows) == size:
+                    return rows, position + index, True
+                rows.append(block[index])
+            position += len(block)
+            if len(block) < block_size:
+                break
+            block_size *= 2
+        return rows, position, False
+    
+    @staticmethod
+    def _error_response(query: str, sparql_query: str, errors: List[str]) -> SearchResponse:
+        """Respuesta vacía de una búsqueda fallida"""
+        return SearchResponse(
+            query=query,
+            results=[],
+            total_results=0,
+            sparql_query=sparql_query,
+            execution_time=0.0,
+            is_valid=False,
+            errors=errors
         )
     
     def _parse_results(self, raw_results: List, query: str) -> List[SearchResult]:
         """Parsear resultados SPARQL a SearchResult"""
-        results = []
+        rows = []
         
         for row in raw_results:
             # Convertir row a diccionario para acceso flexible
             row_dict = row.asdict() if hasattr(row, 'asdict') else {}
-            
-            # Intentar obtener el URI del modelo de varias formas
-            model_uri = None
-            if 'model' in row_dict:
-                model_uri = str(row_dict['model'])
-            elif hasattr(row, 'model'):
-                model_uri = str(row.model)
-            elif len(row) > 0 and str(row[0]).startswith('http'):
-                # Fallback: primer elemento si parece un URI
-                model_uri = str(row[0])
+            model_uri = self._row_model_uri(row)
             
             if not model_uri:
                 # Si no encontramos el URI, skip este resultado
                 logger.warning(f"No se pudo extraer model_uri de resultado SPARQL")
                 continue
             
-            # Obtener metadatos completos del grafo
-            metadata = self._get_model_metadata(URIRef(model_uri))
-            
+            rows.append((model_uri, row_dict))
+        
+        # Metadatos completos de toda la página en una sola hidratación
+        all_metadata = self._get_models_metadata([model_uri for model_uri, _ in rows])
+        
+        results = []
+        for (model_uri, row_dict), metadata in zip(rows, all_metadata):
             # Usar datos del query SPARQL si están disponibles, sino del grafo
             title = row_dict.get('title', metadata.get('title', 'Unknown'))
             source = row_dict.get('source', metadata.get('source', 'Unknown'))
@@ -273,100 +440,125 @@ class SearchEngine:
         
         return results
     
+    @staticmethod
+    def _row_model_uri(row) -> Optional[str]:
+        """URI del modelo de una fila SPARQL (None si no se encuentra)"""
+        row_dict = row.asdict() if hasattr(row, 'asdict') else {}
+        
+        # Intentar obtener el URI del modelo de varias formas
+        if 'model' in row_dict:
+            return str(row_dict['model'])
+        if hasattr(row, 'model'):
+            return str(row.model)
+        if len(row) > 0 and str(row[0]).startswith('http'):
+            # Fallback: primer elemento si parece un URI
+            return str(row[0])
+        return None
+    
+    def _row_title(self, row, model_id: int) -> str:
+        """Título de una fila como en ``_parse_results``: el de la consulta o el del catálogo"""
+        row_dict = row.asdict() if hasattr(row, 'asdict') else {}
+        if 'title' in row_dict:
+            return str(row_dict['title'])
+        title = self.catalog.value(model_id, "title") if model_id >= 0 else None
+        return str(title) if title else 'Unknown'
+    
     def _get_model_metadata(self, model_uri: URIRef) -> Dict[str, Any]:
-        """Obtener metadatos completos de un modelo"""
-        metadata = {}
-        
-        # Propiedades a extraer (usando namespaces correctos)
-        properties = [
-            ("title", DCTERMS.title),           # dcterms:title
-            ("source", DCTERMS.source),         # dcterms:source
-            ("description", DCTERMS.description), # dcterms:description
-            ("task", self.DAIMO.task),          # daimo:task
-            ("library", self.DAIMO.library),    # daimo:library
-            ("downloads", self.DAIMO.downloads), # daimo:downloads
-            ("likes", self.DAIMO.likes),        # daimo:likes (rating)
-            ("accessLevel", self.DAIMO.accessLevel), # daimo:accessLevel
-            ("domain", self.DAIMO.domain),      # daimo:domain
-            ("sourceURL", self.DAIMO.sourceURL) # daimo:sourceURL
-        ]
-        
-        for prop_name, prop_uri in properties:
-            value = self.graph.value(model_uri, prop_uri)
-            if value:
-                metadata[prop_name] = str(value)
-        
-        # Mapear 'likes' a 'rating' para compatibilidad
-        if 'likes' in metadata:
-            try:
-                metadata['rating'] = float(metadata['likes']) / 100.0  # Normalizar a escala 0-5
-            except:
-                metadata['rating'] = 0.0
+        """Obtener metadatos completos de un modelo (desde el catálogo columnar)"""
+        return self._get_models_metadata([model_uri])[0]
+    
+    def _get_models_metadata(self, model_uris: List[Any]) -> List[Dict[str, Any]]:
+        """Metadatos de varios modelos con una sola hidratación del catálogo"""
+        # title, source, description, task, library, downloads, likes,
+        # accessLevel, domain, sourceURL
+        all_metadata = self.catalog.metadata_for(model_uris)
+        
+        for metadata in all_metadata:
+            # Mapear 'likes' a 'rating' para compatibilidad
+            if 'likes' in metadata:
+                try:
+                    metadata['rating'] = float(metadata['likes']) / 100.0  # Normalizar a escala 0-5
+                except:
+                    metadata['rating'] = 0.0
         
-        return metadata
+        return all_metadata
     
     def _rank_results(
         self,
         results: List[SearchResult],
-        query: str
+        query: str,
+        top_k: Optional[int] = None
     ) -> List[SearchResult]:
         """
         Rankear resultados por relevancia
         
-        Estrategia simple:
+        Score (pesos en ``self.ranking_weights``):
         - Score base: 1.0
         - Boost por coincidencia en título
         - Boost por popularidad (downloads)
         - Boost por rating
+        
+        Las señales de popularidad y rating vienen precalculadas del catálogo;
+        el score de toda la página se calcula en una pasada NumPy y solo se
+        ordenan los ``top_k`` mejores (por defecto, todos).
         """
-        query_lower = query.lower()
+        if not results:
+            return []
         
-        for result in results:
-            score = 1.0
-            
-            # Boost por coincidencia en título
-            if query_lower in result.title.lower():
-                score += 2.0
-            
-            # Boost por popularidad (normalizado)
-            downloads = int(result.metadata.get("downloads", 0))
-            if downloads > 0:
-                score += min(downloads / 10_000_000, 2.0)
-            
-            # Boost por rating
-            rating = float(result.metadata.get("rating", 0))
-            if rating > 0:
-                score += rating / 5.0  # Normalizar a 0-1
-            
-            result.score = round(score, 2)
+        model_ids = self.catalog.model_ids(result.model_uri for result in results)
+        scores = self._scores(model_ids, [result.title for result in results], query)
+        
+        ranked = []
+        for i in top_k_indices(scores, top_k):
+            result = results[i]
+            result.score = float(scores[i])
+            ranked.append(result)
         
-        # Ordenar por score descendente
-        return sorted(results, key=lambda r: r.score, reverse=True)
+        return ranked
+    
+    def _scores(self, model_ids: np.ndarray, titles: List[Optional[str]], query: str) -> np.ndarray:
+        """Scores de ranking (redondeados a 2 decimales) en una pasada NumPy"""
+        query_lower = query.lower()
+        title_matches = np.fromiter(
+            (query_lower in (title or "").lower() for title in titles),
+            dtype=bool, count=len(titles)
+        )
+        return np.round(self.ranking_features.score(model_ids, title_matches, self.ranking_weights), 2)
     
     def get_statistics(self) -> Dict[str, Any]:
-        """Obtener estadísticas del grafo"""
-        stats = {
-            "total_models": self.total_models,
-            "total_triples": self.total_triples,
-            "repositories": self._count_by_property(self.DAIMO.source),
-            "tasks": self._count_by_property(self.DAIMO.task),
-            "libraries": self._count_by_property(self.DAIMO.library),
-            "access_levels": self._count_by_property(self.DAIMO.accessLevel)
-        }
+        """Obtener estadísticas del grafo (calculadas una vez por versión)"""
+        return get_graph_statistics(self.graph)
+    
+    def get_facet_counts(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Conteos por valor de cada faceta con los filtros activos
         
-        return stats
+        Se calculan con popcount sobre los bitmaps del catálogo; los de una
+        faceta ignoran el filtro de esa misma faceta (para poder ampliarla).
+        """
+        return get_facet_index(self.catalog).counts(filters, fields)
     
     def _count_by_property(self, property_uri: URIRef) -> Dict[str, int]:
-        """Contar valores únicos de una propiedad"""
-        counts = {}
-        
-        for model in self.graph.subjects(RDF.type, self.DAIMO.Model):
-            value = self.graph.value(model, property_uri)
-            if value:
-                value_str = str(value)
-                counts[value_str] = counts.get(value_str, 0) + 1
-        
-        return counts
+        """
+        Contar modelos por valor de una propiedad (fuera del catálogo).
+
+        Es una agregación SPARQL (``GROUP BY``): sobre grafos del GraphStore la
+        evalúa el motor columnar y el resultado queda en la caché por versión.
+        """
+        query = f"""
+        PREFIX daimo: <{self.DAIMO}>
+        SELECT ?value (COUNT(DISTINCT ?model) AS ?count)
+        WHERE {{
+            ?model a daimo:Model ;
+                   <{property_uri}> ?value .
+        }}
+        GROUP BY ?value
+        """
+        return {str(row.value): int(row["count"]) for row in run_query(self.graph, query)}
 
 
 # Función de conveniencia para uso rápido